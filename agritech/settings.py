@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,10 +32,17 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gestion.middleware.RolesMiddleware',  # Rôle et permissions en cache
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Comptage des requêtes SQL par vue et détection des N+1 (actif par défaut en DEBUG)
+if os.environ.get('BUDGET_REQUETES', str(DEBUG)) == 'True':
+    MIDDLEWARE.append('gestion.middleware.BudgetRequetesMiddleware')
+BUDGET_REQUETES_PAR_VUE = int(os.environ.get('BUDGET_REQUETES_PAR_VUE', 30))
+SEUIL_REQUETES_REPETEES = int(os.environ.get('SEUIL_REQUETES_REPETEES', 5))
+
 ROOT_URLCONF = 'agritech.urls'
 
 TEMPLATES = [
@@ -46,6 +55,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'gestion.referentiel.contexte',
             ],
         },
     },
@@ -77,6 +87,34 @@ else:
         }
     }
 
+# Cache partagé par tous les workers de la machine (fichier SQLite, voir gestion/cache.py).
+# CACHE_BACKEND / CACHE_LOCATION permettent de passer à Redis ou Memcached là où ils existent.
+# Fichier et préfixe propres au projet et à sa base : les rôles sont indexés par id
+# d'utilisateur et ne doivent pas passer d'une base (ou d'une copie du projet) à l'autre.
+_BASE_CACHE = DATABASES['default']
+EMPREINTE_CACHE = hashlib.sha256('|'.join(
+    str(valeur) for valeur in (BASE_DIR, _BASE_CACHE['ENGINE'], _BASE_CACHE.get('HOST', ''),
+                               _BASE_CACHE.get('PORT', ''), _BASE_CACHE['NAME'])
+).encode()).hexdigest()[:12]
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'gestion.cache.SQLiteCache'),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(tempfile.gettempdir(), f'agritech-cache-{EMPREINTE_CACHE}.sqlite3'),
+        ),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', f'agritech-{EMPREINTE_CACHE}'),
+    }
+}
+# Éviction (LRU pour SQLiteCache) : propre aux backends locaux, Redis et Memcached gèrent la leur
+if not CACHES['default']['BACKEND'].endswith(('RedisCache', 'MemcacheCache', 'PyMemcacheCache', 'PyLibMCCache')):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 50000)),
+        'CULL_FREQUENCY': int(os.environ.get('CACHE_CULL_FREQUENCY', 4)),
+    }
+# Tests : cache temporaire propre à l'exécution, jamais celui du serveur (voir gestion/cache.py)
+TEST_RUNNER = 'gestion.test_runner.CacheIsoleRunner'
+
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
@@ -85,6 +123,39 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # WhiteNoise configuration
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Durée de vie (secondes) des statistiques publiques de la page d'accueil en cache
+STATISTIQUES_ACCUEIL_TTL = int(os.environ.get('STATISTIQUES_ACCUEIL_TTL', 300))
+
+# Durée de vie (secondes) du rôle et des permissions d'un utilisateur en cache
+ROLES_CACHE_TTL = int(os.environ.get('ROLES_CACHE_TTL', 300))
+
+# Durée de vie (secondes) du référentiel en mémoire (cultures, communes, arrondissements)
+REFERENTIEL_TTL = int(os.environ.get('REFERENTIEL_TTL', 300))
+
+# Fichiers des saisons de récolte gelées (commande archiver_recoltes)
+ARCHIVES_RECOLTES_DIR = os.environ.get('ARCHIVES_RECOLTES_DIR', BASE_DIR / 'archives')
+
+# Rapports de fin de saison par commune (commande generer_rapports)
+RAPPORTS_DIR = os.environ.get('RAPPORTS_DIR', BASE_DIR / 'rapports')
+
+# Sessions lues dans le cache partagé, écrites aussi en base pour survivre à un redémarrage
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Requêtes SQL lancées simultanément par un tableau de bord async (une connexion par requête)
+TABLEAU_DE_BORD_PARALLELISME = int(os.environ.get('TABLEAU_DE_BORD_PARALLELISME', 4))
+
+# Courriels (récapitulatifs d'alertes de stock) : console en local, SMTP en production
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', BASE_DIR / 'courriels')  # backend filebased
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'alertes@agritech-benin.bj')
+# Adresse publique du site, pour les liens des courriels
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')
+
 # Login URLs
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
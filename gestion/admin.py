@@ -1,17 +1,116 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+
 from .models import (
     Commune, Arrondissement, Producteur, Parcelle,
-    TypeCulture, Recolte, Entrepot, Stock
+    TypeCulture, Recolte, Entrepot, Stock, MouvementStock, AlerteStock, EntreeRecherche
 )
+from .referentiel import referentiel
+from .requetes_sql import estimer_nombre_lignes
+from .saisons import bornes_saison, saison_courante
+
+# En dessous de ce volume, un COUNT(*) exact reste bon marché
+SEUIL_COMPTE_ESTIME = 100_000
+# Saisons proposées par le filtre des récoltes, en remontant depuis la saison en cours
+SAISONS_FILTRE = 5
+
+
+class PaginateurEstime(Paginator):
+    """
+    Sur une liste non filtrée d'une grosse table, le nombre total vient des
+    statistiques du planificateur au lieu d'un COUNT(*) qui lit toute la table.
+    """
+    
+    @cached_property
+    def count(self):
+        requete = getattr(self.object_list, 'query', None)
+        if requete is not None and not requete.where:
+            estimation = estimer_nombre_lignes(self.object_list.model, self.object_list.db)
+            if estimation is not None and estimation >= SEUIL_COMPTE_ESTIME:
+                return estimation
+        return super().count
+
+
+class ArrondissementFilter(admin.RelatedFieldListFilter):
+    """Filtre par arrondissement : libellés « nom (commune) » lus dans le référentiel en mémoire"""
+    
+    def field_choices(self, field, request, model_admin):
+        return [(arrondissement.pk, str(arrondissement)) for arrondissement in referentiel.arrondissements]
+
+
+class SaisonFilter(admin.SimpleListFilter):
+    """
+    Filtre par saison, à la place de date_hierarchy : la liste des saisons est
+    calculée sans requête (date_hierarchy lit les dates distinctes de toute la
+    table) et le filtre est une plage de date_recolte, qui écarte les partitions.
+    """
+    title = 'saison'
+    parameter_name = 'saison'
+    champ_date = 'date_recolte'
+    
+    def lookups(self, request, model_admin):
+        courante = saison_courante()
+        return [(str(annee), str(annee)) for annee in range(courante, courante - SAISONS_FILTRE, -1)]
+    
+    def queryset(self, request, queryset):
+        try:
+            annee = int(self.value())
+        except (TypeError, ValueError):
+            return queryset
+        debut, fin = bornes_saison(annee)
+        return queryset.filter(**{f'{self.champ_date}__gte': debut, f'{self.champ_date}__lt': fin})
+
+
+class AnneeInscriptionFilter(SaisonFilter):
+    """Même filtre borné sur l'année d'inscription des producteurs (plage de l'index producteur_inscription_idx)"""
+    title = "année d'inscription"
+    parameter_name = 'inscription'
+    champ_date = 'date_inscription'
+
+
+class RechercheIndexeeMixin:
+    """
+    Recherche de la liste et de l'autocomplétion dans EntreeRecherche (index
+    par trigrammes) au lieu de `icontains` sur chaque champ de search_fields.
+
+    search_fields reste déclaré : il affiche la barre de recherche et autorise
+    l'autocomplétion depuis les autres modèles.
+    """
+    type_recherche = None
+    # Champ du modèle comparé aux objet_id trouvés
+    champ_recherche = 'pk'
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        trouves = EntreeRecherche.objects.rechercher(search_term, self.type_recherche).values('objet_id')
+        return queryset.filter(**{f'{self.champ_recherche}__in': trouves}), False
+
+
+def _compte(modele, champ):
+    """Sous-requête COUNT des lignes de `modele` rattachées par `champ` (évite le produit de deux jointures)"""
+    return Coalesce(Subquery(
+        modele.objects.filter(**{champ: OuterRef('pk')}).order_by().values(champ)
+        .annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
 
 @admin.register(Commune)
 class CommuneAdmin(admin.ModelAdmin):
     list_display = ['nom', 'code', 'nombre_arrondissements']
     search_fields = ['nom', 'code']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(nb_arrondissements=Count('arrondissements'))
+    
     def nombre_arrondissements(self, obj):
-        return obj.arrondissements.count()
+        return obj.nb_arrondissements
     nombre_arrondissements.short_description = "Nb Arrondissements"
+    nombre_arrondissements.admin_order_field = 'nb_arrondissements'
 
 
 @admin.register(Arrondissement)
@@ -19,33 +118,61 @@ class ArrondissementAdmin(admin.ModelAdmin):
     list_display = ['nom', 'commune', 'code', 'nombre_producteurs', 'nombre_parcelles']
     list_filter = ['commune']
     search_fields = ['nom', 'code', 'commune__nom']
+    autocomplete_fields = ['commune']
+    
+    def get_queryset(self, request):
+        # select_related aussi pour l'autocomplétion, qui affiche « nom (commune) »
+        return super().get_queryset(request).select_related('commune').annotate(
+            nb_producteurs=_compte(Producteur, 'arrondissement'),
+            nb_parcelles=_compte(Parcelle, 'arrondissement'),
+        )
     
     def nombre_producteurs(self, obj):
-        return obj.producteurs.count()
+        return obj.nb_producteurs
     nombre_producteurs.short_description = "Nb Producteurs"
+    nombre_producteurs.admin_order_field = 'nb_producteurs'
     
     def nombre_parcelles(self, obj):
-        return obj.parcelles.count()
+        return obj.nb_parcelles
     nombre_parcelles.short_description = "Nb Parcelles"
+    nombre_parcelles.admin_order_field = 'nb_parcelles'
 
 
 @admin.register(Producteur)
-class ProducteurAdmin(admin.ModelAdmin):
+class ProducteurAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
     list_display = ['user', 'telephone', 'arrondissement', 'date_inscription', 'actif', 'nombre_parcelles']
-    list_filter = ['actif', 'arrondissement__commune', 'date_inscription']
+    list_filter = ['actif', 'arrondissement__commune', AnneeInscriptionFilter]
     search_fields = ['user__username', 'user__first_name', 'user__last_name', 'telephone']
-    date_hierarchy = 'date_inscription'
+    type_recherche = EntreeRecherche.PRODUCTEUR
+    autocomplete_fields = ['user', 'arrondissement']
+    paginator = PaginateurEstime
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # Un select_related ici remplace list_select_related : tout est chargé d'un coup
+        return super().get_queryset(request).select_related('user', 'arrondissement__commune').annotate(
+            nb_parcelles=_compte(Parcelle, 'producteur'),
+        )
     
     def nombre_parcelles(self, obj):
-        return obj.parcelles.count()
+        return obj.nb_parcelles
     nombre_parcelles.short_description = "Nb Parcelles"
+    nombre_parcelles.admin_order_field = 'nb_parcelles'
 
 
 @admin.register(Parcelle)
-class ParcelleAdmin(admin.ModelAdmin):
+class ParcelleAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
     list_display = ['nom', 'producteur', 'arrondissement', 'superficie', 'latitude', 'longitude']
-    list_filter = ['arrondissement__commune', 'arrondissement']
+    list_filter = ['arrondissement__commune', ('arrondissement', ArrondissementFilter)]
     search_fields = ['nom', 'producteur__user__username', 'producteur__user__first_name']
+    type_recherche = EntreeRecherche.PARCELLE
+    autocomplete_fields = ['producteur', 'arrondissement']
+    paginator = PaginateurEstime
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # Le libellé « nom - producteur » sert aussi à l'autocomplétion des récoltes
+        return super().get_queryset(request).select_related('producteur__user', 'arrondissement__commune')
 
 
 @admin.register(TypeCulture)
@@ -55,35 +182,129 @@ class TypeCultureAdmin(admin.ModelAdmin):
 
 
 @admin.register(Recolte)
-class RecolteAdmin(admin.ModelAdmin):
+class RecolteAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
     list_display = ['type_culture', 'parcelle', 'quantite', 'date_recolte', 'producteur_nom', 'date_enregistrement']
-    list_filter = ['type_culture', 'date_recolte', 'parcelle__arrondissement__commune']
+    list_filter = ['type_culture', SaisonFilter, 'date_recolte', 'parcelle__arrondissement__commune']
+    list_select_related = ['type_culture', 'parcelle__producteur__user']
     search_fields = ['parcelle__nom', 'parcelle__producteur__user__username']
-    date_hierarchy = 'date_recolte'
+    # Les récoltes ne sont pas indexées : on cherche leurs parcelles
+    type_recherche = EntreeRecherche.PARCELLE
+    champ_recherche = 'parcelle'
+    autocomplete_fields = ['parcelle']
+    paginator = PaginateurEstime
+    show_full_result_count = False
     
     def producteur_nom(self, obj):
         return obj.producteur
     producteur_nom.short_description = "Producteur"
+    producteur_nom.admin_order_field = 'parcelle__producteur__user__username'
 
 
 @admin.register(Entrepot)
-class EntrepotAdmin(admin.ModelAdmin):
+class EntrepotAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
     list_display = ['nom', 'arrondissement', 'capacite_max', 'seuil_alerte', 'stock_actuel', 'taux_remplissage_pct', 'alerte']
-    list_filter = ['arrondissement__commune', 'arrondissement']
+    list_filter = ['arrondissement__commune', ('arrondissement', ArrondissementFilter)]
+    list_select_related = ['arrondissement__commune']
     search_fields = ['nom', 'gestionnaire__username']
+    type_recherche = EntreeRecherche.ENTREPOT
+    autocomplete_fields = ['arrondissement', 'gestionnaire']
+    
+    # Indicateurs lus dans les colonnes dénormalisées : aucune agrégation par ligne
+    def stock_actuel(self, obj):
+        return obj.stock_actuel
+    stock_actuel.short_description = "Stock actuel"
+    stock_actuel.admin_order_field = 'stock_cumule'
     
     def taux_remplissage_pct(self, obj):
         return f"{obj.taux_remplissage:.1f}%"
     taux_remplissage_pct.short_description = "Taux Remplissage"
+    taux_remplissage_pct.admin_order_field = 'taux_occupation'
     
     def alerte(self, obj):
         return "⚠️ ALERTE" if obj.alerte_stock_bas else "✅ OK"
     alerte.short_description = "État Stock"
+    alerte.admin_order_field = 'en_alerte'
 
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
     list_display = ['entrepot', 'type_culture', 'quantite', 'date_mise_a_jour']
     list_filter = ['entrepot', 'type_culture']
+    list_select_related = ['entrepot', 'type_culture']
+    search_fields = ['entrepot__nom']
+    autocomplete_fields = ['entrepot']
+    readonly_fields = ['date_mise_a_jour']
+    
+    def get_readonly_fields(self, request, obj=None):
+        # Un stock ne change ni d'entrepôt ni de culture : on passe par un transfert
+        if obj is not None:
+            return ['entrepot', 'type_culture', *self.readonly_fields]
+        return self.readonly_fields
+    
+    def get_form(self, request, obj=None, **kwargs):
+        form = super().get_form(request, obj, **kwargs)
+        
+        class StockAdminForm(form):
+            def clean(self):
+                donnees = super().clean()
+                entrepot = self.instance.entrepot if self.instance.pk else donnees.get('entrepot')
+                quantite = donnees.get('quantite')
+                if entrepot is not None and quantite is not None:
+                    ancienne = self.instance.quantite if self.instance.pk else 0
+                    if quantite > ancienne and entrepot.stock_cumule - ancienne + quantite > entrepot.capacite_max:
+                        self.add_error('quantite', "Capacité maximale de l'entrepôt dépassée")
+                return donnees
+        
+        return StockAdminForm
+    
+    def save_model(self, request, obj, form, change):
+        """La quantité saisie est un inventaire : écart au grand livre, sous verrou et capacité vérifiée"""
+        if change and 'quantite' not in form.changed_data:
+            return
+        if not change and not obj.quantite:
+            # Stock vide : aucun écart à inscrire
+            return super().save_model(request, obj, form, change)
+        MouvementStock.objects.inventaire(
+            obj.entrepot, obj.type_culture, obj.quantite, auteur=request.user,
+            commentaire="Modification dans l'administration",
+        )
+        obj.pk = Stock.objects.values_list('pk', flat=True).get(entrepot=obj.entrepot, type_culture=obj.type_culture)
+
+
+
+@admin.register(MouvementStock)
+class MouvementStockAdmin(admin.ModelAdmin):
+    list_display = ['date', 'type_mouvement', 'entrepot', 'entrepot_destination', 'type_culture', 'quantite', 'auteur']
+    list_filter = ['type_mouvement', 'type_culture', 'entrepot']
+    list_select_related = ['entrepot', 'entrepot_destination', 'type_culture', 'auteur']
+    search_fields = ['entrepot__nom', 'commentaire']
+    date_hierarchy = 'date'
+    paginator = PaginateurEstime
+    show_full_result_count = False
+    
+    # Le grand livre ne s'écrit que par MouvementStock.objects (entree, sortie, transfert, inventaire)
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AlerteStock)
+class AlerteStockAdmin(admin.ModelAdmin):
+    list_display = ['entrepot', 'date_declenchement', 'stock_declenchement', 'seuil', 'date_resolution',
+                    'stock_resolution', 'notification_en_attente']
+    list_filter = ['notification_en_attente', 'entrepot']
+    list_select_related = ['entrepot']
     search_fields = ['entrepot__nom']
-    readonly_fields = ['date_mise_a_jour']
\ No newline at end of file
+    date_hierarchy = 'date_declenchement'
+    
+    # Ouvertes et closes par les variations de stock (AlerteStock.objects.evaluer)
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,66 @@
+"""
+Récapitulatifs des alertes de stock bas, envoyés par lots aux gestionnaires.
+
+Les alertes sont ouvertes et closes au fil des variations de stock
+(AlerteStockQuerySet.evaluer) ; ce module ne fait que regrouper les
+transitions pas encore notifiées et envoie un seul courriel par gestionnaire,
+sur une seule connexion au serveur de courrier. À lancer périodiquement :
+python manage.py envoyer_alertes.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import AlerteStock
+
+logger = logging.getLogger('gestion.alertes')
+
+
+def envoyer_recapitulatifs():
+    """
+    Envoie les transitions en attente, groupées par gestionnaire.
+
+    Retourne (nombre de courriels envoyés, nombre d'alertes notifiées). Les
+    alertes d'un entrepôt sans gestionnaire joignable sont marquées notifiées
+    (et journalisées) pour ne pas s'accumuler.
+    """
+    with transaction.atomic():
+        alertes = list(
+            AlerteStock.objects.a_notifier().select_for_update(of=('self',))
+            .select_related('entrepot__gestionnaire').order_by('entrepot__nom', 'date_declenchement')
+        )
+        if not alertes:
+            return 0, 0
+
+        par_gestionnaire = defaultdict(list)
+        for alerte in alertes:
+            gestionnaire = alerte.entrepot.gestionnaire
+            if gestionnaire is None or not gestionnaire.email:
+                logger.warning("Alerte de stock sans destinataire : %s", alerte)
+                continue
+            par_gestionnaire[gestionnaire].append(alerte)
+
+        messages = []
+        for gestionnaire, siennes in par_gestionnaire.items():
+            ouvertes = [alerte for alerte in siennes if alerte.date_resolution is None]
+            resolues = [alerte for alerte in siennes if alerte.date_resolution is not None]
+            messages.append(EmailMessage(
+                subject=f"[AgriTech-Bénin] {len(ouvertes)} alerte(s) de stock bas, {len(resolues)} résolue(s)",
+                body=render_to_string('gestion/emails/recapitulatif_alertes.txt', {
+                    'gestionnaire': gestionnaire, 'ouvertes': ouvertes, 'resolues': resolues,
+                    'lien_stocks': settings.SITE_URL + reverse('gestion_stocks'),
+                }),
+                to=[gestionnaire.email],
+            ))
+        envoyes = get_connection(fail_silently=False).send_messages(messages) if messages else 0
+
+        AlerteStock.objects.filter(pk__in=[alerte.pk for alerte in alertes]).update(
+            notification_en_attente=False, date_notification=timezone.now(),
+        )
+    return envoyes or 0, len(alertes)
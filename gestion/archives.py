@@ -0,0 +1,342 @@
+"""
+Archivage des saisons closes et lecture de tout l'historique des récoltes.
+
+Trois niveaux de stockage (saison = année civile, voir saisons.py) :
+- chaud : gestion_recolte, que lisent saisie, listes et tableaux de bord.
+  Sous PostgreSQL, chaque saison y a sa partition ;
+- tiède (SQLite) : RecolteArchivee, mêmes colonnes, hors des requêtes courantes ;
+- froid : un fichier NumPy compressé par saison (recoltes-2019.npz dans
+  ARCHIVES_RECOLTES_DIR), rangé par colonnes et trié par (-date, -id).
+  Producteur et arrondissement y sont figés au moment du gel, comme dans les
+  cumuls : la clé d'idempotence n'y est pas conservée.
+
+La commande archiver_recoltes fait passer les saisons d'un niveau au suivant
+en SQL brut, sans signaux : les cumuls (CumulRecolte) ne changent pas. Les
+rapports historiques (export, reconstruction des cumuls, prévisions) lisent
+les trois niveaux par les fonctions de ce module.
+"""
+import functools
+import os
+import re
+from collections import defaultdict
+from datetime import timezone as fuseau
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import JournalSynchronisation, Parcelle, Producteur, Recolte, RecolteArchivee
+from .referentiel import referentiel
+from .saisons import bornes_saison, partitions_natives, saisons_entre, supprimer_partition, verrouiller_saison
+
+COLONNES = {
+    'id': np.int64,
+    'parcelle_id': np.int64,
+    'producteur_id': np.int64,
+    'arrondissement_id': np.int64,
+    'type_culture_id': np.int64,
+    'centikilos': np.int64,  # quantité en centièmes de kg : valeurs exactes
+    'date_recolte': 'datetime64[D]',
+    'date_enregistrement': 'datetime64[us]',  # UTC
+}
+CHAMPS_SQL = (
+    'id', 'parcelle_id', 'parcelle__producteur_id', 'parcelle__arrondissement_id', 'type_culture_id',
+    'quantite', 'date_recolte', 'date_enregistrement',
+)
+COLONNES_DEPLACEES = (
+    'id', 'parcelle_id', 'type_culture_id', 'quantite', 'date_recolte', 'date_enregistrement', 'cle_idempotence',
+)
+TAILLE_BLOC = 5000
+_FICHIER = re.compile(r'recoltes-(\d{4})\.npz')
+
+
+class ArchiveInvalide(Exception):
+    """Le fichier relu ne contient pas les lignes écrites"""
+
+
+# --------------------------------------------
+# Tables SQL
+# --------------------------------------------
+
+def tables_recoltes():
+    """Modèles dont les tables contiennent des récoltes (les partitions PostgreSQL sont dans Recolte)"""
+    if partitions_natives(connection):
+        return [Recolte]
+    return [Recolte, RecolteArchivee]
+
+
+def union_recoltes(construire):
+    """
+    Une seule requête sur toutes les tables de récoltes : `construire` reçoit
+    le queryset (non trié) de chaque modèle et renvoie un values_list, réunis
+    par UNION ALL.
+    """
+    requetes = [construire(modele.objects.order_by()) for modele in tables_recoltes()]
+    return requetes[0].union(*requetes[1:], all=True) if len(requetes) > 1 else requetes[0]
+
+
+def saisons_en_base():
+    """Saisons présentes dans les tables SQL, de la plus ancienne à la plus récente"""
+    saisons = set()
+    for modele in tables_recoltes():
+        bornes = modele.objects.aggregate(premiere=Min('date_recolte'), derniere=Max('date_recolte'))
+        if bornes['premiere']:
+            saisons.update(range(bornes['premiere'].year, bornes['derniere'].year + 1))
+    return sorted(saisons)
+
+
+def _plage(modele, annee):
+    debut, fin = bornes_saison(annee)
+    return modele.objects.order_by().filter(date_recolte__gte=debut, date_recolte__lt=fin)
+
+
+def _supprimer_sans_signaux(modele, annee):
+    debut, fin = bornes_saison(annee)
+    with connection.cursor() as curseur:
+        curseur.execute(
+            f'DELETE FROM {modele._meta.db_table} WHERE date_recolte >= %s AND date_recolte < %s',
+            [debut, fin],
+        )
+        return curseur.rowcount
+
+
+def _oublier_du_journal(annee):
+    # Les clients synchronisés ne reçoivent que les saisons de la table principale
+    JournalSynchronisation.objects.filter(
+        modele=JournalSynchronisation.RECOLTE, objet_id__in=_plage(Recolte, annee).values('pk'),
+    ).delete()
+
+
+def archiver_saison(annee):
+    """SQLite : déplace la saison de Recolte vers RecolteArchivee ; retourne le nombre de récoltes"""
+    debut, fin = bornes_saison(annee)
+    colonnes = ', '.join(COLONNES_DEPLACEES)
+    with transaction.atomic():
+        with connection.cursor() as curseur:
+            curseur.execute(
+                f'INSERT INTO {RecolteArchivee._meta.db_table} ({colonnes}) '
+                f'SELECT {colonnes} FROM {Recolte._meta.db_table} '
+                f'WHERE date_recolte >= %s AND date_recolte < %s',
+                [debut, fin],
+            )
+            nombre = curseur.rowcount
+        _oublier_du_journal(annee)
+        _supprimer_sans_signaux(Recolte, annee)
+    return nombre
+
+
+# --------------------------------------------
+# Fichiers gelés
+# --------------------------------------------
+
+def dossier_archives():
+    return Path(settings.ARCHIVES_RECOLTES_DIR)
+
+
+def chemin_saison(annee):
+    return dossier_archives() / f'recoltes-{annee}.npz'
+
+
+def saisons_gelees():
+    """Saisons ayant un fichier gelé, de la plus ancienne à la plus récente"""
+    if not dossier_archives().is_dir():
+        return []
+    return sorted(
+        int(correspondance.group(1))
+        for nom in os.listdir(dossier_archives())
+        if (correspondance := _FICHIER.fullmatch(nom))
+    )
+
+
+def _vide():
+    return {nom: np.empty(0, dtype=type_) for nom, type_ in COLONNES.items()}
+
+
+@functools.lru_cache(maxsize=8)
+def _charger(chemin, modification):
+    # `modification` fait partie de la clé : un fichier réécrit est relu
+    with np.load(chemin) as fichier:
+        return {nom: fichier[nom] for nom in COLONNES}
+
+
+def lire_saison(annee, debut=None, fin=None):
+    """
+    Colonnes (tableaux NumPy, triés par -date_recolte, -id) d'une saison gelée,
+    restreintes aux dates [debut, fin] si données. Tableaux partagés : lecture seule.
+    """
+    chemin = chemin_saison(annee)
+    try:
+        colonnes = _charger(str(chemin), chemin.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return _vide()
+    masque = np.ones(len(colonnes['id']), dtype=bool)
+    if debut is not None:
+        masque &= colonnes['date_recolte'] >= np.datetime64(debut, 'D')
+    if fin is not None:
+        masque &= colonnes['date_recolte'] <= np.datetime64(fin, 'D')
+    if masque.all():
+        return colonnes
+    return {nom: valeurs[masque] for nom, valeurs in colonnes.items()}
+
+
+def _trier(colonnes):
+    ordre = np.lexsort((colonnes['id'], colonnes['date_recolte']))[::-1]
+    return {nom: valeurs[ordre] for nom, valeurs in colonnes.items()}
+
+
+def _colonnes_sql(annee):
+    """Récoltes de la saison dans les tables SQL, en colonnes"""
+    morceaux = defaultdict(list)
+    for modele in tables_recoltes():
+        lignes = _plage(modele, annee).values_list(*CHAMPS_SQL)
+        for ligne in lignes.iterator(chunk_size=TAILLE_BLOC):
+            pk, parcelle, producteur, arrondissement, culture, quantite, jour, enregistrement = ligne
+            morceaux['id'].append(pk)
+            morceaux['parcelle_id'].append(parcelle)
+            morceaux['producteur_id'].append(producteur)
+            morceaux['arrondissement_id'].append(arrondissement)
+            morceaux['type_culture_id'].append(culture)
+            morceaux['centikilos'].append(int(quantite * 100))
+            morceaux['date_recolte'].append(jour)
+            morceaux['date_enregistrement'].append(enregistrement.astimezone(fuseau.utc).replace(tzinfo=None))
+    return {nom: np.array(morceaux[nom], dtype=type_) for nom, type_ in COLONNES.items()}
+
+
+def _ecrire(chemin, colonnes):
+    """Écrit le fichier à côté de sa destination et le relit ; retourne le chemin temporaire"""
+    temporaire = chemin.with_name(f'.{chemin.name}.{os.getpid()}')
+    with open(temporaire, 'wb') as fichier:
+        np.savez_compressed(fichier, **colonnes)
+        fichier.flush()
+        os.fsync(fichier.fileno())
+    with np.load(temporaire) as relu:
+        for nom, valeurs in colonnes.items():
+            if not np.array_equal(relu[nom], valeurs):
+                os.unlink(temporaire)
+                raise ArchiveInvalide(f"{chemin.name} : colonne {nom} différente après relecture")
+    return temporaire
+
+
+def geler_saison(annee):
+    """
+    Écrit les récoltes SQL de la saison dans son fichier (fusionnées avec un
+    fichier existant), vérifie la relecture puis les supprime de la base.
+    Retourne le nombre de récoltes gelées.
+
+    Tout se fait dans une transaction : si l'écriture ou la relecture échoue,
+    la base n'est pas modifiée ; le fichier ne remplace l'ancien qu'en dernier.
+    """
+    chemin = chemin_saison(annee)
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    with transaction.atomic():
+        if partitions_natives(connection):
+            with connection.cursor() as curseur:
+                verrouiller_saison(curseur, annee)
+        nouvelles = _colonnes_sql(annee)
+        if not len(nouvelles['id']):
+            return 0
+        deja_gelees = lire_saison(annee)
+        colonnes = _trier({nom: np.concatenate([deja_gelees[nom], nouvelles[nom]]) for nom in COLONNES})
+        temporaire = _ecrire(chemin, colonnes)
+        try:
+            _oublier_du_journal(annee)
+            for modele in tables_recoltes():
+                _supprimer_sans_signaux(modele, annee)
+            if partitions_natives(connection):
+                with connection.cursor() as curseur:
+                    supprimer_partition(curseur, annee)
+            os.replace(temporaire, chemin)
+        except BaseException:
+            if temporaire.exists():
+                os.unlink(temporaire)
+            raise
+    return len(nouvelles['id'])
+
+
+# --------------------------------------------
+# Lecture de l'historique complet
+# --------------------------------------------
+
+def saisons_recoltes():
+    """Toutes les saisons ayant des récoltes, en base ou gelées"""
+    return sorted(set(saisons_en_base()) | set(saisons_gelees()))
+
+
+def saisons_gelees_entre(debut=None, fin=None):
+    """Saisons gelées recoupant [debut, fin], de la plus récente à la plus ancienne"""
+    gelees = saisons_gelees()
+    if not gelees:
+        return []
+    retenues = set(saisons_entre(debut, fin, gelees[0], gelees[-1]))
+    return [annee for annee in reversed(gelees) if annee in retenues]
+
+
+def _masque_existants(ids, existants):
+    return np.isin(ids, np.fromiter(existants, dtype=np.int64, count=len(existants)))
+
+
+def pk_existantes(modele, ids):
+    """Sous-ensemble des `ids` encore présents dans la table du modèle (par blocs)"""
+    ids = [int(pk) for pk in np.unique(ids)]
+    existantes = set()
+    for position in range(0, len(ids), TAILLE_BLOC):
+        bloc = ids[position:position + TAILLE_BLOC]
+        existantes.update(modele.objects.filter(pk__in=bloc).values_list('pk', flat=True))
+    return existantes
+
+
+def parcelles(ids, *champs):
+    """{pk: (champs…)} des parcelles `ids` encore existantes (par blocs)"""
+    ids = [int(pk) for pk in np.unique(ids)]
+    trouvees = {}
+    for position in range(0, len(ids), TAILLE_BLOC):
+        bloc = ids[position:position + TAILLE_BLOC]
+        for pk, *valeurs in Parcelle.objects.filter(pk__in=bloc).values_list('pk', *champs):
+            trouvees[pk] = tuple(valeurs)
+    return trouvees
+
+
+def contributions_cumuls(annee):
+    """
+    {(periode, arrondissement_id, type_culture_id, producteur_id): [quantité, nombre]}
+    de toutes les récoltes de la saison, quel que soit leur niveau de stockage.
+    """
+    cellules = defaultdict(lambda: [Decimal(0), 0])
+    for modele in tables_recoltes():
+        lignes = _plage(modele, annee).annotate(periode=TruncMonth('date_recolte')).values(
+            'periode', 'parcelle__arrondissement_id', 'type_culture_id', 'parcelle__producteur_id',
+        ).annotate(total=Sum('quantite'), nombre=Count('id')).values_list(
+            'periode', 'parcelle__arrondissement_id', 'type_culture_id', 'parcelle__producteur_id',
+            'total', 'nombre',
+        )
+        for periode, arrondissement_id, type_culture_id, producteur_id, total, nombre in lignes.iterator():
+            cellule = cellules[(periode, arrondissement_id, type_culture_id, producteur_id)]
+            cellule[0] += total
+            cellule[1] += nombre
+
+    gelees = lire_saison(annee)
+    if len(gelees['id']):
+        # Lignes dont le producteur, l'arrondissement ou la culture a été supprimé : cumuls supprimés en cascade
+        masque = _masque_existants(gelees['producteur_id'], pk_existantes(Producteur, gelees['producteur_id']))
+        masque &= _masque_existants(gelees['arrondissement_id'], {a.pk for a in referentiel.arrondissements})
+        masque &= _masque_existants(gelees['type_culture_id'], {c.pk for c in referentiel.cultures})
+        mois = gelees['date_recolte'][masque].astype('datetime64[M]')
+        cles = np.column_stack([
+            mois.astype(np.int64), gelees['arrondissement_id'][masque],
+            gelees['type_culture_id'][masque], gelees['producteur_id'][masque],
+        ])
+        uniques, position = np.unique(cles, axis=0, return_inverse=True)
+        position = position.reshape(-1)
+        totaux = np.zeros(len(uniques), dtype=np.int64)
+        np.add.at(totaux, position, gelees['centikilos'][masque])
+        nombres = np.bincount(position, minlength=len(uniques))
+        periodes = uniques[:, 0].astype('datetime64[M]').astype('datetime64[D]').tolist()
+        for periode, cle, total, nombre in zip(periodes, uniques[:, 1:].tolist(), totaux.tolist(), nombres.tolist()):
+            cellule = cellules[(periode, *cle)]
+            cellule[0] += Decimal(total).scaleb(-2)
+            cellule[1] += nombre
+    return cellules
@@ -0,0 +1,252 @@
+"""
+Cache partagé par tous les workers d'une même machine, stocké dans un fichier SQLite.
+
+Le cache LocMem de Django est propre à chaque processus : avec plusieurs
+workers, chacun recalcule les mêmes statistiques et une invalidation faite
+dans un worker n'atteint pas les autres. Ce backend écrit dans un fichier
+SQLite (mode WAL, lectures concurrentes) que tous les workers ouvrent, sans
+dépendre d'un serveur Redis.
+
+- TTL : chaque entrée porte sa date d'expiration ; une entrée expirée n'est
+  jamais renvoyée et disparaît au prochain nettoyage.
+- LRU : la date du dernier accès est rafraîchie à la lecture (au plus une fois
+  par RAFRAICHISSEMENT_ACCES secondes, pour ne pas écrire à chaque lecture).
+  Au-delà de MAX_ENTRIES, les entrées les moins récemment lues sont supprimées.
+- Atomicité : add(), incr() et incr_version() lisent et écrivent dans une même
+  transaction BEGIN IMMEDIATE, qui verrouille le fichier entre processus.
+
+CACHES = {'default': {'BACKEND': 'gestion.cache.SQLiteCache', 'LOCATION': '/chemin/cache.sqlite3'}}
+"""
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Une lecture ne réécrit la date d'accès que si elle date de plus de N secondes
+RAFRAICHISSEMENT_ACCES = 30
+# Le nombre d'entrées n'est vérifié qu'une écriture sur N
+ECRITURES_ENTRE_NETTOYAGES = 100
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' cle TEXT PRIMARY KEY, valeur BLOB NOT NULL, expire REAL, acces REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_acces_idx ON cache (acces)',
+    'CREATE INDEX IF NOT EXISTS cache_expire_idx ON cache (expire)',
+)
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.chemin = location
+        self._local = threading.local()
+        self._ecritures = 0
+
+    # --------------------------------------------
+    # Connexion : une par thread et par processus
+    # --------------------------------------------
+
+    @property
+    def _connexion(self):
+        # Un worker issu d'un fork ne doit pas réutiliser la connexion de son parent
+        if getattr(self._local, 'pid', None) != os.getpid():
+            dossier = os.path.dirname(self.chemin)
+            if dossier:
+                os.makedirs(dossier, exist_ok=True)
+            connexion = sqlite3.connect(self.chemin, timeout=10, isolation_level=None, check_same_thread=False)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute('PRAGMA synchronous=NORMAL')
+            for instruction in SCHEMA:
+                connexion.execute(instruction)
+            self._local.connexion = connexion
+            self._local.pid = os.getpid()
+        return self._local.connexion
+
+    @contextmanager
+    def _transaction(self):
+        connexion = self._connexion
+        connexion.execute('BEGIN IMMEDIATE')
+        try:
+            yield connexion
+        except BaseException:
+            connexion.execute('ROLLBACK')
+            raise
+        connexion.execute('COMMIT')
+
+    def _lire(self, connexion, cle, maintenant):
+        """(valeur, expire) d'une entrée valide, None sinon"""
+        ligne = connexion.execute(
+            'SELECT valeur, expire, acces FROM cache WHERE cle = ?', (cle,)
+        ).fetchone()
+        if ligne is None:
+            return None
+        valeur, expire, acces = ligne
+        if expire is not None and expire <= maintenant:
+            connexion.execute('DELETE FROM cache WHERE cle = ? AND expire <= ?', (cle, maintenant))
+            return None
+        if acces < maintenant - RAFRAICHISSEMENT_ACCES:
+            connexion.execute('UPDATE cache SET acces = ? WHERE cle = ?', (maintenant, cle))
+        return pickle.loads(valeur), expire
+
+    def _ecrire(self, connexion, cle, valeur, expire, maintenant):
+        connexion.execute(
+            'INSERT INTO cache (cle, valeur, expire, acces) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (cle) DO UPDATE SET valeur = excluded.valeur, expire = excluded.expire, '
+            'acces = excluded.acces',
+            (cle, pickle.dumps(valeur, self.pickle_protocol), expire, maintenant),
+        )
+
+    def _apres_ecriture(self):
+        self._ecritures += 1
+        if self._ecritures % ECRITURES_ENTRE_NETTOYAGES == 0:
+            self._nettoyer()
+
+    def _nettoyer(self):
+        """Supprime les entrées expirées puis, au-delà de MAX_ENTRIES, les moins récemment lues"""
+        connexion = self._connexion
+        connexion.execute('DELETE FROM cache WHERE expire <= ?', (time.time(),))
+        nombre = connexion.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if nombre <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connexion.execute('DELETE FROM cache')
+            return
+        connexion.execute(
+            'DELETE FROM cache WHERE cle IN (SELECT cle FROM cache ORDER BY acces LIMIT ?)',
+            (nombre // self._cull_frequency,),
+        )
+
+    # --------------------------------------------
+    # API du cache Django
+    # --------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        entree = self._lire(self._connexion, cle, time.time())
+        return default if entree is None else entree[0]
+
+    def get_many(self, keys, version=None):
+        resultats = {}
+        maintenant = time.time()
+        connexion = self._connexion
+        for key in keys:
+            entree = self._lire(connexion, self.make_and_validate_key(key, version=version), maintenant)
+            if entree is not None:
+                resultats[key] = entree[0]
+        return resultats
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        self._ecrire(self._connexion, cle, value, self.get_backend_timeout(timeout), time.time())
+        self._apres_ecriture()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expire = self.get_backend_timeout(timeout)
+        maintenant = time.time()
+        with self._transaction() as connexion:
+            for key, value in data.items():
+                self._ecrire(connexion, self.make_and_validate_key(key, version=version), value, expire, maintenant)
+        self._apres_ecriture()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        maintenant = time.time()
+        with self._transaction() as connexion:
+            if self._lire(connexion, cle, maintenant) is not None:
+                return False
+            self._ecrire(connexion, cle, value, self.get_backend_timeout(timeout), maintenant)
+        self._apres_ecriture()
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        maintenant = time.time()
+        curseur = self._connexion.execute(
+            'UPDATE cache SET expire = ?, acces = ? WHERE cle = ? AND (expire IS NULL OR expire > ?)',
+            (self.get_backend_timeout(timeout), maintenant, cle, maintenant),
+        )
+        return curseur.rowcount > 0
+
+    def delete(self, key, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        return self._connexion.execute('DELETE FROM cache WHERE cle = ?', (cle,)).rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        with self._transaction() as connexion:
+            for key in keys:
+                connexion.execute('DELETE FROM cache WHERE cle = ?', (self.make_and_validate_key(key, version=version),))
+
+    def has_key(self, key, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        return self._connexion.execute(
+            'SELECT 1 FROM cache WHERE cle = ? AND (expire IS NULL OR expire > ?)', (cle, time.time()),
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        maintenant = time.time()
+        with self._transaction() as connexion:
+            entree = self._lire(connexion, cle, maintenant)
+            if entree is None:
+                raise ValueError(f"Key '{key}' not found")
+            valeur, expire = entree
+            valeur += delta
+            self._ecrire(connexion, cle, valeur, expire, maintenant)
+        return valeur
+
+    def incr_version(self, key, delta=1, version=None):
+        if version is None:
+            version = self.version
+        ancienne = self.make_and_validate_key(key, version=version)
+        nouvelle = self.make_and_validate_key(key, version=version + delta)
+        maintenant = time.time()
+        with self._transaction() as connexion:
+            entree = self._lire(connexion, ancienne, maintenant)
+            if entree is None:
+                raise ValueError(f"Key '{key}' not found")
+            self._ecrire(connexion, nouvelle, entree[0], entree[1], maintenant)
+            connexion.execute('DELETE FROM cache WHERE cle = ?', (ancienne,))
+        return version + delta
+
+    def clear(self):
+        self._connexion.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connexions conservées d'une requête à l'autre : rien à fermer en fin de requête
+        pass
+
+
+# --------------------------------------------
+# Cache isolé des tests et mesures
+# --------------------------------------------
+
+@contextmanager
+def cache_isole():
+    """
+    Remplace le cache par un fichier SQLite temporaire, supprimé à la sortie.
+
+    Les tests et benchmark_vues travaillent sur une base de test : leurs entrées
+    (rôles indexés par id d'utilisateur) et leurs cache.clear() ne doivent pas
+    atteindre le cache du serveur qui tourne sur la même machine.
+    """
+    from django.test.utils import override_settings
+
+    with tempfile.TemporaryDirectory(prefix='agritech-cache-') as dossier:
+        reglages = {
+            'BACKEND': 'gestion.cache.SQLiteCache',
+            'LOCATION': os.path.join(dossier, 'cache.sqlite3'),
+            'TIMEOUT': settings.CACHES['default'].get('TIMEOUT', 300),
+        }
+        with override_settings(CACHES={'default': reglages}):
+            yield
+
@@ -0,0 +1,177 @@
+"""
+Export en flux (CSV ou JSON lines) des récoltes et des stocks.
+
+Les lignes sont lues par `values_list().iterator(chunk_size=...)` : curseur
+côté serveur sur PostgreSQL, lecture par blocs sur SQLite. Aucune instance de
+modèle n'est construite et la mémoire reste constante quel que soit le volume ;
+le premier octet part avant que tout le résultat soit lu.
+
+L'export des récoltes couvre aussi les saisons archivées et gelées
+(archives.py) : une requête SQL pour les tables, puis les fichiers gelés
+lus par blocs et fusionnés dans l'ordre des dates.
+
+Sous ASGI, Django consommerait en entier un générateur synchrone avant
+d'envoyer le premier octet : `flux_asynchrone` l'expose en itérateur async.
+"""
+import csv
+import heapq
+import itertools
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+
+from .archives import lire_saison, parcelles, saisons_gelees_entre, union_recoltes
+from .filtres import filtrer_recoltes, filtrer_stocks, lire_date
+from .models import Arrondissement, Stock, TypeCulture
+from .referentiel import referentiel
+
+TAILLE_BLOC = 2000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+COLONNES_RECOLTES = [
+    ('id', 'id'),
+    ('date_recolte', 'date_recolte'),
+    ('producteur', 'parcelle__producteur__user__username'),
+    ('parcelle', 'parcelle__nom'),
+    ('arrondissement', 'parcelle__arrondissement__nom'),
+    ('commune', 'parcelle__arrondissement__commune__nom'),
+    ('type_culture', 'type_culture__nom'),
+    ('quantite_kg', 'quantite'),
+    ('date_enregistrement', 'date_enregistrement'),
+]
+
+COLONNES_STOCKS = [
+    ('id', 'id'),
+    ('entrepot', 'entrepot__nom'),
+    ('arrondissement', 'entrepot__arrondissement__nom'),
+    ('commune', 'entrepot__arrondissement__commune__nom'),
+    ('type_culture', 'type_culture__nom'),
+    ('quantite_kg', 'quantite'),
+    ('date_mise_a_jour', 'date_mise_a_jour'),
+]
+
+
+class _Tampon:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def _serialiser(valeur):
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    return valeur
+
+
+class LignesRecoltes:
+    """
+    Lignes d'export de toutes les saisons : la requête SQL (table principale et
+    archive réunies) fusionnée avec les saisons gelées, dans l'ordre
+    (-date_recolte, -id). Même interface que values_list pour generer_export.
+    """
+
+    def __init__(self, requete, parametres):
+        self.requete = requete
+        self.parametres = parametres
+
+    def _gelees(self, chunk_size):
+        type_culture = self.parametres.get('type_culture')
+        arrondissement = self.parametres.get('arrondissement')
+        culture = referentiel.culture_par_nom(type_culture) if type_culture else None
+        if type_culture and culture is None:
+            return
+        date_debut = lire_date(self.parametres.get('date_debut'))
+        date_fin = lire_date(self.parametres.get('date_fin'))
+        for annee in saisons_gelees_entre(date_debut, date_fin):
+            colonnes = lire_saison(annee, date_debut, date_fin)
+            if culture:
+                colonnes = {nom: valeurs[colonnes['type_culture_id'] == culture.pk] for nom, valeurs in colonnes.items()}
+            for position in range(0, len(colonnes['id']), chunk_size):
+                bloc = {nom: valeurs[position:position + chunk_size].tolist() for nom, valeurs in colonnes.items()}
+                # Producteur et arrondissement actuels de la parcelle, comme dans la requête SQL
+                localisation = parcelles(
+                    bloc['parcelle_id'], 'producteur__user__username', 'nom', 'arrondissement_id',
+                )
+                for pk, parcelle_id, type_culture_id, centikilos, date_recolte, date_enregistrement in zip(
+                    bloc['id'], bloc['parcelle_id'], bloc['type_culture_id'], bloc['centikilos'],
+                    bloc['date_recolte'], bloc['date_enregistrement'],
+                ):
+                    if parcelle_id not in localisation:
+                        continue
+                    producteur, nom_parcelle, arrondissement_id = localisation[parcelle_id]
+                    if arrondissement and str(arrondissement).isdigit() and arrondissement_id != int(arrondissement):
+                        continue
+                    lieu = referentiel.get(Arrondissement, arrondissement_id)
+                    yield (
+                        pk, date_recolte, producteur, nom_parcelle, lieu.nom, lieu.commune.nom,
+                        referentiel.get(TypeCulture, type_culture_id).nom, Decimal(centikilos).scaleb(-2),
+                        date_enregistrement.replace(tzinfo=timezone.utc),
+                    )
+
+    def iterator(self, chunk_size=TAILLE_BLOC):
+        lignes = self.requete.iterator(chunk_size=chunk_size)
+        date_debut = lire_date(self.parametres.get('date_debut'))
+        date_fin = lire_date(self.parametres.get('date_fin'))
+        if not saisons_gelees_entre(date_debut, date_fin):
+            return lignes
+        return heapq.merge(lignes, self._gelees(chunk_size), key=lambda ligne: (ligne[1], ligne[0]), reverse=True)
+
+
+def lignes_recoltes(parametres):
+    champs = [champ for _, champ in COLONNES_RECOLTES]
+    requete = union_recoltes(
+        lambda recoltes: filtrer_recoltes(recoltes, parametres).values_list(*champs)
+    ).order_by('-date_recolte', '-id')
+    return COLONNES_RECOLTES, LignesRecoltes(requete, parametres)
+
+
+def lignes_stocks(parametres):
+    stocks = filtrer_stocks(Stock.objects.all(), parametres).order_by('entrepot__nom', 'type_culture__nom')
+    return COLONNES_STOCKS, stocks.values_list(*[champ for _, champ in COLONNES_STOCKS])
+
+
+def generer_export(colonnes, lignes, format_export='csv'):
+    """Générateur de morceaux de texte, une ligne d'export par itération"""
+    entetes = [nom for nom, _ in colonnes]
+    if format_export == 'jsonl':
+        for ligne in lignes.iterator(chunk_size=TAILLE_BLOC):
+            yield json.dumps(dict(zip(entetes, map(_serialiser, ligne))), ensure_ascii=False) + '\n'
+        return
+
+    writer = csv.writer(_Tampon())
+    yield writer.writerow(entetes)
+    for ligne in lignes.iterator(chunk_size=TAILLE_BLOC):
+        yield writer.writerow([_serialiser(valeur) for valeur in ligne])
+
+
+async def flux_asynchrone(morceaux, taille=None):
+    """
+    Itérateur async sur le générateur synchrone `morceaux` (réponses en flux sous ASGI).
+
+    Chaque passage dans le thread de l'ORM lit `taille` morceaux (TAILLE_BLOC par
+    défaut) : le curseur reste sur la même connexion (thread_sensitive) et la
+    mémoire reste bornée.
+    """
+    taille = taille or TAILLE_BLOC
+
+    def bloc():
+        return ''.join(itertools.islice(morceaux, taille))
+
+    try:
+        while True:
+            morceau = await sync_to_async(bloc)()
+            if not morceau:
+                return
+            yield morceau
+    finally:
+        # Client déconnecté : le curseur est fermé dans le thread qui l'a ouvert
+        await sync_to_async(morceaux.close)()
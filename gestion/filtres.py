@@ -0,0 +1,62 @@
+"""
+Filtres partagés par la liste des récoltes, les exports et les commandes.
+
+Les paramètres sont lus depuis un dictionnaire (request.GET ou options de
+commande) ; une valeur absente ou invalide est simplement ignorée.
+"""
+from datetime import date
+
+from .referentiel import referentiel
+
+
+def lire_date(valeur):
+    if not valeur:
+        return None
+    if isinstance(valeur, date):
+        return valeur
+    try:
+        return date.fromisoformat(str(valeur))
+    except ValueError:
+        return None
+
+
+def _filtrer_culture(objets, nom):
+    """Filtre sur type_culture_id (code résolu en mémoire) : aucune jointure vers TypeCulture"""
+    culture = referentiel.culture_par_nom(nom)
+    return objets.filter(type_culture_id=culture.pk) if culture else objets.none()
+
+
+def filtrer_recoltes(recoltes, parametres):
+    """Applique type_culture, arrondissement, date_debut et date_fin à un queryset de Recolte"""
+    type_culture = parametres.get('type_culture')
+    arrondissement = parametres.get('arrondissement')
+    date_debut = lire_date(parametres.get('date_debut'))
+    date_fin = lire_date(parametres.get('date_fin'))
+
+    if type_culture:
+        recoltes = _filtrer_culture(recoltes, type_culture)
+    if arrondissement and str(arrondissement).isdigit():
+        recoltes = recoltes.filter(parcelle__arrondissement__id=arrondissement)
+    if date_debut:
+        recoltes = recoltes.filter(date_recolte__gte=date_debut)
+    if date_fin:
+        recoltes = recoltes.filter(date_recolte__lte=date_fin)
+    return recoltes
+
+
+def filtrer_stocks(stocks, parametres):
+    """Mêmes filtres pour les Stock ; la période porte sur date_mise_a_jour"""
+    type_culture = parametres.get('type_culture')
+    arrondissement = parametres.get('arrondissement')
+    date_debut = lire_date(parametres.get('date_debut'))
+    date_fin = lire_date(parametres.get('date_fin'))
+
+    if type_culture:
+        stocks = _filtrer_culture(stocks, type_culture)
+    if arrondissement and str(arrondissement).isdigit():
+        stocks = stocks.filter(entrepot__arrondissement__id=arrondissement)
+    if date_debut:
+        stocks = stocks.filter(date_mise_a_jour__date__gte=date_debut)
+    if date_fin:
+        stocks = stocks.filter(date_mise_a_jour__date__lte=date_fin)
+    return stocks
@@ -1,5 +1,49 @@
+from decimal import Decimal
+
 from django import forms
-from .models import Recolte, Stock, Parcelle, TypeCulture
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from .models import Entrepot, MouvementStock, Recolte, Parcelle, TypeCulture
+from .referentiel import referentiel
+
+
+class IterateurReferentiel(ModelChoiceIterator):
+    """Options lues dans le référentiel en mémoire au lieu du queryset"""
+    
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for objet in referentiel.liste(self.queryset.model):
+            yield self.choice(objet)
+    
+    def __len__(self):
+        return len(referentiel.liste(self.queryset.model)) + (self.field.empty_label is not None)
+    
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(referentiel.liste(self.queryset.model))
+
+
+class ReferentielChoiceField(forms.ModelChoiceField):
+    """
+    Choix d'un type de culture, d'une commune ou d'un arrondissement sans
+    requête SQL, ni à l'affichage ni à la validation. Le queryset ne sert qu'à
+    désigner le modèle : il doit porter sur toute la table.
+    """
+    iterator = IterateurReferentiel
+    
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        modele = self.queryset.model
+        if isinstance(value, modele):
+            value = value.pk
+        try:
+            return referentiel.get(modele, value)
+        except modele.DoesNotExist:
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+
 
 class RecolteForm(forms.ModelForm):
     """Formulaire pour enregistrer une récolte"""
@@ -19,6 +63,7 @@ class RecolteForm(forms.ModelForm):
             'quantite': 'Quantité (kg)',
             'date_recolte': 'Date de récolte',
         }
+        field_classes = {'type_culture': ReferentielChoiceField}
     
     def __init__(self, *args, **kwargs):
         # Récupérer le producteur pour filtrer ses parcelles
@@ -27,50 +72,187 @@ class RecolteForm(forms.ModelForm):
         
         if producteur:
             # Le producteur ne voit que ses propres parcelles
-            self.fields['parcelle'].queryset = Parcelle.objects.filter(producteur=producteur)
+            self.fields['parcelle'].queryset = Parcelle.objects.filter(producteur=producteur).select_related('producteur__user')
 
 
-class StockForm(forms.ModelForm):
-    """Formulaire pour modifier le stock d'un entrepôt"""
-    
-    class Meta:
-        model = Stock
-        fields = ['type_culture', 'quantite']
-        widgets = {
-            'type_culture': forms.Select(attrs={'class': 'form-control'}),
-            'quantite': forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Quantité en kg'}),
-        }
-        labels = {
-            'type_culture': 'Type de culture',
-            'quantite': 'Quantité en stock (kg)',
-        }
+class LigneInventaireForm(forms.Form):
+    """Quantité comptée pour une culture, ligne de l'inventaire d'un entrepôt"""
+    type_culture = ReferentielChoiceField(queryset=TypeCulture.objects.all(), widget=forms.HiddenInput)
+    quantite = forms.DecimalField(
+        label='Quantité comptée (kg)',
+        max_digits=10, decimal_places=2, min_value=0, required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Non comptée'}),
+    )
+    # Stock affiché au moment du comptage (vide : aucun stock), renvoyé tel quel
+    quantite_affichee = forms.DecimalField(max_digits=10, decimal_places=2, required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, culture=None, stock_actuel=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Affichage seulement : la culture enregistrée est celle du champ caché, validée
+        self.culture = culture
+        self.stock_actuel = stock_actuel
+
+
+class BaseInventaireFormSet(forms.BaseFormSet):
+    """
+    Inventaire de tout un entrepôt : une ligne par type de culture du référentiel.
+
+    Seules les lignes modifiées par rapport au stock affiché sont enregistrées.
+    Ce stock est renvoyé par le formulaire (champ caché quantite_affichee) : si
+    un mouvement l'a changé entre l'affichage et l'envoi, la ligne est refusée
+    et réaffichée avec le stock actuel, pour ne pas écraser ce mouvement. Le
+    total est contrôlé contre la capacité sur l'ensemble des lignes.
+    """
+
+    def __init__(self, *args, entrepot, stocks, **kwargs):
+        # stocks : {type_culture_id: quantité actuelle}, déjà lus par la vue
+        self.entrepot = entrepot
+        self.stocks = stocks
+        self.cultures = referentiel.cultures
+        kwargs['initial'] = [
+            dict(type_culture=culture.pk, quantite=stocks.get(culture.pk), quantite_affichee=stocks.get(culture.pk))
+            for culture in self.cultures
+        ]
+        super().__init__(*args, **kwargs)
+        self.max_num = self.absolute_max = len(self.cultures)
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        if index is not None and index < len(self.cultures):
+            culture = self.cultures[index]
+            kwargs.update(culture=culture, stock_actuel=self.stocks.get(culture.pk))
+        return kwargs
+
+    def clean(self):
+        self.quantites = {}
+        self.affichees = {}
+        if any(self.errors):
+            return
+        conflits = []
+        for form in self.forms:
+            quantite = form.cleaned_data.get('quantite')
+            affichee = form.cleaned_data.get('quantite_affichee')
+            if quantite is None or quantite == affichee:
+                continue
+            type_culture = form.cleaned_data['type_culture']
+            if type_culture in self.quantites:
+                raise ValidationError(f"{type_culture} apparaît deux fois dans l'inventaire", code='doublon')
+            actuelle = self.stocks.get(type_culture.pk)
+            if actuelle != affichee:
+                conflits.append((form, actuelle))
+                continue
+            self.quantites[type_culture] = quantite
+            self.affichees[type_culture] = affichee
+        if conflits:
+            self._reafficher(conflits)
+            return
+        if not self.quantites:
+            raise ValidationError("Aucune quantité n'a été modifiée", code='vide')
+        actuel = sum(self.stocks.values(), Decimal(0))
+        total = actuel + sum(
+            quantite - self.stocks.get(type_culture.pk, 0) for type_culture, quantite in self.quantites.items()
+        )
+        if total > actuel and total > self.entrepot.capacite_max:
+            raise ValidationError(
+                f"Le total compté ({total} kg) dépasse la capacité de l'entrepôt ({self.entrepot.capacite_max} kg)",
+                code='capacite',
+            )
+
+    def _reafficher(self, conflits):
+        """Refuse les lignes dont le stock a changé depuis l'affichage ; le prochain envoi part du stock actuel"""
+        donnees = self.data.copy()
+        for form, actuelle in conflits:
+            affichee = form.cleaned_data['quantite_affichee']
+            form.add_error('quantite', ValidationError(
+                f"Le stock a changé depuis l'affichage ({affichee or 0} kg, maintenant {actuelle or 0} kg) : "
+                f"vérifiez le comptage puis renvoyez",
+                code='conflit',
+            ))
+            donnees[form.add_prefix('quantite_affichee')] = '' if actuelle is None else str(actuelle)
+        self.data = donnees
+        for form in self.forms:
+            form.data = donnees
+
+    def add_error(self, field, error):
+        """Erreur levée à l'enregistrement (capacité atteinte entre-temps), comme Form.add_error(None, ...)"""
+        self.non_form_errors().extend(ValidationError(error).messages)
+
+    def save(self, auteur=None):
+        """Applique toutes les lignes en une transaction ; lève ValidationError (capacité, stock changé)"""
+        return MouvementStock.objects.inventaire_complet(
+            self.entrepot, self.quantites, auteur=auteur, attendues=self.affichees,
+        )
+
+
+InventaireFormSet = forms.formset_factory(LigneInventaireForm, formset=BaseInventaireFormSet, extra=0)
+
+
+class MouvementStockForm(forms.Form):
+    """Entrée, sortie ou transfert de marchandise pour un entrepôt"""
+    type_mouvement = forms.ChoiceField(
+        label='Mouvement',
+        choices=[choix for choix in MouvementStock.TYPES_CHOICES if choix[0] != MouvementStock.INVENTAIRE],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    type_culture = ReferentielChoiceField(
+        label='Type de culture',
+        queryset=TypeCulture.objects.all(),
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    quantite = forms.DecimalField(
+        label='Quantité (kg)',
+        max_digits=10, decimal_places=2, min_value=Decimal('0.01'),
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Quantité en kg'}),
+    )
+    entrepot_destination = forms.ModelChoiceField(
+        label='Entrepôt de destination (transfert)',
+        queryset=Entrepot.objects.none(),
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    commentaire = forms.CharField(
+        label='Commentaire',
+        max_length=200,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Bon de livraison, motif...'}),
+    )
     
     def __init__(self, *args, **kwargs):
-        # Récupérer l'entrepôt
-        entrepot = kwargs.pop('entrepot', None)
+        self.entrepot = kwargs.pop('entrepot')
         super().__init__(*args, **kwargs)
-        
-        self.entrepot = entrepot
+        self.fields['entrepot_destination'].queryset = Entrepot.objects.exclude(pk=self.entrepot.pk)
     
-    def save(self, commit=True):
-        stock = super().save(commit=False)
-        stock.entrepot = self.entrepot
-        
-        if commit:
-            # Vérifier si un stock existe déjà pour ce type de culture
-            existing_stock = Stock.objects.filter(
-                entrepot=self.entrepot,
-                type_culture=stock.type_culture
-            ).first()
-            
-            if existing_stock:
-                # Mettre à jour le stock existant
-                existing_stock.quantite = stock.quantite
-                existing_stock.save()
-                return existing_stock
-            else:
-                # Créer un nouveau stock
-                stock.save()
-                return stock
-        
-        return stock
\ No newline at end of file
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('type_mouvement') == MouvementStock.TRANSFERT and not cleaned_data.get('entrepot_destination'):
+            self.add_error('entrepot_destination', "Choisissez l'entrepôt qui reçoit la marchandise")
+        return cleaned_data
+    
+    def save(self, auteur=None):
+        """Inscrit le mouvement ; lève ValidationError (capacité, stock insuffisant)"""
+        donnees = self.cleaned_data
+        arguments = {
+            'type_culture': donnees['type_culture'],
+            'quantite': donnees['quantite'],
+            'auteur': auteur,
+            'commentaire': donnees['commentaire'],
+        }
+        if donnees['type_mouvement'] == MouvementStock.ENTREE:
+            return MouvementStock.objects.entree(self.entrepot, **arguments)
+        if donnees['type_mouvement'] == MouvementStock.SORTIE:
+            return MouvementStock.objects.sortie(self.entrepot, **arguments)
+        return MouvementStock.objects.transfert(self.entrepot, donnees['entrepot_destination'], **arguments)
+
+
+class ImportRecoltesForm(forms.Form):
+    """Formulaire de dépôt d'un fichier CSV de récoltes"""
+    fichier = forms.FileField(
+        label='Fichier CSV',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'}),
+    )
+    simulation = forms.BooleanField(
+        label='Vérifier seulement (ne rien enregistrer)',
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+
@@ -0,0 +1,270 @@
+"""
+Import en masse de récoltes depuis un fichier CSV.
+
+Colonnes attendues (séparateur virgule ou point-virgule, en-tête obligatoire) :
+    producteur, parcelle, type_culture, quantite, date_recolte
+
+- `producteur` est le nom d'utilisateur, `parcelle` le nom de la parcelle
+  (ou son identifiant numérique, seul accepté quand plusieurs parcelles du
+  producteur portent ce nom à la casse près) ;
+- `type_culture` est le code (MAIS) ou le libellé (Maïs) ;
+- `date_recolte` au format AAAA-MM-JJ ou JJ/MM/AAAA.
+
+Le fichier peut être en UTF-8 (avec ou sans BOM) ou en Windows-1252, l'encodage
+des exports Excel sous Windows : l'encodage est détecté avant l'import.
+
+Le fichier est traité par lots : les références d'un lot sont résolues par
+quelques requêtes groupées (dictionnaires en mémoire), les lignes invalides
+sont signalées avec leur numéro, et les lignes valides sont insérées par
+bulk_create dans une transaction par lot. L'import est idempotent : une
+récolte déjà présente pour (parcelle, type_culture, date_recolte) est ignorée,
+y compris entre imports simultanés (les parcelles du lot sont verrouillées).
+"""
+import codecs
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .archives import union_recoltes
+from .models import CumulRecolte, JournalSynchronisation, Parcelle, Recolte
+from .referentiel import referentiel
+from .saisons import saison_de
+from .statistiques import invalider_statistiques_publiques
+
+COLONNES = ('producteur', 'parcelle', 'type_culture', 'quantite', 'date_recolte')
+TAILLE_LOT = 1000
+FORMATS_DATE = ('%Y-%m-%d', '%d/%m/%Y')
+QUANTITE_MAX = Decimal('1e8')  # Recolte.quantite : 10 chiffres dont 2 décimales
+AMBIGUE = object()  # plusieurs parcelles du producteur portent ce nom (à la casse près)
+ENCODAGES = ('utf-8-sig', 'cp1252')
+TAILLE_BLOC_DECODAGE = 1 << 16
+
+
+class ResultatImport:
+    def __init__(self):
+        self.lignes_lues = 0
+        self.creees = 0
+        self.doublons = 0
+        self.erreurs = []  # (numéro de ligne, message)
+
+    @property
+    def nombre_erreurs(self):
+        return len(self.erreurs)
+
+
+def _lire_date(valeur):
+    for format_date in FORMATS_DATE:
+        try:
+            return datetime.strptime(valeur, format_date).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _carte_cultures():
+    cultures = {}
+    for culture in referentiel.cultures:
+        cultures[culture.nom.upper()] = culture.pk
+        cultures[culture.get_nom_display().upper()] = culture.pk
+    return cultures
+
+
+def _carte_parcelles(lignes):
+    """
+    Résout en une requête les parcelles référencées par un lot.
+
+    Retourne deux tables distinctes, pour qu'une parcelle nommée « 12 » ne se
+    confonde pas avec la parcelle d'identifiant 12 :
+    {(username, nom de parcelle): valeur} et {(username, id): valeur},
+    où valeur = (parcelle_id, arrondissement_id, producteur_id). Un nom porté par
+    plusieurs parcelles du même producteur (à la casse près) vaut AMBIGUE.
+    """
+    usernames = {ligne['producteur'] for _, ligne in lignes if ligne['producteur']}
+    par_nom, par_id = {}, {}
+    parcelles = Parcelle.objects.filter(producteur__user__username__in=usernames).values_list(
+        'pk', 'nom', 'arrondissement_id', 'producteur_id', 'producteur__user__username',
+    )
+    for pk, nom, arrondissement_id, producteur_id, username in parcelles:
+        valeur = (pk, arrondissement_id, producteur_id)
+        cle = (username, nom.strip().lower())
+        par_nom[cle] = AMBIGUE if cle in par_nom else valeur
+        par_id[(username, pk)] = valeur
+    return par_nom, par_id
+
+
+def _trouver_parcelle(parcelles, ligne):
+    """Parcelle désignée par son nom, à défaut par son identifiant numérique"""
+    par_nom, par_id = parcelles
+    parcelle = par_nom.get((ligne['producteur'], ligne['parcelle'].lower()))
+    if parcelle is None and ligne['parcelle'].isdigit():
+        parcelle = par_id.get((ligne['producteur'], int(ligne['parcelle'])))
+    return parcelle
+
+
+def _normaliser(ligne):
+    return {colonne: (ligne.get(colonne) or '').strip() for colonne in COLONNES}
+
+
+def _filtrer_nouvelles(valides, resultat, deja_vues):
+    """Lignes valides absentes de la base et du fichier ; les autres comptent comme doublons"""
+    # Idempotence : une requête pour connaître les récoltes déjà présentes du lot
+    existantes = set(union_recoltes(lambda recoltes: recoltes.filter(
+        parcelle_id__in={parcelle[0] for parcelle, _, _, _ in valides},
+        date_recolte__in={date_recolte for _, _, date_recolte, _ in valides},
+    ).values_list('parcelle_id', 'type_culture_id', 'date_recolte')))
+
+    nouvelles = []
+    for parcelle, type_culture_id, date_recolte, quantite in valides:
+        cle = (parcelle[0], type_culture_id, date_recolte)
+        if cle in existantes or cle in deja_vues:
+            resultat.doublons += 1
+            continue
+        deja_vues.add(cle)
+        nouvelles.append((parcelle, type_culture_id, date_recolte, quantite))
+    return nouvelles
+
+
+def _traiter_lot(lot, cultures, resultat, deja_vues, simulation, producteur=None):
+    if not simulation:
+        # Les lots précédents sont en base : la requête d'existence suffit à les détecter
+        deja_vues.clear()
+    parcelles = _carte_parcelles(lot)
+    valides = []
+
+    for numero, ligne in lot:
+        parcelle = _trouver_parcelle(parcelles, ligne)
+        type_culture_id = cultures.get(ligne['type_culture'].upper())
+        date_recolte = _lire_date(ligne['date_recolte'])
+        try:
+            quantite = Decimal(ligne['quantite'].replace(',', '.'))
+        except InvalidOperation:
+            quantite = None
+
+        if parcelle is None:
+            resultat.erreurs.append((numero, f"Parcelle « {ligne['parcelle']} » inconnue pour « {ligne['producteur']} »"))
+        elif parcelle is AMBIGUE:
+            resultat.erreurs.append((numero, f"Plusieurs parcelles « {ligne['parcelle']} » pour "
+                                             f"« {ligne['producteur']} » : indiquez leur identifiant numérique"))
+        elif producteur is not None and parcelle[2] != producteur.pk:
+            resultat.erreurs.append((numero, "Cette parcelle ne vous appartient pas"))
+        elif type_culture_id is None:
+            resultat.erreurs.append((numero, f"Type de culture « {ligne['type_culture']} » inconnu"))
+        elif date_recolte is None:
+            resultat.erreurs.append((numero, f"Date « {ligne['date_recolte']} » invalide"))
+        elif quantite is None or not quantite.is_finite() or not 0 <= quantite < QUANTITE_MAX:
+            resultat.erreurs.append((numero, f"Quantité « {ligne['quantite']} » invalide"))
+        else:
+            valides.append((parcelle, type_culture_id, date_recolte, quantite.quantize(Decimal('0.01'))))
+
+    if not valides:
+        return
+
+    if simulation:
+        # En simulation, `creees` compte les récoltes qui seraient créées
+        resultat.creees += len(_filtrer_nouvelles(valides, resultat, deja_vues))
+        return
+
+    with transaction.atomic():
+        # Verrou des parcelles du lot (par ordre d'id : pas d'interblocage entre imports) :
+        # un import concurrent des mêmes parcelles attend la fin de celui-ci, son
+        # contrôle d'existence voit alors les récoltes créées ici
+        list(Parcelle.objects.select_for_update().filter(
+            pk__in={parcelle[0] for parcelle, _, _, _ in valides},
+        ).order_by('pk').values_list('pk', flat=True))
+        nouvelles = _filtrer_nouvelles(valides, resultat, deja_vues)
+        if not nouvelles:
+            return
+        creees = Recolte.objects.bulk_create([
+            Recolte(parcelle_id=parcelle[0], type_culture_id=type_culture_id,
+                    date_recolte=date_recolte, quantite=quantite)
+            for parcelle, type_culture_id, date_recolte, quantite in nouvelles
+        ])
+        # bulk_create ne déclenche pas les signaux : cumuls et journal sont mis à jour ici
+        CumulRecolte.objects.ajouter_recoltes(
+            (date_recolte, arrondissement_id, type_culture_id, producteur_id, quantite)
+            for (_, arrondissement_id, producteur_id), type_culture_id, date_recolte, quantite in nouvelles
+        )
+        JournalSynchronisation.objects.enregistrer(
+            JournalSynchronisation.RECOLTE,
+            ((recolte.pk, parcelle[2]) for recolte, (parcelle, _, _, _) in zip(creees, nouvelles)),
+            saisons={recolte.pk: saison_de(recolte.date_recolte) for recolte in creees},
+        )
+        invalider_statistiques_publiques()
+    resultat.creees += len(nouvelles)
+
+
+def importer_recoltes(fichier, taille_lot=TAILLE_LOT, simulation=False, producteur=None):
+    """
+    Importe les récoltes d'un fichier texte CSV déjà ouvert.
+
+    `simulation` valide sans rien écrire ; `producteur` restreint l'import à ses parcelles.
+    """
+    resultat = ResultatImport()
+    debut = fichier.read(4096)
+    fichier.seek(0)
+    try:
+        dialecte = csv.Sniffer().sniff(debut, delimiters=',;')
+    except csv.Error:
+        dialecte = csv.excel
+    lecteur = csv.DictReader(fichier, dialect=dialecte)
+
+    manquantes = set(COLONNES) - set(lecteur.fieldnames or [])
+    if manquantes:
+        resultat.erreurs.append((1, f"Colonnes manquantes : {', '.join(sorted(manquantes))}"))
+        return resultat
+
+    cultures = _carte_cultures()
+    deja_vues = set()
+    lot = []
+    for numero, ligne in enumerate(lecteur, start=2):
+        resultat.lignes_lues += 1
+        lot.append((numero, _normaliser(ligne)))
+        if len(lot) >= taille_lot:
+            _traiter_lot(lot, cultures, resultat, deja_vues, simulation, producteur)
+            lot = []
+    if lot:
+        _traiter_lot(lot, cultures, resultat, deja_vues, simulation, producteur)
+    return resultat
+
+
+def detecter_encodage(binaire):
+    """
+    Premier encodage de ENCODAGES qui décode tout le flux binaire, ou None.
+
+    Le fichier est parcouru par blocs (mémoire constante) puis rembobiné : une
+    erreur de décodage ne peut plus survenir au milieu de l'import.
+    """
+    for encodage in ENCODAGES:
+        binaire.seek(0)
+        decodeur = codecs.getincrementaldecoder(encodage)()
+        try:
+            for bloc in iter(lambda: binaire.read(TAILLE_BLOC_DECODAGE), b''):
+                decodeur.decode(bloc)
+            decodeur.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        binaire.seek(0)
+        return encodage
+    return None
+
+
+def importer_fichier_csv(binaire, taille_lot=TAILLE_LOT, simulation=False, producteur=None):
+    """
+    Importe un fichier CSV ouvert en binaire (fichier déposé ou ouvert avec 'rb').
+
+    Un encodage non reconnu est signalé comme erreur du fichier (ligne 1), sans rien importer.
+    """
+    encodage = detecter_encodage(binaire)
+    if encodage is None:
+        resultat = ResultatImport()
+        resultat.erreurs.append((1, "Encodage du fichier non reconnu : enregistrez-le en UTF-8 ou Windows-1252"))
+        return resultat
+    fichier = io.TextIOWrapper(binaire, encoding=encodage, newline='')
+    try:
+        return importer_recoltes(fichier, taille_lot, simulation, producteur)
+    finally:
+        # Le flux binaire reste à son propriétaire (fichier déposé, with open)
+        fichier.detach()
@@ -0,0 +1,51 @@
+# gestion/management/commands/archiver_recoltes.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from gestion.archives import archiver_saison, chemin_saison, geler_saison, saisons_en_base
+from gestion.saisons import creer_partition, partitions_natives, saison_courante
+
+SAISONS_CHAUDES = 2
+
+
+class Command(BaseCommand):
+    help = (
+        'Range les saisons de récolte closes (à planifier, ex. chaque mois) : partitions de la saison '
+        'suivante (PostgreSQL), déplacement vers l\'archive (SQLite), gel des plus anciennes en fichiers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saisons-chaudes', type=int, default=SAISONS_CHAUDES,
+                            help=f'Saisons gardées dans la table principale, en cours comprise '
+                                 f'(défaut : {SAISONS_CHAUDES})')
+        parser.add_argument('--saisons-en-base', type=int,
+                            help='Saisons gardées en base ; les plus anciennes sont gelées en fichiers '
+                                 '(défaut : aucun gel)')
+
+    def handle(self, *args, **options):
+        chaudes = options['saisons_chaudes']
+        en_base = options['saisons_en_base']
+        if chaudes < 1 or (en_base is not None and en_base < chaudes):
+            raise CommandError('--saisons-chaudes doit valoir au moins 1 et --saisons-en-base au moins autant')
+
+        courante = saison_courante()
+        self.stdout.write(f'🗓️ Saison en cours : {courante}')
+
+        if partitions_natives(connection):
+            with transaction.atomic(), connection.cursor() as curseur:
+                for annee in (courante, courante + 1):
+                    if creer_partition(curseur, annee):
+                        self.stdout.write(f'  🧱 Partition {annee} créée')
+        else:
+            for annee in saisons_en_base():
+                if annee <= courante - chaudes:
+                    nombre = archiver_saison(annee)
+                    self.stdout.write(f'  📦 Saison {annee} : {nombre} récolte(s) déplacée(s) vers l\'archive')
+
+        if en_base is not None:
+            for annee in saisons_en_base():
+                if annee <= courante - en_base:
+                    nombre = geler_saison(annee)
+                    self.stdout.write(f'  🧊 Saison {annee} : {nombre} récolte(s) gelée(s) dans {chemin_saison(annee)}')
+
+        self.stdout.write(self.style.SUCCESS('✅ Archivage des saisons terminé'))
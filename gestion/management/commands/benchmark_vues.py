@@ -0,0 +1,204 @@
+# gestion/management/commands/benchmark_vues.py
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import StringIO
+
+import django
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from gestion import urls as gestion_urls
+from gestion.cache import cache_isole
+from gestion.models import Entrepot, Producteur, Recolte
+from gestion.requetes_sql import CompteurRequetes
+
+# Rôle avec lequel chaque URL est appelée (None = visiteur anonyme)
+ROLES = {
+    'accueil': None,
+    'dashboard_producteur': 'producteur',
+    'mes_recoltes': 'producteur',
+    'ajouter_recolte': 'producteur',
+    'dashboard_gestionnaire': 'gestionnaire',
+    'gestion_stocks': 'gestionnaire',
+    'modifier_stock': 'gestionnaire',
+    'toutes_recoltes': 'gestionnaire',
+    'importer_recoltes': 'gestionnaire',
+    'exporter_recoltes': 'gestionnaire',
+    'exporter_stocks': 'gestionnaire',
+    'flux_synchronisation': 'gestionnaire',
+    'recherche_rapide': 'gestionnaire',
+    'health_check': None,
+}
+
+# Paramètres de requête nécessaires pour que la vue fasse son vrai travail
+PARAMETRES = {
+    'recherche_rapide': '?q=producteur',
+}
+
+# Vues exclues : elles modifient la session ou les données et faussent les mesures suivantes
+EXCLUES = {'logout', 'synchroniser_recoltes'}
+
+
+def centile(valeurs, rang):
+    """Centile par interpolation linéaire (valeurs déjà triées)"""
+    if len(valeurs) == 1:
+        return valeurs[0]
+    position = (len(valeurs) - 1) * rang / 100
+    bas = int(position)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (position - bas)
+
+
+class Command(BaseCommand):
+    help = 'Mesure latence (p50/p95/p99), requêtes SQL et mémoire de chaque vue à plusieurs volumes de données'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--echelles', default='100,1000',
+                            help='Nombres de producteurs synthétiques à atteindre, séparés par des virgules')
+        parser.add_argument('--parcelles-par-producteur', type=int, default=2)
+        parser.add_argument('--recoltes-par-parcelle', type=int, default=10)
+        parser.add_argument('--iterations', type=int, default=20, help='Requêtes mesurées par vue')
+        parser.add_argument('--sortie', default='benchmark_vues.json', help='Fichier JSON de résultats')
+        parser.add_argument('--base-existante', action='store_true',
+                            help='Mesure la base configurée telle quelle, sans base de test ni peuplement')
+
+    def handle(self, *args, **options):
+        try:
+            echelles = sorted({int(e) for e in options['echelles'].split(',') if e.strip()})
+        except ValueError:
+            raise CommandError('--echelles attend des entiers séparés par des virgules')
+
+        resultats = {
+            'date': datetime.now(timezone.utc).isoformat(),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'base': connection.vendor,
+            'iterations': options['iterations'],
+            'echelles': [],
+        }
+
+        setup_test_environment()
+        try:
+            if options['base_existante']:
+                resultats['echelles'].append(self.mesurer_echelle(options))
+            else:
+                # Cache temporaire : les entrées de la base de test n'atteignent pas celui du serveur
+                with cache_isole():
+                    nom_base = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                    self.stdout.write(f'🧪 Base de test : {nom_base}')
+                    try:
+                        call_command('setup_groups', stdout=StringIO())
+                        deja = 0
+                        for echelle in echelles:
+                            self.stdout.write(self.style.WARNING(
+                                f'\n📈 Peuplement jusqu\'à {echelle} producteurs...'
+                            ))
+                            call_command(
+                                'populate_db', stdout=StringIO(),
+                                producteurs=echelle - deja,
+                                parcelles_par_producteur=options['parcelles_par_producteur'],
+                                recoltes_par_parcelle=options['recoltes_par_parcelle'],
+                                entrepots=max(1, (echelle - deja) // 100),
+                            )
+                            deja = echelle
+                            resultats['echelles'].append(self.mesurer_echelle(options))
+                    finally:
+                        connection.creation.destroy_test_db(nom_base, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+        with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+            json.dump(resultats, fichier, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Résultats écrits dans {options["sortie"]}'))
+
+    def clients(self):
+        producteur = Producteur.objects.select_related('user').filter(user__username='jkouassi').first() \
+            or Producteur.objects.select_related('user').first()
+        gestionnaire = User.objects.filter(groups__name='Gestionnaire').first()
+        if producteur is None or gestionnaire is None:
+            raise CommandError('Il faut au moins un producteur et un gestionnaire (lancez populate_db)')
+
+        clients = {None: Client(), 'producteur': Client(), 'gestionnaire': Client()}
+        clients['producteur'].force_login(producteur.user)
+        clients['gestionnaire'].force_login(gestionnaire)
+        return clients
+
+    def urls(self):
+        entrepot = Entrepot.objects.order_by('pk').first()
+        for motif in gestion_urls.urlpatterns:
+            if motif.name in EXCLUES:
+                continue
+            if motif.name not in ROLES:
+                self.stdout.write(self.style.WARNING(f'⚠️ URL "{motif.name}" sans rôle connu : ignorée'))
+                continue
+            if motif.name == 'modifier_stock':
+                if entrepot is None:
+                    continue
+                yield motif.name, reverse(motif.name, args=[entrepot.pk])
+            else:
+                yield motif.name, reverse(motif.name) + PARAMETRES.get(motif.name, '')
+
+    def appeler(self, client, url):
+        reponse = client.get(url)
+        if hasattr(reponse, 'streaming_content'):
+            for _ in reponse.streaming_content:
+                pass
+        return reponse
+
+    def mesurer_echelle(self, options):
+        echelle = {
+            'producteurs': Producteur.objects.count(),
+            'recoltes': Recolte.objects.count(),
+            'entrepots': Entrepot.objects.count(),
+            'vues': {},
+        }
+        self.stdout.write(
+            f"📊 {echelle['producteurs']} producteurs, {echelle['recoltes']} récoltes, "
+            f"{echelle['entrepots']} entrepôts"
+        )
+        clients = self.clients()
+
+        for nom, url in self.urls():
+            client = clients[ROLES[nom]]
+            self.appeler(client, url)  # échauffement (caches, connexions)
+
+            durees = []
+            requetes = 0
+            for _ in range(options['iterations']):
+                with CompteurRequetes() as compteur:
+                    debut = time.perf_counter()
+                    reponse = self.appeler(client, url)
+                    durees.append((time.perf_counter() - debut) * 1000)
+                requetes = max(requetes, compteur.nombre)
+
+            # Passe séparée pour la mémoire : tracemalloc ralentit l'exécution
+            tracemalloc.start()
+            self.appeler(client, url)
+            _, pic = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            durees.sort()
+            echelle['vues'][nom] = {
+                'statut': reponse.status_code,
+                'p50_ms': round(centile(durees, 50), 2),
+                'p95_ms': round(centile(durees, 95), 2),
+                'p99_ms': round(centile(durees, 99), 2),
+                'moyenne_ms': round(statistics.fmean(durees), 2),
+                'requetes_sql': requetes,
+                'memoire_pic_ko': round(pic / 1024, 1),
+            }
+            mesure = echelle['vues'][nom]
+            self.stdout.write(
+                f"  {nom:<24} p50 {mesure['p50_ms']:>8.2f} ms  p95 {mesure['p95_ms']:>8.2f} ms  "
+                f"p99 {mesure['p99_ms']:>8.2f} ms  {requetes:>3} req  {mesure['memoire_pic_ko']:>9.1f} Ko"
+            )
+        return echelle
@@ -0,0 +1,30 @@
+# gestion/management/commands/calculer_previsions.py
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.models import PrevisionRecolte
+from gestion.previsions import HISTORIQUE_TRIMESTRES, HORIZON_TRIMESTRES, rafraichir_previsions
+
+
+class Command(BaseCommand):
+    help = 'Recalcule les prévisions de récolte par parcelle et culture (à planifier, ex. chaque nuit)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--historique', type=int, default=HISTORIQUE_TRIMESTRES,
+                            help=f'Trimestres complets d\'historique utilisés (défaut : {HISTORIQUE_TRIMESTRES})')
+        parser.add_argument('--horizon', type=int, default=HORIZON_TRIMESTRES,
+                            help=f'Trimestres prévus, en cours compris (défaut : {HORIZON_TRIMESTRES})')
+
+    def handle(self, *args, **options):
+        if options['historique'] < 2 or options['horizon'] < 1:
+            raise CommandError('--historique doit valoir au moins 2 et --horizon au moins 1')
+
+        self.stdout.write('🔮 Calcul des prévisions de récolte...')
+        resultat = rafraichir_previsions(historique=options['historique'], horizon=options['horizon'])
+        for etape, duree in resultat['durees'].items():
+            self.stdout.write(f'  ⏱️ {etape:<15} {duree:.2f}s')
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {resultat['previsions']} prévision(s) pour {resultat['series']} couple(s) parcelle/culture"
+        ))
+
+        for ligne in PrevisionRecolte.objects.par_culture():
+            self.stdout.write(f"  🌾 {ligne['periode']:%m/%Y} {ligne['type_culture__nom']:<10} {ligne['total']:>14,.0f} kg")
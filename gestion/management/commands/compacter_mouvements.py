@@ -0,0 +1,28 @@
+# gestion/management/commands/compacter_mouvements.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from gestion.models import MouvementStock
+
+
+class Command(BaseCommand):
+    help = 'Replie les mouvements de stock anciens dans les arrêtés de stock (à planifier régulièrement)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jours',
+            type=int,
+            default=90,
+            help='Conserve le détail des mouvements des N derniers jours (défaut : 90)',
+        )
+
+    def handle(self, *args, **options):
+        if options['jours'] < 0:
+            raise CommandError('--jours doit être positif')
+        avant = timezone.now() - timedelta(days=options['jours'])
+        compactes = MouvementStock.objects.compacter(avant)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {compactes} mouvement(s) antérieur(s) au {avant:%d/%m/%Y} replié(s) dans les arrêtés'
+        ))
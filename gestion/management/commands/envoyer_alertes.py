@@ -0,0 +1,15 @@
+# gestion/management/commands/envoyer_alertes.py
+from django.core.management.base import BaseCommand
+
+from gestion.alertes import envoyer_recapitulatifs
+
+
+class Command(BaseCommand):
+    help = 'Envoie à chaque gestionnaire le récapitulatif des alertes de stock bas (à planifier, ex. toutes les heures)'
+
+    def handle(self, *args, **kwargs):
+        courriels, alertes = envoyer_recapitulatifs()
+        if not alertes:
+            self.stdout.write('📭 Aucune alerte en attente de notification')
+            return
+        self.stdout.write(self.style.SUCCESS(f'📧 {courriels} récapitulatif(s) envoyé(s) pour {alertes} alerte(s)'))
@@ -0,0 +1,42 @@
+# gestion/management/commands/exporter_donnees.py
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from gestion.exports import FORMATS, generer_export, lignes_recoltes, lignes_stocks
+
+
+class Command(BaseCommand):
+    help = 'Exporte en flux les récoltes ou les stocks (CSV ou JSON lines)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('donnees', choices=['recoltes', 'stocks'])
+        parser.add_argument('--format', dest='format_export', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--type-culture', dest='type_culture', help='Code de culture (MAIS, SOJA, ANANAS)')
+        parser.add_argument('--arrondissement', help="Identifiant de l'arrondissement")
+        parser.add_argument('--date-debut', dest='date_debut', help='Date de début incluse (AAAA-MM-JJ)')
+        parser.add_argument('--date-fin', dest='date_fin', help='Date de fin incluse (AAAA-MM-JJ)')
+        parser.add_argument('--sortie', help='Fichier de sortie (sortie standard par défaut)')
+
+    def handle(self, *args, **options):
+        source = lignes_recoltes if options['donnees'] == 'recoltes' else lignes_stocks
+        colonnes, lignes = source(options)
+
+        if options['sortie']:
+            try:
+                fichier = open(options['sortie'], 'w', encoding='utf-8', newline='')
+            except OSError as e:
+                raise CommandError(f"Impossible d'ouvrir {options['sortie']} : {e}")
+        else:
+            fichier = sys.stdout
+
+        nombre = -1 if options['format_export'] == 'csv' else 0  # l'en-tête CSV n'est pas une ligne
+        try:
+            for morceau in generer_export(colonnes, lignes, options['format_export']):
+                fichier.write(morceau)
+                nombre += 1
+        finally:
+            if fichier is not sys.stdout:
+                fichier.close()
+
+        if options['sortie']:
+            self.stdout.write(self.style.SUCCESS(f"✅ {nombre} ligne(s) exportée(s) vers {options['sortie']}"))
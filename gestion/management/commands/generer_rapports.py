@@ -0,0 +1,65 @@
+# gestion/management/commands/generer_rapports.py
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion.rapports import ECHEC, dossier_saison, generer_rapports
+from gestion.referentiel import referentiel
+from gestion.saisons import saison_courante
+
+
+class Command(BaseCommand):
+    help = 'Génère les rapports de fin de saison, un par commune (HTML et CSV), en parallèle et avec reprise'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saison', type=int, help='Année de la saison (défaut : saison en cours)')
+        parser.add_argument('--sortie', default=settings.RAPPORTS_DIR,
+                            help=f'Dossier des rapports (défaut : {settings.RAPPORTS_DIR})')
+        parser.add_argument('--processus', type=int, default=os.cpu_count() or 1,
+                            help='Processus en parallèle (défaut : nombre de cœurs)')
+        parser.add_argument('--commune', action='append', dest='communes', metavar='CODE',
+                            help='Code de commune à traiter (option répétable ; défaut : toutes)')
+        parser.add_argument('--tout-refaire', action='store_true',
+                            help='Régénère aussi les rapports déjà terminés lors d\'une exécution précédente')
+
+    def handle(self, *args, **options):
+        saison = options['saison'] or saison_courante()
+        if options['processus'] < 1:
+            raise CommandError('--processus doit valoir au moins 1')
+        communes = None
+        if options['communes']:
+            par_code = {commune.code: commune.pk for commune in referentiel.communes}
+            inconnues = set(options['communes']) - set(par_code)
+            if inconnues:
+                raise CommandError(f"Commune(s) inconnue(s) : {', '.join(sorted(inconnues))}")
+            communes = [par_code[code] for code in options['communes']]
+
+        dossier = dossier_saison(options['sortie'], saison)
+        self.stdout.write(f'📊 Rapports de la saison {saison} dans {dossier} ({options["processus"]} processus)')
+        debut = time.perf_counter()
+
+        def progression(fait, total, commune_id, entree):
+            if entree['statut'] == ECHEC:
+                self.stdout.write(self.style.ERROR(f"  ❌ [{fait}/{total}] {entree['nom']} : {entree['erreur']}"))
+            else:
+                self.stdout.write(
+                    f"  ✅ [{fait}/{total}] {entree['nom']} : {float(entree['quantite_kg']):,.0f} kg "
+                    f"({entree['duree']:.2f}s)"
+                )
+
+        etat = generer_rapports(
+            saison, options['sortie'], processus=options['processus'],
+            reprendre=not options['tout_refaire'], communes=communes, progression=progression,
+        )
+        echecs = [entree['nom'] for entree in etat['communes'].values() if entree['statut'] == ECHEC]
+        if echecs:
+            raise CommandError(
+                f"{len(echecs)} commune(s) en échec ({', '.join(sorted(echecs))}) : "
+                f"relancer la commande pour ne refaire que celles-ci"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(etat['communes'])} rapport(s) à jour en {time.perf_counter() - debut:.1f}s : "
+            f"{dossier / 'index.html'}"
+        ))
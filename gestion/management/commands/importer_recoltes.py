@@ -0,0 +1,32 @@
+# gestion/management/commands/importer_recoltes.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from gestion.imports import COLONNES, TAILLE_LOT, importer_fichier_csv
+
+
+class Command(BaseCommand):
+    help = f"Importe des récoltes depuis un fichier CSV (colonnes : {', '.join(COLONNES)})"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help='Chemin du fichier CSV (UTF-8 ou Windows-1252)')
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT, help='Lignes validées et insérées par lot')
+        parser.add_argument('--simulation', action='store_true', help='Valide le fichier sans rien enregistrer')
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        try:
+            with open(options['fichier'], 'rb') as fichier:
+                resultat = importer_fichier_csv(fichier, options['taille_lot'], options['simulation'])
+        except OSError as e:
+            raise CommandError(f"Impossible de lire {options['fichier']} : {e}")
+        duree = time.perf_counter() - debut
+
+        for numero, message in resultat.erreurs:
+            self.stdout.write(self.style.ERROR(f'  ❌ Ligne {numero} : {message}'))
+
+        verbe = 'à créer' if options['simulation'] else 'créée(s)'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {resultat.lignes_lues} ligne(s) lue(s) en {duree:.1f}s : {resultat.creees} récolte(s) {verbe}, '
+            f'{resultat.doublons} doublon(s) ignoré(s), {resultat.nombre_erreurs} erreur(s)'
+        ))
@@ -0,0 +1,16 @@
+# gestion/management/commands/indexer_recherche.py
+import time
+
+from django.core.management.base import BaseCommand
+from gestion.models import EntreeRecherche
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche des producteurs, parcelles et entrepôts (après un import massif)"
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('🔎 Indexation des producteurs, parcelles et entrepôts...')
+        debut = time.perf_counter()
+        nombre = EntreeRecherche.objects.reconstruire()
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(f'✅ {nombre} entrée(s) indexée(s) en {duree:.1f}s'))
@@ -0,0 +1,19 @@
+# gestion/management/commands/indexer_spatial.py
+import time
+
+from django.core.management.base import BaseCommand
+from gestion.models import Entrepot, Parcelle
+
+
+class Command(BaseCommand):
+    help = "Recalcule les cellules de la grille spatiale (après un import massif ou un changement de TAILLE_CELLULE)"
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('🗺️ Indexation spatiale des parcelles et entrepôts...')
+        debut = time.perf_counter()
+        parcelles = Parcelle.objects.indexer()
+        entrepots = Entrepot.objects.indexer()
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {parcelles} parcelle(s) et {entrepots} entrepôt(s) réindexé(s) en {duree:.1f}s'
+        ))
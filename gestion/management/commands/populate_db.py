@@ -1,17 +1,38 @@
 from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.utils import timezone
 from gestion.models import (
     Commune, Arrondissement, Producteur, Parcelle,
-    TypeCulture, Recolte, Entrepot, Stock
+    TypeCulture, Recolte, Entrepot, Stock, CumulRecolte, JournalSynchronisation, ArreteStock, EntreeRecherche
 )
+from gestion.spatial import cellule_de
+from gestion.statistiques import invalider_statistiques_publiques
 from datetime import date, timedelta
 from decimal import Decimal
 import random
+import time
 
 class Command(BaseCommand):
     help = 'Remplit la base de données avec des données de test réalistes'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--producteurs', type=int, default=0,
+                            help='Nombre de producteurs synthétiques à générer en plus des données de démonstration')
+        parser.add_argument('--parcelles-par-producteur', type=int, default=2)
+        parser.add_argument('--recoltes-par-parcelle', type=int, default=10)
+        parser.add_argument('--entrepots', type=int, default=0, help="Nombre d'entrepôts synthétiques")
+        parser.add_argument('--graine', type=int, default=2026, help='Graine aléatoire (jeu de données reproductible)')
+        parser.add_argument('--taille-lot', type=int, default=10000, help='Lignes par bulk_create / transaction')
+
+    def handle(self, *args, **options):
+        random.seed(options['graine'])
+        self.peupler_demo()
+        if options['producteurs'] or options['entrepots']:
+            self.generer_volume(options)
+
+    def peupler_demo(self):
         self.stdout.write(self.style.SUCCESS('🚀 Début du peuplement de la base de données...'))
         
         # 1. CRÉER LES COMMUNES
@@ -204,20 +225,22 @@ class Command(BaseCommand):
         # 9. CRÉER DES ENTREPÔTS
         self.stdout.write('🏭 Création des entrepôts...')
         entrepots_data = [
-            ('Entrepôt Central Cotonou', arrondissements['Akpakpa'], 15000, 3000),
-            ('Dépôt Porto-Novo', arrondissements['Vedoko'], 10000, 2000),
-            ('Stockage Parakou', arrondissements['Banikanni'], 12000, 2500),
+            ('Entrepôt Central Cotonou', arrondissements['Akpakpa'], 15000, 3000, 6.3654, 2.4183),
+            ('Dépôt Porto-Novo', arrondissements['Vedoko'], 10000, 2000, 6.4969, 2.6289),
+            ('Stockage Parakou', arrondissements['Banikanni'], 12000, 2500, 9.3372, 2.6303),
         ]
         
         entrepots = []
-        for nom, arr, capacite, seuil in entrepots_data:
+        for nom, arr, capacite, seuil, lat, lon in entrepots_data:
             entrepot, created = Entrepot.objects.get_or_create(
                 nom=nom,
                 defaults={
                     'arrondissement': arr,
                     'capacite_max': Decimal(str(capacite)),
                     'seuil_alerte': Decimal(str(seuil)),
-                    'gestionnaire': user_gest
+                    'gestionnaire': user_gest,
+                    'latitude': Decimal(str(lat)),
+                    'longitude': Decimal(str(lon))
                 }
             )
             entrepots.append(entrepot)
@@ -268,4 +291,149 @@ class Command(BaseCommand):
         self.stdout.write('   GESTIONNAIRE :')
         self.stdout.write('      • gestionnaire1 / gestionnaire123')
         
-        self.stdout.write(self.style.SUCCESS('\n🎉 Vous pouvez maintenant vous connecter !'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('\n🎉 Vous pouvez maintenant vous connecter !'))
+
+    # ============================================
+    # GÉNÉRATION DE VOLUME (tests de charge)
+    # ============================================
+
+    def _inserer_par_lots(self, modele, objets, taille_lot):
+        """bulk_create par lots, une transaction par lot ; retourne les objets insérés (avec pk)"""
+        inseres = []
+        lot = []
+        for objet in objets:
+            lot.append(objet)
+            if len(lot) >= taille_lot:
+                with transaction.atomic():
+                    inseres.extend(modele.objects.bulk_create(lot))
+                lot = []
+        if lot:
+            with transaction.atomic():
+                inseres.extend(modele.objects.bulk_create(lot))
+        return inseres
+
+    def _chrono(self, libelle, debut, nombre):
+        duree = max(time.perf_counter() - debut, 1e-6)
+        self.stdout.write(f'  ✅ {nombre} {libelle} en {duree:.1f}s ({nombre / duree:,.0f} lignes/s)')
+
+    def generer_volume(self, options):
+        """Jeu de données synthétique à l'échelle d'une saison, inséré en bulk_create"""
+        aleatoire = random.Random(options['graine'])
+        taille_lot = options['taille_lot']
+        self.stdout.write(self.style.WARNING('\n📈 Génération du volume synthétique...'))
+
+        arrondissements = list(Arrondissement.objects.values_list('id', flat=True))
+        cultures = list(TypeCulture.objects.values_list('id', flat=True))
+        groupe_producteur = Group.objects.get(name='Producteur')
+        # Un seul hachage pour tous les comptes synthétiques (PBKDF2 coûte ~100 ms par appel)
+        mot_de_passe = make_password('producteur123')
+        # Reprise après un lancement précédent : numérotation à la suite des comptes existants
+        depart = User.objects.filter(username__startswith='synth').count()
+        debut_total = time.perf_counter()
+
+        debut = time.perf_counter()
+        users = self._inserer_par_lots(User, (
+            User(username=f'synth{depart + i:07d}', first_name='Producteur', last_name=f'{depart + i}',
+                 email=f'synth{depart + i}@agritech.bj', password=mot_de_passe)
+            for i in range(options['producteurs'])
+        ), taille_lot)
+        self._inserer_par_lots(User.groups.through, (
+            User.groups.through(user_id=user.pk, group_id=groupe_producteur.pk) for user in users
+        ), taille_lot)
+        self._chrono('utilisateurs', debut, len(users))
+
+        debut = time.perf_counter()
+        producteurs = self._inserer_par_lots(Producteur, (
+            Producteur(user_id=user.pk, telephone=f'9{aleatoire.randrange(10 ** 7):07d}',
+                       arrondissement_id=aleatoire.choice(arrondissements), actif=aleatoire.random() > 0.05)
+            for user in users
+        ), taille_lot)
+        self._chrono('producteurs', debut, len(producteurs))
+
+        debut = time.perf_counter()
+        def parcelle_synthetique(producteur, numero):
+            latitude = Decimal(f'{aleatoire.uniform(6.2, 12.4):.6f}')
+            longitude = Decimal(f'{aleatoire.uniform(0.8, 3.8):.6f}')
+            # bulk_create ne passe pas par save() : la cellule spatiale est calculée ici
+            return Parcelle(producteur_id=producteur.pk, arrondissement_id=producteur.arrondissement_id,
+                            nom=f'Parcelle {numero}',
+                            superficie=Decimal(aleatoire.randint(50, 800)) / 100,
+                            latitude=latitude, longitude=longitude, cellule=cellule_de(latitude, longitude))
+
+        parcelles = self._inserer_par_lots(Parcelle, (
+            parcelle_synthetique(producteur, j + 1)
+            for producteur in producteurs
+            for j in range(options['parcelles_par_producteur'])
+        ), taille_lot)
+        self._chrono('parcelles', debut, len(parcelles))
+
+        debut = time.perf_counter()
+        aujourd_hui = date.today()
+        nombre_recoltes = 0
+        lot = []
+        for parcelle in parcelles:
+            for _ in range(options['recoltes_par_parcelle']):
+                lot.append(Recolte(
+                    parcelle_id=parcelle.pk,
+                    type_culture_id=aleatoire.choice(cultures),
+                    quantite=Decimal(aleatoire.randint(100, 2000)),
+                    date_recolte=aujourd_hui - timedelta(days=aleatoire.randint(1, 730)),
+                ))
+                if len(lot) >= taille_lot:
+                    with transaction.atomic():
+                        Recolte.objects.bulk_create(lot)
+                    nombre_recoltes += len(lot)
+                    lot = []
+        if lot:
+            with transaction.atomic():
+                Recolte.objects.bulk_create(lot)
+            nombre_recoltes += len(lot)
+        self._chrono('récoltes', debut, nombre_recoltes)
+
+        debut = time.perf_counter()
+        depart_entrepots = Entrepot.objects.filter(nom__startswith='Entrepôt synthétique').count()
+        gestionnaire = User.objects.filter(username='gestionnaire1').first()
+
+        def entrepot_synthetique(numero):
+            latitude = Decimal(f'{aleatoire.uniform(6.2, 12.4):.6f}')
+            longitude = Decimal(f'{aleatoire.uniform(0.8, 3.8):.6f}')
+            return Entrepot(nom=f'Entrepôt synthétique {numero}',
+                            arrondissement_id=aleatoire.choice(arrondissements),
+                            capacite_max=Decimal(aleatoire.randint(5, 50) * 1000),
+                            seuil_alerte=Decimal(aleatoire.randint(1, 5) * 1000),
+                            gestionnaire=gestionnaire,
+                            latitude=latitude, longitude=longitude, cellule=cellule_de(latitude, longitude))
+
+        entrepots = self._inserer_par_lots(Entrepot, (
+            entrepot_synthetique(depart_entrepots + i + 1) for i in range(options['entrepots'])
+        ), taille_lot)
+        stocks = self._inserer_par_lots(Stock, (
+            Stock(entrepot_id=entrepot.pk, type_culture_id=culture_id,
+                  quantite=Decimal(aleatoire.randint(0, int(entrepot.capacite_max) // len(cultures))))
+            for entrepot in entrepots
+            for culture_id in cultures
+        ), taille_lot)
+        # Soldes d'ouverture du grand livre des stocks
+        self._inserer_par_lots(ArreteStock, (
+            ArreteStock(entrepot_id=stock.entrepot_id, type_culture_id=stock.type_culture_id,
+                        quantite=stock.quantite, date_arrete=timezone.now())
+            for stock in stocks
+        ), taille_lot)
+        self._chrono('stocks', debut, len(stocks))
+
+        # bulk_create ne déclenche pas les signaux : on recalcule les données dérivées
+        debut = time.perf_counter()
+        Entrepot.objects.filter(pk__in=[e.pk for e in entrepots]).recalculer_stocks()
+        CumulRecolte.objects.reconstruire()
+        JournalSynchronisation.objects.reconstruire()
+        EntreeRecherche.objects.reconstruire()
+        with transaction.atomic():
+            invalider_statistiques_publiques()
+        self._chrono('cumuls reconstruits', debut, CumulRecolte.objects.count())
+
+        total = len(users) + len(producteurs) + len(parcelles) + nombre_recoltes + len(entrepots) + len(stocks)
+        duree = time.perf_counter() - debut_total
+        self.stdout.write(self.style.SUCCESS(
+            f'\n🎉 {total:,} lignes générées en {duree:.1f}s ({total / max(duree, 1e-6):,.0f} lignes/s)'
+        ))
+
@@ -0,0 +1,16 @@
+# gestion/management/commands/reconstruire_cumuls.py
+import time
+
+from django.core.management.base import BaseCommand
+from gestion.models import CumulRecolte
+
+
+class Command(BaseCommand):
+    help = 'Reconstruit les cumuls mensuels de récoltes (après un import massif ou une incohérence)'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('🔄 Reconstruction des cumuls de récoltes...')
+        debut = time.perf_counter()
+        nombre = CumulRecolte.objects.reconstruire()
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(f'✅ {nombre} cellule(s) de cumul reconstruite(s) en {duree:.1f}s'))
@@ -0,0 +1,76 @@
+# gestion/management/commands/verifier_stocks.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from gestion.models import Entrepot, MouvementStock, Stock, TypeCulture
+
+
+class Command(BaseCommand):
+    help = 'Vérifie (et répare avec --reparer) le stock cumulé stocké sur chaque entrepôt, et le grand livre des stocks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reparer',
+            action='store_true',
+            help='Corrige les entrepôts dont le stock cumulé ne correspond pas à la table Stock',
+        )
+
+    def handle(self, *args, **options):
+        # Une seule agrégation groupée pour tous les entrepôts
+        totaux = dict(
+            Stock.objects.order_by().values('entrepot').annotate(
+                total=Sum('quantite')
+            ).values_list('entrepot', 'total')
+        )
+
+        self.verifier_grand_livre()
+
+        ecarts = []
+        for entrepot_id, nom, stock_cumule in Entrepot.objects.values_list('id', 'nom', 'stock_cumule').iterator():
+            attendu = totaux.get(entrepot_id) or 0
+            if stock_cumule != attendu:
+                ecarts.append(entrepot_id)
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️ {nom} : stocké {stock_cumule} kg, réel {attendu} kg'
+                ))
+
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS('✅ Tous les stocks cumulés sont cohérents'))
+            return
+
+        if not options['reparer']:
+            self.stdout.write(self.style.WARNING(
+                f'{len(ecarts)} entrepôt(s) incohérent(s). Relancez avec --reparer pour corriger.'
+            ))
+            return
+
+        with transaction.atomic():
+            Entrepot.objects.filter(pk__in=ecarts).recalculer_stocks()
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(ecarts)} entrepôt(s) réparé(s)'))
+
+    def verifier_grand_livre(self):
+        """Chaque stock doit valoir son arrêté plus les mouvements inscrits depuis (contrôle seul, sans réparation)"""
+        soldes = MouvementStock.objects.soldes_reconstitues()
+        ecarts = 0
+        for nom, culture, entrepot_id, type_culture_id, quantite in Stock.objects.values_list(
+            'entrepot__nom', 'type_culture__nom', 'entrepot_id', 'type_culture_id', 'quantite',
+        ).iterator():
+            attendu = soldes.pop((entrepot_id, type_culture_id), 0)
+            if quantite != attendu:
+                ecarts += 1
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️ {nom} / {culture} : stock {quantite} kg, grand livre {attendu} kg'
+                ))
+        # Restent les soldes sans ligne Stock : ils doivent être nuls (stock supprimé et soldé)
+        orphelins = {cle: solde for cle, solde in soldes.items() if solde}
+        if orphelins:
+            noms = dict(Entrepot.objects.filter(pk__in={e for e, _ in orphelins}).values_list('pk', 'nom'))
+            cultures = dict(TypeCulture.objects.values_list('pk', 'nom'))
+            for (entrepot_id, type_culture_id), solde in orphelins.items():
+                ecarts += 1
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️ {noms.get(entrepot_id, entrepot_id)} / {cultures.get(type_culture_id, type_culture_id)} : '
+                    f'aucun stock, grand livre {solde} kg'
+                ))
+        if not ecarts:
+            self.stdout.write(self.style.SUCCESS('✅ Le grand livre des stocks est cohérent'))
@@ -0,0 +1,89 @@
+import logging
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .requetes_sql import CompteurRequetes
+from .roles import autilisateur_avec_role, utilisateur_avec_role
+
+logger = logging.getLogger('gestion.requetes')
+
+
+class BudgetRequetesMiddleware:
+    """
+    Compte les requêtes SQL de chaque vue et signale les dépassements.
+
+    - plus de BUDGET_REQUETES_PAR_VUE requêtes : avertissement ;
+    - une même forme répétée SEUIL_REQUETES_REPETEES fois ou plus : N+1 probable.
+
+    Le total est renvoyé dans l'en-tête `X-Requetes-SQL`. Les requêtes émises
+    pendant l'itération d'une réponse en flux ne sont pas comptées.
+
+    Synchrone seulement, à dessein : le compteur observe la connexion du thread
+    qui exécute la vue. Sous ASGI, Django le fait tourner dans ce thread (un
+    passage sync/async de plus par requête) et les requêtes lancées en parallèle
+    par executer_en_parallele, sur leurs propres connexions, ne sont pas
+    comptées. Outil de diagnostic, désactivé hors DEBUG (BUDGET_REQUETES).
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budget = getattr(settings, 'BUDGET_REQUETES_PAR_VUE', 30)
+        self.seuil_repetition = getattr(settings, 'SEUIL_REQUETES_REPETEES', 5)
+
+    def __call__(self, request):
+        with CompteurRequetes() as compteur:
+            response = self.get_response(request)
+
+        if compteur.nombre > self.budget:
+            logger.warning(
+                "%s %s : %d requêtes SQL (budget %d)",
+                request.method, request.path, compteur.nombre, self.budget,
+            )
+        for forme, occurrences in compteur.formes_repetees(self.seuil_repetition):
+            logger.warning(
+                "%s %s : N+1 probable, %d× %s",
+                request.method, request.path, occurrences, forme[:300],
+            )
+
+        response['X-Requetes-SQL'] = str(compteur.nombre)
+        return response
+
+
+class RolesMiddleware:
+    """
+    Remplace request.user (et request.auser() des vues async) par l'utilisateur
+    dont le rôle et les permissions viennent du cache (voir roles.py).
+
+    Se place après AuthenticationMiddleware ; l'utilisateur reste chargé à la
+    demande, une page qui ne le lit pas ne fait aucune requête.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Sous ASGI, la chaîne reste async : pas de passage par un thread pour ce middleware
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.installer(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.installer(request)
+        return await self.get_response(request)
+
+    @staticmethod
+    def installer(request):
+        # Rien n'est lu ici : le rôle est résolu au premier accès
+        request.user = SimpleLazyObject(partial(utilisateur_avec_role, request))
+        request.auser = partial(autilisateur_avec_role, request)
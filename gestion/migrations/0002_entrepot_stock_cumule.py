@@ -0,0 +1,46 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:08
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def initialiser_stocks_cumules(apps, schema_editor):
+    Entrepot = apps.get_model('gestion', 'Entrepot')
+    Stock = apps.get_model('gestion', 'Stock')
+    totaux = dict(
+        Stock.objects.values('entrepot').annotate(total=Sum('quantite')).values_list('entrepot', 'total')
+    )
+    for entrepot in Entrepot.objects.all():
+        entrepot.stock_cumule = totaux.get(entrepot.pk) or 0
+        entrepot.taux_occupation = (
+            float(entrepot.stock_cumule) * 100 / float(entrepot.capacite_max)
+            if entrepot.capacite_max > 0 else 0
+        )
+        entrepot.en_alerte = entrepot.stock_cumule < entrepot.seuil_alerte
+        entrepot.save(update_fields=['stock_cumule', 'taux_occupation', 'en_alerte'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entrepot',
+            name='en_alerte',
+            field=models.BooleanField(db_index=True, default=True, editable=False, help_text="Stock sous le seuil d'alerte (maintenu automatiquement)"),
+        ),
+        migrations.AddField(
+            model_name='entrepot',
+            name='stock_cumule',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, help_text='Stock total en kg (maintenu automatiquement)', max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='entrepot',
+            name='taux_occupation',
+            field=models.FloatField(default=0, editable=False, help_text='Taux de remplissage en % (maintenu automatiquement)'),
+        ),
+        migrations.RunPython(initialiser_stocks_cumules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def initialiser_cumuls(apps, schema_editor):
+    Recolte = apps.get_model('gestion', 'Recolte')
+    CumulRecolte = apps.get_model('gestion', 'CumulRecolte')
+    lignes = Recolte.objects.order_by().annotate(periode=TruncMonth('date_recolte')).values(
+        'periode', 'parcelle__arrondissement_id', 'type_culture_id', 'parcelle__producteur_id',
+    ).annotate(total=Sum('quantite'), nombre=Count('id'))
+    CumulRecolte.objects.bulk_create([
+        CumulRecolte(
+            periode=ligne['periode'],
+            arrondissement_id=ligne['parcelle__arrondissement_id'],
+            type_culture_id=ligne['type_culture_id'],
+            producteur_id=ligne['parcelle__producteur_id'],
+            quantite=ligne['total'],
+            nombre_recoltes=ligne['nombre'],
+        )
+        for ligne in lignes
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0002_entrepot_stock_cumule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CumulRecolte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.DateField(help_text='Premier jour du mois')),
+                ('quantite', models.DecimalField(decimal_places=2, default=0, help_text='Quantité cumulée en kg', max_digits=14)),
+                ('nombre_recoltes', models.IntegerField(default=0)),
+                ('arrondissement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cumuls_recoltes', to='gestion.arrondissement')),
+                ('producteur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cumuls_recoltes', to='gestion.producteur')),
+                ('type_culture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cumuls_recoltes', to='gestion.typeculture')),
+            ],
+            options={
+                'verbose_name': 'Cumul de récoltes',
+                'verbose_name_plural': 'Cumuls de récoltes',
+                'ordering': ['-periode'],
+                'unique_together': {('periode', 'arrondissement', 'type_culture', 'producteur')},
+            },
+        ),
+        migrations.RunPython(initialiser_cumuls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0003_cumulrecolte'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cumulrecolte',
+            index=models.Index(fields=['producteur', 'type_culture', 'quantite', 'nombre_recoltes'], name='cumul_producteur_couvrant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producteur',
+            index=models.Index(fields=['actif'], name='producteur_actif_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recolte',
+            index=models.Index(fields=['-date_recolte', '-id'], name='recolte_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recolte',
+            index=models.Index(fields=['parcelle', '-date_recolte', '-id'], name='recolte_parcelle_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recolte',
+            index=models.Index(fields=['type_culture', '-date_recolte', '-id'], name='recolte_culture_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0004_index_requetes_frequentes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recolte',
+            name='cle_idempotence',
+            field=models.CharField(blank=True, editable=False, help_text="Clé générée par l'application mobile : un renvoi du même lot ne crée pas de doublon", max_length=64, null=True, unique=True),
+        ),
+    ]
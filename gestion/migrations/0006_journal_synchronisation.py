@@ -0,0 +1,47 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def initialiser_journal(apps, schema_editor):
+    JournalSynchronisation = apps.get_model('gestion', 'JournalSynchronisation')
+    sources = [
+        ('recolte', apps.get_model('gestion', 'Recolte').objects.values_list('pk', 'parcelle__producteur_id')),
+        ('parcelle', apps.get_model('gestion', 'Parcelle').objects.values_list('pk', 'producteur_id')),
+        ('stock', ((pk, None) for pk in apps.get_model('gestion', 'Stock').objects.values_list('pk', flat=True))),
+    ]
+    for modele, lignes in sources:
+        JournalSynchronisation.objects.bulk_create([
+            JournalSynchronisation(modele=modele, objet_id=objet_id, producteur_id=producteur_id)
+            for objet_id, producteur_id in lignes
+        ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0005_recolte_cle_idempotence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalSynchronisation',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('modele', models.CharField(choices=[('recolte', 'Récolte'), ('parcelle', 'Parcelle'), ('stock', 'Stock')], max_length=20)),
+                ('objet_id', models.BigIntegerField()),
+                ('supprime', models.BooleanField(default=False)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+                ('producteur', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='gestion.producteur')),
+            ],
+            options={
+                'verbose_name': 'Entrée du journal de synchronisation',
+                'verbose_name_plural': 'Journal de synchronisation',
+                'ordering': ['sequence'],
+                'indexes': [models.Index(fields=['producteur', 'sequence'], name='journal_producteur_seq_idx')],
+                'unique_together': {('modele', 'objet_id')},
+            },
+        ),
+        migrations.RunPython(initialiser_journal, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def initialiser_arretes(apps, schema_editor):
+    # Les stocks existants deviennent le solde d'ouverture du grand livre
+    Stock = apps.get_model('gestion', 'Stock')
+    ArreteStock = apps.get_model('gestion', 'ArreteStock')
+    maintenant = timezone.now()
+    ArreteStock.objects.bulk_create([
+        ArreteStock(entrepot_id=entrepot_id, type_culture_id=type_culture_id, quantite=quantite, date_arrete=maintenant)
+        for entrepot_id, type_culture_id, quantite in Stock.objects.values_list('entrepot_id', 'type_culture_id', 'quantite')
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_journal_synchronisation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArreteStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('date_arrete', models.DateTimeField()),
+                ('entrepot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arretes_stock', to='gestion.entrepot')),
+                ('type_culture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arretes_stock', to='gestion.typeculture')),
+            ],
+            options={
+                'verbose_name': 'Arrêté de stock',
+                'verbose_name_plural': 'Arrêtés de stock',
+                'unique_together': {('entrepot', 'type_culture')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MouvementStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_mouvement', models.CharField(choices=[('ENTREE', 'Entrée'), ('SORTIE', 'Sortie'), ('TRANSFERT', 'Transfert'), ('INVENTAIRE', 'Inventaire')], max_length=10)),
+                ('quantite', models.DecimalField(decimal_places=2, help_text="Variation en kg pour l'entrepôt", max_digits=12)),
+                ('commentaire', models.CharField(blank=True, max_length=200)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('auteur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_stock', to=settings.AUTH_USER_MODEL)),
+                ('entrepot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements', to='gestion.entrepot')),
+                ('entrepot_destination', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mouvements_recus', to='gestion.entrepot')),
+                ('type_culture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements', to='gestion.typeculture')),
+            ],
+            options={
+                'verbose_name': 'Mouvement de stock',
+                'verbose_name_plural': 'Mouvements de stock',
+                'ordering': ['-date', '-id'],
+                'indexes': [models.Index(fields=['entrepot', '-date'], name='mouvement_entrepot_date_idx'), models.Index(fields=['date'], name='mouvement_date_idx')],
+            },
+        ),
+        migrations.RunPython(initialiser_arretes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+from gestion.spatial import cellule_de
+
+
+def indexer_parcelles(apps, schema_editor):
+    # Les parcelles existantes reçoivent leur cellule de grille
+    Parcelle = apps.get_model('gestion', 'Parcelle')
+    lot = []
+    for parcelle in Parcelle.objects.exclude(latitude=None).exclude(longitude=None).only(
+        'pk', 'latitude', 'longitude',
+    ).iterator(chunk_size=5000):
+        parcelle.cellule = cellule_de(parcelle.latitude, parcelle.longitude)
+        lot.append(parcelle)
+    Parcelle.objects.bulk_update(lot, ['cellule'], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_mouvementstock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entrepot',
+            name='cellule',
+            field=models.IntegerField(editable=False, help_text='Cellule de la grille spatiale (maintenue automatiquement)', null=True),
+        ),
+        migrations.AddField(
+            model_name='entrepot',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='entrepot',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='parcelle',
+            name='cellule',
+            field=models.IntegerField(editable=False, help_text='Cellule de la grille spatiale (maintenue automatiquement)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='entrepot',
+            index=models.Index(fields=['cellule'], name='entrepot_cellule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parcelle',
+            index=models.Index(fields=['cellule'], name='parcelle_cellule_idx'),
+        ),
+        migrations.RunPython(indexer_parcelles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def ouvrir_alertes_existantes(apps, schema_editor):
+    # Entrepôts déjà sous le seuil : alerte ouverte, sans notification (état antérieur au suivi)
+    Entrepot = apps.get_model('gestion', 'Entrepot')
+    AlerteStock = apps.get_model('gestion', 'AlerteStock')
+    maintenant = timezone.now()
+    AlerteStock.objects.bulk_create([
+        AlerteStock(entrepot_id=pk, seuil=seuil, stock_declenchement=stock, date_declenchement=maintenant,
+                    notification_en_attente=False)
+        for pk, stock, seuil in Entrepot.objects.filter(en_alerte=True).values_list('pk', 'stock_cumule', 'seuil_alerte')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0008_index_spatial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlerteStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seuil', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('stock_declenchement', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date_declenchement', models.DateTimeField(default=django.utils.timezone.now)),
+                ('stock_resolution', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('date_resolution', models.DateTimeField(blank=True, null=True)),
+                ('notification_en_attente', models.BooleanField(default=True)),
+                ('date_notification', models.DateTimeField(blank=True, null=True)),
+                ('entrepot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertes', to='gestion.entrepot')),
+            ],
+            options={
+                'verbose_name': 'Alerte de stock',
+                'verbose_name_plural': 'Alertes de stock',
+                'ordering': ['-date_declenchement'],
+                'indexes': [models.Index(condition=models.Q(('date_resolution__isnull', True)), fields=['-date_declenchement'], name='alerte_ouverte_date_idx'), models.Index(condition=models.Q(('notification_en_attente', True)), fields=['entrepot'], name='alerte_a_notifier_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('date_resolution__isnull', True)), fields=('entrepot',), name='alerte_ouverte_unique')],
+            },
+        ),
+        migrations.RunPython(ouvrir_alertes_existantes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-18 10:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0009_alertes_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrevisionRecolte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periode', models.DateField(help_text='Premier jour du trimestre')),
+                ('quantite', models.DecimalField(decimal_places=2, help_text='Quantité prévue en kg', max_digits=12)),
+                ('date_calcul', models.DateTimeField()),
+                ('arrondissement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='previsions', to='gestion.arrondissement')),
+                ('parcelle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='previsions', to='gestion.parcelle')),
+                ('type_culture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='previsions', to='gestion.typeculture')),
+            ],
+            options={
+                'verbose_name': 'Prévision de récolte',
+                'verbose_name_plural': 'Prévisions de récolte',
+                'ordering': ['periode'],
+                'indexes': [models.Index(fields=['periode', 'arrondissement', 'type_culture', 'quantite'], name='prevision_zone_couvrant_idx')],
+                'unique_together': {('periode', 'parcelle', 'type_culture')},
+            },
+        ),
+    ]
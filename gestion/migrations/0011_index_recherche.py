@@ -0,0 +1,37 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+from gestion.recherche import desinstaller_index, installer_index, remplir_index
+
+
+def indexer_existants(apps, schema_editor):
+    # Producteurs, parcelles et entrepôts déjà en base
+    remplir_index(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_previsions_recolte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntreeRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_objet', models.CharField(choices=[('producteur', 'Producteur'), ('parcelle', 'Parcelle'), ('entrepot', 'Entrepôt')], max_length=20)),
+                ('objet_id', models.BigIntegerField()),
+                ('texte', models.CharField(db_index=True, help_text='Minuscules, sans accents ni ponctuation', max_length=500)),
+                ('libelle', models.CharField(max_length=300)),
+            ],
+            options={
+                'verbose_name': "Entrée de l'index de recherche",
+                'verbose_name_plural': 'Index de recherche',
+                'unique_together': {('objet_id', 'type_objet')},
+            },
+        ),
+        migrations.RunPython(installer_index, desinstaller_index),
+        migrations.RunPython(indexer_existants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from gestion.saisons import departitionner_recoltes, partitionner_recoltes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0011_index_recherche'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecolteArchivee',
+            fields=[
+                ('id', models.BigIntegerField(help_text="Identifiant d'origine de la récolte", primary_key=True, serialize=False)),
+                ('quantite', models.DecimalField(decimal_places=2, help_text='Quantité en kg', max_digits=10)),
+                ('date_recolte', models.DateField()),
+                ('date_enregistrement', models.DateTimeField()),
+                ('cle_idempotence', models.CharField(blank=True, editable=False, max_length=64, null=True)),
+                ('parcelle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recoltes_archivees', to='gestion.parcelle')),
+                ('type_culture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recoltes_archivees', to='gestion.typeculture')),
+            ],
+            options={
+                'verbose_name': 'Récolte archivée',
+                'verbose_name_plural': 'Récoltes archivées',
+                'ordering': ['-date_recolte'],
+                'indexes': [models.Index(fields=['-date_recolte', '-id'], name='archive_date_id_idx'), models.Index(fields=['parcelle', '-date_recolte'], name='archive_parcelle_date_idx')],
+            },
+        ),
+        # PostgreSQL : gestion_recolte partitionnée par saison (aucun effet sous SQLite)
+        migrations.RunPython(partitionner_recoltes, departitionner_recoltes),
+    ]
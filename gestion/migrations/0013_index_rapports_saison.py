@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0012_saisons_recoltes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cumulrecolte',
+            index=models.Index(fields=['arrondissement', 'periode'], name='cumul_arrondissement_mois_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:43
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def initialiser_sequence(apps, schema_editor):
+    # Le compteur reprend après la dernière séquence auto-incrémentée : les jetons des clients restent valables
+    JournalSynchronisation = apps.get_model('gestion', 'JournalSynchronisation')
+    derniere = JournalSynchronisation.objects.aggregate(derniere=Max('sequence'))['derniere'] or 0
+    apps.get_model('gestion', 'SequenceSynchronisation').objects.create(pk=1, valeur=derniere)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0013_index_rapports_saison'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceSynchronisation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valeur', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Séquence du journal de synchronisation',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='journalsynchronisation',
+            unique_together={('modele', 'objet_id', 'producteur')},
+        ),
+        migrations.AlterField(
+            model_name='journalsynchronisation',
+            name='sequence',
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(initialiser_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.10 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+from gestion.saisons import desinstaller_cles, installer_cles
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0014_sequence_synchronisation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleIdempotence',
+            fields=[
+                ('cle', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('recolte_id', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': "Clé d'idempotence",
+                'verbose_name_plural': "Clés d'idempotence",
+            },
+        ),
+        # PostgreSQL : unicité globale de cle_idempotence malgré le partitionnement (aucun effet sous SQLite)
+        migrations.RunPython(installer_cles, desinstaller_cles),
+    ]
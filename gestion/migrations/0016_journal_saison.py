@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 12:01
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import ExtractYear
+
+
+def renseigner_saisons(apps, schema_editor):
+    # Sans changer les séquences : les clients synchronisés ne retéléchargent rien
+    JournalSynchronisation = apps.get_model('gestion', 'JournalSynchronisation')
+    Recolte = apps.get_model('gestion', 'Recolte')
+    JournalSynchronisation.objects.filter(modele='recolte', supprime=False).update(saison=ExtractYear(Subquery(
+        Recolte.objects.filter(pk=OuterRef('objet_id')).values('date_recolte')[:1]
+    )))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0015_cles_idempotence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalsynchronisation',
+            name='saison',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(renseigner_saisons, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.10 on 2026-10-18 12:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0016_journal_saison'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producteur',
+            index=models.Index(fields=['-date_inscription', '-id'], name='producteur_inscription_idx'),
+        ),
+    ]
@@ -1,6 +1,17 @@
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, ExtractYear
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+from .recherche import condition_recherche, documents, remplir_index, termes
+from .spatial import SpatialQuerySet, cellule_de
 
 class Commune(models.Model):
     """Représente une commune au Bénin (ex: Cotonou, Porto-Novo)"""
@@ -44,6 +55,12 @@ class Producteur(models.Model):
         ordering = ['-date_inscription']
         verbose_name = "Producteur"
         verbose_name_plural = "Producteurs"
+        indexes = [
+            # Comptage des producteurs actifs (page d'accueil, dashboard)
+            models.Index(fields=['actif'], name='producteur_actif_idx'),
+            # Ordre de la liste (-date_inscription, -pk) et filtre par année d'inscription de l'admin
+            models.Index(fields=['-date_inscription', '-id'], name='producteur_inscription_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.username}"
@@ -60,15 +77,29 @@ class Parcelle(models.Model):
     superficie = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)], help_text="Superficie en hectares")
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    cellule = models.IntegerField(null=True, editable=False, help_text="Cellule de la grille spatiale (maintenue automatiquement)")
     nom = models.CharField(max_length=100, help_text="Nom ou identifiant de la parcelle")
     
+    objects = SpatialQuerySet.as_manager()
+    
     class Meta:
         ordering = ['producteur', 'nom']
         verbose_name = "Parcelle"
         verbose_name_plural = "Parcelles"
+        indexes = [
+            # Recherches par zone, rayon et plus proches voisins (voir spatial.py)
+            models.Index(fields=['cellule'], name='parcelle_cellule_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nom} - {self.producteur}"
+    
+    def save(self, *args, **kwargs):
+        self.cellule = cellule_de(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'cellule'}
+        super().save(*args, **kwargs)
 
 
 class TypeCulture(models.Model):
@@ -102,11 +133,23 @@ class Recolte(models.Model):
     quantite = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], help_text="Quantité en kg")
     date_recolte = models.DateField()
     date_enregistrement = models.DateTimeField(auto_now_add=True)
+    cle_idempotence = models.CharField(
+        max_length=64, unique=True, null=True, blank=True, editable=False,
+        help_text="Clé générée par l'application mobile : un renvoi du même lot ne crée pas de doublon",
+    )
     
     class Meta:
         ordering = ['-date_recolte']
         verbose_name = "Récolte"
         verbose_name_plural = "Récoltes"
+        indexes = [
+            # Ordre de pagination (-date_recolte, -id) : liste complète et filtre par date
+            models.Index(fields=['-date_recolte', '-id'], name='recolte_date_id_idx'),
+            # Récoltes d'un producteur ou d'un arrondissement (via leurs parcelles), dans l'ordre
+            models.Index(fields=['parcelle', '-date_recolte', '-id'], name='recolte_parcelle_date_idx'),
+            # Filtre par culture dans l'ordre de pagination
+            models.Index(fields=['type_culture', '-date_recolte', '-id'], name='recolte_culture_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.type_culture} - {self.quantite}kg ({self.date_recolte})"
@@ -114,41 +157,314 @@ class Recolte(models.Model):
     @property
     def producteur(self):
         return self.parcelle.producteur
+    
+    def save(self, *args, **kwargs):
+        # Les signaux mettent à jour les cumuls dans la même transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class RecolteArchivee(models.Model):
+    """
+    Récolte d'une saison close, sortie de la table principale (SQLite seulement :
+    PostgreSQL garde chaque saison dans sa partition). Déplacée par la commande
+    archiver_recoltes, sans signaux : les cumuls en tiennent déjà compte.
+    """
+    id = models.BigIntegerField(primary_key=True, help_text="Identifiant d'origine de la récolte")
+    parcelle = models.ForeignKey(Parcelle, on_delete=models.CASCADE, related_name='recoltes_archivees')
+    type_culture = models.ForeignKey(TypeCulture, on_delete=models.CASCADE, related_name='recoltes_archivees')
+    quantite = models.DecimalField(max_digits=10, decimal_places=2, help_text="Quantité en kg")
+    date_recolte = models.DateField()
+    date_enregistrement = models.DateTimeField()
+    cle_idempotence = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['-date_recolte']
+        verbose_name = "Récolte archivée"
+        verbose_name_plural = "Récoltes archivées"
+        indexes = [
+            models.Index(fields=['-date_recolte', '-id'], name='archive_date_id_idx'),
+            models.Index(fields=['parcelle', '-date_recolte'], name='archive_parcelle_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type_culture} - {self.quantite}kg ({self.date_recolte}, archivée)"
+
+
+class CleIdempotence(models.Model):
+    """
+    Clé d'idempotence réservée par une récolte, unique sur toute la table.
+
+    Sous PostgreSQL, gestion_recolte est partitionnée par saison et sa
+    contrainte unique porte sur (cle_idempotence, date_recolte) : des
+    déclencheurs tiennent cette table à jour et refusent une clé déjà prise,
+    quelle que soit la date (voir saisons.installer_cles). Vide sous SQLite,
+    où la contrainte unique de Recolte suffit.
+    """
+    cle = models.CharField(max_length=64, primary_key=True)
+    recolte_id = models.BigIntegerField()
+
+    class Meta:
+        verbose_name = "Clé d'idempotence"
+        verbose_name_plural = "Clés d'idempotence"
+
+    def __str__(self):
+        return self.cle
+
+
+class CumulRecolteQuerySet(models.QuerySet):
+    """Maintenance incrémentale des cumuls de récoltes"""
+
+    def appliquer(self, periode, arrondissement_id, type_culture_id, producteur_id, quantite, nombre):
+        """Ajoute `quantite` kg et `nombre` récoltes à la cellule de cumul (créée au besoin)"""
+        cle = {
+            'periode': periode,
+            'arrondissement_id': arrondissement_id,
+            'type_culture_id': type_culture_id,
+            'producteur_id': producteur_id,
+        }
+        cellule = self.filter(**cle)
+        with transaction.atomic():
+            mis_a_jour = cellule.update(
+                quantite=F('quantite') + quantite,
+                nombre_recoltes=F('nombre_recoltes') + nombre,
+            )
+            if not mis_a_jour and nombre > 0:
+                try:
+                    with transaction.atomic():
+                        self.create(quantite=quantite, nombre_recoltes=nombre, **cle)
+                except IntegrityError:
+                    # Créée entre-temps par une écriture concurrente
+                    cellule.update(
+                        quantite=F('quantite') + quantite,
+                        nombre_recoltes=F('nombre_recoltes') + nombre,
+                    )
+            elif nombre < 0:
+                cellule.filter(nombre_recoltes__lte=0).delete()
+
+    def ajouter_recoltes(self, contributions):
+        """
+        Reporte des récoltes insérées sans signaux (bulk_create).
+
+        `contributions` : itérable de (date_recolte, arrondissement_id, type_culture_id,
+        producteur_id, quantite) ; une mise à jour par cellule touchée.
+        """
+        cellules = defaultdict(lambda: [Decimal(0), 0])
+        for date_recolte, arrondissement_id, type_culture_id, producteur_id, quantite in contributions:
+            cellule = cellules[(self.model.periode_de(date_recolte), arrondissement_id, type_culture_id, producteur_id)]
+            cellule[0] += quantite
+            cellule[1] += 1
+        with transaction.atomic():
+            for (periode, arrondissement_id, type_culture_id, producteur_id), (quantite, nombre) in cellules.items():
+                self.appliquer(periode, arrondissement_id, type_culture_id, producteur_id, quantite, nombre)
+
+    def reconstruire(self, taille_lot=5000):
+        """
+        Recalcule entièrement les cumuls, saison par saison, depuis toutes les
+        récoltes : table principale, archive et saisons gelées (archives.py).
+        """
+        # Import local : archives importe ce module
+        from .archives import contributions_cumuls, saisons_recoltes
+        with transaction.atomic():
+            self.all().delete()
+            cree = 0
+            for annee in saisons_recoltes():
+                lot = [
+                    self.model(
+                        periode=periode,
+                        arrondissement_id=arrondissement_id,
+                        type_culture_id=type_culture_id,
+                        producteur_id=producteur_id,
+                        quantite=quantite,
+                        nombre_recoltes=nombre,
+                    )
+                    for (periode, arrondissement_id, type_culture_id, producteur_id), (quantite, nombre)
+                    in contributions_cumuls(annee).items()
+                ]
+                cree += len(self.bulk_create(lot, batch_size=taille_lot))
+        return cree
+
+
+class CumulRecolte(models.Model):
+    """Cumul mensuel des récoltes par arrondissement, culture et producteur (maintenu automatiquement)"""
+    periode = models.DateField(help_text="Premier jour du mois")
+    arrondissement = models.ForeignKey(Arrondissement, on_delete=models.CASCADE, related_name='cumuls_recoltes')
+    type_culture = models.ForeignKey(TypeCulture, on_delete=models.CASCADE, related_name='cumuls_recoltes')
+    producteur = models.ForeignKey(Producteur, on_delete=models.CASCADE, related_name='cumuls_recoltes')
+    quantite = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Quantité cumulée en kg")
+    nombre_recoltes = models.IntegerField(default=0)
+    
+    objects = CumulRecolteQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['-periode']
+        verbose_name = "Cumul de récoltes"
+        verbose_name_plural = "Cumuls de récoltes"
+        unique_together = ['periode', 'arrondissement', 'type_culture', 'producteur']
+        indexes = [
+            # Index couvrant du dashboard producteur : totaux par culture sans lire la table
+            models.Index(
+                fields=['producteur', 'type_culture', 'quantite', 'nombre_recoltes'],
+                name='cumul_producteur_couvrant_idx',
+            ),
+            # Rapports de saison par commune : arrondissements de la commune, mois de la saison
+            models.Index(fields=['arrondissement', 'periode'], name='cumul_arrondissement_mois_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.periode:%m/%Y} - {self.arrondissement.nom} - {self.type_culture}: {self.quantite}kg"
+    
+    @staticmethod
+    def periode_de(date_recolte):
+        return date_recolte.replace(day=1)
+
+
+class PrevisionRecolteQuerySet(models.QuerySet):
+    """Agrégats des prévisions (calculées par previsions.rafraichir_previsions)"""
+
+    def par_commune(self):
+        return self.values('periode', 'arrondissement__commune__nom', 'type_culture__nom').annotate(
+            total=Sum('quantite'),
+        ).order_by('periode', 'arrondissement__commune__nom', 'type_culture__nom')
+
+    def par_culture(self):
+        return self.values('periode', 'type_culture__nom').annotate(
+            total=Sum('quantite'),
+        ).order_by('periode', 'type_culture__nom')
+
+
+class PrevisionRecolte(models.Model):
+    """Récolte attendue d'une parcelle pour une culture et un trimestre (recalculée en bloc)"""
+    periode = models.DateField(help_text="Premier jour du trimestre")
+    parcelle = models.ForeignKey(Parcelle, on_delete=models.CASCADE, related_name='previsions')
+    # Copie de parcelle.arrondissement : agrégats par commune sans passer par Parcelle
+    arrondissement = models.ForeignKey(Arrondissement, on_delete=models.CASCADE, related_name='previsions')
+    type_culture = models.ForeignKey(TypeCulture, on_delete=models.CASCADE, related_name='previsions')
+    quantite = models.DecimalField(max_digits=12, decimal_places=2, help_text="Quantité prévue en kg")
+    date_calcul = models.DateTimeField()
+    
+    objects = PrevisionRecolteQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['periode']
+        verbose_name = "Prévision de récolte"
+        verbose_name_plural = "Prévisions de récolte"
+        unique_together = ['periode', 'parcelle', 'type_culture']
+        indexes = [
+            # Agrégats par trimestre, commune et culture (capacité des entrepôts)
+            models.Index(fields=['periode', 'arrondissement', 'type_culture', 'quantite'],
+                         name='prevision_zone_couvrant_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.periode:%m/%Y} - {self.parcelle.nom} - {self.type_culture}: {self.quantite}kg prévus"
+
+
+class EntrepotQuerySet(SpatialQuerySet):
+    """Maintenance des indicateurs de stock dénormalisés sur Entrepot, requêtes spatiales"""
+
+    def avec_capacite_libre(self, quantite):
+        """Entrepôts pouvant encore recevoir `quantite` kg"""
+        return self.filter(stock_cumule__lte=F('capacite_max') - quantite)
+
+    def appliquer_variation(self, delta):
+        """Ajoute `delta` kg au stock cumulé puis rafraîchit taux et alerte"""
+        if not delta:
+            return
+        self.update(stock_cumule=F('stock_cumule') + delta)
+        self.rafraichir_indicateurs()
+
+    def rafraichir_indicateurs(self):
+        """Recalcule taux de remplissage et alerte à partir du stock cumulé stocké"""
+        self.update(
+            taux_occupation=Case(
+                When(capacite_max__gt=0, then=F('stock_cumule') * 100.0 / F('capacite_max')),
+                default=Value(0.0),
+                output_field=models.FloatField(),
+            ),
+            en_alerte=Case(
+                When(stock_cumule__lt=F('seuil_alerte'), then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+        )
+        # Seuil franchi dans un sens ou dans l'autre : alerte ouverte ou close
+        AlerteStock.objects.evaluer(self)
+
+    def recalculer_stocks(self):
+        """Reconstruit le stock cumulé depuis la table Stock (réparation)"""
+        totaux = Stock.objects.filter(entrepot=OuterRef('pk')).values('entrepot').annotate(
+            total=Sum('quantite')
+        ).values('total')
+        self.update(stock_cumule=Coalesce(Subquery(totaux), Value(0), output_field=models.DecimalField()))
+        self.rafraichir_indicateurs()
 
 
 class Entrepot(models.Model):
     """Lieu de stockage des récoltes"""
+    # Indicateurs maintenus par les signaux de Stock : ne jamais les écrire depuis un formulaire
+    CHAMPS_DENORMALISES = ('stock_cumule', 'taux_occupation', 'en_alerte')
+
     nom = models.CharField(max_length=100, unique=True)
     arrondissement = models.ForeignKey(Arrondissement, on_delete=models.CASCADE, related_name='entrepots')
     capacite_max = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], help_text="Capacité maximale en kg")
     seuil_alerte = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)], help_text="Seuil d'alerte de stock bas en kg")
     gestionnaire = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='entrepots_geres')
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    cellule = models.IntegerField(null=True, editable=False, help_text="Cellule de la grille spatiale (maintenue automatiquement)")
+    stock_cumule = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, help_text="Stock total en kg (maintenu automatiquement)")
+    taux_occupation = models.FloatField(default=0, editable=False, help_text="Taux de remplissage en % (maintenu automatiquement)")
+    en_alerte = models.BooleanField(default=True, editable=False, db_index=True, help_text="Stock sous le seuil d'alerte (maintenu automatiquement)")
+    
+    objects = EntrepotQuerySet.as_manager()
     
     class Meta:
         ordering = ['nom']
         verbose_name = "Entrepôt"
         verbose_name_plural = "Entrepôts"
+        indexes = [
+            models.Index(fields=['cellule'], name='entrepot_cellule_idx'),
+        ]
     
     def __str__(self):
         return self.nom
     
+    def save(self, *args, **kwargs):
+        self.cellule = cellule_de(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'cellule'}
+        # Ne pas écraser le stock cumulé avec une valeur lue avant une mise à jour concurrente
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CHAMPS_DENORMALISES
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # La capacité ou le seuil ont pu changer
+            Entrepot.objects.filter(pk=self.pk).rafraichir_indicateurs()
+        self.refresh_from_db(fields=self.CHAMPS_DENORMALISES)
+    
     @property
     def stock_actuel(self):
-        """Calcule le stock total actuel dans l'entrepôt"""
-        total = self.stocks.aggregate(total=models.Sum('quantite'))['total']
-        return total or 0
+        """Stock total actuel dans l'entrepôt (valeur stockée, sans requête)"""
+        return self.stock_cumule
     
     @property
     def taux_remplissage(self):
         """Pourcentage de remplissage de l'entrepôt"""
-        if self.capacite_max > 0:
-            return (self.stock_actuel / self.capacite_max) * 100
-        return 0
+        return self.taux_occupation
     
     @property
     def alerte_stock_bas(self):
         """Vérifie si le stock est en dessous du seuil d'alerte"""
-        return self.stock_actuel < self.seuil_alerte
+        return self.en_alerte
 
 
 class Stock(models.Model):
@@ -165,4 +481,617 @@ class Stock(models.Model):
         unique_together = ['entrepot', 'type_culture']
     
     def __str__(self):
-        return f"{self.entrepot.nom} - {self.type_culture}: {self.quantite}kg"
\ No newline at end of file
+        return f"{self.entrepot.nom} - {self.type_culture}: {self.quantite}kg"
+    
+    def save(self, *args, **kwargs):
+        # Les signaux mettent à jour Entrepot.stock_cumule dans la même transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class MouvementStockQuerySet(models.QuerySet):
+    """
+    Écritures du grand livre des stocks.
+
+    Les soldes (Stock.quantite, Entrepot.stock_cumule) sont modifiés par des
+    UPDATE conditionnels avec F() : la base vérifie capacité et stock
+    disponible au moment de l'écriture, sans lecture préalable qu'une
+    transaction concurrente pourrait rendre fausse. L'entrepôt est toujours
+    écrit avant le stock, pour que deux mouvements ne se bloquent pas
+    mutuellement.
+    """
+
+    def _crediter(self, entrepot_id, type_culture_id, quantite):
+        credite = Entrepot.objects.filter(
+            pk=entrepot_id, stock_cumule__lte=F('capacite_max') - quantite,
+        ).update(stock_cumule=F('stock_cumule') + quantite)
+        if not credite:
+            raise ValidationError("Capacité maximale de l'entrepôt dépassée", code='capacite')
+        stock = Stock.objects.filter(entrepot_id=entrepot_id, type_culture_id=type_culture_id)
+        if not stock.update(quantite=F('quantite') + quantite, date_mise_a_jour=timezone.now()):
+            try:
+                with transaction.atomic():
+                    # bulk_create : pas de signal, l'entrepôt est déjà crédité
+                    Stock.objects.bulk_create([
+                        Stock(entrepot_id=entrepot_id, type_culture_id=type_culture_id, quantite=quantite)
+                    ])
+            except IntegrityError:
+                # Créé entre-temps par un mouvement concurrent
+                stock.update(quantite=F('quantite') + quantite, date_mise_a_jour=timezone.now())
+
+    def _debiter(self, entrepot_id, type_culture_id, quantite):
+        Entrepot.objects.filter(pk=entrepot_id).update(stock_cumule=F('stock_cumule') - quantite)
+        debite = Stock.objects.filter(
+            entrepot_id=entrepot_id, type_culture_id=type_culture_id, quantite__gte=quantite,
+        ).update(quantite=F('quantite') - quantite, date_mise_a_jour=timezone.now())
+        if not debite:
+            raise ValidationError("Stock insuffisant pour cette sortie", code='stock_insuffisant')
+
+    def _enregistrer(self, type_mouvement, entrepot, type_culture, quantite, destination=None, auteur=None,
+                     commentaire='', variations=()):
+        """Applique les `variations` (entrepot_id, delta) et inscrit le mouvement, en une transaction"""
+        with transaction.atomic():
+            for entrepot_id, delta in variations:
+                if delta > 0:
+                    self._crediter(entrepot_id, type_culture.pk, delta)
+                elif delta < 0:
+                    self._debiter(entrepot_id, type_culture.pk, -delta)
+            entrepots = [entrepot_id for entrepot_id, _ in variations]
+            Entrepot.objects.filter(pk__in=entrepots).rafraichir_indicateurs()
+            JournalSynchronisation.objects.enregistrer(
+                JournalSynchronisation.STOCK,
+                ((pk, None) for pk in Stock.objects.filter(
+                    entrepot_id__in=entrepots, type_culture=type_culture,
+                ).values_list('pk', flat=True)),
+            )
+            return self.create(
+                type_mouvement=type_mouvement, entrepot=entrepot, entrepot_destination=destination,
+                type_culture=type_culture, quantite=quantite, auteur=auteur, commentaire=commentaire,
+            )
+
+    @staticmethod
+    def _verifier_quantite(quantite):
+        if quantite is None or quantite <= 0:
+            raise ValidationError("La quantité doit être strictement positive", code='quantite')
+
+    def entree(self, entrepot, type_culture, quantite, auteur=None, commentaire=''):
+        """Entrée de marchandise ; refusée si elle dépasse la capacité de l'entrepôt"""
+        self._verifier_quantite(quantite)
+        return self._enregistrer(self.model.ENTREE, entrepot, type_culture, quantite, auteur=auteur,
+                                 commentaire=commentaire, variations=[(entrepot.pk, quantite)])
+
+    def sortie(self, entrepot, type_culture, quantite, auteur=None, commentaire=''):
+        """Sortie de marchandise ; refusée si le stock est insuffisant"""
+        self._verifier_quantite(quantite)
+        return self._enregistrer(self.model.SORTIE, entrepot, type_culture, -quantite, auteur=auteur,
+                                 commentaire=commentaire, variations=[(entrepot.pk, -quantite)])
+
+    def transfert(self, entrepot, destination, type_culture, quantite, auteur=None, commentaire=''):
+        """Sortie de `entrepot` et entrée dans `destination`, tout ou rien"""
+        self._verifier_quantite(quantite)
+        if destination.pk == entrepot.pk:
+            raise ValidationError("L'entrepôt de destination doit être différent", code='destination')
+        # Entrepôts écrits dans l'ordre des clés : deux transferts croisés ne s'interbloquent pas
+        variations = sorted([(entrepot.pk, -quantite), (destination.pk, quantite)])
+        return self._enregistrer(self.model.TRANSFERT, entrepot, type_culture, -quantite, destination=destination,
+                                 auteur=auteur, commentaire=commentaire, variations=variations)
+
+    def inventaire(self, entrepot, type_culture, quantite_comptee, auteur=None, commentaire=''):
+        """Aligne le stock sur la quantité comptée ; l'écart est inscrit au grand livre"""
+        if quantite_comptee is None or quantite_comptee < 0:
+            raise ValidationError("La quantité comptée ne peut pas être négative", code='quantite')
+        with transaction.atomic():
+            # Verrou de l'entrepôt : l'écart calculé reste juste jusqu'à l'écriture
+            Entrepot.objects.select_for_update().filter(pk=entrepot.pk).values_list('pk', flat=True).first()
+            actuelle = Stock.objects.filter(entrepot=entrepot, type_culture=type_culture).values_list(
+                'quantite', flat=True,
+            ).first() or Decimal(0)
+            ecart = quantite_comptee - actuelle
+            return self._enregistrer(self.model.INVENTAIRE, entrepot, type_culture, ecart, auteur=auteur,
+                                     commentaire=commentaire, variations=[(entrepot.pk, ecart)])
+
+    def inventaire_complet(self, entrepot, quantites, auteur=None, commentaire='', attendues=None):
+        """
+        Inventaire de plusieurs cultures d'un entrepôt, tout ou rien.
+
+        `quantites` associe à chaque type de culture compté sa quantité. Les stocks
+        et les mouvements sont écrits par lots (bulk_update / bulk_create) : le
+        nombre de requêtes ne dépend pas du nombre de cultures. Lève
+        ValidationError si le nouveau total augmente et dépasse la capacité, ou
+        si le stock d'une culture ne vaut plus celui de `attendues` (stock vu au
+        comptage, None : aucun stock). Retourne les mouvements d'inventaire
+        inscrits (un par écart non nul).
+        """
+        if any(quantite is None or quantite < 0 for quantite in quantites.values()):
+            raise ValidationError("La quantité comptée ne peut pas être négative", code='quantite')
+        with transaction.atomic():
+            # Verrou de l'entrepôt : les écarts calculés restent justes jusqu'à l'écriture
+            capacite = Entrepot.objects.select_for_update().filter(pk=entrepot.pk).values_list(
+                'capacite_max', flat=True,
+            ).get()
+            stocks = {stock.type_culture_id: stock for stock in Stock.objects.filter(entrepot=entrepot)}
+            changees = [
+                str(type_culture) for type_culture, attendue in (attendues or {}).items()
+                if (stocks[type_culture.pk].quantite if type_culture.pk in stocks else None) != attendue
+            ]
+            if changees:
+                raise ValidationError(
+                    f"Le stock a changé depuis le comptage ({', '.join(changees)}) : vérifiez puis renvoyez",
+                    code='conflit',
+                )
+            maintenant = timezone.now()
+            a_modifier, a_creer, mouvements = [], [], []
+            for type_culture, quantite in quantites.items():
+                stock = stocks.get(type_culture.pk)
+                ecart = quantite - (stock.quantite if stock is not None else 0)
+                if not ecart:
+                    continue
+                if stock is None:
+                    a_creer.append(Stock(entrepot_id=entrepot.pk, type_culture=type_culture, quantite=quantite))
+                else:
+                    stock.quantite = quantite
+                    stock.date_mise_a_jour = maintenant
+                    a_modifier.append(stock)
+                mouvements.append(self.model(
+                    type_mouvement=self.model.INVENTAIRE, entrepot_id=entrepot.pk, type_culture=type_culture,
+                    quantite=ecart, auteur=auteur, commentaire=commentaire,
+                ))
+            variation = sum((mouvement.quantite for mouvement in mouvements), Decimal(0))
+            total = sum((stock.quantite for stock in stocks.values()), Decimal(0)) + sum(
+                (stock.quantite for stock in a_creer), Decimal(0),
+            )
+            if variation > 0 and total > capacite:
+                raise ValidationError("Capacité maximale de l'entrepôt dépassée", code='capacite')
+            # bulk_update / bulk_create : pas de signal, le cumul est reporté en une fois
+            Stock.objects.bulk_update(a_modifier, ['quantite', 'date_mise_a_jour'])
+            Stock.objects.bulk_create(a_creer)
+            Entrepot.objects.filter(pk=entrepot.pk).appliquer_variation(variation)
+            JournalSynchronisation.objects.enregistrer(
+                JournalSynchronisation.STOCK, ((stock.pk, None) for stock in a_modifier + a_creer),
+            )
+            return self.bulk_create(mouvements)
+
+    def compacter(self, avant):
+        """
+        Replie les mouvements antérieurs à `avant` dans ArreteStock puis les supprime.
+
+        Ces mouvements sont anciens et figés : le repli ne dépend pas des
+        écritures en cours. Retourne le nombre de mouvements compactés.
+        """
+        anciens = self.filter(date__lt=avant)
+        variations = defaultdict(Decimal)
+        for entrepot_id, type_culture_id, total in anciens.order_by().values(
+            'entrepot', 'type_culture',
+        ).annotate(total=Sum('quantite')).values_list('entrepot', 'type_culture', 'total'):
+            variations[(entrepot_id, type_culture_id)] += total
+        # Un transfert crédite la destination de l'opposé de sa quantité
+        for entrepot_id, type_culture_id, total in anciens.filter(type_mouvement=self.model.TRANSFERT).order_by().values(
+            'entrepot_destination', 'type_culture',
+        ).annotate(total=Sum('quantite')).values_list('entrepot_destination', 'type_culture', 'total'):
+            variations[(entrepot_id, type_culture_id)] -= total
+
+        with transaction.atomic():
+            arretes = {
+                (arrete.entrepot_id, arrete.type_culture_id): arrete
+                for arrete in ArreteStock.objects.select_for_update().filter(
+                    entrepot_id__in={entrepot_id for entrepot_id, _ in variations},
+                )
+            }
+            a_creer = []
+            for (entrepot_id, type_culture_id), variation in variations.items():
+                arrete = arretes.get((entrepot_id, type_culture_id))
+                if arrete is None:
+                    a_creer.append(ArreteStock(entrepot_id=entrepot_id, type_culture_id=type_culture_id,
+                                               quantite=variation, date_arrete=avant))
+                else:
+                    arrete.quantite += variation
+                    arrete.date_arrete = avant
+            ArreteStock.objects.bulk_update(arretes.values(), ['quantite', 'date_arrete'], batch_size=1000)
+            ArreteStock.objects.bulk_create(a_creer, batch_size=1000)
+            compactes, _ = anciens.delete()
+        return compactes
+
+    def soldes_reconstitues(self):
+        """{(entrepot_id, type_culture_id): solde} = arrêté + mouvements restants (contrôle des soldes)"""
+        soldes = defaultdict(Decimal)
+        for entrepot_id, type_culture_id, quantite in ArreteStock.objects.values_list(
+            'entrepot', 'type_culture', 'quantite',
+        ):
+            soldes[(entrepot_id, type_culture_id)] += quantite
+        for entrepot_id, type_culture_id, total in self.order_by().values('entrepot', 'type_culture').annotate(
+            total=Sum('quantite'),
+        ).values_list('entrepot', 'type_culture', 'total'):
+            soldes[(entrepot_id, type_culture_id)] += total
+        for entrepot_id, type_culture_id, total in self.filter(type_mouvement=self.model.TRANSFERT).order_by().values(
+            'entrepot_destination', 'type_culture',
+        ).annotate(total=Sum('quantite')).values_list('entrepot_destination', 'type_culture', 'total'):
+            soldes[(entrepot_id, type_culture_id)] -= total
+        return soldes
+
+
+class MouvementStock(models.Model):
+    """
+    Grand livre des stocks : chaque entrée, sortie, transfert ou inventaire.
+
+    `quantite` est la variation pour `entrepot` (négative pour une sortie ou un
+    transfert) ; un transfert crédite `entrepot_destination` de l'opposé.
+    """
+    ENTREE = 'ENTREE'
+    SORTIE = 'SORTIE'
+    TRANSFERT = 'TRANSFERT'
+    INVENTAIRE = 'INVENTAIRE'
+    
+    TYPES_CHOICES = [
+        (ENTREE, 'Entrée'),
+        (SORTIE, 'Sortie'),
+        (TRANSFERT, 'Transfert'),
+        (INVENTAIRE, 'Inventaire'),
+    ]
+    
+    type_mouvement = models.CharField(max_length=10, choices=TYPES_CHOICES)
+    entrepot = models.ForeignKey(Entrepot, on_delete=models.CASCADE, related_name='mouvements')
+    entrepot_destination = models.ForeignKey(
+        Entrepot, on_delete=models.CASCADE, null=True, blank=True, related_name='mouvements_recus',
+    )
+    type_culture = models.ForeignKey(TypeCulture, on_delete=models.CASCADE, related_name='mouvements')
+    quantite = models.DecimalField(max_digits=12, decimal_places=2, help_text="Variation en kg pour l'entrepôt")
+    auteur = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='mouvements_stock')
+    commentaire = models.CharField(max_length=200, blank=True)
+    date = models.DateTimeField(auto_now_add=True)
+    
+    objects = MouvementStockQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['-date', '-id']
+        verbose_name = "Mouvement de stock"
+        verbose_name_plural = "Mouvements de stock"
+        indexes = [
+            # Derniers mouvements d'un entrepôt
+            models.Index(fields=['entrepot', '-date'], name='mouvement_entrepot_date_idx'),
+            # Compaction des mouvements anciens
+            models.Index(fields=['date'], name='mouvement_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_type_mouvement_display()} {self.entrepot.nom} - {self.type_culture}: {self.quantite}kg"
+
+
+class ArreteStock(models.Model):
+    """Solde d'un stock à `date_arrete`, dans lequel les mouvements antérieurs ont été repliés"""
+    entrepot = models.ForeignKey(Entrepot, on_delete=models.CASCADE, related_name='arretes_stock')
+    type_culture = models.ForeignKey(TypeCulture, on_delete=models.CASCADE, related_name='arretes_stock')
+    quantite = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    date_arrete = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = "Arrêté de stock"
+        verbose_name_plural = "Arrêtés de stock"
+        unique_together = ['entrepot', 'type_culture']
+    
+    def __str__(self):
+        return f"{self.entrepot.nom} - {self.type_culture}: {self.quantite}kg au {self.date_arrete:%d/%m/%Y}"
+
+
+class AlerteStockQuerySet(models.QuerySet):
+    """Transitions des alertes de stock bas, évaluées à chaque variation de stock"""
+
+    def ouvertes(self):
+        return self.filter(date_resolution__isnull=True)
+
+    def a_notifier(self):
+        return self.filter(notification_en_attente=True)
+
+    def evaluer(self, entrepots):
+        """
+        Ouvre ou clôt l'alerte des `entrepots` (QuerySet) selon leur indicateur en_alerte.
+
+        Deux requêtes de lecture ; une écriture seulement s'il y a transition.
+        Retourne (nombre d'alertes ouvertes, nombre d'alertes closes).
+        """
+        etats = list(entrepots.order_by().values_list('pk', 'en_alerte', 'stock_cumule', 'seuil_alerte'))
+        if not etats:
+            return 0, 0
+        ouvertes = dict(self.ouvertes().filter(
+            entrepot_id__in=[pk for pk, _, _, _ in etats],
+        ).values_list('entrepot_id', 'pk'))
+
+        a_ouvrir = [
+            AlerteStock(entrepot_id=pk, stock_declenchement=stock, seuil=seuil)
+            for pk, en_alerte, stock, seuil in etats
+            if en_alerte and pk not in ouvertes
+        ]
+        a_clore = [ouvertes[pk] for pk, en_alerte, _, _ in etats if not en_alerte and pk in ouvertes]
+
+        if a_ouvrir:
+            # Une seule alerte ouverte par entrepôt (contrainte unique partielle)
+            self.bulk_create(a_ouvrir, ignore_conflicts=True)
+        if a_clore:
+            self.filter(pk__in=a_clore).update(
+                date_resolution=timezone.now(),
+                stock_resolution=Subquery(Entrepot.objects.filter(pk=OuterRef('entrepot_id')).values('stock_cumule')),
+                notification_en_attente=True,
+            )
+        return len(a_ouvrir), len(a_clore)
+
+
+class AlerteStock(models.Model):
+    """
+    Épisode de stock bas d'un entrepôt : déclenché quand le stock passe sous le
+    seuil, résolu quand il repasse au-dessus. Chaque transition est signalée au
+    gestionnaire dans le prochain récapitulatif (commande envoyer_alertes).
+    """
+    entrepot = models.ForeignKey(Entrepot, on_delete=models.CASCADE, related_name='alertes')
+    seuil = models.DecimalField(max_digits=10, decimal_places=2)
+    stock_declenchement = models.DecimalField(max_digits=12, decimal_places=2)
+    date_declenchement = models.DateTimeField(default=timezone.now)
+    stock_resolution = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    date_resolution = models.DateTimeField(null=True, blank=True)
+    notification_en_attente = models.BooleanField(default=True)
+    date_notification = models.DateTimeField(null=True, blank=True)
+    
+    objects = AlerteStockQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['-date_declenchement']
+        verbose_name = "Alerte de stock"
+        verbose_name_plural = "Alertes de stock"
+        constraints = [
+            models.UniqueConstraint(fields=['entrepot'], condition=Q(date_resolution__isnull=True),
+                                    name='alerte_ouverte_unique'),
+        ]
+        indexes = [
+            # Alertes ouvertes, les plus récentes d'abord (tableau de bord)
+            models.Index(fields=['-date_declenchement'], condition=Q(date_resolution__isnull=True),
+                         name='alerte_ouverte_date_idx'),
+            # Transitions pas encore envoyées (récapitulatif)
+            models.Index(fields=['entrepot'], condition=Q(notification_en_attente=True),
+                         name='alerte_a_notifier_idx'),
+        ]
+    
+    def __str__(self):
+        etat = "ouverte" if self.date_resolution is None else f"résolue le {self.date_resolution:%d/%m/%Y}"
+        return f"{self.entrepot.nom} : stock bas depuis le {self.date_declenchement:%d/%m/%Y} ({etat})"
+
+
+class SequenceSynchronisation(models.Model):
+    """
+    Compteur unique (pk=1) des séquences du journal de synchronisation.
+
+    Une séquence est réservée par UPDATE de cette ligne : le verrou pris est
+    tenu jusqu'au COMMIT, si bien qu'une transaction qui réserve après une autre
+    attend qu'elle soit validée. Les séquences deviennent donc visibles dans
+    l'ordre croissant, et un client ne peut pas dépasser avec son jeton une
+    écriture encore en cours (ce que permettait une séquence auto-incrémentée,
+    attribuée à l'INSERT). Les écritures du journal sont ainsi sérialisées entre
+    la première inscription d'une transaction et sa validation.
+    """
+    valeur = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Séquence du journal de synchronisation"
+
+    @classmethod
+    def reserver(cls, nombre):
+        """
+        Réserve `nombre` séquences consécutives et retourne la première. À appeler
+        dans la transaction qui écrit : le verrou dure jusqu'à sa validation.
+        """
+        if not cls.objects.filter(pk=1).update(valeur=F('valeur') + nombre):
+            # Table vidée (flush) : le compteur repart après la dernière séquence inscrite
+            derniere = JournalSynchronisation.objects.aggregate(derniere=Max('sequence'))['derniere'] or 0
+            cls.objects.get_or_create(pk=1, defaults={'valeur': derniere})
+            cls.objects.filter(pk=1).update(valeur=F('valeur') + nombre)
+        return cls.objects.values_list('valeur', flat=True).get(pk=1) - nombre + 1
+
+
+class JournalSynchronisationQuerySet(models.QuerySet):
+    """Tenue du journal des modifications lu par les clients synchronisés"""
+
+    def enregistrer(self, modele, objets, supprime=False, saisons=None):
+        """
+        Inscrit la dernière version de chaque objet : `objets` est un itérable de
+        (objet_id, producteur_id). L'entrée précédente d'un objet est remplacée,
+        si bien que le journal ne grossit qu'avec le nombre d'objets (et de
+        propriétaires successifs). `saisons` donne {objet_id: saison} des récoltes.
+
+        Un objet qui change de producteur laisse une pierre tombale à l'ancien,
+        inscrite avant l'entrée du nouveau : le flux de l'ancien propriétaire
+        lui retire l'objet.
+        """
+        objets = dict(objets)
+        if not objets:
+            return
+        with transaction.atomic():
+            # Séquences réservées d'abord : le verrou du compteur rend la lecture ci-dessous sûre.
+            # Au plus une pierre tombale par objet ; les séquences inutilisées sont sans conséquence.
+            reservees = 2 * len(objets)
+            premiere = SequenceSynchronisation.reserver(reservees)
+            remplacees = []
+            tombes = []
+            for sequence, objet_id, producteur_id, deja_supprime in self.filter(
+                modele=modele, objet_id__in=list(objets),
+            ).values_list('sequence', 'objet_id', 'producteur_id', 'supprime'):
+                if producteur_id == objets[objet_id]:
+                    remplacees.append(sequence)
+                elif not deja_supprime:
+                    remplacees.append(sequence)
+                    tombes.append((objet_id, producteur_id))
+            if remplacees:
+                self.filter(sequence__in=remplacees).delete()
+            saisons = saisons or {}
+            lignes = [(objet_id, producteur_id, True, None) for objet_id, producteur_id in tombes]
+            lignes += [
+                (objet_id, producteur_id, supprime, None if supprime else saisons.get(objet_id))
+                for objet_id, producteur_id in objets.items()
+            ]
+            if len(lignes) > reservees:
+                premiere = SequenceSynchronisation.reserver(len(lignes))
+            self.bulk_create([
+                self.model(sequence=premiere + rang, modele=modele, objet_id=objet_id, producteur_id=producteur_id,
+                           supprime=est_supprime, saison=saison)
+                for rang, (objet_id, producteur_id, est_supprime, saison) in enumerate(lignes)
+            ], batch_size=1000)
+
+    def reconstruire(self, taille_lot=5000):
+        """
+        Inscrit les objets absents du journal ou inscrits sous un autre producteur,
+        et les pierres tombales des objets disparus (après un bulk_create, une
+        migration ou un update() qui contourne les signaux).
+
+        Les entrées déjà à jour gardent leur séquence : les clients synchronisés
+        ne retéléchargent que ce qui a réellement changé. Retourne le nombre
+        d'entrées écrites.
+        """
+        aucune = Value(None, output_field=models.IntegerField())
+        sources = {
+            self.model.RECOLTE: Recolte.objects.values_list(
+                'pk', 'parcelle__producteur_id', ExtractYear('date_recolte'),
+            ),
+            self.model.PARCELLE: Parcelle.objects.values_list('pk', 'producteur_id', aucune),
+            self.model.STOCK: Stock.objects.values_list('pk', aucune, aucune),
+        }
+        ecrites = 0
+        with transaction.atomic():
+            for modele, lignes in sources.items():
+                lot = []
+                for ligne in lignes.order_by('pk').iterator(chunk_size=taille_lot):
+                    lot.append(ligne)
+                    if len(lot) >= taille_lot:
+                        ecrites += self._completer(modele, lot)
+                        lot = []
+                ecrites += self._completer(modele, lot)
+                disparus = list(self.filter(modele=modele, supprime=False).exclude(
+                    objet_id__in=lignes.model.objects.values('pk'),
+                ).values_list('objet_id', 'producteur_id'))
+                self.enregistrer(modele, disparus, supprime=True)
+                ecrites += len(disparus)
+        return ecrites
+
+    def _completer(self, modele, lot):
+        """
+        Inscrit les objets du lot, des triplets (objet_id, producteur_id, saison),
+        dont l'entrée vivante manque ou désigne un autre producteur ou une autre saison
+        """
+        a_jour = set(self.filter(
+            modele=modele, supprime=False, objet_id__in=[objet_id for objet_id, _, _ in lot],
+        ).values_list('objet_id', 'producteur_id', 'saison'))
+        manquants = [ligne for ligne in lot if ligne not in a_jour]
+        self.enregistrer(
+            modele, ((objet_id, producteur_id) for objet_id, producteur_id, _ in manquants),
+            saisons={objet_id: saison for objet_id, _, saison in manquants},
+        )
+        return len(manquants)
+
+
+class JournalSynchronisation(models.Model):
+    """
+    Dernière modification connue de chaque récolte, parcelle et stock.
+
+    `sequence` croît à chaque écriture, dans l'ordre des validations : un
+    client qui a tout lu jusqu'à la séquence N ne redemande que les entrées > N.
+    Une suppression laisse une entrée `supprime=True` (pierre tombale) pour que
+    les clients l'appliquent.
+    """
+    RECOLTE = 'recolte'
+    PARCELLE = 'parcelle'
+    STOCK = 'stock'
+    MODELES_CHOICES = [
+        (RECOLTE, 'Récolte'),
+        (PARCELLE, 'Parcelle'),
+        (STOCK, 'Stock'),
+    ]
+
+    # Attribuée par SequenceSynchronisation, dans l'ordre des validations
+    sequence = models.BigIntegerField(primary_key=True)
+    modele = models.CharField(max_length=20, choices=MODELES_CHOICES)
+    objet_id = models.BigIntegerField()
+    # Propriétaire des récoltes et parcelles, pour le flux d'un producteur (conservé après suppression)
+    producteur = models.ForeignKey(
+        Producteur, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+    )
+    supprime = models.BooleanField(default=False)
+    date_modification = models.DateTimeField(auto_now=True)
+    # Saison d'une récolte vivante : le flux ne la cherche que dans cette plage de dates (une partition)
+    saison = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    objects = JournalSynchronisationQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['sequence']
+        verbose_name = "Entrée du journal de synchronisation"
+        verbose_name_plural = "Journal de synchronisation"
+        # Une entrée par propriétaire : l'ancien garde la pierre tombale d'un objet qui a changé de mains
+        unique_together = ['modele', 'objet_id', 'producteur']
+        indexes = [
+            # Flux d'un producteur : ses entrées après le jeton, dans l'ordre
+            models.Index(fields=['producteur', 'sequence'], name='journal_producteur_seq_idx'),
+        ]
+
+    def __str__(self):
+        action = "suppression" if self.supprime else "modification"
+        return f"#{self.sequence} {action} {self.modele} {self.objet_id}"
+
+
+class EntreeRechercheQuerySet(models.QuerySet):
+    """Tenue et interrogation de l'index de recherche (voir gestion/recherche.py)"""
+
+    def indexer(self, type_objet, objet_ids):
+        """Réécrit les entrées des objets ; celle d'un objet qui n'existe plus est supprimée"""
+        objet_ids = set(objet_ids)
+        if not objet_ids:
+            return
+        with transaction.atomic():
+            self.filter(type_objet=type_objet, objet_id__in=objet_ids).delete()
+            self.bulk_create([
+                self.model(type_objet=type_objet, objet_id=objet_id, texte=texte, libelle=libelle)
+                for objet_id, texte, libelle in documents(apps, type_objet, objet_ids)
+            ])
+
+    def reconstruire(self, taille_lot=5000):
+        """Réindexe tous les objets (après un bulk_create ou un update() qui contourne les signaux)"""
+        with transaction.atomic():
+            return remplir_index(apps, taille_lot)
+
+    def rechercher(self, saisie, type_objet=None):
+        """Entrées dont le texte contient chaque terme de `saisie` (accents et casse ignorés)"""
+        liste_termes = termes(saisie)
+        if not liste_termes:
+            return self.none()
+        entrees = self if type_objet is None else self.filter(type_objet=type_objet)
+        return entrees.filter(condition_recherche(connections[self.db].vendor, liste_termes))
+
+
+class EntreeRecherche(models.Model):
+    """
+    Texte normalisé d'un producteur, d'une parcelle ou d'un entrepôt, indexé par
+    trigrammes pour l'admin et la saisie semi-automatique.
+    """
+    PRODUCTEUR = 'producteur'
+    PARCELLE = 'parcelle'
+    ENTREPOT = 'entrepot'
+    TYPES_CHOICES = [
+        (PRODUCTEUR, 'Producteur'),
+        (PARCELLE, 'Parcelle'),
+        (ENTREPOT, 'Entrepôt'),
+    ]
+
+    type_objet = models.CharField(max_length=20, choices=TYPES_CHOICES)
+    objet_id = models.BigIntegerField()
+    texte = models.CharField(max_length=500, db_index=True, help_text="Minuscules, sans accents ni ponctuation")
+    libelle = models.CharField(max_length=300)
+
+    objects = EntreeRechercheQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Entrée de l'index de recherche"
+        verbose_name_plural = "Index de recherche"
+        # objet_id en tête : un index commençant par type_objet (3 valeurs) attirerait
+        # le planificateur de SQLite au lieu des seules lignes trouvées par FTS5
+        unique_together = ['objet_id', 'type_objet']
+
+    def __str__(self):
+        return f"{self.get_type_objet_display()} : {self.libelle}"
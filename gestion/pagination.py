@@ -0,0 +1,145 @@
+"""
+Pagination par curseur (keyset) sur (-date_recolte, -id).
+
+Contrairement à OFFSET, chaque page se lit par une recherche d'index à partir
+de la dernière ligne affichée : le coût reste constant quelle que soit la
+profondeur de la page ou la taille de la table.
+"""
+import base64
+from datetime import date
+
+from django.db.models import Q
+
+from .saisons import bornes_saison, saison_courante, saison_de
+
+TAILLE_PAGE_DEFAUT = 50
+TAILLE_PAGE_MAX = 200
+
+
+def encoder_curseur(date_recolte, pk):
+    brut = f"{date_recolte.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(brut).decode().rstrip('=')
+
+
+def decoder_curseur(curseur):
+    """Retourne (date_recolte, pk) ou None si le curseur est absent ou invalide"""
+    if not curseur:
+        return None
+    try:
+        rembourrage = '=' * (-len(curseur) % 4)
+        brut = base64.urlsafe_b64decode(curseur + rembourrage).decode()
+        date_texte, pk = brut.split('|')
+        return date.fromisoformat(date_texte), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def lire_taille_page(valeur):
+    try:
+        taille = int(valeur)
+    except (TypeError, ValueError):
+        return TAILLE_PAGE_DEFAUT
+    return max(1, min(taille, TAILLE_PAGE_MAX))
+
+
+class PageCurseur:
+    """Une page de résultats avec les liens vers les pages voisines"""
+
+    def __init__(self, objets, url_precedente=None, url_suivante=None):
+        self.objets = objets
+        self.url_precedente = url_precedente
+        self.url_suivante = url_suivante
+
+    def __iter__(self):
+        return iter(self.objets)
+
+    def __len__(self):
+        return len(self.objets)
+
+    def __bool__(self):
+        return bool(self.objets)
+
+    @property
+    def a_precedente(self):
+        return self.url_precedente is not None
+
+    @property
+    def a_suivante(self):
+        return self.url_suivante is not None
+
+
+def _url(request, **parametres):
+    query = request.GET.copy()
+    for cle in ('apres', 'avant'):
+        query.pop(cle, None)
+    for cle, valeur in parametres.items():
+        query[cle] = valeur
+    return f"?{query.urlencode()}"
+
+
+def charger_recoltes(queryset, ordre, limite, depuis=None):
+    """
+    Lit d'abord les clés de la page sur Recolte seule, puis charge ces lignes
+    avec leurs jointures : le planificateur ne peut pas partir d'une table
+    jointe et trier toute la table des récoltes.
+
+    Chaque requête est bornée sur date_recolte (une partition ou une plage de
+    partitions sous PostgreSQL) : les clés sont d'abord cherchées dans la
+    saison de `depuis` (date du curseur) ou dans la saison en cours, puis, si
+    la page n'est pas pleine, dans les saisons précédentes (suivantes en ordre
+    croissant), en une seule requête.
+    """
+    debut, fin = bornes_saison(saison_courante() if depuis is None else saison_de(depuis))
+    if ordre[0].startswith('-'):
+        saison, suite = Q(date_recolte__gte=debut), Q(date_recolte__lt=debut)
+    else:
+        saison, suite = Q(date_recolte__lt=fin), Q(date_recolte__gte=fin)
+    cles = list(queryset.filter(saison).order_by(*ordre).values_list('pk', 'date_recolte')[:limite])
+    if len(cles) < limite:
+        cles += queryset.filter(suite).order_by(*ordre).values_list('pk', 'date_recolte')[:limite - len(cles)]
+    if not cles:
+        return []
+    dates = [date_recolte for _, date_recolte in cles]
+    return list(queryset.filter(
+        pk__in=[pk for pk, _ in cles], date_recolte__range=(min(dates), max(dates)),
+    ).order_by(*ordre))
+
+
+def paginer_recoltes(request, queryset):
+    """
+    Découpe `queryset` (des Recolte) en pages triées du plus récent au plus ancien.
+
+    Les paramètres GET `apres` / `avant` portent le curseur de la dernière /
+    première ligne de la page courante ; `taille` est borné à TAILLE_PAGE_MAX.
+    """
+    taille = lire_taille_page(request.GET.get('taille'))
+    apres = decoder_curseur(request.GET.get('apres'))
+    avant = None if apres else decoder_curseur(request.GET.get('avant'))
+
+    if avant:
+        # On remonte vers les récoltes plus récentes, puis on remet la page dans l'ordre
+        date_recolte, pk = avant
+        lignes = charger_recoltes(
+            queryset.filter(Q(date_recolte__gt=date_recolte) | Q(date_recolte=date_recolte, pk__gt=pk)),
+            ('date_recolte', 'id'), taille + 1, depuis=date_recolte,
+        )
+        a_precedente = len(lignes) > taille
+        objets = lignes[:taille][::-1]
+        a_suivante = True
+    else:
+        depuis = None
+        if apres:
+            depuis, pk = apres
+            queryset = queryset.filter(Q(date_recolte__lt=depuis) | Q(date_recolte=depuis, pk__lt=pk))
+        lignes = charger_recoltes(queryset, ('-date_recolte', '-id'), taille + 1, depuis=depuis)
+        a_suivante = len(lignes) > taille
+        objets = lignes[:taille]
+        a_precedente = apres is not None
+
+    url_precedente = url_suivante = None
+    if objets and a_precedente:
+        url_precedente = _url(request, avant=encoder_curseur(objets[0].date_recolte, objets[0].pk))
+    if objets and a_suivante:
+        url_suivante = _url(request, apres=encoder_curseur(objets[-1].date_recolte, objets[-1].pk))
+
+    return PageCurseur(objets, url_precedente, url_suivante)
@@ -0,0 +1,49 @@
+"""
+Exécution concurrente de requêtes indépendantes pour les vues async.
+
+L'ORM de Django est synchrone : chaque requête est lancée dans un thread
+(`sync_to_async(thread_sensitive=False)`), avec sa propre connexion, et au
+plus TABLEAU_DE_BORD_PARALLELISME requêtes à la fois. Le temps d'une page
+tend alors vers celui de la requête la plus lente au lieu de leur somme.
+
+Dans une transaction ouverte (tests, ATOMIC_REQUESTS), les autres connexions
+ne verraient pas les écritures non validées : les requêtes s'exécutent alors
+l'une après l'autre sur la connexion de la requête HTTP.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+
+def _dans_un_thread(fonction):
+    """Enveloppe `fonction` pour un thread de l'exécuteur : connexions expirées fermées comme en fin de requête"""
+    def executer():
+        close_old_connections()
+        try:
+            return fonction()
+        finally:
+            close_old_connections()
+    return executer
+
+
+async def executer_en_parallele(taches, limite=None):
+    """
+    Exécute les fonctions synchrones de `taches` ({nom: fonction}).
+
+    Retourne {nom: résultat}. Les fonctions doivent renvoyer des valeurs déjà
+    évaluées (listes, nombres), jamais des QuerySets paresseux.
+    """
+    # Les connexions sont propres à chaque thread : on interroge celle de la requête HTTP
+    if await sync_to_async(lambda: connection.in_atomic_block)():
+        return await sync_to_async(lambda: {nom: fonction() for nom, fonction in taches.items()})()
+
+    semaphore = asyncio.Semaphore(limite or settings.TABLEAU_DE_BORD_PARALLELISME)
+
+    async def lancer(fonction):
+        async with semaphore:
+            return await sync_to_async(_dans_un_thread(fonction), thread_sensitive=False)()
+
+    resultats = await asyncio.gather(*(lancer(fonction) for fonction in taches.values()))
+    return dict(zip(taches, resultats))
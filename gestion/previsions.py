@@ -0,0 +1,165 @@
+"""
+Prévisions de récolte par parcelle et culture, calculées en bloc avec NumPy.
+
+L'historique est lu en une requête groupée (parcelle, culture, trimestre)
+par table de récoltes et rangé dans une matrice séries × trimestres. Toutes les séries
+partagent le même axe des temps, donc la même matrice de régression :
+tendance linéaire + effet de chaque trimestre de l'année. Un seul appel à
+lstsq ajuste toutes les séries d'un coup (une colonne de second membre par
+série), sans boucle Python par parcelle. Les saisons archivées ou gelées
+(archives.py) font partie de l'historique.
+
+Un trimestre sans récolte compte pour 0 kg. Les prévisions négatives sont
+ramenées à 0.
+"""
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .archives import lire_saison, parcelles, saisons_gelees_entre, tables_recoltes
+from .models import PrevisionRecolte
+from .requetes_sql import inserer_lignes
+
+HISTORIQUE_TRIMESTRES = 12
+HORIZON_TRIMESTRES = 2
+CHAMPS_ENREGISTRES = ('periode', 'parcelle', 'arrondissement', 'type_culture', 'quantite', 'date_calcul')
+
+
+def index_trimestre(jour):
+    """Numéro absolu du trimestre de `jour` (année * 4 + trimestre - 1)"""
+    return jour.year * 4 + (jour.month - 1) // 3
+
+
+def debut_trimestre(index):
+    annee, trimestre = divmod(index, 4)
+    return date(annee, trimestre * 3 + 1, 1)
+
+
+def _historique_gele(premier, dernier):
+    """Lignes (parcelle, culture, arrondissement, trimestre, total) des saisons gelées"""
+    debut, fin = debut_trimestre(premier), debut_trimestre(dernier) - timedelta(days=1)
+    morceaux = [lire_saison(annee, debut, fin) for annee in saisons_gelees_entre(debut, fin)]
+    morceaux = [colonnes for colonnes in morceaux if len(colonnes['id'])]
+    if not morceaux:
+        return np.empty((0, 5))
+    colonnes = {nom: np.concatenate([morceau[nom] for morceau in morceaux]) for nom in morceaux[0]}
+    # Arrondissement actuel de la parcelle, comme pour les récoltes en base ; parcelles supprimées écartées
+    localisation = parcelles(colonnes['parcelle_id'], 'arrondissement_id')
+    connues = np.array(sorted(localisation), dtype=np.int64)
+    masque = np.isin(colonnes['parcelle_id'], connues)
+    parcelle = colonnes['parcelle_id'][masque]
+    arrondissement = np.array([localisation[pk][0] for pk in parcelle.tolist()], dtype=np.int64)
+    # Mois depuis 1970 -> numéro absolu du trimestre (année * 4 + trimestre - 1)
+    mois = colonnes['date_recolte'][masque].astype('datetime64[M]').astype(np.int64) + 1970 * 12
+    return np.column_stack([
+        parcelle, colonnes['type_culture_id'][masque], arrondissement,
+        mois // 3 - premier, colonnes['centikilos'][masque] / 100,
+    ]).astype(np.float64)
+
+
+def charger_historique(premier, dernier):
+    """
+    Récoltes des trimestres [premier, dernier[ (numéros absolus), en une requête
+    groupée par parcelle, culture et trimestre et par table de récoltes, plus
+    les saisons gelées de la période (archives.py).
+
+    Retourne (series, arrondissements, quantites) : series est un tableau N × 2
+    (parcelle, culture), arrondissements l'arrondissement de chaque parcelle et
+    quantites la matrice N × (dernier - premier) des kg récoltés.
+    """
+    lignes = []
+    for modele in tables_recoltes():
+        lignes += (
+            modele.objects.order_by()
+            .filter(date_recolte__gte=debut_trimestre(premier), date_recolte__lt=debut_trimestre(dernier))
+            .values('parcelle_id', 'type_culture_id', 'parcelle__arrondissement_id')
+            .annotate(
+                # Comparaisons de dates plutôt qu'extractions (fonctions Python sous SQLite, 3 fois plus lentes)
+                trimestre=Case(*(
+                    When(date_recolte__lt=debut_trimestre(index + 1), then=Value(index - premier))
+                    for index in range(premier, dernier)
+                ), output_field=IntegerField()),
+                total=Cast(Sum('quantite'), FloatField()),
+            )
+            .values_list('parcelle_id', 'type_culture_id', 'parcelle__arrondissement_id', 'trimestre', 'total')
+        )
+    tableau = np.array(lignes, dtype=np.float64).reshape(-1, 5)
+    tableau = np.concatenate([tableau, _historique_gele(premier, dernier)])
+    if not len(tableau):
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, dernier - premier))
+
+    cles = tableau[:, :2].astype(np.int64)
+    series, position = np.unique(cles, axis=0, return_inverse=True)
+    position = position.reshape(-1)
+    arrondissements = np.zeros(len(series), dtype=np.int64)
+    arrondissements[position] = tableau[:, 2].astype(np.int64)
+
+    quantites = np.zeros((len(series), dernier - premier))
+    # Une même série et un même trimestre peuvent venir de plusieurs niveaux de stockage : additionnés
+    np.add.at(quantites, (position, tableau[:, 3].astype(np.int64)), tableau[:, 4])
+    return series, arrondissements, quantites
+
+
+def matrice_regression(premier, nombre):
+    """Colonnes : constante, tendance, indicatrices des trimestres 2 à 4 (trimestre 1 en référence)"""
+    indices = np.arange(premier, premier + nombre)
+    colonnes = [np.ones(nombre), (indices - premier).astype(np.float64)]
+    colonnes += [(indices % 4 == trimestre).astype(np.float64) for trimestre in (1, 2, 3)]
+    return np.column_stack(colonnes)
+
+
+def ajuster(quantites, premier, horizon):
+    """Prévisions (N × horizon) des `horizon` trimestres suivant l'historique, pour toutes les séries"""
+    nombre = quantites.shape[1]
+    regression = matrice_regression(premier, nombre + horizon)
+    if nombre < regression.shape[1]:
+        # Historique trop court pour la saisonnalité : tendance seule
+        regression = regression[:, :2]
+    coefficients, *_ = np.linalg.lstsq(regression[:nombre], quantites.T, rcond=None)
+    return np.clip(regression[nombre:] @ coefficients, 0, None).T
+
+
+def rafraichir_previsions(historique=HISTORIQUE_TRIMESTRES, horizon=HORIZON_TRIMESTRES, aujourd_hui=None,
+                          taille_lot=10000):
+    """
+    Recalcule toute la table PrevisionRecolte.
+
+    L'historique couvre les `historique` trimestres complets précédant le
+    trimestre en cours ; les prévisions portent sur le trimestre en cours et
+    les suivants. Retourne les compteurs et durées de chaque étape.
+    """
+    courant = index_trimestre(aujourd_hui or timezone.localdate())
+    premier = courant - historique
+    durees = {}
+
+    debut = time.perf_counter()
+    series, arrondissements, quantites = charger_historique(premier, courant)
+    durees['chargement'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    previsions = ajuster(quantites, premier, horizon) if len(series) else np.empty((0, horizon))
+    previsions = np.round(previsions, 2)
+    durees['ajustement'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    # Valeurs adaptées une fois : inserer_lignes n'instancie aucun modèle
+    date_calcul = connection.ops.adapt_datetimefield_value(timezone.now())
+    periodes = [connection.ops.adapt_datefield_value(debut_trimestre(courant + decalage))
+                for decalage in range(horizon)]
+    parcelles, cultures = series[:, 0].tolist(), series[:, 1].tolist()
+    arrondissements, valeurs = arrondissements.tolist(), previsions.tolist()
+    with transaction.atomic():
+        PrevisionRecolte.objects.all().delete()
+        inserer_lignes(PrevisionRecolte, CHAMPS_ENREGISTRES, (
+            (periode, parcelle, arrondissement, culture, valeur, date_calcul)
+            for parcelle, culture, arrondissement, ligne in zip(parcelles, cultures, arrondissements, valeurs)
+            for periode, valeur in zip(periodes, ligne)
+        ), taille_lot=taille_lot)
+    durees['enregistrement'] = time.perf_counter() - debut
+
+    return {'series': len(series), 'previsions': len(series) * horizon, 'durees': durees}
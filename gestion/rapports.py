@@ -0,0 +1,308 @@
+"""
+Rapports de fin de saison, un par commune, écrits en HTML et en CSV.
+
+Chaque rapport présente la production de la saison par culture, par
+arrondissement et par producteur, puis chaque entrepôt de la commune avec
+son stock par culture et la couverture de la production par les stocks.
+
+- Données : une poignée de requêtes groupées par commune. La production vient
+  des cumuls mensuels (CumulRecolte), qui couvrent aussi les saisons
+  archivées ou gelées ; noms de cultures et d'arrondissements viennent du
+  référentiel en mémoire. Les stocks sont ceux du moment de la génération.
+- Parallélisme : une tâche par commune dans un pool de processus (contexte
+  « spawn » : chaque processus ouvre ses propres connexions).
+- Reprise : chaque rapport terminé est inscrit dans etat.json, à côté des
+  fichiers. Une nouvelle exécution saute les communes déjà faites et ne
+  refait que celles en échec ou manquantes.
+
+python manage.py generer_rapports --saison 2025 --sortie rapports/
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+from pathlib import Path
+
+import django
+from django.db.models import Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Arrondissement, Commune, CumulRecolte, Entrepot, Producteur, Stock
+from .referentiel import referentiel
+from .saisons import bornes_saison
+
+FICHIER_ETAT = 'etat.json'
+TERMINE = 'termine'
+ECHEC = 'echec'
+CENTIEME = Decimal('0.01')
+COLONNES_CSV = ['rubrique', 'libelle', 'type_culture', 'quantite_kg', 'nombre_recoltes', 'indicateur_pct']
+
+
+def _pourcentage(partie, total):
+    return round(float(partie) * 100 / float(total), 1) if total else None
+
+
+def _nom_producteur(prenom, nom, username):
+    return f'{prenom} {nom}'.strip() or username
+
+
+# --------------------------------------------
+# Données d'une commune
+# --------------------------------------------
+
+def donnees_commune(commune, saison):
+    """Contenu du rapport de `commune` pour la saison (quatre requêtes)"""
+    debut, fin = bornes_saison(saison)
+    cultures = referentiel.cultures
+    arrondissements = [a for a in referentiel.arrondissements if a.commune_id == commune.pk]
+    ids_arrondissements = [a.pk for a in arrondissements]
+
+    cumuls = CumulRecolte.objects.order_by().filter(
+        arrondissement_id__in=ids_arrondissements, periode__gte=debut, periode__lt=fin,
+    )
+    lignes = list(
+        cumuls.values('arrondissement_id', 'type_culture_id', 'producteur_id')
+        .annotate(quantite=Sum('quantite'), nombre=Sum('nombre_recoltes'))
+        .values_list('arrondissement_id', 'type_culture_id', 'producteur_id', 'quantite', 'nombre')
+    )
+    producteurs = {
+        pk: _nom_producteur(prenom, nom, username)
+        for pk, prenom, nom, username in Producteur.objects.filter(
+            pk__in=cumuls.values('producteur_id'),
+        ).values_list('pk', 'user__first_name', 'user__last_name', 'user__username')
+    }
+    entrepots = list(Entrepot.objects.filter(arrondissement_id__in=ids_arrondissements).order_by('nom').values_list(
+        'pk', 'nom', 'arrondissement_id', 'capacite_max', 'seuil_alerte', 'stock_cumule', 'taux_occupation',
+        'en_alerte',
+    ))
+    stocks = defaultdict(dict)
+    for entrepot_id, type_culture_id, quantite in Stock.objects.filter(
+        entrepot__arrondissement_id__in=ids_arrondissements,
+    ).values_list('entrepot_id', 'type_culture_id', 'quantite'):
+        stocks[entrepot_id][type_culture_id] = quantite
+
+    def cumul():
+        return {'quantite': Decimal(0), 'nombre': 0, 'cultures': defaultdict(Decimal)}
+
+    total = cumul()
+    par_arrondissement = defaultdict(cumul)
+    par_producteur = defaultdict(cumul)
+    for arrondissement_id, type_culture_id, producteur_id, quantite, nombre in lignes:
+        for groupe in (total, par_arrondissement[arrondissement_id], par_producteur[producteur_id]):
+            groupe['quantite'] += quantite
+            groupe['nombre'] += nombre
+            groupe['cultures'][type_culture_id] += quantite
+
+    def rangee(libelle, groupe):
+        return {
+            'libelle': libelle,
+            'quantite': groupe['quantite'],
+            'nombre': groupe['nombre'],
+            'cultures': [groupe['cultures'].get(culture.pk, Decimal(0)) for culture in cultures],
+            'part': _pourcentage(groupe['quantite'], total['quantite']),
+        }
+
+    stock_par_culture = defaultdict(Decimal)
+    for par_culture in stocks.values():
+        for type_culture_id, quantite in par_culture.items():
+            stock_par_culture[type_culture_id] += quantite
+
+    return {
+        'commune': commune,
+        'saison': saison,
+        'date_generation': timezone.now(),
+        'cultures': cultures,
+        'total': rangee('Total', total),
+        'par_culture': [
+            {
+                'culture': culture,
+                'quantite': total['cultures'].get(culture.pk, Decimal(0)),
+                'part': _pourcentage(total['cultures'].get(culture.pk, 0), total['quantite']),
+                'stock': stock_par_culture.get(culture.pk, Decimal(0)),
+                # Part de la production de la saison présente en stock dans la commune
+                'couverture': _pourcentage(stock_par_culture.get(culture.pk, 0), total['cultures'].get(culture.pk, 0)),
+            }
+            for culture in cultures
+        ],
+        'par_arrondissement': [
+            rangee(arrondissement.nom, par_arrondissement[arrondissement.pk])
+            for arrondissement in arrondissements if arrondissement.pk in par_arrondissement
+        ],
+        'par_producteur': sorted(
+            (rangee(producteurs.get(pk, f'Producteur {pk}'), groupe) for pk, groupe in par_producteur.items()),
+            key=lambda ligne: (-ligne['quantite'], ligne['libelle']),
+        ),
+        'entrepots': [
+            {
+                'nom': nom,
+                'arrondissement': referentiel.get(Arrondissement, arrondissement_id).nom,
+                'capacite_max': capacite_max,
+                'seuil_alerte': seuil_alerte,
+                'stock': stock_cumule,
+                'taux_occupation': round(taux_occupation, 1),
+                'en_alerte': en_alerte,
+                'stocks': [stocks[pk].get(culture.pk, Decimal(0)) for culture in cultures],
+            }
+            for pk, nom, arrondissement_id, capacite_max, seuil_alerte, stock_cumule, taux_occupation, en_alerte
+            in entrepots
+        ],
+    }
+
+
+# --------------------------------------------
+# Écriture des fichiers
+# --------------------------------------------
+
+def _kg(quantite):
+    return Decimal(quantite).quantize(CENTIEME)
+
+
+def lignes_csv(donnees):
+    """Lignes du CSV : une rubrique par tableau du rapport HTML"""
+    yield COLONNES_CSV
+    noms = [culture.nom for culture in donnees['cultures']]
+    for ligne in donnees['par_culture']:
+        culture = ligne['culture']
+        yield ['culture', culture.get_nom_display(), culture.nom, _kg(ligne['quantite']), '', ligne['part']]
+        yield ['couverture', culture.get_nom_display(), culture.nom, _kg(ligne['stock']), '', ligne['couverture']]
+    for rubrique in ('par_arrondissement', 'par_producteur'):
+        nom_rubrique = rubrique.removeprefix('par_')
+        for ligne in donnees[rubrique]:
+            for nom, quantite in zip(noms, ligne['cultures']):
+                if quantite:
+                    yield [nom_rubrique, ligne['libelle'], nom, _kg(quantite), '', '']
+            yield [nom_rubrique, ligne['libelle'], '', _kg(ligne['quantite']), ligne['nombre'], ligne['part']]
+    for entrepot in donnees['entrepots']:
+        for nom, quantite in zip(noms, entrepot['stocks']):
+            yield ['entrepot', entrepot['nom'], nom, _kg(quantite), '', '']
+        yield ['entrepot', entrepot['nom'], '', _kg(entrepot['stock']), '', entrepot['taux_occupation']]
+
+
+def _ecrire_atomique(chemin, contenu):
+    temporaire = chemin.with_name(f'.{chemin.name}.{os.getpid()}')
+    temporaire.write_text(contenu, encoding='utf-8')
+    os.replace(temporaire, chemin)
+
+
+def nom_fichier(commune):
+    return f'commune-{slugify(commune.code) or commune.pk}'
+
+
+def ecrire_rapport(dossier, donnees):
+    """Écrit <nom>.html et <nom>.csv dans `dossier` ; retourne les noms des fichiers"""
+    base = nom_fichier(donnees['commune'])
+    tampon = io.StringIO()
+    csv.writer(tampon).writerows(lignes_csv(donnees))
+    _ecrire_atomique(dossier / f'{base}.csv', tampon.getvalue())
+    _ecrire_atomique(dossier / f'{base}.html', render_to_string('gestion/rapports/commune.html', donnees))
+    return [f'{base}.html', f'{base}.csv']
+
+
+def generer_rapport_commune(commune_id, saison, dossier):
+    """Tâche d'un processus du pool : rapport complet d'une commune, résumé pour etat.json"""
+    debut = time.perf_counter()
+    referentiel.nouvelle_requete()
+    commune = referentiel.get(Commune, commune_id)
+    donnees = donnees_commune(commune, saison)
+    fichiers = ecrire_rapport(Path(dossier), donnees)
+    return {
+        'statut': TERMINE,
+        'nom': commune.nom,
+        'fichiers': fichiers,
+        'quantite_kg': str(donnees['total']['quantite']),
+        'nombre_recoltes': donnees['total']['nombre'],
+        'entrepots': len(donnees['entrepots']),
+        'duree': round(time.perf_counter() - debut, 3),
+    }
+
+
+# --------------------------------------------
+# Exécution d'une saison complète
+# --------------------------------------------
+
+def dossier_saison(sortie, saison):
+    return Path(sortie) / f'saison-{saison}'
+
+
+def lire_etat(dossier):
+    try:
+        return json.loads((dossier / FICHIER_ETAT).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return {'communes': {}}
+
+
+def _rapport_present(dossier, entree):
+    return entree.get('statut') == TERMINE and all((dossier / nom).exists() for nom in entree['fichiers'])
+
+
+def generer_rapports(saison, sortie, processus=None, reprendre=True, communes=None, progression=None):
+    """
+    Génère les rapports de la saison dans <sortie>/saison-<saison>/ puis index.html.
+
+    `communes` restreint aux identifiants donnés ; `progression(fait, total,
+    commune_id, entree)` est appelé après chaque commune. Retourne l'état final
+    (contenu de etat.json) ; une commune en échec n'interrompt pas les autres.
+    """
+    dossier = dossier_saison(sortie, saison)
+    dossier.mkdir(parents=True, exist_ok=True)
+    etat = lire_etat(dossier) if reprendre else {'communes': {}}
+    etat['saison'] = saison
+    a_faire = [
+        pk for pk in (communes or [commune.pk for commune in referentiel.communes])
+        if not _rapport_present(dossier, etat['communes'].get(str(pk), {}))
+    ]
+    processus = processus or os.cpu_count() or 1
+
+    def enregistrer(commune_id, entree, fait):
+        etat['communes'][str(commune_id)] = entree
+        _ecrire_atomique(dossier / FICHIER_ETAT, json.dumps(etat, ensure_ascii=False, indent=2))
+        if progression:
+            progression(fait, len(a_faire), commune_id, entree)
+
+    def echec(commune_id, erreur):
+        return {'statut': ECHEC, 'nom': referentiel.get(Commune, commune_id).nom,
+                'erreur': f'{type(erreur).__name__}: {erreur}'}
+
+    if processus == 1 or len(a_faire) <= 1:
+        for fait, commune_id in enumerate(a_faire, start=1):
+            try:
+                entree = generer_rapport_commune(commune_id, saison, str(dossier))
+            except Exception as erreur:
+                entree = echec(commune_id, erreur)
+            enregistrer(commune_id, entree, fait)
+    else:
+        # spawn : processus neufs, sans les connexions ni les verrous du processus parent
+        with ProcessPoolExecutor(max_workers=min(processus, len(a_faire)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=django.setup) as pool:
+            taches = {
+                pool.submit(generer_rapport_commune, commune_id, saison, str(dossier)): commune_id
+                for commune_id in a_faire
+            }
+            for fait, tache in enumerate(as_completed(taches), start=1):
+                commune_id = taches[tache]
+                try:
+                    entree = tache.result()
+                except Exception as erreur:
+                    entree = echec(commune_id, erreur)
+                enregistrer(commune_id, entree, fait)
+
+    ecrire_index(dossier, etat)
+    return etat
+
+
+def ecrire_index(dossier, etat):
+    """Page d'accueil de la saison : une ligne par commune, liens vers ses rapports"""
+    lignes = sorted(etat['communes'].values(), key=lambda entree: entree['nom'])
+    _ecrire_atomique(dossier / 'index.html', render_to_string('gestion/rapports/index.html', {
+        'saison': etat['saison'],
+        'communes': lignes,
+        'date_generation': timezone.now(),
+    }))
@@ -0,0 +1,208 @@
+"""
+Index de recherche des producteurs, parcelles et entrepôts.
+
+Les recherches de l'admin (`icontains` sur user__first_name, producteur__user…)
+traversent des jointures et parcourent des tables entières. Ici, chaque objet a
+une ligne dans EntreeRecherche : son texte normalisé (minuscules, sans accents,
+ponctuation réduite à des espaces, téléphone aussi en chiffres seuls), réécrit
+par les signaux à chaque enregistrement.
+
+Ce texte est indexé par trigrammes, ce qui sert aussi bien les débuts de mots
+que les fragments (« ouss » dans « Amoussou », « 3456 » dans un numéro) :
+- SQLite : table virtuelle FTS5 `tokenize='trigram'`, tenue par des triggers ;
+- PostgreSQL : index GIN `gin_trgm_ops` (extension pg_trgm), utilisé par LIKE.
+
+Chaque terme de la saisie doit figurer dans le texte. Un terme de moins de
+trois caractères n'a pas de trigramme : il filtre les résultats des autres
+termes ou, s'il est seul, cherche les textes qui commencent par lui (plage
+sur l'index B-tree de `texte`).
+
+Une migration qui reconstruit la table sous SQLite (ALTER non géré) supprime
+les triggers : elle doit rappeler installer_index.
+"""
+import re
+import unicodedata
+
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TABLE_FTS = 'gestion_recherche_fts'
+INDEX_TRIGRAMMES = 'recherche_texte_trgm_idx'
+TAILLE_TRIGRAMME = 3
+LONGUEUR_MIN_SAISIE = 2
+SUGGESTIONS_MAX = 20
+
+_SEPARATEURS = re.compile(r'[\W_]+')
+_NUMERO = re.compile(r'\+?[\d\s./-]*\d[\d\s./-]*')
+
+
+def normaliser(*morceaux):
+    """Texte en minuscules, sans accents ni ponctuation, mots séparés par une espace"""
+    texte = unicodedata.normalize('NFKD', ' '.join(str(morceau or '') for morceau in morceaux))
+    texte = ''.join(caractere for caractere in texte if not unicodedata.combining(caractere))
+    return ' '.join(_SEPARATEURS.split(texte.casefold())).strip()
+
+
+def chiffres(texte):
+    return re.sub(r'\D', '', texte or '')
+
+
+def termes(saisie):
+    """Termes normalisés d'une saisie ; un numéro tapé avec espaces ou tirets reste un seul terme"""
+    saisie = (saisie or '').strip()
+    if _NUMERO.fullmatch(saisie):
+        return [chiffres(saisie)]
+    return list(dict.fromkeys(normaliser(saisie).split()))
+
+
+# --------------------------------------------
+# Documents indexés
+# --------------------------------------------
+
+def _nom_complet(prenom, nom, username):
+    return f'{prenom} {nom}'.strip() or username
+
+
+def _producteurs(apps, ids):
+    Producteur = apps.get_model('gestion', 'Producteur')
+    lignes = Producteur.objects.values_list(
+        'pk', 'user__first_name', 'user__last_name', 'user__username', 'telephone',
+    )
+    if ids is not None:
+        lignes = lignes.filter(pk__in=ids)
+    for pk, prenom, nom, username, telephone in lignes.order_by('pk').iterator(chunk_size=5000):
+        yield (
+            pk, normaliser(prenom, nom, username, telephone, chiffres(telephone)),
+            f'{_nom_complet(prenom, nom, username)} ({telephone})',
+        )
+
+
+def _parcelles(apps, ids):
+    Parcelle = apps.get_model('gestion', 'Parcelle')
+    lignes = Parcelle.objects.values_list(
+        'pk', 'nom', 'producteur__user__first_name', 'producteur__user__last_name', 'producteur__user__username',
+    )
+    if ids is not None:
+        lignes = lignes.filter(pk__in=ids)
+    for pk, nom_parcelle, prenom, nom, username in lignes.order_by('pk').iterator(chunk_size=5000):
+        yield pk, normaliser(nom_parcelle, prenom, nom, username), f'{nom_parcelle} - {_nom_complet(prenom, nom, username)}'
+
+
+def _entrepots(apps, ids):
+    Entrepot = apps.get_model('gestion', 'Entrepot')
+    lignes = Entrepot.objects.values_list('pk', 'nom', 'gestionnaire__username')
+    if ids is not None:
+        lignes = lignes.filter(pk__in=ids)
+    for pk, nom, gestionnaire in lignes.order_by('pk').iterator(chunk_size=5000):
+        yield pk, normaliser(nom, gestionnaire), nom
+
+
+SOURCES = {
+    'producteur': _producteurs,
+    'parcelle': _parcelles,
+    'entrepot': _entrepots,
+}
+
+
+def documents(apps, type_objet, ids=None):
+    """(objet_id, texte, libellé) des objets `ids` (tous si None) du type donné"""
+    modele = apps.get_model('gestion', 'EntreeRecherche')
+    longueur_texte = modele._meta.get_field('texte').max_length
+    longueur_libelle = modele._meta.get_field('libelle').max_length
+    for objet_id, texte, libelle in SOURCES[type_objet](apps, ids):
+        yield objet_id, texte[:longueur_texte], libelle[:longueur_libelle]
+
+
+def remplir_index(apps, taille_lot=5000):
+    """Vide puis réécrit toute la table de recherche ; retourne le nombre d'entrées"""
+    EntreeRecherche = apps.get_model('gestion', 'EntreeRecherche')
+    EntreeRecherche.objects.all().delete()
+    nombre = 0
+    for type_objet in SOURCES:
+        lot = []
+        for objet_id, texte, libelle in documents(apps, type_objet):
+            lot.append(EntreeRecherche(type_objet=type_objet, objet_id=objet_id, texte=texte, libelle=libelle))
+            if len(lot) >= taille_lot:
+                EntreeRecherche.objects.bulk_create(lot)
+                nombre += len(lot)
+                lot = []
+        EntreeRecherche.objects.bulk_create(lot)
+        nombre += len(lot)
+    return nombre
+
+
+# --------------------------------------------
+# Condition de recherche
+# --------------------------------------------
+
+def condition_recherche(vendor, liste_termes):
+    """Q sur EntreeRecherche : chaque terme doit figurer dans `texte`"""
+    longs = [terme for terme in liste_termes if len(terme) >= TAILLE_TRIGRAMME]
+    courts = [terme for terme in liste_termes if len(terme) < TAILLE_TRIGRAMME]
+    condition = Q()
+    if not longs:
+        # Aucun trigramme exploitable : début du texte, par l'index B-tree
+        premier, courts = courts[0], courts[1:]
+        if vendor == 'sqlite':
+            # LIKE n'utilise pas l'index sous SQLite (insensible à la casse) : plage équivalente
+            condition &= Q(texte__gte=premier, texte__lt=premier + '\uffff')
+        else:
+            condition &= Q(texte__startswith=premier)
+    elif vendor == 'sqlite':
+        expression = ' AND '.join(f'"{terme}"' for terme in longs)
+        condition &= Q(pk__in=RawSQL(f'SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s', [expression]))
+    else:
+        for terme in longs:
+            condition &= Q(texte__contains=terme)
+    for terme in courts:
+        condition &= Q(texte__contains=terme)
+    return condition
+
+
+# --------------------------------------------
+# Installation de l'index plein texte (migrations)
+# --------------------------------------------
+
+def _instructions_sqlite(table):
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_FTS} USING fts5("
+        f"texte, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {TABLE_FTS}(rowid, texte) VALUES (new.id, new.texte); END",
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, texte) VALUES ('delete', old.id, old.texte); END",
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE_FTS}_au AFTER UPDATE OF texte ON {table} BEGIN "
+        f"INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, texte) VALUES ('delete', old.id, old.texte); "
+        f"INSERT INTO {TABLE_FTS}(rowid, texte) VALUES (new.id, new.texte); END",
+        f"INSERT INTO {TABLE_FTS}({TABLE_FTS}) VALUES ('rebuild')",
+    ]
+
+
+def installer_index(apps, schema_editor):
+    table = apps.get_model('gestion', 'EntreeRecherche')._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        instructions = _instructions_sqlite(table)
+    elif vendor == 'postgresql':
+        instructions = [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            f'CREATE INDEX IF NOT EXISTS {INDEX_TRIGRAMMES} ON {table} USING gin (texte gin_trgm_ops)',
+        ]
+    else:
+        # Autres bases : LIKE sur la table de recherche, sans jointure mais sans index
+        instructions = []
+    for instruction in instructions:
+        schema_editor.execute(instruction)
+
+
+def desinstaller_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        instructions = [f'DROP TRIGGER IF EXISTS {TABLE_FTS}_{suffixe}' for suffixe in ('ai', 'ad', 'au')]
+        instructions.append(f'DROP TABLE IF EXISTS {TABLE_FTS}')
+    elif vendor == 'postgresql':
+        instructions = [f'DROP INDEX IF EXISTS {INDEX_TRIGRAMMES}']
+    else:
+        instructions = []
+    for instruction in instructions:
+        schema_editor.execute(instruction)
@@ -0,0 +1,133 @@
+"""
+Référentiel en mémoire : types de culture, communes et arrondissements.
+
+Ces tables tiennent en quelques centaines de lignes et ne changent presque
+jamais, mais formulaires, filtres et listes déroulantes les relisaient à
+chaque requête. Chaque processus les charge une fois (trois requêtes) et les
+garde tant que la version partagée n'a pas changé.
+
+- Version : un identifiant aléatoire dans le cache partagé, comparé au plus
+  une fois par requête HTTP (aucune requête SQL, une lecture du cache).
+- Invalidation : les signaux de TypeCulture, Commune et Arrondissement vident
+  le référentiel du processus qui écrit, puis publient une nouvelle version
+  après commit ; les autres workers rechargent à leur requête suivante.
+- REFERENTIEL_TTL borne l'obsolescence si une écriture contourne les signaux
+  (update(), bulk_create) ou si une transaction est annulée après lecture.
+
+Les instances renvoyées sont partagées entre requêtes et threads : à lire
+seulement, jamais à modifier ni à enregistrer.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Arrondissement, Commune, TypeCulture
+
+CLE_VERSION = 'gestion:referentiel:version'
+
+
+class DonneesReferentiel:
+    """Contenu des trois tables à une version donnée"""
+
+    def __init__(self, version):
+        self.version = version
+        self.charge_le = time.monotonic()
+        self.cultures = list(TypeCulture.objects.all())
+        self.communes = list(Commune.objects.all())
+        communes = {commune.pk: commune for commune in self.communes}
+        self.arrondissements = list(Arrondissement.objects.all())
+        for arrondissement in self.arrondissements:
+            # str(arrondissement) affiche la commune : aucune requête supplémentaire
+            Arrondissement.commune.field.set_cached_value(arrondissement, communes[arrondissement.commune_id])
+        self.listes = {
+            TypeCulture: self.cultures,
+            Commune: self.communes,
+            Arrondissement: self.arrondissements,
+        }
+        self.par_pk = {modele: {objet.pk: objet for objet in objets} for modele, objets in self.listes.items()}
+        self.cultures_par_nom = {culture.nom: culture for culture in self.cultures}
+
+
+class Referentiel:
+    """Accès au référentiel du processus, rechargé quand la version partagée change"""
+
+    def __init__(self):
+        self._donnees = None
+        self._verifie = False
+        self._verrou = threading.Lock()
+
+    @staticmethod
+    def _perime(donnees, version=None):
+        if donnees is None or time.monotonic() - donnees.charge_le > getattr(settings, 'REFERENTIEL_TTL', 300):
+            return True
+        return version is not None and donnees.version != version
+
+    def _courantes(self):
+        donnees = self._donnees
+        if not self._verifie or self._perime(donnees):
+            version = cache.get_or_set(CLE_VERSION, lambda: uuid.uuid4().hex, None)
+            with self._verrou:
+                donnees = self._donnees
+                if self._perime(donnees, version):
+                    donnees = self._donnees = DonneesReferentiel(version)
+                self._verifie = True
+        return donnees
+
+    def nouvelle_requete(self):
+        """La version partagée sera relue à la prochaine lecture"""
+        self._verifie = False
+
+    def vider(self):
+        self._donnees = None
+
+    # --------------------------------------------
+    # Lecture
+    # --------------------------------------------
+
+    def liste(self, modele):
+        return self._courantes().listes[modele]
+
+    def get(self, modele, pk):
+        """Objet de clé `pk` ; lève modele.DoesNotExist comme objects.get()"""
+        try:
+            return self._courantes().par_pk[modele][int(pk)]
+        except (KeyError, TypeError, ValueError):
+            raise modele.DoesNotExist(f"{modele._meta.object_name} {pk!r} absent du référentiel")
+
+    @property
+    def cultures(self):
+        return self.liste(TypeCulture)
+
+    @property
+    def communes(self):
+        return self.liste(Commune)
+
+    @property
+    def arrondissements(self):
+        return self.liste(Arrondissement)
+
+    def culture_par_nom(self, nom):
+        """Type de culture de code `nom` (MAIS, SOJA…), None s'il n'existe pas"""
+        return self._courantes().cultures_par_nom.get(nom)
+
+
+referentiel = Referentiel()
+
+
+def invalider_referentiel():
+    # Le processus qui écrit relit tout de suite ; les autres après commit
+    referentiel.vider()
+
+    def publier():
+        cache.set(CLE_VERSION, uuid.uuid4().hex, None)
+        referentiel.vider()
+    transaction.on_commit(publier)
+
+
+def contexte(request):
+    """Processeur de contexte : {{ referentiel.cultures }}, {{ referentiel.arrondissements }}…"""
+    return {'referentiel': referentiel}
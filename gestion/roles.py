@@ -0,0 +1,124 @@
+"""
+Rôle et permissions de l'utilisateur connecté, mis en cache entre les requêtes.
+
+Sans cache, chaque page authentifiée relit le producteur lié, les groupes et
+les permissions (de l'utilisateur et de ses groupes). RolesMiddleware les
+résout une fois par utilisateur puis les replace dans les caches que
+consultent Django (ModelBackend : `_perm_cache`) et l'ORM (`user.producteur`).
+Le cache ne contient que des identifiants et des chaînes : le producteur est
+reconstruit à chaque requête, ses champs autres que les clés lus à la demande.
+
+Les signaux suppriment l'entrée d'un utilisateur quand son producteur, ses
+groupes ou ses permissions changent. Une modification d'un groupe ou d'une
+permission touche beaucoup d'utilisateurs : elle change la version commune à
+toutes les entrées. ROLES_CACHE_TTL borne l'obsolescence si une écriture
+contourne les signaux (update(), bulk_create).
+"""
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import router, transaction
+
+from .models import Arrondissement, Producteur
+from .referentiel import referentiel
+
+CLE_VERSION = 'gestion:roles:version'
+GROUPE_GESTIONNAIRE = 'Gestionnaire'
+
+ROLE_PRODUCTEUR = 'producteur'
+ROLE_GESTIONNAIRE = 'gestionnaire'
+ROLE_ADMIN = 'admin'
+
+
+def _cle(user_id):
+    # Version aléatoire : une version évincée du cache ne peut pas ressusciter d'anciennes entrées.
+    # « v2 » : entrées réduites à des identifiants et des chaînes (l'ancien format contenait une instance)
+    version = cache.get_or_set(CLE_VERSION, lambda: uuid.uuid4().hex, None)
+    return f'gestion:role:v2:{version}:{user_id}'
+
+
+def calculer_role(user):
+    """Rôle en types simples (identifiants, noms, codes de permission) : rien d'un modèle n'est mis en cache"""
+    backend = ModelBackend()
+    producteur = Producteur.objects.filter(user=user).values_list('pk', 'arrondissement_id').first()
+    return {
+        'producteur_id': producteur[0] if producteur else None,
+        'arrondissement_id': producteur[1] if producteur else None,
+        'groupes': sorted(user.groups.values_list('name', flat=True)),
+        'permissions_utilisateur': sorted(backend.get_user_permissions(user)),
+        'permissions_groupes': sorted(backend.get_group_permissions(user)),
+    }
+
+
+def _producteur(user, role):
+    """
+    Producteur reconstruit sans requête : identifiants connus, autres champs différés
+    (lus en base au premier accès), arrondissement et commune pris dans le référentiel.
+    """
+    producteur = Producteur.from_db(
+        router.db_for_read(Producteur), ['id', 'user_id', 'arrondissement_id'],
+        [role['producteur_id'], user.pk, role['arrondissement_id']],
+    )
+    Producteur.user.field.set_cached_value(producteur, user)
+    if role['arrondissement_id'] is not None:
+        try:
+            arrondissement = referentiel.get(Arrondissement, role['arrondissement_id'])
+        except Arrondissement.DoesNotExist:
+            pass  # Référentiel en retard : l'arrondissement sera lu à la demande
+        else:
+            Producteur.arrondissement.field.set_cached_value(producteur, arrondissement)
+    return producteur
+
+
+def appliquer_role(user, role):
+    """Remplit les caches de `user` : ni has_perm() ni user.producteur ne font plus de requête"""
+    user._user_perm_cache = set(role['permissions_utilisateur'])
+    user._group_perm_cache = set(role['permissions_groupes'])
+    user._perm_cache = user._user_perm_cache | user._group_perm_cache
+
+    # None mémorisé : l'accès à user.producteur lève DoesNotExist sans requête
+    producteur = _producteur(user, role) if role['producteur_id'] is not None else None
+    User.producteur.related.set_cached_value(user, producteur)
+
+    user.groupes = role['groupes']
+    user.est_gestionnaire = GROUPE_GESTIONNAIRE in role['groupes']
+    if producteur is not None:
+        user.role = ROLE_PRODUCTEUR
+    elif user.est_gestionnaire:
+        user.role = ROLE_GESTIONNAIRE
+    else:
+        user.role = ROLE_ADMIN
+    return user
+
+
+def utilisateur_avec_role(request):
+    """Utilisateur de la requête, rôle appliqué ; résolu une seule fois par requête"""
+    if not hasattr(request, '_utilisateur_avec_role'):
+        user = get_user(request)
+        if user.is_authenticated:
+            cle = _cle(user.pk)
+            role = cache.get(cle)
+            if role is None:
+                role = calculer_role(user)
+                cache.set(cle, role, getattr(settings, 'ROLES_CACHE_TTL', 300))
+            appliquer_role(user, role)
+        request._utilisateur_avec_role = user
+    return request._utilisateur_avec_role
+
+
+async def autilisateur_avec_role(request):
+    return await sync_to_async(utilisateur_avec_role)(request)
+
+
+def invalider_role(user_id):
+    # Après commit : un calcul concurrent ne doit pas remettre en cache l'ancien rôle
+    transaction.on_commit(lambda: cache.delete(_cle(user_id)))
+
+
+def invalider_tous_les_roles():
+    transaction.on_commit(lambda: cache.set(CLE_VERSION, uuid.uuid4().hex, None))
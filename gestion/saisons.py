@@ -0,0 +1,275 @@
+"""
+Saisons de récolte et partitionnement de la table des récoltes.
+
+Une saison est une année civile de date_recolte. Les requêtes courantes
+(saisie, listes, tableaux de bord) portent sur la saison en cours ; les
+saisons closes ne servent plus qu'aux rapports historiques.
+
+- PostgreSQL : gestion_recolte est partitionnée par plage de date_recolte,
+  une partition par saison (gestion_recolte_2024…) plus une partition par
+  défaut. Le planificateur écarte les partitions hors de la plage demandée.
+  La clé primaire devient (id, date_recolte) et la contrainte unique de
+  cle_idempotence porte sur (cle_idempotence, date_recolte) : PostgreSQL exige
+  la clé de partition dans toute contrainte unique. Django continue d'utiliser
+  `id`. L'unicité de la clé seule est tenue par la table CleIdempotence (voir
+  installer_cles).
+- SQLite : pas de partitionnement ; les saisons closes sont déplacées dans
+  la table RecolteArchivee (voir archives.py).
+
+Ce module ne dépend pas des modèles : la migration qui partitionne la table
+l'utilise.
+"""
+import re
+from datetime import date
+
+from django.utils import timezone
+
+TABLE = 'gestion_recolte'
+PARTITION_DEFAUT = f'{TABLE}_autres'
+SEQUENCE = f'{TABLE}_id_seq'
+TABLE_CLES = 'gestion_cleidempotence'
+FONCTION_RESERVER_CLE = f'{TABLE}_reserver_cle'
+FONCTION_LIBERER_CLE = f'{TABLE}_liberer_cle'
+
+
+def saison_de(jour):
+    return jour.year
+
+
+def saison_courante(aujourd_hui=None):
+    return saison_de(aujourd_hui or timezone.localdate())
+
+
+def bornes_saison(annee):
+    """[début, fin[ de la saison"""
+    return date(annee, 1, 1), date(annee + 1, 1, 1)
+
+
+def saisons_entre(debut=None, fin=None, premiere=None, derniere=None):
+    """Saisons de [premiere, derniere] qui recoupent les dates [debut, fin] (bornes facultatives)"""
+    if premiere is None or derniere is None:
+        return []
+    if debut is not None:
+        premiere = max(premiere, saison_de(debut))
+    if fin is not None:
+        derniere = min(derniere, saison_de(fin))
+    return list(range(premiere, derniere + 1))
+
+
+def partitions_natives(connexion):
+    """La base partitionne elle-même gestion_recolte (migration 0012)"""
+    return connexion.vendor == 'postgresql'
+
+
+# --------------------------------------------
+# Partitions PostgreSQL
+# --------------------------------------------
+
+def nom_partition(annee):
+    return f'{TABLE}_{annee}'
+
+
+def _litteral(jour):
+    # Bornes de partition : DDL sans paramètres liés
+    return f"'{jour.isoformat()}'"
+
+
+def partitions_existantes(curseur):
+    """Saisons ayant leur propre partition"""
+    curseur.execute(
+        "SELECT enfant.relname FROM pg_inherits "
+        "JOIN pg_class enfant ON enfant.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = %s::regclass",
+        [TABLE],
+    )
+    motif = re.compile(rf'{TABLE}_(\d{{4}})')
+    return sorted(
+        int(correspondance.group(1))
+        for (nom,) in curseur.fetchall()
+        if (correspondance := motif.fullmatch(nom))
+    )
+
+
+def creer_partition(curseur, annee):
+    """
+    Crée la partition de la saison si elle n'existe pas ; retourne True si créée.
+
+    Les lignes de cette saison déjà rangées dans la partition par défaut y sont
+    déplacées avant l'attachement (sinon PostgreSQL le refuse).
+    """
+    if annee in partitions_existantes(curseur):
+        return False
+    nom = nom_partition(annee)
+    debut, fin = bornes_saison(annee)
+    curseur.execute(f'CREATE TABLE {nom} (LIKE {TABLE} INCLUDING DEFAULTS)')
+    curseur.execute(
+        f'WITH deplacees AS (DELETE FROM {PARTITION_DEFAUT} '
+        f'WHERE date_recolte >= {_litteral(debut)} AND date_recolte < {_litteral(fin)} RETURNING *) '
+        f'INSERT INTO {nom} SELECT * FROM deplacees'
+    )
+    curseur.execute(
+        f'ALTER TABLE {TABLE} ATTACH PARTITION {nom} '
+        f'FOR VALUES FROM ({_litteral(debut)}) TO ({_litteral(fin)})'
+    )
+    # Lignes copiées avant l'attachement, hors déclencheurs : leur suppression de
+    # la partition par défaut a libéré leurs clés d'idempotence
+    curseur.execute(
+        f'INSERT INTO {TABLE_CLES} (cle, recolte_id) '
+        f'SELECT cle_idempotence, id FROM {nom} WHERE cle_idempotence IS NOT NULL ON CONFLICT DO NOTHING'
+    )
+    return True
+
+
+def verrouiller_saison(curseur, annee):
+    """Bloque les écritures sur la saison jusqu'à la fin de la transaction (lectures permises)"""
+    table = nom_partition(annee) if annee in partitions_existantes(curseur) else TABLE
+    curseur.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+
+
+def supprimer_partition(curseur, annee):
+    """Supprime la partition d'une saison (ses lignes ont été gelées)"""
+    curseur.execute(f'DROP TABLE IF EXISTS {nom_partition(annee)}')
+
+
+def _definitions(curseur):
+    """Index (hors clé primaire) et clés étrangères de gestion_recolte, pour les recréer"""
+    curseur.execute(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE schemaname = current_schema() AND tablename = %s",
+        [TABLE],
+    )
+    index = [(nom, definition) for nom, definition in curseur.fetchall() if not nom.endswith('_pkey')]
+    curseur.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [TABLE],
+    )
+    return index, curseur.fetchall()
+
+
+def _recreer_table(schema_editor, partitionnee):
+    """
+    Reconstruit gestion_recolte, partitionnée par saison ou non, en conservant
+    colonnes, données, index, clés étrangères et numérotation des id.
+    """
+    ancienne = f'{TABLE}_reconstruction'
+    with schema_editor.connection.cursor() as curseur:
+        index, cles_etrangeres = _definitions(curseur)
+        curseur.execute(f'SELECT min(date_recolte), max(date_recolte), max(id) FROM {TABLE}')
+        premiere_date, derniere_date, dernier_id = curseur.fetchone()
+
+        curseur.execute(f'ALTER TABLE {TABLE} RENAME TO {ancienne}')
+        clause = ' PARTITION BY RANGE (date_recolte)' if partitionnee else ''
+        curseur.execute(f'CREATE TABLE {TABLE} (LIKE {ancienne} INCLUDING DEFAULTS){clause}')
+        # LIKE ne copie ni l'identité ni la séquence : une séquence propre à la nouvelle table
+        curseur.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id DROP DEFAULT')
+        if partitionnee:
+            courante = saison_courante()
+            premiere = min(premiere_date.year if premiere_date else courante, courante)
+            derniere = max(derniere_date.year if derniere_date else courante, courante) + 1
+            curseur.execute(f'CREATE TABLE {PARTITION_DEFAUT} PARTITION OF {TABLE} DEFAULT')
+            for annee in range(premiere, derniere + 1):
+                debut, fin = bornes_saison(annee)
+                curseur.execute(
+                    f'CREATE TABLE {nom_partition(annee)} PARTITION OF {TABLE} '
+                    f'FOR VALUES FROM ({_litteral(debut)}) TO ({_litteral(fin)})'
+                )
+        curseur.execute(f'INSERT INTO {TABLE} SELECT * FROM {ancienne}')
+        # Supprime aussi les partitions, index et séquence de l'ancienne table
+        curseur.execute(f'DROP TABLE {ancienne} CASCADE')
+
+        curseur.execute(f'CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+        curseur.execute(f"SELECT setval('{SEQUENCE}', %s, false)", [(dernier_id or 0) + 1])
+        curseur.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+
+        cle_partition = ', date_recolte' if partitionnee else ''
+        curseur.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id{cle_partition})')
+        for nom, definition in index:
+            if definition.startswith('CREATE UNIQUE INDEX'):
+                # Contrainte unique (cle_idempotence) : la clé de partition s'y ajoute
+                colonnes = re.search(r'\(([^()]*)\)\s*$', definition).group(1)
+                colonnes = ', '.join(c.strip() for c in colonnes.split(',') if c.strip() != 'date_recolte')
+                curseur.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {nom} UNIQUE ({colonnes}{cle_partition})')
+            else:
+                # « ON ONLY » : index d'une table partitionnée, à recréer sur toutes les partitions
+                curseur.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+        for nom, definition in cles_etrangeres:
+            curseur.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {nom} {definition}')
+
+
+# --------------------------------------------
+# Unicité globale des clés d'idempotence (PostgreSQL)
+# --------------------------------------------
+
+def installer_cles(apps, schema_editor):
+    """
+    Inscrit les clés existantes dans CleIdempotence puis installe les
+    déclencheurs de gestion_recolte qui la tiennent à jour :
+
+    - à l'insertion ou à la modification, la clé est réservée pour l'id de la
+      récolte ; une clé déjà réservée par une autre récolte lève une violation
+      d'unicité (IntegrityError côté Django), quelle que soit la date ;
+    - une ligne qui change de partition (date_recolte modifiée) garde son id,
+      donc sa clé ;
+    - à la suppression (y compris le gel d'une saison), la clé est libérée.
+    """
+    if not partitions_natives(schema_editor.connection):
+        return
+    schema_editor.execute(
+        f'INSERT INTO {TABLE_CLES} (cle, recolte_id) '
+        f'SELECT cle_idempotence, id FROM {TABLE} WHERE cle_idempotence IS NOT NULL'
+    )
+    schema_editor.execute(f"""
+        CREATE FUNCTION {FONCTION_RESERVER_CLE}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND OLD.cle_idempotence IS DISTINCT FROM NEW.cle_idempotence THEN
+                DELETE FROM {TABLE_CLES} WHERE cle = OLD.cle_idempotence AND recolte_id = OLD.id;
+            END IF;
+            IF NEW.cle_idempotence IS NOT NULL THEN
+                INSERT INTO {TABLE_CLES} (cle, recolte_id) VALUES (NEW.cle_idempotence, NEW.id)
+                ON CONFLICT (cle) DO UPDATE SET recolte_id = EXCLUDED.recolte_id
+                WHERE {TABLE_CLES}.recolte_id = EXCLUDED.recolte_id;
+                IF NOT FOUND THEN
+                    RAISE unique_violation USING
+                        MESSAGE = 'cle_idempotence déjà utilisée : ' || NEW.cle_idempotence,
+                        CONSTRAINT = '{TABLE_CLES}_pkey';
+                END IF;
+            END IF;
+            RETURN NEW;
+        END $$
+    """)
+    schema_editor.execute(f"""
+        CREATE FUNCTION {FONCTION_LIBERER_CLE}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            -- Une ligne déplacée vers une autre partition est encore présente : sa clé reste réservée
+            DELETE FROM {TABLE_CLES} WHERE cle = OLD.cle_idempotence AND recolte_id = OLD.id
+                AND NOT EXISTS (SELECT 1 FROM {TABLE} WHERE id = OLD.id);
+            RETURN NULL;
+        END $$
+    """)
+    schema_editor.execute(
+        f'CREATE TRIGGER {FONCTION_RESERVER_CLE} BEFORE INSERT OR UPDATE ON {TABLE} '
+        f'FOR EACH ROW EXECUTE FUNCTION {FONCTION_RESERVER_CLE}()'
+    )
+    schema_editor.execute(
+        f'CREATE TRIGGER {FONCTION_LIBERER_CLE} AFTER DELETE ON {TABLE} '
+        f'FOR EACH ROW WHEN (OLD.cle_idempotence IS NOT NULL) EXECUTE FUNCTION {FONCTION_LIBERER_CLE}()'
+    )
+
+
+def desinstaller_cles(apps, schema_editor):
+    if not partitions_natives(schema_editor.connection):
+        return
+    for fonction in (FONCTION_RESERVER_CLE, FONCTION_LIBERER_CLE):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {fonction} ON {TABLE}')
+        schema_editor.execute(f'DROP FUNCTION IF EXISTS {fonction}()')
+
+
+def partitionner_recoltes(apps, schema_editor):
+    if partitions_natives(schema_editor.connection):
+        _recreer_table(schema_editor, partitionnee=True)
+
+
+def departitionner_recoltes(apps, schema_editor):
+    if partitions_natives(schema_editor.connection):
+        _recreer_table(schema_editor, partitionnee=False)
@@ -0,0 +1,336 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.core.exceptions import ValidationError
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Arrondissement, Commune, CumulRecolte, EntreeRecherche, Entrepot, JournalSynchronisation, MouvementStock,
+    Parcelle, Producteur, Recolte, RecolteArchivee, Stock, TypeCulture,
+)
+from .referentiel import invalider_referentiel, referentiel
+from .roles import invalider_role, invalider_tous_les_roles
+from .saisons import saison_de
+from .statistiques import invalider_statistiques_publiques
+
+
+# ============================================
+# STOCK CUMULÉ DES ENTREPÔTS
+# ============================================
+
+@receiver(pre_save, sender=Stock)
+def memoriser_ancien_stock(sender, instance, raw=False, **kwargs):
+    """Mémorise l'entrepôt et la quantité avant modification pour calculer la variation"""
+    instance._etat_precedent = None
+    if raw:
+        return
+    # Stock.save() est atomique : entrepôt puis stock restent verrouillés jusqu'au COMMIT, dans
+    # l'ordre des mouvements du grand livre. Deux enregistrements concurrents ne lisent pas le même
+    # état précédent, et la capacité vérifiée après l'écriture reste juste.
+    Entrepot.objects.select_for_update().filter(pk=instance.entrepot_id).values_list('pk', flat=True).first()
+    if instance.pk is None:
+        return
+    instance._etat_precedent = Stock.objects.select_for_update().filter(pk=instance.pk).values_list(
+        'entrepot_id', 'quantite'
+    ).first()
+
+
+@receiver(post_save, sender=Stock)
+def reporter_variation_stock(sender, instance, raw=False, **kwargs):
+    """Reporte la variation de quantité sur le stock cumulé de l'entrepôt"""
+    if raw:
+        return
+    precedent = getattr(instance, '_etat_precedent', None)
+    if precedent:
+        ancien_entrepot_id, ancienne_quantite = precedent
+        if ancien_entrepot_id != instance.entrepot_id:
+            Entrepot.objects.filter(pk=ancien_entrepot_id).appliquer_variation(-ancienne_quantite)
+            _inscrire_inventaire(ancien_entrepot_id, instance.type_culture_id, -ancienne_quantite)
+            delta = instance.quantite
+        else:
+            delta = instance.quantite - ancienne_quantite
+    else:
+        delta = instance.quantite
+    entrepots = Entrepot.objects.filter(pk=instance.entrepot_id)
+    if delta > 0 and not entrepots.avec_capacite_libre(delta).exists():
+        # Lève dans la transaction de Stock.save() : l'écriture est annulée
+        raise ValidationError("Capacité maximale de l'entrepôt dépassée", code='capacite')
+    entrepots.appliquer_variation(delta)
+    _inscrire_inventaire(instance.entrepot_id, instance.type_culture_id, delta)
+    instance._etat_precedent = None
+
+
+def _inscrire_inventaire(entrepot_id, type_culture_id, delta, commentaire="Modification directe du stock"):
+    """Une modification directe d'un Stock (admin, script) reste tracée au grand livre"""
+    if delta:
+        MouvementStock.objects.create(
+            type_mouvement=MouvementStock.INVENTAIRE, entrepot_id=entrepot_id,
+            type_culture_id=type_culture_id, quantite=delta, commentaire=commentaire,
+        )
+
+
+@receiver(post_delete, sender=Stock)
+def retirer_stock_supprime(sender, instance, origin=None, **kwargs):
+    """Retire la quantité d'un stock supprimé (y compris par cascade) et solde son grand livre"""
+    Entrepot.objects.filter(pk=instance.entrepot_id).appliquer_variation(-instance.quantite)
+    # Par cascade depuis l'entrepôt ou la culture, leurs mouvements sont supprimés avec eux
+    if isinstance(origin, Stock) or getattr(origin, 'model', None) is Stock:
+        _inscrire_inventaire(instance.entrepot_id, instance.type_culture_id, -instance.quantite,
+                             commentaire="Suppression du stock")
+
+
+# ============================================
+# CUMULS DE RÉCOLTES
+# ============================================
+
+def _localisation_parcelle(parcelle_id):
+    """(arrondissement_id, producteur_id) d'une parcelle"""
+    return Parcelle.objects.filter(pk=parcelle_id).values_list('arrondissement_id', 'producteur_id').first()
+
+
+@receiver(pre_save, sender=Recolte)
+def memoriser_ancienne_recolte(sender, instance, raw=False, **kwargs):
+    instance._cumul_precedent = None
+    if raw or instance.pk is None:
+        return
+    instance._cumul_precedent = Recolte.objects.filter(pk=instance.pk).values_list(
+        'date_recolte', 'parcelle__arrondissement_id', 'type_culture_id',
+        'parcelle__producteur_id', 'quantite',
+    ).first()
+
+
+@receiver(post_save, sender=Recolte)
+def reporter_recolte_dans_cumuls(sender, instance, raw=False, **kwargs):
+    """Retire l'ancienne contribution de la récolte et ajoute la nouvelle"""
+    if raw:
+        return
+    precedent = getattr(instance, '_cumul_precedent', None)
+    if precedent:
+        date_recolte, arrondissement_id, type_culture_id, producteur_id, quantite = precedent
+        CumulRecolte.objects.appliquer(
+            CumulRecolte.periode_de(date_recolte), arrondissement_id, type_culture_id, producteur_id,
+            -quantite, -1,
+        )
+    localisation = _localisation_parcelle(instance.parcelle_id)
+    if localisation:
+        arrondissement_id, producteur_id = localisation
+        CumulRecolte.objects.appliquer(
+            CumulRecolte.periode_de(instance.date_recolte), arrondissement_id, instance.type_culture_id,
+            producteur_id, instance.quantite, 1,
+        )
+    instance._cumul_precedent = None
+
+
+@receiver(post_delete, sender=Recolte)
+@receiver(post_delete, sender=RecolteArchivee)
+def retirer_recolte_des_cumuls(sender, instance, **kwargs):
+    localisation = _localisation_parcelle(instance.parcelle_id)
+    if localisation:
+        arrondissement_id, producteur_id = localisation
+        CumulRecolte.objects.appliquer(
+            CumulRecolte.periode_de(instance.date_recolte), arrondissement_id, instance.type_culture_id,
+            producteur_id, -instance.quantite, -1,
+        )
+
+
+@receiver(pre_save, sender=Parcelle)
+def memoriser_ancienne_localisation(sender, instance, raw=False, **kwargs):
+    instance._localisation_precedente = None
+    if raw or instance.pk is None:
+        return
+    instance._localisation_precedente = _localisation_parcelle(instance.pk)
+
+
+@receiver(post_save, sender=Parcelle)
+def deplacer_cumuls_parcelle(sender, instance, raw=False, **kwargs):
+    """Une parcelle qui change d'arrondissement ou de producteur emporte ses récoltes"""
+    precedente = getattr(instance, '_localisation_precedente', None)
+    instance._localisation_precedente = None
+    if raw or not precedente or precedente == (instance.arrondissement_id, instance.producteur_id):
+        return
+    ancien_arrondissement_id, ancien_producteur_id = precedente
+    # Les récoltes archivées (saisons closes sous SQLite) comptent aussi dans les cumuls
+    contributions = [
+        ligne
+        for recoltes in (instance.recoltes, instance.recoltes_archivees)
+        for ligne in recoltes.order_by().annotate(
+            periode=TruncMonth('date_recolte')
+        ).values('periode', 'type_culture_id').annotate(total=Sum('quantite'), nombre=Count('id'))
+    ]
+    with transaction.atomic():
+        if ancien_producteur_id != instance.producteur_id:
+            # Les récoltes passent dans le flux de synchronisation du nouveau producteur
+            saisons = {pk: saison_de(jour) for pk, jour in instance.recoltes.values_list('pk', 'date_recolte')}
+            JournalSynchronisation.objects.enregistrer(
+                JournalSynchronisation.RECOLTE, ((pk, instance.producteur_id) for pk in saisons), saisons=saisons,
+            )
+        for ligne in contributions:
+            CumulRecolte.objects.appliquer(
+                ligne['periode'], ancien_arrondissement_id, ligne['type_culture_id'],
+                ancien_producteur_id, -ligne['total'], -ligne['nombre'],
+            )
+            CumulRecolte.objects.appliquer(
+                ligne['periode'], instance.arrondissement_id, ligne['type_culture_id'],
+                instance.producteur_id, ligne['total'], ligne['nombre'],
+            )
+
+
+# ============================================
+# JOURNAL DE SYNCHRONISATION
+# ============================================
+
+def _proprietaire(instance):
+    """Producteur_id à inscrire au journal pour une récolte, une parcelle ou un stock"""
+    if isinstance(instance, Parcelle):
+        return instance.producteur_id
+    if isinstance(instance, Recolte):
+        localisation = _localisation_parcelle(instance.parcelle_id)
+        return localisation[1] if localisation else None
+    return None
+
+
+@receiver(post_save, sender=Recolte)
+@receiver(post_save, sender=Parcelle)
+@receiver(post_save, sender=Stock)
+def journaliser_modification(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    saisons = {instance.pk: saison_de(instance.date_recolte)} if isinstance(instance, Recolte) else None
+    JournalSynchronisation.objects.enregistrer(
+        sender._meta.model_name, [(instance.pk, _proprietaire(instance))], saisons=saisons,
+    )
+
+
+@receiver(post_delete, sender=Recolte)
+@receiver(post_delete, sender=Parcelle)
+@receiver(post_delete, sender=Stock)
+def journaliser_suppression(sender, instance, **kwargs):
+    # En cascade, les récoltes sont supprimées avant leur parcelle : le propriétaire est encore lisible
+    JournalSynchronisation.objects.enregistrer(
+        sender._meta.model_name, [(instance.pk, _proprietaire(instance))], supprime=True,
+    )
+
+
+# ============================================
+# STATISTIQUES DE LA PAGE D'ACCUEIL
+# ============================================
+
+@receiver(post_save, sender=Producteur)
+@receiver(post_delete, sender=Producteur)
+@receiver(post_save, sender=Commune)
+@receiver(post_delete, sender=Commune)
+@receiver(post_save, sender=Recolte)
+@receiver(post_delete, sender=Recolte)
+def invalider_statistiques_accueil(sender, raw=False, **kwargs):
+    if not raw:
+        invalider_statistiques_publiques()
+
+
+# ============================================
+# RÔLES ET PERMISSIONS EN CACHE
+# ============================================
+
+@receiver(post_save, sender=Producteur)
+@receiver(post_delete, sender=Producteur)
+def invalider_role_producteur(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalider_role(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalider_role_utilisateur(sender, instance, raw=False, update_fields=None, **kwargs):
+    # La connexion ne met à jour que last_login : le rôle reste valide
+    if not raw and set(update_fields or ()) != {'last_login'}:
+        invalider_role(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalider_role_affectation(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalider_role(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...) : pk_set contient les utilisateurs
+        for user_id in pk_set:
+            invalider_role(user_id)
+    else:
+        invalider_tous_les_roles()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalider_roles_permissions_groupe(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalider_tous_les_roles()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalider_roles_groupe(sender, raw=False, **kwargs):
+    if not raw:
+        invalider_tous_les_roles()
+
+
+# ============================================
+# INDEX DE RECHERCHE
+# ============================================
+
+@receiver(post_save, sender=Producteur)
+@receiver(post_delete, sender=Producteur)
+def indexer_producteur(sender, instance, raw=False, **kwargs):
+    if not raw:
+        EntreeRecherche.objects.indexer(EntreeRecherche.PRODUCTEUR, [instance.pk])
+
+
+@receiver(post_save, sender=Parcelle)
+@receiver(post_delete, sender=Parcelle)
+def indexer_parcelle(sender, instance, raw=False, **kwargs):
+    if not raw:
+        EntreeRecherche.objects.indexer(EntreeRecherche.PARCELLE, [instance.pk])
+
+
+@receiver(post_save, sender=Entrepot)
+@receiver(post_delete, sender=Entrepot)
+def indexer_entrepot(sender, instance, raw=False, **kwargs):
+    if not raw:
+        EntreeRecherche.objects.indexer(EntreeRecherche.ENTREPOT, [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def indexer_utilisateur(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Les noms de l'utilisateur figurent dans le texte de son producteur, de ses parcelles et de ses entrepôts"""
+    if raw or set(update_fields or ()) == {'last_login'}:
+        return
+    producteurs = list(Producteur.objects.filter(user=instance).values_list('pk', flat=True))
+    EntreeRecherche.objects.indexer(EntreeRecherche.PRODUCTEUR, producteurs)
+    EntreeRecherche.objects.indexer(
+        EntreeRecherche.PARCELLE, Parcelle.objects.filter(producteur__in=producteurs).values_list('pk', flat=True),
+    )
+    EntreeRecherche.objects.indexer(
+        EntreeRecherche.ENTREPOT, instance.entrepots_geres.values_list('pk', flat=True),
+    )
+
+
+# ============================================
+# RÉFÉRENTIEL EN MÉMOIRE
+# ============================================
+
+@receiver(request_started)
+def verifier_version_referentiel(sender, **kwargs):
+    referentiel.nouvelle_requete()
+
+
+@receiver(post_save, sender=TypeCulture)
+@receiver(post_delete, sender=TypeCulture)
+@receiver(post_save, sender=Commune)
+@receiver(post_delete, sender=Commune)
+@receiver(post_save, sender=Arrondissement)
+@receiver(post_delete, sender=Arrondissement)
+def invalider_referentiel_modifie(sender, raw=False, **kwargs):
+    if not raw:
+        invalider_referentiel()
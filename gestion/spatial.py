@@ -0,0 +1,128 @@
+"""
+Index spatial en grille régulière, sans PostGIS.
+
+La surface est découpée en cellules de TAILLE_CELLULE degrés. Chaque parcelle
+et chaque entrepôt stocke le numéro de sa cellule (colonne `cellule`, indexée) :
+numéro = ligne * COLONNES + colonne, si bien qu'une ligne de la grille est une
+plage continue de numéros. Une recherche dans un rectangle devient une plage
+d'index par ligne couverte, puis un filtre exact sur latitude/longitude : le
+coût dépend du nombre de points de la zone, pas de la taille de la table.
+
+Rayon et plus proches voisins partent du rectangle englobant du cercle, puis
+calculent la distance exacte (haversine) sur les seuls candidats.
+"""
+import math
+
+from django.db import models
+from django.db.models import Q
+
+TAILLE_CELLULE = 0.05  # degrés, soit environ 5,5 km de côté sous les tropiques
+COLONNES = round(360 / TAILLE_CELLULE)
+RAYON_TERRE_KM = 6371.0
+KM_PAR_DEGRE = math.pi * RAYON_TERRE_KM / 180
+# Au-delà, une seule plage d'index couvre le rectangle (le filtre exact reste appliqué)
+LIGNES_MAX_PAR_REQUETE = 64
+
+
+def cellule_de(latitude, longitude):
+    """Numéro de cellule d'un point, None sans coordonnées"""
+    if latitude is None or longitude is None:
+        return None
+    ligne = math.floor((float(latitude) + 90) / TAILLE_CELLULE)
+    colonne = math.floor((float(longitude) + 180) / TAILLE_CELLULE) % COLONNES
+    return ligne * COLONNES + colonne
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique (formule de haversine)"""
+    phi1, phi2 = math.radians(float(lat1)), math.radians(float(lat2))
+    dphi = phi2 - phi1
+    dlambda = math.radians(float(lon2) - float(lon1))
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAYON_TERRE_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def plages_rectangle(sud, ouest, nord, est):
+    """Plages (début, fin) de numéros de cellule couvrant le rectangle"""
+    debut = cellule_de(sud, ouest)
+    fin = cellule_de(nord, est)
+    ligne_debut, colonne_debut = divmod(debut, COLONNES)
+    ligne_fin, colonne_fin = divmod(fin, COLONNES)
+    if ligne_fin - ligne_debut >= LIGNES_MAX_PAR_REQUETE:
+        return [(debut, fin)]
+    return [
+        (ligne * COLONNES + colonne_debut, ligne * COLONNES + colonne_fin)
+        for ligne in range(ligne_debut, ligne_fin + 1)
+    ]
+
+
+def rectangle_autour(latitude, longitude, rayon_km):
+    """(sud, ouest, nord, est) englobant le cercle de `rayon_km` autour du point"""
+    latitude, longitude = float(latitude), float(longitude)
+    # Marge d'un micro-degré : les bornes sont arrondies à 6 décimales comme les coordonnées
+    dlat = rayon_km / KM_PAR_DEGRE + 1e-6
+    cosinus = math.cos(math.radians(min(89.9, abs(latitude) + dlat)))
+    dlon = min(180.0, rayon_km / (KM_PAR_DEGRE * cosinus) + 1e-6)
+    return (
+        max(-90.0, latitude - dlat), max(-180.0, longitude - dlon),
+        min(89.999999, latitude + dlat), min(179.999999, longitude + dlon),
+    )
+
+
+class SpatialQuerySet(models.QuerySet):
+    """Requêtes spatiales des modèles ayant latitude, longitude et cellule"""
+
+    def indexer(self, taille_lot=5000):
+        """Recalcule `cellule` (après bulk_create, update() ou changement de TAILLE_CELLULE)"""
+        modele = self.model
+        nombre = 0
+        lot = []
+        for objet in self.only('pk', 'latitude', 'longitude', 'cellule').iterator(chunk_size=taille_lot):
+            cellule = cellule_de(objet.latitude, objet.longitude)
+            if cellule != objet.cellule:
+                objet.cellule = cellule
+                lot.append(objet)
+            if len(lot) >= taille_lot:
+                nombre += modele.objects.bulk_update(lot, ['cellule'])
+                lot = []
+        if lot:
+            nombre += modele.objects.bulk_update(lot, ['cellule'])
+        return nombre
+
+    def dans_rectangle(self, sud, ouest, nord, est):
+        """Objets dont le point est dans le rectangle (QuerySet, bornes incluses)"""
+        if sud > nord or ouest > est:
+            return self.none()
+        plages = Q()
+        for debut, fin in plages_rectangle(sud, ouest, nord, est):
+            plages |= Q(cellule__range=(debut, fin))
+        return self.filter(
+            plages,
+            latitude__gte=sud, latitude__lte=nord,
+            longitude__gte=ouest, longitude__lte=est,
+        )
+
+    def dans_rayon(self, latitude, longitude, rayon_km):
+        """Liste des objets à moins de `rayon_km`, du plus proche au plus loin (attribut `distance_km`)"""
+        candidats = self.dans_rectangle(*rectangle_autour(latitude, longitude, rayon_km))
+        resultats = []
+        for objet in candidats:
+            objet.distance_km = distance_km(latitude, longitude, objet.latitude, objet.longitude)
+            if objet.distance_km <= rayon_km:
+                resultats.append(objet)
+        resultats.sort(key=lambda objet: (objet.distance_km, objet.pk))
+        return resultats
+
+    def plus_proches(self, latitude, longitude, k=1):
+        """
+        Les `k` objets les plus proches, triés par distance.
+
+        Le rayon part d'une cellule et double tant qu'il contient moins de `k`
+        objets : k trouvés dans le cercle sont forcément les k plus proches.
+        """
+        rayon = TAILLE_CELLULE * KM_PAR_DEGRE
+        while True:
+            resultats = self.dans_rayon(latitude, longitude, rayon)
+            if len(resultats) >= k or rayon >= math.pi * RAYON_TERRE_KM:
+                return resultats[:k]
+            rayon *= 2
@@ -0,0 +1,42 @@
+"""
+Statistiques publiques de la page d'accueil, mises en cache.
+
+Ces agrégats portent sur des tables entières : ils sont aussi servis au
+tableau de bord des gestionnaires depuis la même entrée de cache.
+
+Les signaux de Producteur, Commune et Recolte invalident l'entrée après
+validation de la transaction ; la durée de vie STATISTIQUES_ACCUEIL_TTL borne
+l'obsolescence si une écriture contourne les signaux (update(), bulk_create).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Commune, CumulRecolte, Producteur
+
+CLE_CACHE = 'gestion:statistiques_accueil'
+
+
+def calculer_statistiques_publiques():
+    totaux = CumulRecolte.objects.aggregate(quantite=Sum('quantite'), nombre=Sum('nombre_recoltes'))
+    return {
+        'total_producteurs': Producteur.objects.filter(actif=True).count(),
+        'total_communes': Commune.objects.count(),
+        'total_recoltes_kg': totaux['quantite'] or 0,
+        'total_recoltes': totaux['nombre'] or 0,
+    }
+
+
+def statistiques_publiques():
+    """Statistiques de l'accueil : aucune requête SQL tant que le cache est valide"""
+    statistiques = cache.get(CLE_CACHE)
+    if statistiques is None:
+        statistiques = calculer_statistiques_publiques()
+        cache.set(CLE_CACHE, statistiques, getattr(settings, 'STATISTIQUES_ACCUEIL_TTL', 300))
+    return statistiques
+
+
+def invalider_statistiques_publiques():
+    # Après commit : un recalcul concurrent ne doit pas remettre en cache l'ancienne valeur
+    transaction.on_commit(lambda: cache.delete(CLE_CACHE))
@@ -0,0 +1,247 @@
+"""
+Synchronisation avec l'application mobile et les bureaux de terrain.
+
+Envoi : le client envoie en une requête toutes les récoltes d'une journée de terrain,
+chacune avec une clé d'idempotence qu'il a générée (UUID). Le lot est validé
+en entier puis inséré dans une seule transaction : soit tout est enregistré,
+soit rien. Un renvoi du même lot après une coupure réseau ne fait qu'une
+requête de lecture et renvoie les récoltes déjà créées.
+
+Réception : le client ne télécharge que ce qui a changé depuis son dernier
+jeton, lu dans JournalSynchronisation par pages bornées. Le travail dépend du
+nombre de modifications, pas de la taille des tables.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .archives import union_recoltes
+from .models import CumulRecolte, JournalSynchronisation, Parcelle, Recolte, Stock
+from .referentiel import referentiel
+from .saisons import bornes_saison, saison_de
+from .statistiques import invalider_statistiques_publiques
+
+TAILLE_LOT_MAX = 500
+TAILLE_PAGE_FLUX_DEFAUT = 200
+TAILLE_PAGE_FLUX_MAX = 1000
+LONGUEUR_CLE_MAX = Recolte._meta.get_field('cle_idempotence').max_length
+QUANTITE_MAX = Decimal('1e8')  # Recolte.quantite : 10 chiffres dont 2 décimales
+
+
+class LotInvalide(Exception):
+    """Le lot est refusé en entier ; `erreurs` liste (index, clé, message)"""
+
+    def __init__(self, erreurs):
+        super().__init__(f"{len(erreurs)} entrée(s) invalide(s)")
+        self.erreurs = erreurs
+
+
+def _lire_quantite(valeur):
+    if isinstance(valeur, bool) or not isinstance(valeur, (int, float, str)):
+        return None
+    try:
+        quantite = Decimal(str(valeur).replace(',', '.'))
+    except InvalidOperation:
+        return None
+    if not quantite.is_finite() or not 0 <= quantite < QUANTITE_MAX:
+        return None
+    return quantite.quantize(Decimal('0.01'))
+
+
+def _lire_date(valeur):
+    try:
+        return date.fromisoformat(valeur)
+    except (TypeError, ValueError):
+        return None
+
+
+def _valider(producteur, entrees):
+    """Retourne les récoltes à créer, indexées par clé, ou lève LotInvalide"""
+    # Mêmes règles que RecolteForm : uniquement les parcelles du producteur
+    parcelles = dict(producteur.parcelles.values_list('pk', 'arrondissement_id'))
+    cultures = {}
+    for culture in referentiel.cultures:
+        cultures[culture.nom] = culture.pk
+        cultures[str(culture.pk)] = culture.pk
+
+    erreurs = []
+    valides = {}
+    for index, entree in enumerate(entrees):
+        if not isinstance(entree, dict):
+            erreurs.append((index, None, "Objet JSON attendu"))
+            continue
+        cle = entree.get('cle')
+        parcelle_id = entree.get('parcelle')
+        type_culture_id = cultures.get(str(entree.get('type_culture', '')).upper())
+        quantite = _lire_quantite(entree.get('quantite'))
+        date_recolte = _lire_date(entree.get('date_recolte'))
+
+        if not isinstance(cle, str) or not 0 < len(cle) <= LONGUEUR_CLE_MAX:
+            erreurs.append((index, cle, f"Clé d'idempotence manquante ou trop longue ({LONGUEUR_CLE_MAX} caractères max)"))
+        elif cle in valides:
+            erreurs.append((index, cle, "Clé présente plusieurs fois dans le lot"))
+        elif isinstance(parcelle_id, bool) or parcelle_id not in parcelles:
+            erreurs.append((index, cle, "Cette parcelle ne vous appartient pas ou n'existe pas"))
+        elif type_culture_id is None:
+            erreurs.append((index, cle, "Type de culture inconnu"))
+        elif quantite is None:
+            erreurs.append((index, cle, "Quantité invalide"))
+        elif date_recolte is None:
+            erreurs.append((index, cle, "Date invalide (format AAAA-MM-JJ)"))
+        else:
+            valides[cle] = Recolte(
+                parcelle_id=parcelle_id, type_culture_id=type_culture_id,
+                quantite=quantite, date_recolte=date_recolte, cle_idempotence=cle,
+            )
+            valides[cle].arrondissement_id = parcelles[parcelle_id]
+
+    if erreurs:
+        raise LotInvalide(erreurs)
+    return valides
+
+
+def _existantes(producteur, cles):
+    """{clé: id de la récolte} des clés déjà enregistrées ; une clé d'un autre producteur est refusée"""
+    existantes = {}
+    conflits = []
+    # Saisons archivées comprises : un lot renvoyé longtemps après reste reconnu
+    lignes = union_recoltes(lambda recoltes: recoltes.filter(cle_idempotence__in=cles).values_list(
+        'cle_idempotence', 'pk', 'parcelle__producteur_id',
+    ))
+    for cle, pk, producteur_id in lignes:
+        if producteur_id != producteur.pk:
+            conflits.append((cles.index(cle), cle, "Clé déjà utilisée"))
+        else:
+            existantes[cle] = pk
+    if conflits:
+        raise LotInvalide(conflits)
+    return existantes
+
+
+def _inserer(producteur, recoltes):
+    with transaction.atomic():
+        creees = Recolte.objects.bulk_create(recoltes)
+        # bulk_create ne déclenche pas les signaux : cumuls et journal sont mis à jour ici
+        CumulRecolte.objects.ajouter_recoltes(
+            (recolte.date_recolte, recolte.arrondissement_id, recolte.type_culture_id, producteur.pk, recolte.quantite)
+            for recolte in recoltes
+        )
+        JournalSynchronisation.objects.enregistrer(
+            JournalSynchronisation.RECOLTE, ((recolte.pk, producteur.pk) for recolte in creees),
+            saisons={recolte.pk: saison_de(recolte.date_recolte) for recolte in creees},
+        )
+        invalider_statistiques_publiques()
+    return creees
+
+
+def synchroniser_recoltes(producteur, entrees):
+    """
+    Enregistre un lot de récoltes envoyé par `producteur`.
+
+    Retourne la liste, dans l'ordre du lot, de {'cle', 'id', 'statut'} où
+    statut vaut 'creee' ou 'existante'. Lève LotInvalide si une entrée est
+    refusée : dans ce cas rien n'est écrit.
+    """
+    if not isinstance(entrees, list) or not entrees:
+        raise LotInvalide([(None, None, "Liste de récoltes non vide attendue")])
+    if len(entrees) > TAILLE_LOT_MAX:
+        raise LotInvalide([(None, None, f"Lot limité à {TAILLE_LOT_MAX} récoltes")])
+
+    valides = _valider(producteur, entrees)
+    cles = list(valides)
+
+    for tentative in range(2):
+        existantes = _existantes(producteur, cles)
+        nouvelles = [recolte for cle, recolte in valides.items() if cle not in existantes]
+        try:
+            creees = {recolte.cle_idempotence: recolte.pk for recolte in _inserer(producteur, nouvelles)} if nouvelles else {}
+            break
+        except IntegrityError:
+            # Renvoi concurrent du même lot : les clés existent maintenant, on relit
+            if tentative:
+                raise
+
+    resultats = []
+    for cle in cles:
+        if cle in existantes:
+            resultats.append({'cle': cle, 'id': existantes[cle], 'statut': 'existante'})
+        else:
+            resultats.append({'cle': cle, 'id': creees[cle], 'statut': 'creee'})
+    return resultats
+
+
+# ============================================
+# FLUX DES MODIFICATIONS
+# ============================================
+
+# Champs transmis pour chaque modèle du journal
+CHAMPS_FLUX = {
+    JournalSynchronisation.RECOLTE: (Recolte, ('parcelle_id', 'type_culture_id', 'quantite', 'date_recolte',
+                                               'date_enregistrement', 'cle_idempotence')),
+    JournalSynchronisation.PARCELLE: (Parcelle, ('producteur_id', 'arrondissement_id', 'nom', 'superficie',
+                                                 'latitude', 'longitude')),
+    JournalSynchronisation.STOCK: (Stock, ('entrepot_id', 'type_culture_id', 'quantite', 'date_mise_a_jour')),
+}
+
+
+def lire_jeton(valeur):
+    """Séquence contenue dans un jeton de synchronisation (0 = tout télécharger)"""
+    try:
+        return max(0, int(valeur))
+    except (TypeError, ValueError):
+        return 0
+
+
+def flux_modifications(jeton=0, taille=TAILLE_PAGE_FLUX_DEFAUT, producteur=None):
+    """
+    Page des modifications postérieures à `jeton`, dans l'ordre du journal.
+
+    Avec `producteur`, seules ses récoltes et parcelles sont transmises.
+    Retourne {'modifications': [...], 'jeton': str, 'encore': bool} : le client
+    rappelle avec le nouveau jeton tant que `encore` est vrai.
+    """
+    taille = max(1, min(taille, TAILLE_PAGE_FLUX_MAX))
+    entrees = JournalSynchronisation.objects.filter(sequence__gt=jeton)
+    if producteur is not None:
+        entrees = entrees.filter(producteur=producteur)
+    entrees = list(entrees.order_by('sequence').values_list(
+        'sequence', 'modele', 'objet_id', 'supprime', 'date_modification', 'saison',
+    )[:taille + 1])
+    encore = len(entrees) > taille
+    entrees = entrees[:taille]
+
+    # Une requête par modèle pour les lignes encore présentes ; une récolte n'est
+    # cherchée que dans la saison inscrite au journal (une partition sous PostgreSQL)
+    donnees = {}
+    for modele, (classe, champs) in CHAMPS_FLUX.items():
+        par_saison = defaultdict(list)
+        for _, nom, objet_id, supprime, _, saison in entrees:
+            if nom == modele and not supprime:
+                par_saison[saison].append(objet_id)
+        if par_saison:
+            filtre = Q()
+            for saison, ids in par_saison.items():
+                if saison is None:
+                    filtre |= Q(pk__in=ids)
+                else:
+                    debut, fin = bornes_saison(saison)
+                    filtre |= Q(pk__in=ids, date_recolte__gte=debut, date_recolte__lt=fin)
+            donnees[modele] = {ligne['id']: ligne for ligne in classe.objects.filter(filtre).values('id', *champs)}
+
+    modifications = []
+    for sequence, modele, objet_id, supprime, date_modification, _ in entrees:
+        ligne = donnees.get(modele, {}).get(objet_id)
+        modification = {'sequence': sequence, 'modele': modele, 'id': objet_id, 'date': date_modification,
+                        'supprime': supprime or ligne is None}
+        if ligne is not None and not supprime:
+            modification['donnees'] = {champ: ligne[champ] for champ in CHAMPS_FLUX[modele][1]}
+        modifications.append(modification)
+
+    return {
+        'modifications': modifications,
+        'jeton': str(entrees[-1][0] if entrees else jeton),
+        'encore': encore,
+    }
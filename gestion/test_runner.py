@@ -0,0 +1,16 @@
+from django.test.runner import DiscoverRunner
+
+from .cache import cache_isole
+
+
+class CacheIsoleRunner(DiscoverRunner):
+    """Lanceur de tests (TEST_RUNNER) : toute l'exécution utilise un cache temporaire, voir cache_isole()"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_isole = cache_isole()
+        self._cache_isole.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_isole.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
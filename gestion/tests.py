@@ -1,3 +1,2328 @@
-from django.test import TestCase
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Commune, Arrondissement, Producteur, Parcelle,
+    TypeCulture, Recolte, Entrepot, Stock, CumulRecolte, JournalSynchronisation, MouvementStock, AlerteStock,
+    PrevisionRecolte, EntreeRecherche, RecolteArchivee, CleIdempotence,
+)
+from .cache import SQLiteCache
+from .forms import InventaireFormSet, LigneInventaireForm
+from .pagination import encoder_curseur
+from .referentiel import invalider_referentiel, referentiel
+from .requetes_sql import CompteurRequetes
+from .synchronisation import flux_modifications
+from . import urls as gestion_urls
+
+
+def peupler_volume(nb_producteurs=300, parcelles_par_producteur=2, recoltes_par_parcelle=30, graine=42,
+                   prefixe=''):
+    """
+    Jeu de données volumineux inséré en bulk (cumuls et journal reconstruits à la fin).
+
+    `prefixe` permet d'appeler la fonction plusieurs fois pour faire grossir la base.
+    """
+    aleatoire = random.Random(graine)
+    call_command('setup_groups', stdout=StringIO())
+
+    communes = Commune.objects.bulk_create([
+        Commune(nom=f'{prefixe}Commune {i}', code=f'{prefixe}C{i}') for i in range(10)
+    ])
+    arrondissements = Arrondissement.objects.bulk_create([
+        Arrondissement(nom=f'Arrondissement {i}', commune=communes[i % len(communes)], code=f'A{i}')
+        for i in range(40)
+    ])
+    cultures = [TypeCulture.objects.get_or_create(nom=nom)[0] for nom, _ in TypeCulture.TYPES_CHOICES]
+    # Communes et arrondissements insérés sans signaux
+    invalider_referentiel()
+
+    mot_de_passe = make_password('motdepasse')
+    users = User.objects.bulk_create([
+        User(username=f'{prefixe}producteur{i}', password=mot_de_passe) for i in range(nb_producteurs)
+    ])
+    Group.objects.get(name='Producteur').user_set.add(*users)
+    producteurs = Producteur.objects.bulk_create([
+        Producteur(user=user, telephone=f'97{i:06d}', arrondissement=aleatoire.choice(arrondissements),
+                   actif=aleatoire.random() > 0.1)
+        for i, user in enumerate(users)
+    ])
+    parcelles = Parcelle.objects.bulk_create([
+        Parcelle(producteur=producteur, arrondissement=producteur.arrondissement,
+                 superficie=Decimal('1.50'), nom=f'Parcelle {j}')
+        for producteur in producteurs for j in range(parcelles_par_producteur)
+    ])
+    debut = date(2024, 1, 1)
+    Recolte.objects.bulk_create([
+        Recolte(parcelle=parcelle, type_culture=aleatoire.choice(cultures),
+                quantite=Decimal(aleatoire.randint(100, 1500)),
+                date_recolte=debut + timedelta(days=aleatoire.randint(0, 700)))
+        for parcelle in parcelles for _ in range(recoltes_par_parcelle)
+    ], batch_size=5000)
+    CumulRecolte.objects.reconstruire()
+
+    gestionnaire = User.objects.create_user(f'{prefixe}gestionnaire', password='motdepasse')
+    gestionnaire.groups.add(Group.objects.get(name='Gestionnaire'))
+    for i in range(20):
+        entrepot = Entrepot.objects.create(
+            nom=f'{prefixe}Entrepôt {i}', arrondissement=arrondissements[i], capacite_max=Decimal('10000'),
+            seuil_alerte=Decimal('2000'), gestionnaire=gestionnaire,
+        )
+        for culture in cultures:
+            Stock.objects.create(entrepot=entrepot, type_culture=culture, quantite=Decimal(aleatoire.randint(0, 3000)))
+    JournalSynchronisation.objects.reconstruire()
+    EntreeRecherche.objects.reconstruire()
+
+    return {
+        'producteur': producteurs[0],
+        'gestionnaire': gestionnaire,
+        'arrondissement': arrondissements[0],
+        'culture': cultures[0],
+        'entrepot': entrepot,
+    }
+
+
+# Tables qui grossissent avec l'activité : elles ne doivent jamais être parcourues en entier
+TABLES_VOLUMINEUSES = {
+    'gestion_recolte', 'gestion_parcelle', 'gestion_producteur', 'auth_user', 'gestion_entreerecherche',
+    'gestion_cumulrecolte', 'gestion_journalsynchronisation', 'gestion_mouvementstock', 'gestion_recoltearchivee',
+}
+
+
+class StockCumuleTests(TestCase):
+    """Stock cumulé, taux de remplissage et alerte stockés sur Entrepot, toujours égaux à la table Stock"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Arrondissement', commune=commune, code='A')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.soja = TypeCulture.objects.create(nom=TypeCulture.SOJA)
+        cls.entrepot = Entrepot.objects.create(nom='Entrepôt', arrondissement=arrondissement,
+                                               capacite_max=Decimal('1000'), seuil_alerte=Decimal('200'))
+        cls.autre = Entrepot.objects.create(nom='Autre', arrondissement=arrondissement,
+                                            capacite_max=Decimal('400'), seuil_alerte=Decimal('50'))
+
+    def verifier(self, *entrepots):
+        for entrepot in entrepots or (self.entrepot, self.autre):
+            entrepot.refresh_from_db()
+            total = Stock.objects.filter(entrepot=entrepot).aggregate(total=Sum('quantite'))['total'] or 0
+            self.assertEqual(entrepot.stock_cumule, total, entrepot.nom)
+            self.assertAlmostEqual(entrepot.taux_occupation, float(total) * 100 / float(entrepot.capacite_max))
+            self.assertEqual(entrepot.en_alerte, total < entrepot.seuil_alerte)
+
+    def test_creation_modification_suppression(self):
+        self.verifier()
+        self.assertTrue(self.entrepot.en_alerte)
+        stock = Stock.objects.create(entrepot=self.entrepot, type_culture=self.mais, quantite=Decimal('150'))
+        Stock.objects.create(entrepot=self.entrepot, type_culture=self.soja, quantite=Decimal('100'))
+        self.verifier()
+        self.assertFalse(self.entrepot.en_alerte)
+        self.assertEqual(self.entrepot.taux_occupation, 25.0)
+
+        stock.quantite = Decimal('50')
+        stock.save()
+        self.verifier()
+        self.assertTrue(self.entrepot.en_alerte)
+        # Stock déplacé vers un autre entrepôt : les deux cumulés suivent
+        stock.entrepot = self.autre
+        stock.save()
+        self.verifier()
+        stock.delete()
+        self.verifier()
+        # Suppression en cascade d'une culture : un signal par stock supprimé
+        Stock.objects.create(entrepot=self.autre, type_culture=self.soja, quantite=Decimal('30'))
+        self.soja.delete()
+        self.verifier()
+        self.assertEqual(self.autre.stock_cumule, 0)
+
+    def test_chemins_par_lots(self):
+        MouvementStock.objects.entree(self.entrepot, self.mais, Decimal('300'))
+        MouvementStock.objects.transfert(self.entrepot, self.autre, self.mais, Decimal('120'))
+        MouvementStock.objects.inventaire_complet(self.entrepot, {self.mais: Decimal('90'), self.soja: Decimal('40')})
+        self.verifier()
+        # bulk_create ne déclenche pas de signal : recalculer_stocks répare
+        Stock.objects.filter(entrepot=self.autre).delete()
+        Stock.objects.bulk_create([Stock(entrepot=self.autre, type_culture=self.soja, quantite=Decimal('380'))])
+        Entrepot.objects.filter(pk=self.autre.pk).recalculer_stocks()
+        self.verifier()
+        self.assertEqual(self.autre.taux_occupation, 95.0)
+
+    def test_verifier_stocks_reparer(self):
+        Stock.objects.create(entrepot=self.entrepot, type_culture=self.mais, quantite=Decimal('500'))
+        Entrepot.objects.filter(pk=self.entrepot.pk).update(stock_cumule=Decimal('7'), taux_occupation=0.7)
+        sortie = StringIO()
+        call_command('verifier_stocks', stdout=sortie)
+        self.assertIn('Entrepôt : stocké 7.00 kg', sortie.getvalue())
+        self.entrepot.refresh_from_db()
+        self.assertEqual(self.entrepot.stock_cumule, Decimal('7'))
+
+        call_command('verifier_stocks', '--reparer', stdout=StringIO())
+        self.verifier()
+        sortie = StringIO()
+        call_command('verifier_stocks', stdout=sortie)
+        self.assertIn('Tous les stocks cumulés sont cohérents', sortie.getvalue())
+
+
+class PaginationCurseurTests(TestCase):
+    """Pagination par curseur : dates égales à cheval sur deux pages, curseurs invalides, dernière page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Arrondissement', commune=commune, code='A')
+        producteur = Producteur.objects.create(user=User.objects.create_user('producteur'), telephone='97000000',
+                                               arrondissement=arrondissement)
+        parcelle = Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                           superficie=Decimal('1'), nom='Parcelle')
+        mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        # Trois récoltes le même jour : les pages de 2 coupent au milieu des égalités
+        jours = [date(2025, 3, 1)] * 3 + [date(2025, 2, 1)] * 3 + [date(2025, 1, 1)]
+        for jour in jours:
+            Recolte.objects.create(parcelle=parcelle, type_culture=mais, quantite=Decimal('10'), date_recolte=jour)
+        cls.ordre = list(Recolte.objects.order_by('-date_recolte', '-id').values_list('pk', flat=True))
+
+    def page(self, **parametres):
+        from django.test import RequestFactory
+        from .pagination import paginer_recoltes
+        requete = RequestFactory().get('/', parametres)
+        return paginer_recoltes(requete, Recolte.objects.all())
+
+    def suivre(self, url):
+        from django.http import QueryDict
+        return self.page(**QueryDict(url.lstrip('?')).dict())
+
+    def test_egalites_de_date_entre_les_pages(self):
+        page, vus, pages = self.page(taille=2), [], []
+        while True:
+            pages.append(page)
+            vus += [recolte.pk for recolte in page]
+            if not page.a_suivante:
+                break
+            page = self.suivre(page.url_suivante)
+        self.assertEqual(vus, self.ordre)
+        self.assertEqual([len(p) for p in pages], [2, 2, 2, 1])
+        self.assertFalse(pages[0].a_precedente)
+
+        # Retour en arrière depuis la dernière page : mêmes pages, dans l'ordre inverse
+        page = pages[-1]
+        for attendue in reversed(pages[:-1]):
+            page = self.suivre(page.url_precedente)
+            self.assertEqual([r.pk for r in page], [r.pk for r in attendue])
+        self.assertFalse(page.a_precedente)
+
+    def test_derniere_page(self):
+        page = self.page(taille=7)
+        self.assertEqual([r.pk for r in page], self.ordre)
+        self.assertFalse(page.a_suivante or page.a_precedente)
+        # Curseur placé sur la dernière ligne : page vide, sans lien
+        derniere = Recolte.objects.get(pk=self.ordre[-1])
+        vide = self.page(apres=encoder_curseur(derniere.date_recolte, derniere.pk))
+        self.assertEqual(list(vide), [])
+        self.assertIsNone(vide.url_suivante)
+        self.assertIsNone(vide.url_precedente)
+
+    def test_pages_a_cheval_sur_deux_saisons(self):
+        recolte = Recolte.objects.get(pk=self.ordre[0])
+        anciennes = [
+            Recolte.objects.create(parcelle=recolte.parcelle, type_culture=recolte.type_culture,
+                                   quantite=Decimal('10'), date_recolte=date(2024, 12, jour)).pk
+            for jour in (31, 30)
+        ]
+        ordre = self.ordre + anciennes
+        with mock.patch('gestion.saisons.timezone.localdate', return_value=date(2025, 6, 1)), \
+                CaptureQueriesContext(connection) as requetes:
+            page, vus = self.page(taille=3), []
+            while True:
+                vus += [r.pk for r in page]
+                if not page.a_suivante:
+                    break
+                page = self.suivre(page.url_suivante)
+            self.assertEqual(vus, ordre)
+            # Retour à la page à cheval sur 2025 et 2024
+            page = self.suivre(page.url_precedente)
+            self.assertEqual([r.pk for r in page], ordre[3:6])
+        # Toute lecture des récoltes est bornée sur date_recolte (une saison, ou les précédentes)
+        for requete in requetes.captured_queries:
+            with self.subTest(sql=requete['sql']):
+                self.assertRegex(requete['sql'], r'WHERE .*"date_recolte" (<|>=|BETWEEN)')
+
+    def test_curseurs_invalides(self):
+        import base64
+        premiere = [r.pk for r in self.page(taille=3)]
+        for curseur in ['', 'pas du base64 !', 'Zm9v', base64.urlsafe_b64encode(b'2025-13-01|4').decode(),
+                        base64.urlsafe_b64encode(b'2025-01-01|x').decode(),
+                        base64.urlsafe_b64encode(b'2025-01-01|1|2').decode(),
+                        base64.urlsafe_b64encode(b'\xff\xfe').decode()]:
+            with self.subTest(curseur=curseur):
+                # Curseur illisible : retour à la première page, pas d'erreur
+                self.assertEqual([r.pk for r in self.page(taille=3, apres=curseur)], premiere)
+                self.assertEqual([r.pk for r in self.page(taille=3, avant=curseur)], premiere)
+        # Taille hors bornes ramenée dans [1, TAILLE_PAGE_MAX]
+        self.assertEqual(len(self.page(taille='0')), 1)
+        self.assertEqual(len(self.page(taille='abc')), 7)
+
+
+class ExportsTests(TestCase):
+    """Exports CSV et JSON lines : contenu, filtres combinés et lecture en flux"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_groups', stdout=StringIO())
+        commune = Commune.objects.create(nom='Dassa-Zoumè', code='C')
+        cls.nord = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        cls.sud = Arrondissement.objects.create(nom='Sud', commune=commune, code='S')
+        producteur = Producteur.objects.create(user=User.objects.create_user('akpovi'), telephone='97000000',
+                                               arrondissement=cls.nord)
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.soja = TypeCulture.objects.create(nom=TypeCulture.SOJA)
+        for arrondissement in (cls.nord, cls.sud):
+            parcelle = Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                               superficie=Decimal('1'), nom=f'Champ {arrondissement.nom}')
+            for mois, culture in enumerate([cls.mais, cls.soja, cls.mais], start=1):
+                Recolte.objects.create(parcelle=parcelle, type_culture=culture, quantite=Decimal(f'{mois}00.5'),
+                                       date_recolte=date(2025, mois, 15))
+        entrepot = Entrepot.objects.create(nom='Magasin', arrondissement=cls.sud, capacite_max=Decimal('1000'),
+                                           seuil_alerte=Decimal('10'))
+        Stock.objects.create(entrepot=entrepot, type_culture=cls.mais, quantite=Decimal('250'))
+        cls.gestionnaire = User.objects.create_user('gestionnaire')
+        cls.gestionnaire.groups.add(Group.objects.get(name='Gestionnaire'))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.gestionnaire)
+
+    def telecharger(self, nom, **parametres):
+        reponse = self.client.get(reverse(nom), parametres)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        return reponse, b''.join(reponse.streaming_content).decode('utf-8')
+
+    def test_csv_et_json_lines(self):
+        import csv
+        import json
+        reponse, contenu = self.telecharger('exporter_recoltes')
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="recoltes.csv"', reponse['Content-Disposition'])
+        lignes = list(csv.reader(StringIO(contenu)))
+        self.assertEqual(lignes[0][:3], ['id', 'date_recolte', 'producteur'])
+        attendus = list(Recolte.objects.order_by('-date_recolte', '-id').values_list('pk', flat=True))
+        self.assertEqual([int(ligne[0]) for ligne in lignes[1:]], attendus)
+        self.assertEqual(lignes[1][5:8], ['Dassa-Zoumè', 'MAIS', '300.50'])
+
+        reponse, contenu = self.telecharger('exporter_stocks', format='jsonl')
+        self.assertEqual(reponse['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        stocks = [json.loads(ligne) for ligne in contenu.splitlines()]
+        self.assertEqual(len(stocks), 1)
+        self.assertEqual((stocks[0]['entrepot'], stocks[0]['quantite_kg']), ('Magasin', '250.00'))
+        # Format inconnu : CSV
+        reponse, _ = self.telecharger('exporter_stocks', format='xlsx')
+        self.assertIn('filename="stocks.csv"', reponse['Content-Disposition'])
+
+    def test_filtres_combines(self):
+        from .filtres import filtrer_recoltes
+        from .exports import lignes_recoltes
+        cas = [
+            ({'type_culture': 'MAIS', 'arrondissement': str(self.sud.pk)},
+             Q(type_culture=self.mais, parcelle__arrondissement=self.sud)),
+            ({'date_debut': '2025-02-01', 'date_fin': '2025-02-28', 'type_culture': 'SOJA'},
+             Q(date_recolte__month=2, type_culture=self.soja)),
+            ({'date_debut': '2025-02-16', 'arrondissement': str(self.nord.pk)},
+             Q(date_recolte__gte=date(2025, 2, 16), parcelle__arrondissement=self.nord)),
+            # Valeurs invalides ignorées, culture inconnue : aucun résultat
+            ({'date_debut': '2025-13-01', 'arrondissement': 'nord'}, Q()),
+            ({'type_culture': 'MANIOC'}, Q(pk__in=[])),
+        ]
+        for parametres, attendu in cas:
+            with self.subTest(parametres=parametres):
+                attendus = set(Recolte.objects.filter(attendu).values_list('pk', flat=True))
+                self.assertEqual(set(filtrer_recoltes(Recolte.objects.all(), parametres).values_list('pk', flat=True)),
+                                 attendus)
+                _, lignes = lignes_recoltes(parametres)
+                self.assertEqual({ligne[0] for ligne in lignes.iterator()}, attendus)
+
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        sortie = f'{dossier.name}/recoltes.csv'
+        call_command('exporter_donnees', 'recoltes', '--type-culture', 'SOJA', '--sortie', sortie, stdout=StringIO())
+        with open(sortie, encoding='utf-8') as fichier:
+            self.assertEqual(len(fichier.read().splitlines()), 1 + Recolte.objects.filter(type_culture=self.soja).count())
+
+    def test_lecture_en_flux(self):
+        from django.db.models.query import QuerySet
+        reponse = self.client.get(reverse('exporter_recoltes'))
+        morceaux = iter(reponse.streaming_content)
+        # L'en-tête part avant toute lecture des récoltes
+        with self.assertNumQueries(0):
+            self.assertTrue(next(morceaux).startswith(b'id,date_recolte'))
+        # Les lignes viennent de QuerySet.iterator() : jamais de résultat chargé en entier
+        with mock.patch.object(QuerySet, '_fetch_all', side_effect=AssertionError('export matérialisé')):
+            with mock.patch('gestion.exports.TAILLE_BLOC', 2):
+                self.assertEqual(len(list(morceaux)), 6)
+
+    async def test_flux_asynchrone_sous_asgi(self):
+        from django.db.models.query import QuerySet
+        attendu = await sync_to_async(lambda: self.telecharger('exporter_recoltes')[1])()
+        await self.async_client.aforce_login(self.gestionnaire)
+        reponse = await self.async_client.get(reverse('exporter_recoltes'))
+        self.assertEqual(reponse.status_code, 200)
+        # Itérateur async : rien n'est matérialisé par Django avant l'envoi
+        self.assertTrue(reponse.is_async)
+        with mock.patch.object(QuerySet, '_fetch_all', side_effect=AssertionError('export matérialisé')):
+            with mock.patch('gestion.exports.TAILLE_BLOC', 2):
+                morceaux = [morceau async for morceau in reponse.streaming_content]
+        # En-tête + 6 lignes, deux par passage dans le thread de l'ORM
+        self.assertEqual(len(morceaux), 4)
+        self.assertEqual(b''.join(morceaux).decode('utf-8'), attendu)
+
+
+class ExecutionParalleleTests(TransactionTestCase):
+    """executer_en_parallele hors transaction : vraies connexions distinctes, parallélisme borné"""
+
+    def setUp(self):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+
+    def test_connexions_distinctes(self):
+        from django.db import connections
+        from .parallele import executer_en_parallele
+        ensemble = threading.Barrier(2, timeout=5)
+
+        def tache():
+            # Deux tâches doivent tourner en même temps pour franchir la barrière
+            ensemble.wait()
+            return threading.get_ident(), id(connections['default']), Arrondissement.objects.count()
+
+        resultats = async_to_sync(executer_en_parallele)({'a': tache, 'b': tache}, limite=2)
+        (thread_a, connexion_a, nombre_a), (thread_b, connexion_b, nombre_b) = resultats['a'], resultats['b']
+        self.assertNotEqual(thread_a, thread_b)
+        self.assertNotEqual(connexion_a, connexion_b)
+        self.assertNotIn(threading.get_ident(), (thread_a, thread_b))
+        # Données validées visibles de chaque connexion
+        self.assertEqual((nombre_a, nombre_b), (1, 1))
+
+    def test_parallelisme_borne(self):
+        from .parallele import executer_en_parallele
+        verrou = threading.Lock()
+        en_cours, maximum = [0], [0]
+
+        def tache():
+            with verrou:
+                en_cours[0] += 1
+                maximum[0] = max(maximum[0], en_cours[0])
+            time.sleep(0.05)
+            nombre = Commune.objects.count()
+            with verrou:
+                en_cours[0] -= 1
+            return nombre
+
+        resultats = async_to_sync(executer_en_parallele)({i: tache for i in range(6)}, limite=2)
+        self.assertEqual(resultats, {i: 1 for i in range(6)})
+        self.assertEqual(maximum[0], 2)
+
+    def test_sequentiel_dans_une_transaction(self):
+        from .parallele import executer_en_parallele
+        with transaction.atomic():
+            Commune.objects.create(nom='Non validée', code='X')
+            resultats = async_to_sync(executer_en_parallele)({'nombre': Commune.objects.count})
+        # Les écritures non validées ne sont visibles que sur la connexion de la requête
+        self.assertEqual(resultats, {'nombre': 2})
+
+    def test_middleware_des_roles_reste_async(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import RolesMiddleware
+
+        async def vue(request):
+            user = await request.auser()
+            return HttpResponse('connecté' if user.is_authenticated else 'anonyme')
+
+        middleware = RolesMiddleware(vue)
+        self.assertTrue(iscoroutinefunction(middleware))
+        requete = RequestFactory().get('/')
+        requete.session = {}
+        reponse = async_to_sync(middleware)(requete)
+        self.assertEqual(reponse.content.decode(), 'anonyme')
+        self.assertFalse(iscoroutinefunction(RolesMiddleware(lambda request: HttpResponse())))
+
+
+class CumulsRecoltesTests(TestCase):
+    """Cumuls mensuels tenus par les signaux et l'import : toujours égaux à l'agrégat des récoltes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        cls.nord = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        cls.sud = Arrondissement.objects.create(nom='Sud', commune=commune, code='S')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.soja = TypeCulture.objects.create(nom=TypeCulture.SOJA)
+        cls.parcelles = []
+        for i, arrondissement in enumerate((cls.nord, cls.sud)):
+            producteur = Producteur.objects.create(user=User.objects.create_user(f'producteur{i}'),
+                                                   telephone=f'9700000{i}', arrondissement=arrondissement)
+            cls.parcelles.append(Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                                         superficie=Decimal('1'), nom=f'Parcelle {i}'))
+
+    def cumuls(self):
+        return sorted(CumulRecolte.objects.values_list(
+            'periode', 'arrondissement_id', 'type_culture_id', 'producteur_id', 'quantite', 'nombre_recoltes',
+        ))
+
+    def verifier(self):
+        from django.db.models import Count
+        from django.db.models.functions import TruncMonth
+        attendus = sorted(
+            Recolte.objects.annotate(periode=TruncMonth('date_recolte')).values_list(
+                'periode', 'parcelle__arrondissement_id', 'type_culture_id', 'parcelle__producteur_id',
+            ).annotate(total=Sum('quantite'), nombre=Count('id')).order_by()
+        )
+        self.assertEqual(self.cumuls(), attendus)
+
+    def recolte(self, parcelle=0, culture=None, quantite='100', jour=date(2025, 3, 10)):
+        return Recolte.objects.create(parcelle=self.parcelles[parcelle], type_culture=culture or self.mais,
+                                      quantite=Decimal(quantite), date_recolte=jour)
+
+    def test_creation_modification_suppression(self):
+        recolte = self.recolte()
+        self.recolte(quantite='50')
+        self.recolte(parcelle=1, culture=self.soja)
+        self.verifier()
+        recolte.quantite = Decimal('80')
+        recolte.save()
+        self.verifier()
+        # Autre mois, autre culture, parcelle d'un autre producteur : la cellule d'origine est vidée
+        recolte.date_recolte = date(2025, 4, 2)
+        recolte.save()
+        self.verifier()
+        recolte.type_culture = self.soja
+        recolte.save()
+        self.verifier()
+        recolte.parcelle = self.parcelles[1]
+        recolte.save()
+        self.verifier()
+        recolte.delete()
+        self.verifier()
+        self.assertFalse(CumulRecolte.objects.filter(periode=date(2025, 4, 1)).exists())
+        # Parcelle déplacée dans un autre arrondissement : ses récoltes suivent
+        parcelle = self.parcelles[0]
+        parcelle.arrondissement = self.sud
+        parcelle.save()
+        self.verifier()
+
+    def test_import_en_masse(self):
+        from .imports import importer_recoltes
+        self.recolte()
+        fichier = StringIO(
+            'producteur,parcelle,type_culture,quantite,date_recolte\n'
+            'producteur0,Parcelle 0,MAIS,30,2025-03-20\n'
+            'producteur0,Parcelle 0,SOJA,12.5,14/05/2025\n'
+            'producteur1,Parcelle 1,MAIS,40,2025-03-20\n'
+        )
+        self.assertEqual(importer_recoltes(fichier, taille_lot=2).creees, 3)
+        self.verifier()
+
+    def test_reconstruction_idempotente(self):
+        for jour in (date(2025, 1, 5), date(2025, 1, 20), date(2025, 2, 1)):
+            self.recolte(jour=jour)
+            self.recolte(parcelle=1, culture=self.soja, jour=jour)
+        cumuls = self.cumuls()
+        call_command('reconstruire_cumuls', stdout=StringIO())
+        self.assertEqual(self.cumuls(), cumuls)
+        call_command('reconstruire_cumuls', stdout=StringIO())
+        self.assertEqual(self.cumuls(), cumuls)
+        # Répare une dérive
+        CumulRecolte.objects.update(quantite=0)
+        call_command('reconstruire_cumuls', stdout=StringIO())
+        self.verifier()
+
+
+class ImportRecoltesTests(TestCase):
+    """Import CSV : idempotence, erreurs par ligne, simulation et encodage du fichier"""
+
+    ENTETE = 'producteur,parcelle,type_culture,quantite,date_recolte\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_groups', stdout=StringIO())
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.producteurs = []
+        for username in ('akpovi', 'dossou'):
+            producteur = Producteur.objects.create(user=User.objects.create_user(username),
+                                                   telephone=f'97{username}', arrondissement=arrondissement)
+            cls.producteurs.append(producteur)
+        cls.champ = Parcelle.objects.create(producteur=cls.producteurs[0], arrondissement=arrondissement,
+                                            superficie=Decimal('1'), nom='Champ Élevé')
+        cls.voisine = Parcelle.objects.create(producteur=cls.producteurs[1], arrondissement=arrondissement,
+                                              superficie=Decimal('1'), nom='Voisine')
+        cls.gestionnaire = User.objects.create_user('gestionnaire')
+        cls.gestionnaire.groups.add(Group.objects.get(name='Gestionnaire'))
+
+    def importer(self, contenu, **options):
+        """Import par la commande d'un fichier écrit sur disque ; retourne la sortie"""
+        if isinstance(contenu, str):
+            contenu = contenu.encode('utf-8')
+        with tempfile.TemporaryDirectory() as dossier:
+            chemin = os.path.join(dossier, 'recoltes.csv')
+            with open(chemin, 'wb') as fichier:
+                fichier.write(contenu)
+            sortie = StringIO()
+            call_command('importer_recoltes', chemin, stdout=sortie, **options)
+        return sortie.getvalue()
+
+    def test_reimport_idempotent(self):
+        contenu = self.ENTETE + (
+            'akpovi,Champ Élevé,MAIS,30,2025-03-20\n'
+            'akpovi,champ élevé,Maïs,12.5,14/05/2025\n'
+            'dossou,Voisine,MAIS,"40,5",2025-03-20\n'
+        )
+        self.assertIn('3 récolte(s) créée(s), 0 doublon(s)', self.importer(contenu, taille_lot=2))
+        self.assertEqual(Recolte.objects.count(), 3)
+        journal = JournalSynchronisation.objects.count()
+        self.assertIn('0 récolte(s) créée(s), 3 doublon(s)', self.importer(contenu))
+        self.assertEqual(Recolte.objects.count(), 3)
+        self.assertEqual(JournalSynchronisation.objects.count(), journal)
+        self.assertEqual(Recolte.objects.get(parcelle=self.voisine).quantite, Decimal('40.50'))
+
+    def test_erreurs_par_ligne(self):
+        from .imports import importer_recoltes
+        fichier = StringIO(self.ENTETE + (
+            'akpovi,Champ Élevé,MAIS,30,2025-03-20\n'
+            'akpovi,Inconnue,MAIS,30,2025-03-20\n'
+            'akpovi,Champ Élevé,RIZ,30,2025-03-20\n'
+            'akpovi,Champ Élevé,MAIS,30,2025-13-40\n'
+            'akpovi,Champ Élevé,MAIS,-3,2025-03-21\n'
+            'dossou,Voisine,MAIS,30,2025-03-20\n'
+        ))
+        resultat = importer_recoltes(fichier, taille_lot=4, producteur=self.producteurs[0])
+        self.assertEqual((resultat.lignes_lues, resultat.creees), (6, 1))
+        self.assertEqual([numero for numero, _ in resultat.erreurs], [3, 4, 5, 6, 7])
+        self.assertIn('Inconnue', resultat.erreurs[0][1])
+        self.assertEqual(resultat.erreurs[4][1], 'Cette parcelle ne vous appartient pas')
+        self.assertEqual(Recolte.objects.get().parcelle, self.champ)
+        # Colonnes manquantes : erreur du fichier, rien n'est lu
+        resultat = importer_recoltes(StringIO('producteur;parcelle\nakpovi;Champ Élevé\n'))
+        self.assertEqual(resultat.erreurs, [(1, 'Colonnes manquantes : date_recolte, quantite, type_culture')])
+
+    def test_simulation(self):
+        contenu = self.ENTETE + (
+            'akpovi,Champ Élevé,MAIS,30,2025-03-20\n'
+            'akpovi,Champ Élevé,MAIS,30,2025-03-20\n'
+            'dossou,Voisine,MAIS,40,2025-03-20\n'
+        )
+        sortie = self.importer(contenu, simulation=True, taille_lot=1)
+        self.assertIn('2 récolte(s) à créer, 1 doublon(s)', sortie)
+        self.assertFalse(Recolte.objects.exists())
+        self.assertFalse(CumulRecolte.objects.exists())
+        self.assertFalse(JournalSynchronisation.objects.filter(modele=JournalSynchronisation.RECOLTE).exists())
+
+    def test_parcelle_nommee_comme_un_identifiant(self):
+        homonyme = Parcelle.objects.create(producteur=self.producteurs[0], arrondissement=self.champ.arrondissement,
+                                           superficie=Decimal('1'), nom=str(self.champ.pk))
+        self.importer(self.ENTETE + (
+            f'akpovi,{self.champ.pk},MAIS,30,2025-03-20\n'
+            f'dossou,{self.voisine.pk},MAIS,40,2025-03-20\n'
+            f'akpovi,{self.voisine.pk},MAIS,50,2025-03-20\n'
+        ))
+        # Le nom l'emporte sur l'identifiant, qui reste utilisable pour les autres parcelles
+        self.assertEqual(Recolte.objects.get(quantite=30).parcelle, homonyme)
+        self.assertEqual(Recolte.objects.get(quantite=40).parcelle, self.voisine)
+        self.assertFalse(Recolte.objects.filter(quantite=50).exists())
+
+    def test_parcelles_homonymes_a_la_casse_pres(self):
+        majuscules = Parcelle.objects.create(producteur=self.producteurs[0], arrondissement=self.champ.arrondissement,
+                                             superficie=Decimal('1'), nom='CHAMP ÉLEVÉ')
+        from .imports import importer_recoltes
+        resultat = importer_recoltes(StringIO(self.ENTETE + (
+            'akpovi,Champ Élevé,MAIS,30,2025-03-20\n'
+            f'akpovi,{majuscules.pk},MAIS,40,2025-03-20\n'
+            'dossou,Voisine,MAIS,50,2025-03-20\n'
+        )))
+        # Aucune des deux parcelles n'est choisie au hasard : l'identifiant est demandé
+        self.assertEqual([numero for numero, _ in resultat.erreurs], [2])
+        self.assertIn('identifiant numérique', resultat.erreurs[0][1])
+        self.assertEqual(Recolte.objects.get(quantite=40).parcelle, majuscules)
+        self.assertFalse(Recolte.objects.filter(parcelle=self.champ).exists())
+
+    def test_encodages(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        cp1252 = (self.ENTETE + 'akpovi,Champ Élevé,Maïs,30,2025-03-20\n').encode('cp1252')
+        with self.assertRaises(UnicodeDecodeError):
+            cp1252.decode('utf-8')
+        self.assertIn('1 récolte(s) créée(s)', self.importer(cp1252))
+        # BOM UTF-8 d'Excel : l'en-tête reste reconnu
+        self.importer('\ufeff' + self.ENTETE + 'akpovi,Champ Élevé,MAIS,20,2025-03-21\n')
+        self.assertEqual(Recolte.objects.count(), 2)
+
+        # Ni UTF-8 ni Windows-1252 (0x81 n'existe pas en cp1252) : erreur du fichier, pas d'exception
+        illisible = (self.ENTETE + 'akpovi,Champ Élevé,MAIS,10,2025-03-22\n').encode('utf-8') + b'\x81\xff\n'
+        self.assertIn('Ligne 1 : Encodage du fichier non reconnu', self.importer(illisible))
+        cache.clear()
+        self.client.force_login(self.gestionnaire)
+        reponse = self.client.post(reverse('importer_recoltes'), {
+            'fichier': SimpleUploadedFile('recoltes.csv', illisible, content_type='text/csv'),
+        })
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.context['resultat'].erreurs[0][0], 1)
+        reponse = self.client.post(reverse('importer_recoltes'), {
+            'fichier': SimpleUploadedFile('recoltes.csv', cp1252.replace(b'30', b'35'), content_type='text/csv'),
+        })
+        self.assertEqual(reponse.context['resultat'].creees, 0)
+        self.assertEqual(reponse.context['resultat'].doublons, 1)
+        self.assertEqual(Recolte.objects.count(), 2)
+
+
+class StatistiquesAccueilTests(TestCase):
+    """Statistiques de l'accueil servies depuis le cache et invalidées après chaque écriture qui les change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        cls.arrondissement = Arrondissement.objects.create(nom='Arrondissement', commune=commune, code='A')
+        cls.producteur = Producteur.objects.create(user=User.objects.create_user('producteur'), telephone='97000000',
+                                                   arrondissement=cls.arrondissement)
+        cls.parcelle = Parcelle.objects.create(producteur=cls.producteur, arrondissement=cls.arrondissement,
+                                               superficie=Decimal('1'), nom='Parcelle')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+
+    def setUp(self):
+        cache.clear()
+
+    def statistiques(self):
+        from .statistiques import statistiques_publiques
+        return statistiques_publiques()
+
+    def apres(self, ecriture):
+        """Exécute `ecriture` comme une requête validée, puis relit les statistiques"""
+        self.statistiques()
+        with self.captureOnCommitCallbacks(execute=True):
+            ecriture()
+        return self.statistiques()
+
+    def test_servies_depuis_le_cache(self):
+        self.statistiques()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.statistiques()['total_producteurs'], 1)
+
+    def test_invalidation_par_les_recoltes(self):
+        recolte = Recolte(parcelle=self.parcelle, type_culture=self.mais, quantite=Decimal('120'),
+                          date_recolte=date(2025, 3, 1))
+        self.assertEqual(self.apres(recolte.save)['total_recoltes_kg'], Decimal('120'))
+        recolte.quantite = Decimal('70')
+        self.assertEqual(self.apres(recolte.save)['total_recoltes_kg'], Decimal('70'))
+        self.assertEqual(self.apres(recolte.delete)['total_recoltes_kg'], 0)
+
+        from .imports import importer_recoltes
+        fichier = StringIO('producteur,parcelle,type_culture,quantite,date_recolte\n'
+                           'producteur,Parcelle,MAIS,45,2025-03-02\n')
+        self.assertEqual(self.apres(lambda: importer_recoltes(fichier))['total_recoltes_kg'], Decimal('45'))
+
+        from .synchronisation import synchroniser_recoltes
+        lot = [{'cle': 'hors-ligne', 'parcelle': self.parcelle.pk, 'type_culture': 'MAIS', 'quantite': '5',
+                'date_recolte': '2025-03-03'}]
+        self.assertEqual(self.apres(lambda: synchroniser_recoltes(self.producteur, lot))['total_recoltes_kg'],
+                         Decimal('50'))
+
+    def test_invalidation_par_les_producteurs_et_communes(self):
+        self.producteur.actif = False
+        self.assertEqual(self.apres(self.producteur.save)['total_producteurs'], 0)
+        commune = Commune(nom='Autre', code='X')
+        self.assertEqual(self.apres(commune.save)['total_communes'], 2)
+
+    def test_stocks_sans_effet(self):
+        # Les stocks ne figurent pas dans les statistiques publiques : l'entrée reste valide
+        entrepot = Entrepot.objects.create(nom='Entrepôt', arrondissement=self.arrondissement,
+                                           capacite_max=Decimal('1000'), seuil_alerte=Decimal('10'))
+        statistiques = self.statistiques()
+        with self.captureOnCommitCallbacks(execute=True):
+            MouvementStock.objects.entree(entrepot, self.mais, Decimal('300'))
+            Stock.objects.filter(entrepot=entrepot).get().delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.statistiques(), statistiques)
+        cache.clear()
+        self.assertEqual(self.statistiques(), statistiques)
+
+
+class PopulateDbTests(TestCase):
+    """Génération de volume par populate_db : petit volume, données dérivées cohérentes"""
+
+    def test_generation_et_reprise(self):
+        call_command('setup_groups', stdout=StringIO())
+        options = {'parcelles_par_producteur': 2, 'recoltes_par_parcelle': 3, 'taille_lot': 4, 'stdout': StringIO()}
+        call_command('populate_db', producteurs=5, entrepots=2, **options)
+        synthetiques = Producteur.objects.filter(user__username__startswith='synth')
+        self.assertEqual(synthetiques.count(), 5)
+        self.assertEqual(Recolte.objects.filter(parcelle__producteur__in=synthetiques).count(), 5 * 2 * 3)
+        self.assertEqual(Stock.objects.filter(entrepot__nom__startswith='Entrepôt synthétique').count(),
+                         2 * TypeCulture.objects.count())
+
+        # Données dérivées recalculées après les bulk_create
+        cumuls = CumulRecolte.objects.aggregate(quantite=Sum('quantite'), nombre=Sum('nombre_recoltes'))
+        self.assertEqual((cumuls['quantite'], cumuls['nombre']),
+                         (Recolte.objects.aggregate(total=Sum('quantite'))['total'], Recolte.objects.count()))
+        sortie = StringIO()
+        call_command('verifier_stocks', stdout=sortie)
+        self.assertNotIn('⚠️', sortie.getvalue())
+        self.assertEqual(
+            JournalSynchronisation.objects.filter(supprime=False).count(),
+            Recolte.objects.count() + Parcelle.objects.count() + Stock.objects.count(),
+        )
+        self.assertTrue(EntreeRecherche.objects.filter(type_objet=EntreeRecherche.PRODUCTEUR,
+                                                       objet_id=synthetiques.first().pk).exists())
+
+        # Second lancement : démonstration inchangée, volume ajouté à la suite
+        call_command('populate_db', producteurs=2, entrepots=1, **options)
+        self.assertEqual(synthetiques.count(), 7)
+        self.assertEqual(Entrepot.objects.filter(nom__startswith='Entrepôt synthétique').count(), 3)
+
+
+class BenchmarkVuesTests(TestCase):
+    """Mesure des vues par benchmark_vues sur la base de test, une itération"""
+
+    def test_toutes_les_vues_mesurees(self):
+        call_command('setup_groups', stdout=StringIO())
+        call_command('populate_db', producteurs=2, parcelles_par_producteur=1, recoltes_par_parcelle=2,
+                     entrepots=1, stdout=StringIO())
+        cache.clear()
+        commande = 'gestion.management.commands.benchmark_vues'
+        with tempfile.TemporaryDirectory() as dossier, \
+                mock.patch(f'{commande}.setup_test_environment'), \
+                mock.patch(f'{commande}.teardown_test_environment'):
+            sortie = os.path.join(dossier, 'benchmark.json')
+            call_command('benchmark_vues', '--base-existante', '--iterations', '1', '--sortie', sortie,
+                         stdout=StringIO())
+            with open(sortie, encoding='utf-8') as fichier:
+                resultats = json.load(fichier)
+
+        self.assertEqual(len(resultats['echelles']), 1)
+        vues = resultats['echelles'][0]['vues']
+        attendues = {motif.name for motif in gestion_urls.urlpatterns} - {'logout', 'synchroniser_recoltes'}
+        self.assertEqual(set(vues), attendues)
+        for nom, mesure in vues.items():
+            self.assertLess(mesure['statut'], 400, nom)
+            self.assertGreaterEqual(mesure['p99_ms'], mesure['p50_ms'], nom)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Plans d'exécution propres à SQLite")
+class PlansRequetesTests(TestCase):
+    """Vérifie par EXPLAIN QUERY PLAN que les vues n'effectuent aucun parcours complet des grosses tables"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.donnees = peupler_volume()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        from .statistiques import statistiques_publiques
+        cache.clear()
+        # Agrégats de tables entières : calculés une fois par invalidation, hors des pages mesurées
+        statistiques_publiques()
+
+    def parcours_complets(self, url, utilisateur=None):
+        if utilisateur:
+            self.client.force_login(utilisateur)
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url)
+            if hasattr(reponse, 'streaming_content'):
+                b''.join(reponse.streaming_content)
+        self.assertEqual(reponse.status_code, 200, url)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for requete in requetes.captured_queries:
+                sql = requete['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                # Alias des tables (U0, T3...) : le plan les nomme à la place de la table
+                alias = {nom: table for table, nom in re.findall(r'"(\w+)" (?:AS )?(\w+)\b', sql)}
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for ligne in cursor.fetchall():
+                    detail = ligne[-1]
+                    # Tout SCAN est un parcours complet, y compris « USING (COVERING) INDEX » ; seul SEARCH est borné
+                    correspondance = re.match(r'SCAN (\w+)', detail)
+                    if correspondance and alias.get(correspondance.group(1), correspondance.group(1)) in TABLES_VOLUMINEUSES:
+                        plans.append((detail, sql))
+        return [f'{detail} <- {sql[:200]}' for detail, sql in plans if not self.lecture_ordonnee_limitee(detail, sql)]
+
+    def lecture_ordonnee_limitee(self, detail, sql):
+        """
+        Seule exception : un index parcouru dans l'ordre du ORDER BY et arrêté par LIMIT
+        (première page par curseur) lit au plus LIMIT lignes. Il doit être la boucle
+        externe du plan ; un tri en B-tree temporaire ou l'absence de LIMIT le
+        ramène à un parcours complet.
+        """
+        if ' USING ' not in detail or not re.search(r'\bLIMIT \d+$', sql):
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [ligne[-1] for ligne in cursor.fetchall()]
+        return plan[0] == detail and not any('TEMP B-TREE' in etape for etape in plan)
+
+    def test_accueil(self):
+        self.assertEqual(self.parcours_complets('/'), [])
+
+    def test_dashboard_producteur(self):
+        utilisateur = self.donnees['producteur'].user
+        self.assertEqual(self.parcours_complets('/producteur/dashboard/', utilisateur), [])
+
+    def test_mes_recoltes(self):
+        utilisateur = self.donnees['producteur'].user
+        self.assertEqual(self.parcours_complets('/producteur/mes-recoltes/', utilisateur), [])
+
+    def test_dashboard_gestionnaire(self):
+        self.assertEqual(self.parcours_complets('/gestionnaire/dashboard/', self.donnees['gestionnaire']), [])
+
+    def test_gestion_stocks(self):
+        self.assertEqual(self.parcours_complets('/gestionnaire/stocks/', self.donnees['gestionnaire']), [])
+
+    def test_toutes_recoltes(self):
+        gestionnaire = self.donnees['gestionnaire']
+        for parametres in [
+            '',
+            f"?type_culture={self.donnees['culture'].nom}",
+            f"?arrondissement={self.donnees['arrondissement'].pk}",
+            '?date_debut=2025-01-01&date_fin=2025-03-31',
+            f'?apres={encoder_curseur(date(2024, 6, 1), 10 ** 9)}',
+        ]:
+            with self.subTest(parametres=parametres):
+                self.assertEqual(self.parcours_complets(f'/gestionnaire/recoltes/{parametres}', gestionnaire), [])
+
+    def test_recherche_rapide(self):
+        gestionnaire = self.donnees['gestionnaire']
+        for saisie in ['producteur1', 'ducteur 12', '97 000 1', 'pa', 'entrepot 1']:
+            with self.subTest(saisie=saisie):
+                self.assertEqual(self.parcours_complets(f'/api/recherche/?q={saisie}', gestionnaire), [])
+
+
+class BudgetRequetesTests(TestCase):
+    """
+    Plafond de requêtes SQL pour chaque URL de gestion/urls.py.
+
+    Chaque vue est mesurée sur une petite base puis sur une base plusieurs fois
+    plus grosse : le nombre de requêtes doit être identique (pas de N+1) et
+    rester sous le plafond. Une nouvelle URL sans budget fait échouer le test.
+    """
+
+    # nom d'URL -> (rôle, plafond de requêtes). Les données de test s'arrêtent en 2025 : la
+    # saison en cours est vide, les listes de récoltes relisent les saisons précédentes (+1)
+    BUDGETS = {
+        'accueil': (None, 3),
+        'logout': ('producteur', 3),
+        'dashboard_producteur': ('producteur', 7),
+        'mes_recoltes': ('producteur', 4),
+        'ajouter_recolte': ('producteur', 2),
+        'synchroniser_recoltes': ('producteur', 26),  # journal : réservation des séquences (UPDATE + SELECT)
+        'dashboard_gestionnaire': ('gestionnaire', 11),  # cache des statistiques vide : 3 de moins ensuite
+        'gestion_stocks': ('gestionnaire', 4),
+        'modifier_stock': ('gestionnaire', 5),
+        'toutes_recoltes': ('gestionnaire', 4),
+        'importer_recoltes': ('gestionnaire', 1),
+        'exporter_recoltes': ('gestionnaire', 2),
+        'exporter_stocks': ('gestionnaire', 2),
+        'flux_synchronisation': ('gestionnaire', 3),
+        'recherche_rapide': ('gestionnaire', 2),
+        'health_check': (None, 0),
+    }
+
+    def corps_synchronisation(self):
+        # Un mois encore vide à chaque appel : les cumuls sont toujours créés, pas mis à jour
+        self.mois_synchronises = getattr(self, 'mois_synchronises', 0) + 1
+        parcelle = self.donnees['producteur'].parcelles.first()
+        return {'recoltes': [
+            {'cle': str(uuid.uuid4()), 'parcelle': parcelle.pk, 'type_culture': culture,
+             'quantite': '100', 'date_recolte': f'2020-{self.mois_synchronises:02d}-{jour:02d}'}
+            for culture in ('MAIS', 'SOJA') for jour in range(1, 11)
+        ]}
+
+    # Vues qui n'acceptent que POST : nom d'URL -> méthode fabriquant le corps JSON
+    VUES_POST = {
+        'synchroniser_recoltes': corps_synchronisation,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.donnees = peupler_volume(nb_producteurs=4, parcelles_par_producteur=1, recoltes_par_parcelle=2)
+
+    def url(self, nom):
+        if nom == 'modifier_stock':
+            return reverse(nom, args=[self.donnees['entrepot'].pk])
+        if nom == 'flux_synchronisation':
+            # Page courte : les premières entrées du journal sont des récoltes dans les deux bases
+            return reverse(nom) + '?taille=5'
+        if nom == 'recherche_rapide':
+            return reverse(nom) + '?q=producteur'
+        return reverse(nom)
+
+    def mesurer(self, nom):
+        role, _ = self.BUDGETS[nom]
+        self.client.logout()
+        if role == 'producteur':
+            self.client.force_login(self.donnees['producteur'].user)
+        elif role == 'gestionnaire':
+            self.client.force_login(self.donnees['gestionnaire'])
+        corps = self.VUES_POST[nom](self) if nom in self.VUES_POST else None
+        cache.clear()
+        if role is not None:
+            # Session et rôle en cache, comme pour toute page après la première
+            self.client.get(reverse('accueil'))
+        # Référentiel déjà chargé par le processus, comme après la première requête
+        referentiel.cultures
+        with CompteurRequetes() as compteur:
+            if corps is not None:
+                reponse = self.client.post(self.url(nom), corps, content_type='application/json')
+            else:
+                reponse = self.client.get(self.url(nom))
+            if hasattr(reponse, 'streaming_content'):
+                b''.join(reponse.streaming_content)
+        self.assertLess(reponse.status_code, 400, nom)
+        return compteur
+
+    def test_toutes_les_urls_ont_un_budget(self):
+        noms = {motif.name for motif in gestion_urls.urlpatterns}
+        self.assertEqual(noms - set(self.BUDGETS), set())
+
+    def test_budget_independant_du_volume(self):
+        petite_base = {nom: self.mesurer(nom).nombre for nom in self.BUDGETS}
+        peupler_volume(nb_producteurs=30, parcelles_par_producteur=3, recoltes_par_parcelle=10, prefixe='x')
+        for nom, (_, plafond) in self.BUDGETS.items():
+            with self.subTest(url=nom):
+                compteur = self.mesurer(nom)
+                self.assertEqual(compteur.nombre, petite_base[nom], f"{nom} : le nombre de requêtes dépend du volume")
+                self.assertLessEqual(compteur.nombre, plafond)
+                self.assertEqual(compteur.formes_repetees(seuil=3), [])
+
+
+class SynchronisationRecoltesTests(TestCase):
+    """Envoi groupé des récoltes saisies hors connexion"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_groups', stdout=StringIO())
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        parcelles = []
+        for i in range(2):
+            user = User.objects.create_user(f'producteur{i}')
+            user.groups.add(Group.objects.get(name='Producteur'))
+            producteur = Producteur.objects.create(user=user, telephone=f'9700000{i}', arrondissement=arrondissement)
+            parcelles.append(Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                                     superficie=Decimal('1'), nom='Parcelle'))
+        cls.parcelle, cls.autre_parcelle = parcelles
+        cls.producteur = cls.parcelle.producteur
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.producteur.user)
+
+    def envoyer(self, entrees):
+        return self.client.post('/producteur/api/recoltes/synchroniser/', {'recoltes': entrees},
+                                content_type='application/json')
+
+    def entree(self, cle, parcelle=None, quantite='250.5'):
+        return {'cle': cle, 'parcelle': (parcelle or self.parcelle).pk, 'type_culture': 'MAIS',
+                'quantite': quantite, 'date_recolte': '2025-07-14'}
+
+    def test_renvoi_idempotent(self):
+        entrees = [self.entree(f'cle-{i}') for i in range(3)]
+        premier = self.envoyer(entrees)
+        self.assertEqual(premier.status_code, 201)
+        self.assertEqual(premier.json()['creees'], 3)
+
+        with CompteurRequetes() as compteur:
+            renvoi = self.envoyer(entrees)
+        self.assertEqual(renvoi.status_code, 200)
+        self.assertEqual(renvoi.json()['existantes'], 3)
+        self.assertEqual([r['id'] for r in renvoi.json()['recoltes']], [r['id'] for r in premier.json()['recoltes']])
+        self.assertFalse([sql for sql, _ in compteur.requetes if sql.startswith(('INSERT', 'UPDATE'))])
+
+        self.assertEqual(Recolte.objects.filter(parcelle=self.parcelle).count(), 3)
+        cumul = CumulRecolte.objects.get(producteur=self.producteur, periode=date(2025, 7, 1))
+        self.assertEqual((cumul.quantite, cumul.nombre_recoltes), (Decimal('751.50'), 3))
+
+    def test_lot_refuse_en_entier(self):
+        reponse = self.envoyer([self.entree('ok'), self.entree('etrangere', parcelle=self.autre_parcelle)])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual([e['index'] for e in reponse.json()['erreurs']], [1])
+        self.assertFalse(Recolte.objects.filter(cle_idempotence__in=['ok', 'etrangere']).exists())
+
+    def test_cle_d_un_autre_producteur(self):
+        Recolte.objects.create(parcelle=self.autre_parcelle, type_culture=self.mais,
+                               quantite=Decimal('10'), date_recolte=date(2025, 7, 1), cle_idempotence='prise')
+        reponse = self.envoyer([self.entree('prise')])
+        self.assertEqual(reponse.status_code, 400)
+        self.assertNotIn('id', reponse.json()['erreurs'][0])
+
+
+class FluxSynchronisationTests(TestCase):
+    """Flux des modifications depuis un jeton, avec pierres tombales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_groups', stdout=StringIO())
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.producteurs = []
+        for i in range(2):
+            user = User.objects.create_user(f'producteur{i}')
+            user.groups.add(Group.objects.get(name='Producteur'))
+            producteur = Producteur.objects.create(user=user, telephone=f'9700000{i}', arrondissement=arrondissement)
+            cls.producteurs.append(producteur)
+            for j in range(2):
+                parcelle = Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                                   superficie=Decimal('1'), nom=f'Parcelle {j}')
+                for jour in range(1, 4):
+                    Recolte.objects.create(parcelle=parcelle, type_culture=cls.mais, quantite=Decimal('100'),
+                                           date_recolte=date(2025, 6, jour))
+        cls.producteur = cls.producteurs[0]
+        cls.gestionnaire = User.objects.create_user('gestionnaire')
+        cls.gestionnaire.groups.add(Group.objects.get(name='Gestionnaire'))
+        entrepot = Entrepot.objects.create(nom='Magasin', arrondissement=arrondissement,
+                                           capacite_max=Decimal('1000'), seuil_alerte=Decimal('10'))
+        Stock.objects.create(entrepot=entrepot, type_culture=cls.mais, quantite=Decimal('250'))
+
+    def setUp(self):
+        cache.clear()
+
+    def lire(self, jeton='0', taille=1000):
+        reponse = self.client.get('/api/synchronisation/modifications/', {'depuis': jeton, 'taille': taille})
+        self.assertEqual(reponse.status_code, 200)
+        return reponse.json()
+
+    def test_seulement_les_changements(self):
+        self.client.force_login(self.gestionnaire)
+        jeton = self.lire()['jeton']
+        recolte = Recolte.objects.filter(parcelle__producteur=self.producteur).first()
+        recolte.quantite = Decimal('999')
+        recolte.save()
+        supprimee = Recolte.objects.exclude(pk=recolte.pk).first()
+        id_supprime = supprimee.pk
+        supprimee.delete()
+
+        flux = self.lire(jeton)
+        self.assertFalse(flux['encore'])
+        changements = {(m['modele'], m['id']): m for m in flux['modifications']}
+        self.assertEqual(set(changements), {('recolte', recolte.pk), ('recolte', id_supprime)})
+        self.assertEqual(changements[('recolte', recolte.pk)]['donnees']['quantite'], '999.00')
+        self.assertTrue(changements[('recolte', id_supprime)]['supprime'])
+        self.assertEqual(self.lire(flux['jeton'])['modifications'], [])
+
+    def test_recoltes_lues_dans_leur_saison(self):
+        recolte = Recolte.objects.filter(parcelle__producteur=self.producteur).first()
+        jeton = flux_modifications()['jeton']
+        recolte.date_recolte = date(2024, 11, 3)
+        recolte.save()
+        entree = JournalSynchronisation.objects.get(modele='recolte', objet_id=recolte.pk)
+        self.assertEqual(entree.saison, 2024)
+        with CaptureQueriesContext(connection) as requetes:
+            flux = flux_modifications(jeton)
+        self.assertEqual(flux['modifications'][0]['donnees']['date_recolte'], date(2024, 11, 3))
+        lecture = [r['sql'] for r in requetes.captured_queries if 'FROM "gestion_recolte"' in r['sql']]
+        self.assertRegex(lecture[0], r'"date_recolte" >= .*"date_recolte" <')
+        # Saison effacée (journal antérieur à la colonne) : recherche par id seul
+        JournalSynchronisation.objects.filter(pk=entree.pk).update(saison=None)
+        self.assertEqual(flux_modifications(jeton)['modifications'][0]['donnees']['date_recolte'], date(2024, 11, 3))
+        # La reconstruction renseigne la saison sans toucher à l'objet
+        JournalSynchronisation.objects.reconstruire()
+        self.assertEqual(JournalSynchronisation.objects.get(modele='recolte', objet_id=recolte.pk).saison, 2024)
+
+    def test_pages_bornees(self):
+        self.client.force_login(self.gestionnaire)
+        jeton, vus = '0', set()
+        while True:
+            flux = self.lire(jeton, taille=4)
+            self.assertLessEqual(len(flux['modifications']), 4)
+            vus.update((m['modele'], m['id']) for m in flux['modifications'])
+            jeton = flux['jeton']
+            if not flux['encore']:
+                break
+        self.assertEqual(len(vus), Recolte.objects.count() + Parcelle.objects.count() + Stock.objects.count())
+
+    def test_producteur_ne_recoit_que_ses_donnees(self):
+        self.client.force_login(self.producteur.user)
+        modeles = {(m['modele'], m['id']) for m in self.lire()['modifications']}
+        attendus = {('recolte', pk) for pk in Recolte.objects.filter(parcelle__producteur=self.producteur)
+                    .values_list('pk', flat=True)}
+        attendus |= {('parcelle', pk) for pk in self.producteur.parcelles.values_list('pk', flat=True)}
+        self.assertEqual(modeles, attendus)
+
+    def test_changement_de_producteur(self):
+        ancien, nouveau = self.producteurs
+        parcelle = ancien.parcelles.first()
+        cedees = {('parcelle', parcelle.pk)} | {('recolte', pk) for pk in parcelle.recoltes.values_list('pk', flat=True)}
+        jetons = {}
+        for producteur in self.producteurs:
+            self.client.force_login(producteur.user)
+            jetons[producteur] = self.lire()['jeton']
+
+        parcelle.producteur = nouveau
+        parcelle.save()
+
+        # L'ancien propriétaire reçoit une pierre tombale pour la parcelle et chacune de ses récoltes
+        self.client.force_login(ancien.user)
+        flux = self.lire(jetons[ancien])
+        self.assertEqual({(m['modele'], m['id']) for m in flux['modifications']}, cedees)
+        self.assertTrue(all(m['supprime'] for m in flux['modifications']))
+        # Le nouveau les reçoit vivantes
+        self.client.force_login(nouveau.user)
+        flux = self.lire(jetons[nouveau])
+        self.assertEqual({(m['modele'], m['id']) for m in flux['modifications']}, cedees)
+        self.assertFalse(any(m['supprime'] for m in flux['modifications']))
+        # Un gestionnaire qui rejoue le flux dans l'ordre finit avec les objets présents
+        self.client.force_login(self.gestionnaire)
+        etat = {}
+        for modification in self.lire()['modifications']:
+            etat[(modification['modele'], modification['id'])] = not modification['supprime']
+        self.assertTrue(all(etat[cle] for cle in cedees))
+
+        # Retour au premier propriétaire : la pierre tombale du second est inscrite à son tour
+        parcelle.producteur = ancien
+        parcelle.save()
+        self.assertEqual(list(JournalSynchronisation.objects.filter(
+            modele=JournalSynchronisation.PARCELLE, objet_id=parcelle.pk,
+        ).values_list('producteur_id', 'supprime').order_by('sequence')), [(nouveau.pk, True), (ancien.pk, False)])
+
+    def test_reconstruction_sans_renumerotation(self):
+        avant = list(JournalSynchronisation.objects.values_list('sequence', 'modele', 'objet_id', 'producteur_id'))
+        self.assertEqual(JournalSynchronisation.objects.reconstruire(), 0)
+        self.assertEqual(list(JournalSynchronisation.objects.values_list(
+            'sequence', 'modele', 'objet_id', 'producteur_id',
+        )), avant)
+
+        # Écritures qui contournent les signaux : seules elles sont rattrapées
+        ancien, nouveau = self.producteurs
+        parcelle = ancien.parcelles.first()
+        Parcelle.objects.filter(pk=parcelle.pk).update(producteur=nouveau)
+        ajoutee = Recolte.objects.bulk_create([Recolte(parcelle=parcelle, type_culture=self.mais,
+                                                       quantite=Decimal('5'), date_recolte=date(2025, 7, 1))])[0]
+        supprimee = Recolte.objects.filter(parcelle__producteur=ancien).first()
+        Recolte.objects.filter(pk=supprimee.pk)._raw_delete(connection.alias)
+        derniere = max(sequence for sequence, _, _, _ in avant)
+
+        # Parcelle et 3 récoltes cédées (pierre tombale + entrée), récolte ajoutée, récolte disparue
+        self.assertEqual(JournalSynchronisation.objects.reconstruire(), 6)
+        nouvelles = set(JournalSynchronisation.objects.filter(sequence__gt=derniere).values_list(
+            'modele', 'objet_id', 'producteur_id', 'supprime',
+        ))
+        attendues = {('parcelle', parcelle.pk, ancien.pk, True), ('parcelle', parcelle.pk, nouveau.pk, False),
+                     ('recolte', ajoutee.pk, nouveau.pk, False), ('recolte', supprimee.pk, ancien.pk, True)}
+        for pk in parcelle.recoltes.exclude(pk=ajoutee.pk).values_list('pk', flat=True):
+            attendues |= {('recolte', pk, ancien.pk, True), ('recolte', pk, nouveau.pk, False)}
+        self.assertEqual(nouvelles, attendues)
+        self.assertEqual(JournalSynchronisation.objects.reconstruire(), 0)
+
+
+class SequenceSynchronisationConcurrenteTests(TransactionTestCase):
+    """Deux écrivains concurrents : les séquences deviennent visibles dans l'ordre des validations"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Base SQLite en mémoire : une écriture concurrente échoue au lieu d'attendre")
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        producteur = Producteur.objects.create(user=User.objects.create_user('producteur'), telephone='97000000',
+                                               arrondissement=arrondissement)
+        self.parcelle = Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                                superficie=Decimal('1'), nom='Parcelle')
+        self.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+
+    def test_ecriture_lente_jamais_depassee(self):
+        from django.db import connections
+        ecrite, liberer = threading.Event(), threading.Event()
+        recoltes = {}
+
+        def ecrire(nom, attendre):
+            try:
+                with transaction.atomic():
+                    recoltes[nom] = Recolte.objects.create(parcelle=self.parcelle, type_culture=self.mais,
+                                                           quantite=Decimal('10'), date_recolte=date(2025, 6, 1))
+                    if attendre:
+                        ecrite.set()
+                        liberer.wait(10)
+            finally:
+                connections.close_all()
+
+        jeton = flux_modifications()['jeton']
+        lente = threading.Thread(target=ecrire, args=('lente', True))
+        lente.start()
+        self.assertTrue(ecrite.wait(10))
+        rapide = threading.Thread(target=ecrire, args=('rapide', False))
+        rapide.start()
+        rapide.join(0.5)
+        # L'écriture rapide attend la validation de la lente : aucun jeton ne peut la dépasser
+        self.assertTrue(rapide.is_alive())
+        self.assertEqual(flux_modifications(int(jeton))['modifications'], [])
+        liberer.set()
+        lente.join(10)
+        rapide.join(10)
+
+        flux = flux_modifications(int(jeton))
+        self.assertEqual([m['id'] for m in flux['modifications']], [recoltes['lente'].pk, recoltes['rapide'].pk])
+
+
+class ImportConcurrentTests(TransactionTestCase):
+    """Deux imports simultanés du même fichier : la récolte n'est créée et cumulée qu'une fois"""
+
+    def setUp(self):
+        if not connection.features.has_select_for_update:
+            self.skipTest("Pas de verrou de ligne (SELECT ... FOR UPDATE) sur ce moteur")
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        producteur = Producteur.objects.create(user=User.objects.create_user('akpovi'), telephone='97000000',
+                                               arrondissement=arrondissement)
+        Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                superficie=Decimal('1'), nom='Champ')
+        TypeCulture.objects.create(nom=TypeCulture.MAIS)
+
+    def test_import_simultane_sans_doublon(self):
+        from django.db import connections
+        from . import imports
+        contenu = 'producteur,parcelle,type_culture,quantite,date_recolte\nakpovi,Champ,MAIS,30,2025-03-20\n'
+        controle, liberer = threading.Event(), threading.Event()
+        filtrer = imports._filtrer_nouvelles
+        resultats = []
+
+        def filtrer_puis_attendre(*args):
+            nouvelles = filtrer(*args)
+            if not controle.is_set():
+                # Premier import : contrôle d'existence fait, insertion pas encore écrite
+                controle.set()
+                liberer.wait(10)
+            return nouvelles
+
+        def importer():
+            try:
+                resultats.append(imports.importer_recoltes(StringIO(contenu)))
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(imports, '_filtrer_nouvelles', filtrer_puis_attendre):
+            premier = threading.Thread(target=importer)
+            premier.start()
+            self.assertTrue(controle.wait(10))
+            second = threading.Thread(target=importer)
+            second.start()
+            second.join(0.5)
+            # Le second import attend le verrou des parcelles au lieu de refaire le contrôle
+            self.assertTrue(second.is_alive())
+            liberer.set()
+            premier.join(10)
+            second.join(10)
+
+        self.assertEqual(sorted((r.creees, r.doublons) for r in resultats), [(0, 1), (1, 0)])
+        self.assertEqual(Recolte.objects.count(), 1)
+        self.assertEqual(CumulRecolte.objects.aggregate(total=Sum('quantite'))['total'], Decimal('30'))
+        self.assertEqual(JournalSynchronisation.objects.filter(modele=JournalSynchronisation.RECOLTE).count(), 1)
+
+
+class AdminChangelistTests(TestCase):
+    """Les listes de l'admin ont un nombre de requêtes constant, quel que soit le volume"""
+
+    @classmethod
+    def setUpTestData(cls):
+        peupler_volume(nb_producteurs=4, parcelles_par_producteur=1, recoltes_par_parcelle=2)
+        cls.admin = User.objects.create_superuser('admin', password='motdepasse')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        # Session et rôle en cache avant les mesures
+        self.client.get(reverse('admin:index'))
+
+    def mesurer(self, url):
+        with CompteurRequetes() as compteur:
+            reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200, url)
+        return compteur
+
+    def test_requetes_independantes_du_volume(self):
+        from django.contrib import admin as admin_site
+        urls = [
+            f'/admin/gestion/{modele._meta.model_name}/'
+            for modele in admin_site.site._registry if modele._meta.app_label == 'gestion'
+        ]
+        petite_base = {url: self.mesurer(url).nombre for url in urls}
+        peupler_volume(nb_producteurs=30, parcelles_par_producteur=3, recoltes_par_parcelle=10, prefixe='x')
+        for url in urls:
+            with self.subTest(url=url):
+                compteur = self.mesurer(url)
+                self.assertEqual(compteur.formes_repetees(seuil=3), [])
+                self.assertEqual(compteur.nombre, petite_base[url])
+
+    def test_filtre_par_saison(self):
+        from .saisons import saison_courante
+        Recolte.objects.filter(pk=Recolte.objects.order_by('pk').values('pk')[:1]).update(
+            date_recolte=date(saison_courante(), 1, 15),
+        )
+        compteur = self.mesurer('/admin/gestion/recolte/')
+        # Ni date_hierarchy ni liste de saisons tirée de la table
+        self.assertFalse([sql for sql, _ in compteur.requetes if 'DISTINCT' in sql.upper()])
+        reponse = self.client.get('/admin/gestion/recolte/', {'saison': saison_courante()})
+        attendues = Recolte.objects.filter(date_recolte__year=saison_courante()).count()
+        self.assertEqual(reponse.context['cl'].result_count, attendues)
+        self.assertGreater(attendues, 0)
+
+    def test_filtre_par_annee_d_inscription(self):
+        from .saisons import saison_courante
+        compteur = self.mesurer('/admin/gestion/producteur/')
+        self.assertFalse([sql for sql, _ in compteur.requetes if 'DISTINCT' in sql.upper()])
+        reponse = self.client.get('/admin/gestion/producteur/', {'inscription': saison_courante()})
+        self.assertEqual(reponse.context['cl'].result_count, Producteur.objects.count())
+        reponse = self.client.get('/admin/gestion/producteur/', {'inscription': saison_courante() - 1})
+        self.assertEqual(reponse.context['cl'].result_count, 0)
+
+    def test_compte_estime_sur_table_entiere(self):
+        from .admin import PaginateurEstime
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginateur = PaginateurEstime(Recolte.objects.all(), 100)
+        if connection.vendor == 'sqlite':
+            with mock.patch('gestion.admin.SEUIL_COMPTE_ESTIME', 0):
+                with CompteurRequetes() as compteur:
+                    self.assertEqual(paginateur.count, Recolte.objects.count())
+                self.assertNotIn('COUNT', compteur.requetes[0][0].upper())
+        filtre = PaginateurEstime(Recolte.objects.filter(quantite__gt=0), 100)
+        self.assertEqual(filtre.count, Recolte.objects.filter(quantite__gt=0).count())
+
+
+class MouvementStockTests(TestCase):
+    """Grand livre des stocks : soldes atomiques, capacité et compaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_groups', stdout=StringIO())
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Arrondissement', commune=commune, code='A')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.soja = TypeCulture.objects.create(nom=TypeCulture.SOJA)
+        cls.source = Entrepot.objects.create(nom='Source', arrondissement=arrondissement,
+                                             capacite_max=Decimal('1000'), seuil_alerte=Decimal('100'))
+        cls.destination = Entrepot.objects.create(nom='Destination', arrondissement=arrondissement,
+                                                  capacite_max=Decimal('500'), seuil_alerte=Decimal('100'))
+
+    def quantite(self, entrepot, culture):
+        return Stock.objects.filter(entrepot=entrepot, type_culture=culture).values_list('quantite', flat=True).first()
+
+    def verifier_coherence(self):
+        for entrepot in (self.source, self.destination):
+            entrepot.refresh_from_db()
+            total = Stock.objects.filter(entrepot=entrepot).aggregate(total=Sum('quantite'))['total'] or 0
+            self.assertEqual(entrepot.stock_cumule, total)
+        soldes = MouvementStock.objects.soldes_reconstitues()
+        for stock in Stock.objects.all():
+            self.assertEqual(soldes[(stock.entrepot_id, stock.type_culture_id)], stock.quantite)
+
+    def test_entree_sortie_transfert(self):
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('600'))
+        MouvementStock.objects.entree(self.source, self.soja, Decimal('300'))
+        MouvementStock.objects.sortie(self.source, self.mais, Decimal('100'))
+        MouvementStock.objects.transfert(self.source, self.destination, self.mais, Decimal('200'))
+        self.assertEqual(self.quantite(self.source, self.mais), Decimal('300'))
+        self.assertEqual(self.quantite(self.destination, self.mais), Decimal('200'))
+        self.verifier_coherence()
+
+    def test_refus_sans_effet(self):
+        MouvementStock.objects.entree(self.destination, self.mais, Decimal('400'))
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('300'))
+        with self.assertRaises(ValidationError):
+            MouvementStock.objects.entree(self.source, self.soja, Decimal('701'))
+        with self.assertRaises(ValidationError):
+            MouvementStock.objects.sortie(self.source, self.soja, Decimal('1'))
+        with self.assertRaises(ValidationError):
+            # La destination déborderait : la sortie de la source est annulée aussi
+            MouvementStock.objects.transfert(self.source, self.destination, self.mais, Decimal('150'))
+        self.assertEqual(self.quantite(self.source, self.mais), Decimal('300'))
+        self.assertEqual(MouvementStock.objects.count(), 2)
+        self.verifier_coherence()
+
+    def test_suppression_soldee_au_grand_livre(self):
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('300'))
+        MouvementStock.objects.entree(self.source, self.soja, Decimal('100'))
+        Stock.objects.get(entrepot=self.source, type_culture=self.mais).delete()
+        Stock.objects.filter(entrepot=self.source, type_culture=self.soja).delete()
+        self.assertEqual(MouvementStock.objects.soldes_reconstitues()[(self.source.pk, self.mais.pk)], 0)
+        self.assertEqual(MouvementStock.objects.soldes_reconstitues()[(self.source.pk, self.soja.pk)], 0)
+        # Le stock recréé repart de zéro, au grand livre comme en table
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('50'))
+        self.verifier_coherence()
+        sortie = StringIO()
+        call_command('verifier_stocks', stdout=sortie)
+        self.assertNotIn('⚠️', sortie.getvalue())
+        # Un solde resté sans stock est signalé
+        MouvementStock.objects.filter(commentaire='Suppression du stock', type_culture=self.soja).delete()
+        sortie = StringIO()
+        call_command('verifier_stocks', stdout=sortie)
+        self.assertIn('Source / SOJA : aucun stock, grand livre 100', sortie.getvalue())
+
+    def test_enregistrement_direct_verifie_la_capacite(self):
+        stock = Stock.objects.create(entrepot=self.destination, type_culture=self.mais, quantite=Decimal('400'))
+        stock.quantite = Decimal('501')
+        with self.assertRaises(ValidationError):
+            stock.save()
+        with self.assertRaises(ValidationError):
+            Stock.objects.create(entrepot=self.destination, type_culture=self.soja, quantite=Decimal('101'))
+        self.assertEqual(self.quantite(self.destination, self.mais), Decimal('400'))
+        self.assertIsNone(self.quantite(self.destination, self.soja))
+        self.verifier_coherence()
+
+    def test_admin_passe_par_l_inventaire(self):
+        admin = User.objects.create_superuser('admin', password='motdepasse')
+        self.client.force_login(admin)
+        MouvementStock.objects.entree(self.destination, self.mais, Decimal('400'))
+        stock = Stock.objects.get(entrepot=self.destination, type_culture=self.mais)
+        url = reverse('admin:gestion_stock_change', args=[stock.pk])
+        reponse = self.client.post(url, {'quantite': '550'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertIn('quantite', reponse.context['adminform'].form.errors)
+        reponse = self.client.post(url, {'quantite': '350'})
+        self.assertEqual(reponse.status_code, 302)
+        inventaire = MouvementStock.objects.get(type_mouvement=MouvementStock.INVENTAIRE)
+        self.assertEqual((inventaire.quantite, inventaire.auteur), (Decimal('-50'), admin))
+        reponse = self.client.post(reverse('admin:gestion_stock_add'), {
+            'entrepot': self.destination.pk, 'type_culture': self.soja.pk, 'quantite': '100',
+        })
+        self.assertEqual(reponse.status_code, 302)
+        self.assertEqual(self.quantite(self.destination, self.soja), Decimal('100'))
+        self.verifier_coherence()
+
+    def donnees_inventaire(self, formset, **quantites):
+        donnees = {'form-TOTAL_FORMS': len(formset.forms), 'form-INITIAL_FORMS': len(formset.forms)}
+        for index, ligne in enumerate(formset.forms):
+            donnees[f'form-{index}-type_culture'] = ligne.culture.pk
+            # Stock affiché au comptage, renvoyé par le champ caché
+            donnees[f'form-{index}-quantite_affichee'] = '' if ligne.stock_actuel is None else str(ligne.stock_actuel)
+            quantite = quantites.get(ligne.culture.nom, ligne.stock_actuel)
+            donnees[f'form-{index}-quantite'] = '' if quantite is None else str(quantite)
+        return donnees
+
+    def test_inventaire_complet_en_une_transaction(self):
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('300'))
+        stocks = {self.mais.pk: Decimal('300')}
+        formset = InventaireFormSet(entrepot=self.source, stocks=stocks)
+        self.assertEqual([ligne.culture for ligne in formset], [self.mais, self.soja])
+        # Le total (600 + 500) dépasse la capacité : rien n'est écrit
+        trop = InventaireFormSet(self.donnees_inventaire(formset, MAIS='600', SOJA='500'),
+                                 entrepot=self.source, stocks=stocks)
+        self.assertFalse(trop.is_valid())
+        self.assertIn("capacité", trop.non_form_errors()[0])
+        formset = InventaireFormSet(self.donnees_inventaire(formset, MAIS='250', SOJA='400'),
+                                    entrepot=self.source, stocks=stocks)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        mouvements = formset.save()
+        self.assertEqual(sorted(m.quantite for m in mouvements), [Decimal('-50'), Decimal('400')])
+        self.assertEqual(self.quantite(self.source, self.soja), Decimal('400'))
+        self.assertEqual(set(JournalSynchronisation.objects.filter(modele=JournalSynchronisation.STOCK).values_list(
+            'objet_id', flat=True)), set(Stock.objects.filter(entrepot=self.source).values_list('pk', flat=True)))
+        self.verifier_coherence()
+
+    def test_inventaire_apres_un_mouvement_concurrent(self):
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('300'))
+        affiche = InventaireFormSet(entrepot=self.source, stocks={self.mais.pk: Decimal('300')})
+        donnees = self.donnees_inventaire(affiche, MAIS='250', SOJA='100')
+        # Entrée de 50 kg de maïs pendant le comptage
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('50'))
+        formset = InventaireFormSet(donnees, entrepot=self.source, stocks={self.mais.pk: Decimal('350')})
+        self.assertFalse(formset.is_valid())
+        self.assertEqual([list(ligne.errors) for ligne in formset], [['quantite'], []])
+        self.assertIn('350', formset.forms[0].errors['quantite'][0])
+        # Réaffichée avec le stock actuel : le renvoi après vérification est accepté
+        self.assertEqual(formset.data['form-0-quantite_affichee'], '350')
+        formset = InventaireFormSet(formset.data, entrepot=self.source, stocks={self.mais.pk: Decimal('350')})
+        self.assertTrue(formset.is_valid(), formset.errors)
+
+        # Mouvement arrivé entre la validation et l'enregistrement : refusé sous verrou, rien n'est écrit
+        MouvementStock.objects.sortie(self.source, self.mais, Decimal('20'))
+        with self.assertRaises(ValidationError):
+            formset.save()
+        self.assertEqual(self.quantite(self.source, self.mais), Decimal('330'))
+        self.assertIsNone(self.quantite(self.source, self.soja))
+        self.verifier_coherence()
+
+    def test_inventaire_concurrent_par_la_vue(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse'))
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('300'))
+        url = reverse('modifier_stock', args=[self.source.pk])
+        affiche = self.client.get(url).context['inventaire']
+        donnees = self.donnees_inventaire(affiche, MAIS='250')
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('50'))
+        reponse = self.client.post(url, donnees)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertContains(reponse, 'name="form-0-quantite_affichee" value="350')
+        self.assertEqual(self.quantite(self.source, self.mais), Decimal('350'))
+        self.assertEqual(self.client.post(url, reponse.context['inventaire'].data).status_code, 302)
+        self.assertEqual(self.quantite(self.source, self.mais), Decimal('250'))
+        self.verifier_coherence()
+
+    def test_inventaire_complet_requetes_constantes(self):
+        nombres = []
+        for entrepot, cultures in ((self.destination, [self.mais]), (self.source, [self.mais, self.soja])):
+            with CompteurRequetes() as compteur:
+                MouvementStock.objects.inventaire_complet(entrepot, dict.fromkeys(cultures, Decimal('100')))
+            nombres.append(compteur.nombre)
+        self.assertEqual(nombres[0], nombres[1])
+        self.verifier_coherence()
+
+    def test_compaction(self):
+        MouvementStock.objects.entree(self.source, self.mais, Decimal('600'))
+        MouvementStock.objects.transfert(self.source, self.destination, self.mais, Decimal('200'))
+        compactes = MouvementStock.objects.compacter(timezone.now())
+        self.assertEqual(compactes, 2)
+        self.assertFalse(MouvementStock.objects.exists())
+        MouvementStock.objects.sortie(self.destination, self.mais, Decimal('50'))
+        self.verifier_coherence()
+
+
+class RolesCacheTests(TestCase):
+    """Rôle et permissions résolus une fois puis servis depuis le cache, invalidés par les signaux"""
+
+    TABLES_DU_ROLE = ('django_session', 'auth_group', 'auth_permission', 'gestion_producteur')
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_groups', stdout=StringIO())
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        user = User.objects.create_user('producteur')
+        user.groups.add(Group.objects.get(name='Producteur'))
+        producteur = Producteur.objects.create(user=user, telephone='97000000', arrondissement=arrondissement)
+        Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement, superficie=Decimal('1'),
+                                nom='Parcelle')
+        gestionnaire = User.objects.create_user('gestionnaire')
+        gestionnaire.groups.add(Group.objects.get(name='Gestionnaire'))
+        cls.donnees = {'producteur': producteur, 'gestionnaire': gestionnaire}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.donnees['gestionnaire'])
+
+    def test_aucune_requete_de_role_apres_la_premiere_page(self):
+        self.client.get(reverse('gestion_stocks'))
+        with CaptureQueriesContext(connection) as requetes:
+            self.assertEqual(self.client.get(reverse('gestion_stocks')).status_code, 200)
+        for requete in requetes.captured_queries:
+            for table in self.TABLES_DU_ROLE:
+                self.assertNotIn(f'"{table}"', requete['sql'])
+
+    def test_producteur_depuis_le_cache(self):
+        self.client.force_login(self.donnees['producteur'].user)
+        self.assertRedirects(self.client.get(reverse('accueil')), reverse('dashboard_producteur'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('dashboard_producteur')).status_code, 200)
+
+    def test_cache_en_types_simples(self):
+        from .roles import _cle, utilisateur_avec_role
+        producteur = self.donnees['producteur']
+        self.client.force_login(producteur.user)
+        self.client.get(reverse('mes_recoltes'))
+        role = cache.get(_cle(producteur.user.pk))
+
+        def simple(valeur):
+            if isinstance(valeur, (list, tuple)):
+                return all(simple(element) for element in valeur)
+            return valeur is None or isinstance(valeur, (bool, int, str))
+
+        self.assertTrue(all(simple(valeur) for valeur in role.values()), role)
+        self.assertEqual((role['producteur_id'], role['arrondissement_id']),
+                         (producteur.pk, producteur.arrondissement_id))
+
+        # Producteur reconstruit sans requête ; les autres champs sont lus à la demande
+        requete = mock.Mock(spec=['session'], session=self.client.session)
+        with self.assertNumQueries(1):  # l'utilisateur de la session, rien pour le rôle
+            user = utilisateur_avec_role(requete)
+            self.assertEqual(user.producteur.pk, producteur.pk)
+            self.assertEqual(user.producteur.arrondissement.commune.nom, 'Commune')
+        with self.assertNumQueries(1):
+            self.assertEqual(user.producteur.telephone, '97000000')
+
+    def test_retrait_du_groupe(self):
+        self.assertEqual(self.client.get(reverse('gestion_stocks')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.donnees['gestionnaire'].groups.clear()
+        self.assertEqual(self.client.get(reverse('gestion_stocks')).status_code, 403)
+        self.assertRedirects(self.client.get(reverse('accueil')), reverse('admin:index'),
+                             fetch_redirect_response=False)
+
+    def test_permission_retiree_au_groupe(self):
+        self.assertEqual(self.client.get(reverse('gestion_stocks')).status_code, 200)
+        groupe = Group.objects.get(name='Gestionnaire')
+        with self.captureOnCommitCallbacks(execute=True):
+            groupe.permissions.remove(groupe.permissions.get(codename='view_stock'))
+        self.assertEqual(self.client.get(reverse('gestion_stocks')).status_code, 403)
+
+
+class IndexSpatialTests(TestCase):
+    """Rectangle, rayon et plus proches voisins : mêmes résultats qu'un parcours complet"""
+
+    @classmethod
+    def setUpTestData(cls):
+        donnees = peupler_volume(nb_producteurs=20, parcelles_par_producteur=5, recoltes_par_parcelle=0)
+        aleatoire = random.Random(7)
+        parcelles = list(Parcelle.objects.all())
+        for parcelle in parcelles:
+            parcelle.latitude = Decimal(f'{aleatoire.uniform(6.2, 12.4):.6f}')
+            parcelle.longitude = Decimal(f'{aleatoire.uniform(0.8, 3.8):.6f}')
+        Parcelle.objects.bulk_update(parcelles, ['latitude', 'longitude'])
+        Parcelle.objects.indexer()
+        for entrepot in Entrepot.objects.all():
+            entrepot.latitude = Decimal(f'{aleatoire.uniform(6.2, 12.4):.6f}')
+            entrepot.longitude = Decimal(f'{aleatoire.uniform(0.8, 3.8):.6f}')
+            entrepot.save()
+        cls.entrepot = donnees['entrepot']
+        cls.centres = [(aleatoire.uniform(6.2, 12.4), aleatoire.uniform(0.8, 3.8)) for _ in range(10)]
+
+    def distances(self, objets, latitude, longitude):
+        from .spatial import distance_km
+        return sorted((distance_km(latitude, longitude, o.latitude, o.longitude), o.pk) for o in objets)
+
+    def test_rayon_et_rectangle(self):
+        toutes = list(Parcelle.objects.all())
+        for latitude, longitude in self.centres:
+            with self.subTest(centre=(latitude, longitude)):
+                attendues = [pk for distance, pk in self.distances(toutes, latitude, longitude) if distance <= 60]
+                self.assertEqual([p.pk for p in Parcelle.objects.dans_rayon(latitude, longitude, 60)], attendues)
+                rectangle = Parcelle.objects.dans_rectangle(latitude - 0.5, longitude - 0.5, latitude + 0.5, longitude + 0.5)
+                self.assertEqual(
+                    set(rectangle.values_list('pk', flat=True)),
+                    {p.pk for p in toutes
+                     if abs(float(p.latitude) - latitude) <= 0.5 and abs(float(p.longitude) - longitude) <= 0.5},
+                )
+
+    def test_plus_proches(self):
+        toutes = list(Parcelle.objects.all())
+        for latitude, longitude in self.centres:
+            with self.subTest(centre=(latitude, longitude)):
+                attendues = [pk for _, pk in self.distances(toutes, latitude, longitude)[:7]]
+                self.assertEqual([p.pk for p in Parcelle.objects.plus_proches(latitude, longitude, 7)], attendues)
+
+    def test_entrepot_le_plus_proche_avec_capacite(self):
+        latitude, longitude = self.centres[0]
+        self.entrepot.refresh_from_db()
+        Entrepot.objects.filter(pk=self.entrepot.pk).update(latitude=latitude, longitude=longitude)
+        Entrepot.objects.filter(pk=self.entrepot.pk).indexer()
+        self.assertEqual(Entrepot.objects.plus_proches(latitude, longitude)[0].pk, self.entrepot.pk)
+        place = self.entrepot.capacite_max - self.entrepot.stock_cumule
+        disponibles = Entrepot.objects.avec_capacite_libre(place + 1).plus_proches(latitude, longitude)
+        self.assertNotEqual(disponibles[0].pk, self.entrepot.pk)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "Plan d'exécution propre à SQLite")
+    def test_recherche_sous_lineaire(self):
+        latitude, longitude = self.centres[0]
+        with CaptureQueriesContext(connection) as requetes:
+            list(Parcelle.objects.dans_rectangle(latitude - 0.1, longitude - 0.1, latitude + 0.1, longitude + 0.1))
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + requetes.captured_queries[0]['sql'])
+            plan = ' '.join(str(ligne[-1]) for ligne in cursor.fetchall())
+        self.assertIn('parcelle_cellule_idx', plan)
+
+
+class SQLiteCacheTests(unittest.TestCase):
+    """Cache partagé entre workers : deux instances sur le même fichier simulent deux processus"""
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        chemin = f'{dossier.name}/cache.sqlite3'
+        self.worker1 = SQLiteCache(chemin, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+        self.worker2 = SQLiteCache(chemin, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+
+    def test_partage_et_invalidation(self):
+        self.worker1.set('stats', {'total': 3})
+        self.assertEqual(self.worker2.get('stats'), {'total': 3})
+        self.worker2.delete('stats')
+        self.assertIsNone(self.worker1.get('stats'))
+        self.assertTrue(self.worker1.add('verrou', 1))
+        self.assertFalse(self.worker2.add('verrou', 2))
+        self.assertEqual(self.worker2.get_or_set('verrou', 3), 1)
+
+    def test_cache_des_tests_isole(self):
+        from django.core.cache import caches
+        from agritech import settings as reglages
+        # Cache du serveur : fichier et préfixe dérivés du projet et de la base
+        self.assertIn(reglages.EMPREINTE_CACHE, reglages.CACHES['default']['LOCATION'])
+        self.assertIn(reglages.EMPREINTE_CACHE, reglages.CACHES['default']['KEY_PREFIX'])
+        # Tests : fichier temporaire propre à l'exécution (TEST_RUNNER)
+        self.assertNotEqual(caches['default'].chemin, reglages.CACHES['default']['LOCATION'])
+        self.assertTrue(os.path.basename(os.path.dirname(caches['default'].chemin)).startswith('agritech-cache-'))
+
+    def test_expiration(self):
+        self.worker1.set('court', 'valeur', timeout=0.05)
+        self.worker1.set('permanent', 'valeur', timeout=None)
+        self.assertTrue(self.worker2.has_key('court'))
+        time.sleep(0.1)
+        self.assertIsNone(self.worker2.get('court'))
+        self.assertTrue(self.worker2.add('court', 'nouvelle'))
+        self.assertEqual(self.worker1.get('permanent'), 'valeur')
+
+    def test_incr_atomique_entre_threads(self):
+        self.worker1.set('compteur', 0)
+
+        def incrementer(cache):
+            for _ in range(50):
+                cache.incr('compteur')
+
+        threads = [threading.Thread(target=incrementer, args=(cache,))
+                   for cache in (self.worker1, self.worker2) * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.worker1.get('compteur'), 200)
+        self.assertEqual(self.worker2.incr_version('compteur'), 2)
+        self.assertEqual(self.worker1.get('compteur', version=2), 200)
+        self.assertIsNone(self.worker1.get('compteur'))
+
+    def test_eviction_des_moins_recemment_lus(self):
+        for i in range(12):
+            self.worker1.set(f'cle{i}', i)
+            # Dates d'accès distinctes : cle0 la plus ancienne
+            self.worker1._connexion.execute('UPDATE cache SET acces = ? WHERE cle LIKE ?', (i, f'%:cle{i}'))
+        self.worker1._connexion.execute('UPDATE cache SET acces = 100 WHERE cle LIKE ?', ('%:cle0',))
+        self.worker1._nettoyer()
+        restantes = self.worker1.get_many([f'cle{i}' for i in range(12)])
+        self.assertEqual(len(restantes), 12 - 12 // 2)
+        self.assertIn('cle0', restantes)
+        self.assertNotIn('cle1', restantes)
+
+
+class AlertesStockTests(TestCase):
+    """Alertes ouvertes et closes aux variations de stock, récapitulatif par gestionnaire"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Arrondissement', commune=commune, code='A')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.gestionnaire = User.objects.create_user('gestionnaire', email='gestionnaire@example.com')
+        cls.entrepots = [
+            Entrepot.objects.create(nom=f'Entrepôt {i}', arrondissement=arrondissement, capacite_max=Decimal('1000'),
+                                    seuil_alerte=Decimal('100'), gestionnaire=cls.gestionnaire)
+            for i in range(2)
+        ]
+
+    def test_transitions(self):
+        entrepot = self.entrepots[0]
+        # Entrepôt vide à la création : alerte ouverte
+        self.assertEqual(AlerteStock.objects.ouvertes().filter(entrepot=entrepot).count(), 1)
+        MouvementStock.objects.entree(entrepot, self.mais, Decimal('150'))
+        alerte = AlerteStock.objects.get(entrepot=entrepot)
+        self.assertEqual(alerte.stock_resolution, Decimal('150'))
+        # Une variation sans franchissement du seuil n'écrit rien
+        MouvementStock.objects.sortie(entrepot, self.mais, Decimal('20'))
+        self.assertEqual(AlerteStock.objects.filter(entrepot=entrepot).count(), 1)
+        MouvementStock.objects.sortie(entrepot, self.mais, Decimal('100'))
+        nouvelle = AlerteStock.objects.ouvertes().get(entrepot=entrepot)
+        self.assertEqual(nouvelle.stock_declenchement, Decimal('30'))
+        self.assertEqual(AlerteStock.objects.filter(entrepot=entrepot).count(), 2)
+
+    def test_recapitulatif_groupe(self):
+        from django.core import mail
+        from .alertes import envoyer_recapitulatifs
+        MouvementStock.objects.entree(self.entrepots[1], self.mais, Decimal('500'))
+        # Entrepôt 0 toujours sous le seuil ; entrepôt 1 déclenché puis résolu (une seule alerte)
+        self.assertEqual(envoyer_recapitulatifs(), (1, 2))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['gestionnaire@example.com'])
+        self.assertIn('Entrepôt 0', mail.outbox[0].body)
+        self.assertIn('Stock revenu au-dessus du seuil', mail.outbox[0].body)
+        # Plus rien en attente : pas de second courriel
+        self.assertEqual(envoyer_recapitulatifs(), (0, 0))
+        self.assertFalse(AlerteStock.objects.a_notifier().exists())
+
+
+class PrevisionsRecolteTests(TestCase):
+    """Ajustement vectorisé : une série tendance + saison exacte est prolongée sans erreur"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Arrondissement', commune=commune, code='A')
+        user = User.objects.create_user('producteur')
+        producteur = Producteur.objects.create(user=user, telephone='97000000', arrondissement=arrondissement)
+        cls.parcelles = [
+            Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                    superficie=Decimal('1'), nom=f'Parcelle {i}')
+            for i in range(2)
+        ]
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.soja = TypeCulture.objects.create(nom=TypeCulture.SOJA)
+
+    def test_tendance_et_saison(self):
+        from .previsions import rafraichir_previsions
+        saison = [0, 300, 50, 0]
+        recoltes = []
+        for i in range(8):  # 2024 T1 à 2025 T4
+            debut = date(2024 + i // 4, (i % 4) * 3 + 1, 10)
+            # Deux récoltes par trimestre : la requête doit les additionner
+            quantite = Decimal(100 + 20 * i + saison[i % 4])
+            recoltes += [Recolte(parcelle=self.parcelles[0], type_culture=self.mais, quantite=quantite / 2,
+                                 date_recolte=debut + timedelta(days=jour)) for jour in (0, 30)]
+            recoltes.append(Recolte(parcelle=self.parcelles[1], type_culture=self.soja, quantite=Decimal(80),
+                                    date_recolte=debut))
+        Recolte.objects.bulk_create(recoltes)
+
+        resultat = rafraichir_previsions(historique=8, horizon=2, aujourd_hui=date(2026, 2, 15))
+        self.assertEqual((resultat['series'], resultat['previsions']), (2, 4))
+        previsions = {
+            (p.parcelle_id, p.periode): p.quantite for p in PrevisionRecolte.objects.all()
+        }
+        self.assertEqual(previsions[(self.parcelles[0].pk, date(2026, 1, 1))], Decimal('260.00'))
+        self.assertEqual(previsions[(self.parcelles[0].pk, date(2026, 4, 1))], Decimal('580.00'))
+        self.assertEqual(previsions[(self.parcelles[1].pk, date(2026, 4, 1))], Decimal('80.00'))
+        par_commune = list(PrevisionRecolte.objects.par_commune().filter(periode=date(2026, 4, 1)))
+        self.assertEqual([ligne['total'] for ligne in par_commune], [Decimal('580.00'), Decimal('80.00')])
+
+        # Recalcul : la table est remplacée, pas complétée
+        rafraichir_previsions(historique=8, horizon=1, aujourd_hui=date(2026, 2, 15))
+        self.assertEqual(PrevisionRecolte.objects.count(), 2)
+
+
+class IndexRechercheTests(TestCase):
+    """Index de recherche : tenu par les signaux, insensible aux accents, utilisé par l'admin et l'API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('setup_groups', stdout=StringIO())
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        # 12 producteurs : « producteur1 » désigne aussi producteur10 et producteur11
+        for i in range(12):
+            user = User.objects.create_user(f'producteur{i}')
+            user.groups.add(Group.objects.get(name='Producteur'))
+            producteur = Producteur.objects.create(user=user, telephone=f'97{i:06d}', arrondissement=arrondissement)
+            for j in range(2):
+                parcelle = Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                                   superficie=Decimal('1.50'), nom=f'Parcelle {j}')
+                Recolte.objects.create(parcelle=parcelle, type_culture=mais, quantite=Decimal('100'),
+                                       date_recolte=date(2025, 6, 1))
+        cls.gestionnaire = User.objects.create_user('gestionnaire')
+        cls.gestionnaire.groups.add(Group.objects.get(name='Gestionnaire'))
+        user = User.objects.create_user('ehoundji', first_name='Élodie', last_name='Houndjì')
+        cls.producteur = Producteur.objects.create(
+            user=user, telephone='+229 97 45 12 88', arrondissement=arrondissement,
+        )
+        cls.parcelle = Parcelle.objects.create(
+            producteur=cls.producteur, arrondissement=arrondissement,
+            superficie=Decimal('2.00'), nom='Bas-fond Kpèvi',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def trouves(self, saisie, type_objet=None):
+        return set(EntreeRecherche.objects.rechercher(saisie, type_objet).values_list('type_objet', 'objet_id'))
+
+    def test_accents_fragments_et_telephone(self):
+        attendu = {(EntreeRecherche.PRODUCTEUR, self.producteur.pk)}
+        for saisie in ['elodie', 'HOUNDJI', 'élod hound', 'oundj', '97 45 12', '4512', '+22997451288']:
+            with self.subTest(saisie=saisie):
+                self.assertEqual(self.trouves(saisie, EntreeRecherche.PRODUCTEUR), attendu)
+        self.assertEqual(self.trouves('kpevi'), {(EntreeRecherche.PARCELLE, self.parcelle.pk)})
+        self.assertEqual(self.trouves('elodie zzz'), set())
+        self.assertEqual(self.trouves('  ,; '), set())
+        # Terme trop court pour un trigramme : début du texte
+        self.assertEqual(self.trouves('él', EntreeRecherche.PRODUCTEUR), attendu)
+
+    def test_meme_resultat_que_icontains(self):
+        for saisie in ['producteur1', 'ducteur2', '970000', 'arcel']:
+            with self.subTest(saisie=saisie):
+                producteurs = Producteur.objects.filter(
+                    Q(user__username__icontains=saisie) | Q(telephone__icontains=saisie)
+                ).values_list('pk', flat=True)
+                parcelles = Parcelle.objects.filter(
+                    Q(nom__icontains=saisie) | Q(producteur__user__username__icontains=saisie)
+                ).values_list('pk', flat=True)
+                self.assertEqual(self.trouves(saisie, EntreeRecherche.PRODUCTEUR),
+                                 {(EntreeRecherche.PRODUCTEUR, pk) for pk in producteurs})
+                self.assertEqual(self.trouves(saisie, EntreeRecherche.PARCELLE),
+                                 {(EntreeRecherche.PARCELLE, pk) for pk in parcelles})
+
+    def test_signaux(self):
+        user = self.producteur.user
+        user.last_name = 'Dossou-Yovo'
+        user.save()
+        self.assertEqual(self.trouves('yovo', EntreeRecherche.PRODUCTEUR), {(EntreeRecherche.PRODUCTEUR, self.producteur.pk)})
+        # Le nom du producteur figure aussi dans le texte de ses parcelles
+        self.assertIn((EntreeRecherche.PARCELLE, self.parcelle.pk), self.trouves('dossou kpevi'))
+
+        self.parcelle.nom = 'Champ du marigot'
+        self.parcelle.save()
+        self.assertEqual(self.trouves('marigot'), {(EntreeRecherche.PARCELLE, self.parcelle.pk)})
+        self.producteur.delete()
+        self.assertEqual(self.trouves('marigot') | self.trouves('yovo'), set())
+
+    def test_admin_et_recherche_rapide(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='motdepasse'))
+        reponse = self.client.get('/admin/gestion/producteur/', {'q': 'élodie'})
+        self.assertEqual([p.pk for p in reponse.context['cl'].result_list], [self.producteur.pk])
+        reponse = self.client.get('/admin/gestion/recolte/', {'q': 'ducteur1'})
+        self.assertEqual(
+            {r.pk for r in reponse.context['cl'].result_list},
+            set(Recolte.objects.filter(parcelle__producteur__user__username__contains='ducteur1').values_list('pk', flat=True)),
+        )
+
+        self.client.force_login(self.gestionnaire)
+        reponse = self.client.get(reverse('recherche_rapide'), {'q': 'houndj', 'type': 'producteur'})
+        self.assertEqual(reponse.json()['resultats'], [{
+            'type': 'producteur', 'id': self.producteur.pk, 'libelle': 'Élodie Houndjì (+229 97 45 12 88)',
+            'url': reverse('admin:gestion_producteur_change', args=[self.producteur.pk]),
+        }])
+        self.assertEqual(len(self.client.get(reverse('recherche_rapide'), {'q': 'producteur', 'limite': 5}).json()['resultats']), 5)
+        self.assertEqual(self.client.get(reverse('recherche_rapide'), {'q': 'x', 'type': 'inconnu'}).status_code, 400)
+
+        self.client.force_login(self.producteur.user)
+        self.assertEqual(self.client.get(reverse('recherche_rapide'), {'q': 'houndj'}).status_code, 403)
+
+
+class ReferentielTests(TestCase):
+    """Cultures, communes et arrondissements lus en mémoire, rechargés quand la version change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.donnees = peupler_volume(nb_producteurs=3, parcelles_par_producteur=1, recoltes_par_parcelle=2)
+
+    def setUp(self):
+        referentiel.nouvelle_requete()
+        referentiel.cultures
+
+    def test_aucune_requete_une_fois_charge(self):
+        culture = self.donnees['culture']
+        with self.assertNumQueries(0):
+            self.assertEqual(referentiel.culture_par_nom(culture.nom), culture)
+            self.assertEqual(len(referentiel.arrondissements), 40)
+            str(referentiel.get(Arrondissement, self.donnees['arrondissement'].pk))
+            form = LigneInventaireForm({'type_culture': culture.pk, 'quantite': '10'})
+            self.assertEqual(len(form.fields['type_culture'].choices), 4)
+            self.assertIn(f'value="{culture.pk}"', str(form['type_culture']))
+            self.assertTrue(form.is_valid())
+            self.assertFalse(LigneInventaireForm({'type_culture': 10 ** 6, 'quantite': '10'}).is_valid())
+        self.assertIs(form.cleaned_data['type_culture'], referentiel.get(TypeCulture, culture.pk))
+
+    def test_invalidation_par_les_signaux(self):
+        commune = Commune.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            commune.nom = 'Abomey-Calavi'
+            commune.save()
+        referentiel.nouvelle_requete()
+        self.assertIn('Abomey-Calavi', {c.nom for c in referentiel.communes})
+        arrondissement = next(a for a in referentiel.arrondissements if a.commune_id == commune.pk)
+        self.assertEqual(str(arrondissement), f'{arrondissement.nom} (Abomey-Calavi)')
+
+    def test_version_publiee_par_un_autre_processus(self):
+        Commune.objects.filter(pk=Commune.objects.first().pk).update(nom='Ouidah')
+        referentiel.nouvelle_requete()
+        self.assertNotIn('Ouidah', {c.nom for c in referentiel.communes})
+        # Nouvelle version dans le cache partagé : rechargé à la requête suivante, pas avant
+        cache.set('gestion:referentiel:version', uuid.uuid4().hex, None)
+        self.assertNotIn('Ouidah', {c.nom for c in referentiel.communes})
+        referentiel.nouvelle_requete()
+        self.assertIn('Ouidah', {c.nom for c in referentiel.communes})
+
+    def test_filtre_par_culture(self):
+        from .filtres import filtrer_recoltes
+        culture = self.donnees['culture']
+        self.assertEqual(
+            set(filtrer_recoltes(Recolte.objects.all(), {'type_culture': culture.nom})),
+            set(Recolte.objects.filter(type_culture=culture)),
+        )
+        self.assertFalse(filtrer_recoltes(Recolte.objects.all(), {'type_culture': 'INCONNUE'}).exists())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Table d'archive propre à SQLite (PostgreSQL : partitions)")
+class ArchivageSaisonsTests(TestCase):
+    """Saisons closes déplacées puis gelées : rapports et cumuls inchangés"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissements = [Arrondissement.objects.create(nom=f'Arrondissement {i}', commune=commune, code=f'A{i}')
+                           for i in range(2)]
+        cultures = [TypeCulture.objects.create(nom=nom) for nom in (TypeCulture.MAIS, TypeCulture.SOJA)]
+        cls.arrondissement, cls.culture = arrondissements[0], cultures[0]
+        # Récoltes de 2024 et 2025, dont quelques-unes autour du changement de saison
+        jours = [date(2024, 2, 10), date(2024, 6, 1), date(2024, 11, 20),
+                 date(2025, 1, 15), date(2025, 2, 20), date(2025, 7, 4)]
+        for i, arrondissement in enumerate(arrondissements):
+            producteur = Producteur.objects.create(user=User.objects.create_user(f'producteur{i}'),
+                                                   telephone=f'9700000{i}', arrondissement=arrondissement)
+            for j in range(2):
+                parcelle = Parcelle.objects.create(producteur=producteur, arrondissement=arrondissement,
+                                                   superficie=Decimal('1.50'), nom=f'Parcelle {j}')
+                for k, jour in enumerate(jours):
+                    Recolte.objects.create(parcelle=parcelle, type_culture=cultures[(j + k) % 2],
+                                           quantite=Decimal(100 + 10 * k + j), date_recolte=jour)
+        cls.producteur = producteur
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(ARCHIVES_RECOLTES_DIR=dossier.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+        # Saison en cours : 2026, les deux saisons de données sont closes
+        aujourd_hui = mock.patch('gestion.saisons.timezone.localdate', return_value=date(2026, 3, 1))
+        aujourd_hui.start()
+        self.addCleanup(aujourd_hui.stop)
+
+    def archiver(self, *arguments):
+        call_command('archiver_recoltes', *arguments, stdout=StringIO())
+
+    def cumuls(self):
+        return sorted(CumulRecolte.objects.values_list(
+            'periode', 'arrondissement_id', 'type_culture_id', 'producteur_id', 'quantite', 'nombre_recoltes',
+        ))
+
+    def export(self, **parametres):
+        from .exports import lignes_recoltes
+        _, lignes = lignes_recoltes(parametres)
+        return list(lignes.iterator(chunk_size=7))
+
+    def test_archiver_puis_geler(self):
+        from .archives import chemin_saison, saisons_gelees
+        from .previsions import charger_historique, index_trimestre
+        arrondissement = self.arrondissement.pk
+        filtres = [
+            {},
+            {'type_culture': self.culture.nom},
+            {'arrondissement': str(arrondissement)},
+            {'date_debut': '2024-11-15', 'date_fin': '2025-02-10'},
+        ]
+        exports = [self.export(**parametres) for parametres in filtres]
+        cumuls = self.cumuls()
+        periode = (index_trimestre(date(2024, 1, 1)), index_trimestre(date(2026, 1, 1)))
+        historique = charger_historique(*periode)
+        saison_2024 = set(Recolte.objects.filter(date_recolte__year=2024).values_list('pk', flat=True))
+        self.assertTrue(saison_2024)
+
+        self.archiver('--saisons-chaudes', '2')
+        self.assertFalse(Recolte.objects.filter(date_recolte__year=2024).exists())
+        self.assertEqual(set(RecolteArchivee.objects.values_list('pk', flat=True)), saison_2024)
+        self.assertFalse(JournalSynchronisation.objects.filter(objet_id__in=saison_2024, modele='recolte').exists())
+        self.assertEqual(self.cumuls(), cumuls)
+        self.assertEqual([self.export(**parametres) for parametres in filtres], exports)
+
+        self.archiver('--saisons-chaudes', '1', '--saisons-en-base', '1')
+        self.assertEqual(saisons_gelees(), [2024, 2025])
+        self.assertTrue(chemin_saison(2025).exists())
+        self.assertFalse(Recolte.objects.exists() or RecolteArchivee.objects.exists())
+        self.assertEqual(self.cumuls(), cumuls)
+        self.assertEqual([self.export(**parametres) for parametres in filtres], exports)
+        for avant, apres in zip(historique, charger_historique(*periode)):
+            np.testing.assert_array_equal(avant, apres)
+        CumulRecolte.objects.reconstruire()
+        self.assertEqual(self.cumuls(), cumuls)
+
+        # Une récolte tardive d'une saison gelée rejoint son fichier au gel suivant
+        tardive = Recolte.objects.create(parcelle=self.producteur.parcelles.first(),
+                                         type_culture=self.culture, quantite=Decimal('12.34'),
+                                         date_recolte=date(2024, 6, 1))
+        self.assertEqual(self.export(date_debut='2024-06-01', date_fin='2024-06-01')[0][0], tardive.pk)
+        self.archiver('--saisons-chaudes', '1', '--saisons-en-base', '1')
+        self.assertFalse(Recolte.objects.exists())
+        lignes = self.export(date_debut='2024-06-01', date_fin='2024-06-01')
+        self.assertEqual(lignes[0][0], tardive.pk)
+        self.assertEqual(lignes[0][7], Decimal('12.34'))
+
+    def test_cumuls_coherents_avec_une_reconstruction(self):
+        self.archiver('--saisons-chaudes', '1')
+        parcelles = list(Parcelle.objects.filter(recoltes_archivees__isnull=False).distinct()[:3])
+        # Parcelle déplacée : ses récoltes archivées suivent dans les cumuls
+        parcelles[0].arrondissement = Arrondissement.objects.exclude(pk=parcelles[0].arrondissement_id).first()
+        parcelles[0].save()
+        # Parcelle supprimée : ses récoltes archivées disparaissent des cumuls
+        parcelles[1].delete()
+        self.archiver('--saisons-chaudes', '1', '--saisons-en-base', '1')
+        # Après le gel, producteur et arrondissement sont figés dans le fichier, comme dans les cumuls
+        parcelles[2].delete()
+        cumuls = self.cumuls()
+        CumulRecolte.objects.reconstruire()
+        self.assertEqual(self.cumuls(), cumuls)
+
+    def test_lot_renvoye_apres_archivage(self):
+        from .synchronisation import synchroniser_recoltes
+        producteur = self.producteur
+        entree = {'cle': 'lot-2024', 'parcelle': producteur.parcelles.first().pk, 'type_culture': 'MAIS',
+                  'quantite': '10', 'date_recolte': '2024-05-02'}
+        synchroniser_recoltes(producteur, [entree])
+        self.archiver('--saisons-chaudes', '1')
+        synchroniser_recoltes(producteur, [entree])
+        self.assertEqual(RecolteArchivee.objects.filter(cle_idempotence='lot-2024').count(), 1)
+        self.assertFalse(Recolte.objects.filter(cle_idempotence='lot-2024').exists())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Partitions et déclencheurs propres à PostgreSQL")
+class PartitionsPostgresqlTests(TestCase):
+    """Table des récoltes reconstruite par la migration 0012 : partitions, clés, index et unicité des clés"""
+
+    @classmethod
+    def setUpTestData(cls):
+        commune = Commune.objects.create(nom='Commune', code='C')
+        arrondissement = Arrondissement.objects.create(nom='Nord', commune=commune, code='N')
+        cls.mais = TypeCulture.objects.create(nom=TypeCulture.MAIS)
+        cls.producteur = Producteur.objects.create(user=User.objects.create_user('producteur'),
+                                                   telephone='97000000', arrondissement=arrondissement)
+        cls.parcelle = Parcelle.objects.create(producteur=cls.producteur, arrondissement=arrondissement,
+                                               superficie=Decimal('1'), nom='Parcelle')
+
+    def recolte(self, jour, cle=None):
+        return Recolte.objects.create(parcelle=self.parcelle, type_culture=self.mais, quantite=Decimal('10'),
+                                      date_recolte=jour, cle_idempotence=cle)
+
+    def test_structure(self):
+        from .saisons import TABLE, partitions_existantes, saison_courante
+        with connection.cursor() as curseur:
+            curseur.execute("SELECT partstrat FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+            self.assertEqual(curseur.fetchone(), ('r',))
+            courante = saison_courante()
+            self.assertTrue({courante, courante + 1} <= set(partitions_existantes(curseur)))
+            curseur.execute(
+                "SELECT array_agg(attname ORDER BY attname) FROM pg_index "
+                "JOIN pg_attribute ON attrelid = indrelid AND attnum = ANY(indkey) "
+                "WHERE indrelid = %s::regclass AND indisprimary", [TABLE],
+            )
+            self.assertEqual(curseur.fetchone()[0], ['date_recolte', 'id'])
+            # Index de Recolte.Meta recréés sur la table partitionnée (donc sur chaque partition)
+            curseur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", [TABLE])
+            self.assertTrue({'recolte_date_id_idx', 'recolte_parcelle_date_idx', 'recolte_culture_date_idx'}
+                            <= {nom for (nom,) in curseur.fetchall()})
+            curseur.execute("SELECT count(*) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+                            [TABLE])
+            self.assertEqual(curseur.fetchone()[0], 2)
+        # id attribué par la séquence propre à la table
+        premiere, seconde = self.recolte(date(courante, 3, 1)), self.recolte(date(courante - 1, 3, 1))
+        self.assertGreater(seconde.pk, premiere.pk)
+        self.assertEqual(Recolte.objects.get(pk=seconde.pk).date_recolte, date(courante - 1, 3, 1))
+
+    def test_cle_unique_toutes_saisons(self):
+        recolte = self.recolte(date(2025, 5, 1), cle='cle-1')
+        self.assertEqual(CleIdempotence.objects.get(cle='cle-1').recolte_id, recolte.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.recolte(date(2024, 5, 1), cle='cle-1')
+        # Changement de saison : la ligne change de partition et garde sa clé
+        recolte.date_recolte = date(2024, 5, 1)
+        recolte.save()
+        self.assertEqual(CleIdempotence.objects.get(cle='cle-1').recolte_id, recolte.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.recolte(date(2025, 5, 1), cle='cle-1')
+        # Suppression : la clé est libérée
+        recolte.delete()
+        self.assertFalse(CleIdempotence.objects.filter(cle='cle-1').exists())
+        self.recolte(date(2025, 5, 1), cle='cle-1')
+
+    def test_renvoi_concurrent_autre_date(self):
+        from . import synchronisation
+        entree = {'cle': 'lot-1', 'parcelle': self.parcelle.pk, 'type_culture': 'MAIS',
+                  'quantite': '10', 'date_recolte': '2025-05-01'}
+        creee = synchronisation.synchroniser_recoltes(self.producteur, [entree])[0]
+        # Renvoi lu avant l'écriture du premier : l'insertion lève IntegrityError puis relit
+        lecture = synchronisation._existantes
+        with mock.patch.object(synchronisation, '_existantes', side_effect=[{}, lecture(self.producteur, ['lot-1'])]):
+            resultat = synchronisation.synchroniser_recoltes(self.producteur, [dict(entree, date_recolte='2024-05-01')])
+        self.assertEqual(resultat, [{'cle': 'lot-1', 'id': creee['id'], 'statut': 'existante'}])
+        self.assertEqual(Recolte.objects.filter(cle_idempotence='lot-1').count(), 1)
+
+    def test_creer_partition_garde_les_cles(self):
+        from .saisons import creer_partition, partitions_existantes, saison_courante
+        annee = saison_courante() + 5
+        recolte = self.recolte(date(annee, 2, 1), cle='lointaine')
+        with connection.cursor() as curseur:
+            self.assertTrue(creer_partition(curseur, annee))
+            self.assertIn(annee, partitions_existantes(curseur))
+            curseur.execute(f"SELECT count(*) FROM gestion_recolte_{annee}")
+            self.assertEqual(curseur.fetchone()[0], 1)
+        self.assertEqual(CleIdempotence.objects.get(cle='lointaine').recolte_id, recolte.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.recolte(date(annee - 1, 2, 1), cle='lointaine')
+
+
+class RapportsSaisonTests(TestCase):
+    """Un rapport par commune, généré une seule fois même après un échec partiel"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.donnees = peupler_volume(nb_producteurs=8, parcelles_par_producteur=1, recoltes_par_parcelle=10)
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.sortie = dossier.name
+        referentiel.nouvelle_requete()
+
+    def test_contenu_et_requetes(self):
+        from .rapports import donnees_commune, lignes_csv
+        commune = self.donnees['producteur'].parcelles.first().arrondissement.commune
+        referentiel.cultures
+        with self.assertNumQueries(4):
+            donnees = donnees_commune(commune, 2024)
+        attendu = CumulRecolte.objects.filter(
+            arrondissement__commune=commune, periode__year=2024,
+        ).aggregate(total=Sum('quantite'))['total']
+        self.assertGreater(attendu, 0)
+        self.assertEqual(donnees['total']['quantite'], attendu)
+        self.assertEqual(sum(ligne['quantite'] for ligne in donnees['par_producteur']), attendu)
+        self.assertEqual(sum(ligne['quantite'] for ligne in donnees['par_culture']), attendu)
+        self.assertEqual(len(donnees['entrepots']), Entrepot.objects.filter(arrondissement__commune=commune).count())
+        totaux_arrondissements = [ligne for ligne in lignes_csv(donnees) if ligne[0] == 'arrondissement' and not ligne[2]]
+        self.assertEqual(sum(ligne[3] for ligne in totaux_arrondissements), attendu)
+
+    def test_reprise_apres_echec(self):
+        from . import rapports
+        communes = list(Commune.objects.values_list('pk', flat=True))
+        en_panne = communes[3]
+        donnees_commune = rapports.donnees_commune
+
+        def panne(commune, saison):
+            if commune.pk == en_panne:
+                raise RuntimeError('connexion perdue')
+            return donnees_commune(commune, saison)
+
+        with mock.patch('gestion.rapports.donnees_commune', side_effect=panne):
+            etat = rapports.generer_rapports(2024, self.sortie, processus=1)
+        self.assertEqual(etat['communes'][str(en_panne)]['statut'], rapports.ECHEC)
+        self.assertEqual(sum(entree['statut'] == rapports.TERMINE for entree in etat['communes'].values()),
+                         len(communes) - 1)
+
+        # Seule la commune en échec est refaite ; la commande échoue tant qu'il en reste
+        with mock.patch('gestion.rapports.ecrire_rapport', wraps=rapports.ecrire_rapport) as ecrire:
+            call_command('generer_rapports', '--saison', '2024', '--sortie', self.sortie, '--processus', '1',
+                         stdout=StringIO())
+        self.assertEqual(ecrire.call_count, 1)
+        dossier = rapports.dossier_saison(self.sortie, 2024)
+        etat = rapports.lire_etat(dossier)
+        self.assertTrue(all(entree['statut'] == rapports.TERMINE for entree in etat['communes'].values()))
+        commune = Commune.objects.get(pk=en_panne)
+        self.assertIn(commune.nom, (dossier / f'{rapports.nom_fichier(commune)}.html').read_text(encoding='utf-8'))
+        self.assertIn(f'{rapports.nom_fichier(commune)}.csv', (dossier / 'index.html').read_text(encoding='utf-8'))
+
+        with mock.patch('gestion.rapports.donnees_commune', side_effect=RuntimeError('base indisponible')):
+            with self.assertRaises(CommandError):
+                call_command('generer_rapports', '--saison', '2024', '--sortie', self.sortie, '--processus', '1',
+                             '--tout-refaire', '--commune', commune.code, stdout=StringIO())
@@ -12,12 +12,22 @@ urlpatterns = [
     path('producteur/dashboard/', views.dashboard_producteur, name='dashboard_producteur'),
     path('producteur/mes-recoltes/', views.mes_recoltes, name='mes_recoltes'),
     path('producteur/ajouter-recolte/', views.ajouter_recolte, name='ajouter_recolte'),
+    path('producteur/api/recoltes/synchroniser/', views.synchroniser_recoltes, name='synchroniser_recoltes'),
     
     # URLs pour les Gestionnaires
     path('gestionnaire/dashboard/', views.dashboard_gestionnaire, name='dashboard_gestionnaire'),
     path('gestionnaire/stocks/', views.gestion_stocks, name='gestion_stocks'),
     path('gestionnaire/stocks/modifier/<int:entrepot_id>/', views.modifier_stock, name='modifier_stock'),
     path('gestionnaire/recoltes/', views.toutes_recoltes, name='toutes_recoltes'),
+    path('gestionnaire/recoltes/importer/', views.importer_recoltes, name='importer_recoltes'),
+    path('gestionnaire/export/recoltes/', views.exporter_recoltes, name='exporter_recoltes'),
+    path('gestionnaire/export/stocks/', views.exporter_stocks, name='exporter_stocks'),
+    
+    # API de synchronisation (application mobile, bureaux de terrain)
+    path('api/synchronisation/modifications/', views.flux_synchronisation, name='flux_synchronisation'),
+    
+    # Saisie semi-automatique (producteurs, parcelles, entrepôts)
+    path('api/recherche/', views.recherche_rapide, name='recherche_rapide'),
     
     # Health check pour les cron jobs
     path('health/', views.health_check, name='health_check'),
@@ -1,17 +1,36 @@
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
+from django.core.exceptions import ValidationError
 from django.db.models import Sum, Q
 from .models import (
     Producteur, Parcelle, Recolte, TypeCulture, 
-    Entrepot, Stock, Arrondissement, Commune
+    Entrepot, Stock, Arrondissement, Commune, CumulRecolte, MouvementStock, AlerteStock, EntreeRecherche
+)
+from .forms import RecolteForm, InventaireFormSet, ImportRecoltesForm, MouvementStockForm
+from .imports import COLONNES as COLONNES_IMPORT, importer_fichier_csv
+from .pagination import charger_recoltes, paginer_recoltes
+from .parallele import executer_en_parallele
+from .roles import ROLE_GESTIONNAIRE, ROLE_PRODUCTEUR
+from .filtres import filtrer_recoltes
+from .exports import FORMATS, flux_asynchrone, generer_export, lignes_recoltes, lignes_stocks
+from .recherche import LONGUEUR_MIN_SAISIE, SUGGESTIONS_MAX
+from .statistiques import statistiques_publiques
+from .synchronisation import (
+    TAILLE_PAGE_FLUX_DEFAUT, LotInvalide, flux_modifications, lire_jeton,
+    synchroniser_recoltes as synchroniser_lot_recoltes,
 )
-from .forms import RecolteForm, StockForm
 
 from django.contrib.auth import logout
 from django.shortcuts import redirect, render
 from django.contrib import messages
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 
 def health_check(request):
     """Endpoint simple pour les health checks"""
@@ -28,36 +47,42 @@ def custom_logout(request):
     return redirect('accueil')
 
 @login_required
-def dashboard_producteur(request):
+async def dashboard_producteur(request):
     """Tableau de bord du producteur - Voit uniquement ses données"""
-    try:
-        producteur = request.user.producteur
-    except Producteur.DoesNotExist:
+    # Le gabarit lit request.user : on lui donne l'utilisateur déjà chargé par auser()
+    request.user = await request.auser()
+    # Producteur (avec arrondissement et commune) issu du rôle en cache
+    producteur = getattr(request.user, 'producteur', None)
+    if producteur is None:
         messages.error(request, "Vous n'êtes pas enregistré comme producteur.")
         return redirect('admin:index')
     
-    # Statistiques du producteur
-    mes_parcelles = producteur.parcelles.all()
-    mes_recoltes = Recolte.objects.filter(parcelle__producteur=producteur)
-    
-    # Total des récoltes par type de culture
-    recoltes_par_culture = mes_recoltes.values('type_culture__nom').annotate(
-        total=Sum('quantite')
-    ).order_by('-total')
-    
-    # Dernières récoltes
-    dernieres_recoltes = mes_recoltes.order_by('-date_recolte')[:5]
+    # Statistiques du producteur (lues dans les cumuls, pas dans Recolte), calculées en parallèle
+    mes_cumuls = CumulRecolte.objects.filter(producteur=producteur)
+    donnees = await executer_en_parallele({
+        'nombre_parcelles': lambda: producteur.parcelles.count(),
+        'totaux': lambda: mes_cumuls.aggregate(total=Sum('quantite'), nombre=Sum('nombre_recoltes')),
+        # Total des récoltes par type de culture
+        'recoltes_par_culture': lambda: list(
+            mes_cumuls.values('type_culture__nom').annotate(total=Sum('quantite')).order_by('-total')
+        ),
+        # Dernières récoltes
+        'dernieres_recoltes': lambda: charger_recoltes(
+            Recolte.objects.filter(parcelle__producteur=producteur).select_related('parcelle', 'type_culture'),
+            ('-date_recolte', '-id'), 5,
+        ),
+    })
     
     context = {
         'producteur': producteur,
-        'nombre_parcelles': mes_parcelles.count(),
-        'nombre_recoltes': mes_recoltes.count(),
-        'recoltes_par_culture': recoltes_par_culture,
-        'dernieres_recoltes': dernieres_recoltes,
-        'total_recolte': mes_recoltes.aggregate(Sum('quantite'))['quantite__sum'] or 0,
+        'nombre_parcelles': donnees['nombre_parcelles'],
+        'nombre_recoltes': donnees['totaux']['nombre'] or 0,
+        'recoltes_par_culture': donnees['recoltes_par_culture'],
+        'dernieres_recoltes': donnees['dernieres_recoltes'],
+        'total_recolte': donnees['totaux']['total'] or 0,
     }
     
-    return render(request, 'gestion/dashboard_producteur.html', context)
+    return await sync_to_async(render)(request, 'gestion/dashboard_producteur.html', context)
 
 
 @login_required
@@ -69,7 +94,12 @@ def mes_recoltes(request):
         messages.error(request, "Vous n'êtes pas enregistré comme producteur.")
         return redirect('admin:index')
     
-    recoltes = Recolte.objects.filter(parcelle__producteur=producteur).order_by('-date_recolte')
+    recoltes = paginer_recoltes(
+        request,
+        Recolte.objects.filter(parcelle__producteur=producteur).select_related(
+            'parcelle__arrondissement__commune', 'type_culture'
+        ),
+    )
     
     context = {
         'recoltes': recoltes,
@@ -106,62 +136,95 @@ def ajouter_recolte(request):
     return render(request, 'gestion/ajouter_recolte.html', context)
 
 
+@login_required
+@permission_required('gestion.add_recolte', raise_exception=True)
+@require_POST
+def synchroniser_recoltes(request):
+    """
+    API JSON de l'application mobile : enregistre un lot de récoltes saisies hors connexion.
+
+    Corps : {"recoltes": [{"cle", "parcelle", "type_culture", "quantite", "date_recolte"}, ...]}
+    """
+    try:
+        producteur = request.user.producteur
+    except Producteur.DoesNotExist:
+        return JsonResponse({'erreurs': [{'message': "Vous n'êtes pas enregistré comme producteur."}]}, status=403)
+    
+    try:
+        corps = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'erreurs': [{'message': "Corps JSON invalide"}]}, status=400)
+    entrees = corps.get('recoltes') if isinstance(corps, dict) else corps
+    
+    try:
+        resultats = synchroniser_lot_recoltes(producteur, entrees)
+    except LotInvalide as exc:
+        erreurs = [{'index': index, 'cle': cle, 'message': message} for index, cle, message in exc.erreurs]
+        return JsonResponse({'erreurs': erreurs}, status=400)
+    
+    creees = sum(1 for resultat in resultats if resultat['statut'] == 'creee')
+    return JsonResponse(
+        {'recoltes': resultats, 'creees': creees, 'existantes': len(resultats) - creees},
+        status=201 if creees else 200,
+    )
+
+
 # ============================================
 # VUES POUR LES GESTIONNAIRES
 # ============================================
 
 @login_required
 @permission_required('gestion.view_stock', raise_exception=True)
-def dashboard_gestionnaire(request):
+async def dashboard_gestionnaire(request):
     """Tableau de bord du gestionnaire - Voit tout"""
+    # Le gabarit lit request.user : on lui donne l'utilisateur déjà chargé par auser()
+    request.user = await request.auser()
     
-    # Statistiques globales
-    total_producteurs = Producteur.objects.filter(actif=True).count()
-    total_recoltes = Recolte.objects.count()
-    total_entrepots = Entrepot.objects.count()
+    # Requêtes indépendantes : lancées en parallèle (voir parallele.py)
+    context = await executer_en_parallele({
+        # Statistiques globales (agrégats de tables entières, servis depuis le cache de l'accueil)
+        'statistiques': statistiques_publiques,
+        'total_entrepots': lambda: Entrepot.objects.count(),
+        # Alertes de stock bas ouvertes (table indexée, tenue à jour à chaque variation de stock)
+        'alertes_ouvertes': lambda: list(AlerteStock.objects.ouvertes().select_related('entrepot')),
+        # Stock total par type de culture
+        'stocks_par_culture': lambda: list(
+            Stock.objects.values('type_culture__nom').annotate(total=Sum('quantite')).order_by('-total')
+        ),
+        # Récoltes récentes
+        'recoltes_recentes': lambda: charger_recoltes(
+            Recolte.objects.select_related(
+                'parcelle__producteur__user', 'parcelle__arrondissement', 'type_culture'
+            ),
+            ('-date_recolte', '-id'), 10,
+        ),
+        # Production par arrondissement
+        'production_par_zone': lambda: list(
+            CumulRecolte.objects.values(
+                'arrondissement__nom',
+                'arrondissement__commune__nom'
+            ).annotate(
+                total=Sum('quantite')
+            ).order_by('-total')[:5]
+        ),
+    })
+    statistiques = context.pop('statistiques')
+    context['total_producteurs'] = statistiques['total_producteurs']
+    context['total_recoltes'] = statistiques['total_recoltes']
+    context['nombre_alertes'] = len(context['alertes_ouvertes'])
     
-    # Entrepôts avec alertes
-    entrepots_alerte = [e for e in Entrepot.objects.all() if e.alerte_stock_bas]
-    
-    # Stock total par type de culture
-    stocks_par_culture = Stock.objects.values('type_culture__nom').annotate(
-        total=Sum('quantite')
-    ).order_by('-total')
-    
-    # Récoltes récentes
-    recoltes_recentes = Recolte.objects.select_related(
-        'parcelle__producteur__user', 'type_culture'
-    ).order_by('-date_recolte')[:10]
-    
-    # Production par arrondissement
-    production_par_zone = Recolte.objects.values(
-        'parcelle__arrondissement__nom',
-        'parcelle__arrondissement__commune__nom'
-    ).annotate(
-        total=Sum('quantite')
-    ).order_by('-total')[:5]
-    
-    context = {
-        'total_producteurs': total_producteurs,
-        'total_recoltes': total_recoltes,
-        'total_entrepots': total_entrepots,
-        'entrepots_alerte': entrepots_alerte,
-        'nombre_alertes': len(entrepots_alerte),
-        'stocks_par_culture': stocks_par_culture,
-        'recoltes_recentes': recoltes_recentes,
-        'production_par_zone': production_par_zone,
-    }
-    
-    return render(request, 'gestion/dashboard_gestionnaire.html', context)
+    return await sync_to_async(render)(request, 'gestion/dashboard_gestionnaire.html', context)
 
 
 @login_required
 @permission_required('gestion.view_stock', raise_exception=True)
 def gestion_stocks(request):
     """Vue de gestion des stocks pour les gestionnaires"""
-    entrepots = Entrepot.objects.all()
+    entrepots = Entrepot.objects.select_related(
+        'arrondissement__commune', 'gestionnaire'
+    ).prefetch_related('stocks__type_culture')
     
-    # Calculer les alertes pour chaque entrepôt
+    # Indicateurs stockés : aucune agrégation par entrepôt
     for entrepot in entrepots:
         entrepot.alerte = entrepot.alerte_stock_bas
         entrepot.stock_total = entrepot.stock_actuel
@@ -177,23 +240,44 @@ def gestion_stocks(request):
 @login_required
 @permission_required('gestion.change_stock', raise_exception=True)
 def modifier_stock(request, entrepot_id):
-    """Permet au gestionnaire de modifier les stocks d'un entrepôt"""
-    entrepot = get_object_or_404(Entrepot, id=entrepot_id)
-    stocks = Stock.objects.filter(entrepot=entrepot)
+    """Permet au gestionnaire d'inventorier tout l'entrepôt en un envoi ou d'inscrire un mouvement"""
+    entrepot = get_object_or_404(Entrepot.objects.select_related('arrondissement__commune'), id=entrepot_id)
+    stocks = list(Stock.objects.filter(entrepot=entrepot).select_related('type_culture'))
+    quantites = {stock.type_culture_id: stock.quantite for stock in stocks}
     
+    inventaire = InventaireFormSet(entrepot=entrepot, stocks=quantites)
+    form_mouvement = MouvementStockForm(entrepot=entrepot)
     if request.method == 'POST':
-        form = StockForm(request.POST, entrepot=entrepot)
-        if form.is_valid():
-            stock = form.save()
-            messages.success(request, f"Stock de {stock.type_culture} mis à jour : {stock.quantite}kg")
-            return redirect('gestion_stocks')
-    else:
-        form = StockForm(entrepot=entrepot)
+        if 'mouvement' in request.POST:
+            form_mouvement = form_valide = MouvementStockForm(request.POST, entrepot=entrepot)
+        else:
+            inventaire = form_valide = InventaireFormSet(request.POST, entrepot=entrepot, stocks=quantites)
+        if form_valide.is_valid():
+            try:
+                resultat = form_valide.save(auteur=request.user)
+            except ValidationError as exc:
+                form_valide.add_error(None, exc)
+            else:
+                if isinstance(resultat, MouvementStock):
+                    messages.success(
+                        request,
+                        f"{resultat.get_type_mouvement_display()} de {abs(resultat.quantite)}kg de "
+                        f"{resultat.type_culture} enregistrée",
+                    )
+                else:
+                    messages.success(
+                        request, f"Inventaire de {entrepot.nom} enregistré : {len(resultat)} écart(s) ajusté(s)",
+                    )
+                return redirect('gestion_stocks')
+    
+    mouvements = entrepot.mouvements.select_related('type_culture', 'entrepot_destination', 'auteur')[:10]
     
     context = {
         'entrepot': entrepot,
         'stocks': stocks,
-        'form': form,
+        'inventaire': inventaire,
+        'form_mouvement': form_mouvement,
+        'mouvements': mouvements,
     }
     
     return render(request, 'gestion/modifier_stock.html', context)
@@ -206,30 +290,145 @@ def toutes_recoltes(request):
     recoltes = Recolte.objects.select_related(
         'parcelle__producteur__user', 
         'type_culture',
-        'parcelle__arrondissement'
-    ).order_by('-date_recolte')
+        'parcelle__arrondissement__commune'
+    )
     
-    # Filtres
+    # Filtres (partagés avec les exports)
     type_culture = request.GET.get('type_culture')
     arrondissement = request.GET.get('arrondissement')
-    
-    if type_culture:
-        recoltes = recoltes.filter(type_culture__nom=type_culture)
-    
-    if arrondissement:
-        recoltes = recoltes.filter(parcelle__arrondissement__id=arrondissement)
+    recoltes = filtrer_recoltes(recoltes, request.GET)
+    filtres = request.GET.copy()
+    for cle in ('apres', 'avant', 'taille'):
+        filtres.pop(cle, None)
     
     context = {
-        'recoltes': recoltes,
-        'types_cultures': TypeCulture.objects.all(),
-        'arrondissements': Arrondissement.objects.all(),
+        'recoltes': paginer_recoltes(request, recoltes),
         'type_culture_filtre': type_culture,
         'arrondissement_filtre': arrondissement,
+        'date_debut_filtre': request.GET.get('date_debut', ''),
+        'date_fin_filtre': request.GET.get('date_fin', ''),
+        'filtres_query': filtres.urlencode(),
     }
     
     return render(request, 'gestion/toutes_recoltes.html', context)
 
 
+@login_required
+@permission_required(['gestion.add_recolte', 'gestion.view_stock'], raise_exception=True)
+def importer_recoltes(request):
+    """Import en masse d'un fichier CSV de récoltes (pour gestionnaires)"""
+    resultat = None
+    if request.method == 'POST':
+        form = ImportRecoltesForm(request.POST, request.FILES)
+        if form.is_valid():
+            simulation = form.cleaned_data['simulation']
+            resultat = importer_fichier_csv(form.cleaned_data['fichier'].file, simulation=simulation)
+            if resultat.creees and not simulation:
+                messages.success(request, f"{resultat.creees} récolte(s) importée(s) avec succès !")
+            elif resultat.nombre_erreurs:
+                messages.error(request, f"{resultat.nombre_erreurs} ligne(s) en erreur.")
+    else:
+        form = ImportRecoltesForm()
+    
+    context = {
+        'form': form,
+        'resultat': resultat,
+        'erreurs': resultat.erreurs[:200] if resultat else [],
+        'colonnes': COLONNES_IMPORT,
+    }
+    
+    return render(request, 'gestion/importer_recoltes.html', context)
+
+
+def _reponse_export(request, nom_fichier, colonnes, lignes):
+    format_export = request.GET.get('format', 'csv')
+    if format_export not in FORMATS:
+        format_export = 'csv'
+    morceaux = generer_export(colonnes, lignes, format_export)
+    if isinstance(request, ASGIRequest):
+        morceaux = flux_asynchrone(morceaux)
+    response = StreamingHttpResponse(morceaux, content_type=FORMATS[format_export])
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}.{format_export}"'
+    return response
+
+
+@login_required
+@permission_required('gestion.view_recolte', raise_exception=True)
+def exporter_recoltes(request):
+    """Export en flux des récoltes, avec les filtres de toutes_recoltes"""
+    colonnes, lignes = lignes_recoltes(request.GET)
+    return _reponse_export(request, 'recoltes', colonnes, lignes)
+
+
+@login_required
+@permission_required('gestion.view_stock', raise_exception=True)
+def exporter_stocks(request):
+    """Export en flux des stocks par entrepôt et culture"""
+    colonnes, lignes = lignes_stocks(request.GET)
+    return _reponse_export(request, 'stocks', colonnes, lignes)
+
+
+# ============================================
+# API DE SYNCHRONISATION
+# ============================================
+
+@login_required
+def flux_synchronisation(request):
+    """
+    Modifications (et suppressions) depuis le jeton `depuis`, par pages de `taille`.
+
+    Les gestionnaires reçoivent tout ; un producteur ne reçoit que ses récoltes et parcelles.
+    """
+    if request.user.has_perm('gestion.view_stock'):
+        producteur = None
+    else:
+        try:
+            producteur = request.user.producteur
+        except Producteur.DoesNotExist:
+            return JsonResponse({'erreurs': [{'message': "Accès réservé aux producteurs et gestionnaires."}]}, status=403)
+    
+    try:
+        taille = int(request.GET.get('taille', TAILLE_PAGE_FLUX_DEFAUT))
+    except ValueError:
+        taille = TAILLE_PAGE_FLUX_DEFAUT
+    flux = flux_modifications(lire_jeton(request.GET.get('depuis')), taille, producteur)
+    return JsonResponse(flux)
+
+
+# ============================================
+# RECHERCHE
+# ============================================
+
+@login_required
+@permission_required('gestion.view_stock', raise_exception=True)
+def recherche_rapide(request):
+    """
+    Suggestions de saisie semi-automatique : producteurs, parcelles et entrepôts
+    dont le texte contient chaque terme de `q` (paramètre `type` pour n'en garder qu'un).
+    """
+    saisie = request.GET.get('q', '').strip()
+    type_objet = request.GET.get('type') or None
+    if type_objet is not None and type_objet not in dict(EntreeRecherche.TYPES_CHOICES):
+        return JsonResponse({'erreurs': [{'champ': 'type', 'message': "Type d'objet inconnu."}]}, status=400)
+    try:
+        limite = max(1, min(int(request.GET.get('limite', 10)), SUGGESTIONS_MAX))
+    except ValueError:
+        limite = 10
+    if len(saisie) < LONGUEUR_MIN_SAISIE:
+        return JsonResponse({'resultats': []})
+    
+    entrees = EntreeRecherche.objects.rechercher(saisie, type_objet).values_list('type_objet', 'objet_id', 'libelle')
+    return JsonResponse({'resultats': [
+        {
+            'type': type_entree,
+            'id': objet_id,
+            'libelle': libelle,
+            'url': reverse(f'admin:gestion_{type_entree}_change', args=[objet_id]),
+        }
+        for type_entree, objet_id, libelle in entrees[:limite]
+    ]})
+
+
 # ============================================
 # VUE PUBLIQUE
 # ============================================
@@ -238,25 +437,18 @@ def accueil(request):
     """Page d'accueil du site"""
     try:
         if request.user.is_authenticated:
-            # Rediriger selon le type d'utilisateur
-            try:
-                if hasattr(request.user, 'producteur') and request.user.producteur:
-                    return redirect('dashboard_producteur')
-            except Producteur.DoesNotExist:
-                pass
+            # Rediriger selon le type d'utilisateur (rôle résolu par RolesMiddleware, en cache)
+            if request.user.role == ROLE_PRODUCTEUR:
+                return redirect('dashboard_producteur')
             
-            if request.user.groups.filter(name='Gestionnaire').exists():
+            if request.user.role == ROLE_GESTIONNAIRE:
                 return redirect('dashboard_gestionnaire')
             
             # Si authentifié mais ni producteur ni gestionnaire
             return redirect('admin:index')
         
-        # Statistiques publiques
-        context = {
-            'total_producteurs': Producteur.objects.filter(actif=True).count(),
-            'total_communes': Commune.objects.count(),
-            'total_recoltes_kg': Recolte.objects.aggregate(Sum('quantite'))['quantite__sum'] or 0,
-        }
+        # Statistiques publiques (servies depuis le cache)
+        context = statistiques_publiques()
         
         return render(request, 'gestion/accueil.html', context)
     